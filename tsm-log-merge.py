@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import getopt
+import json
+import os
+import sys
+import traceback
+
+from zephyr.common import cli
+from zephyr.common import exceptions
+from zephyr.common import log_manager
+from zephyr.common import log_slicer
+
+TIME_FORMATS = ['%Y-%m-%d %H:%M:%S,%f', '%Y-%m-%d %H:%M:%S.%f',
+                '%Y-%m-%d %H:%M:%S']
+
+
+def usage(except_obj):
+    print('Usage: tsm-log-merge.py {-r results_dir | log_file...} '
+          '[-s <time>] [-u <time>] [-t <test>] [-l <leeway>] '
+          '[-o <file>] [-n]')
+    print('')
+    print('   Merge Options:')
+    print('     -s, --since <time>')
+    print('         Only merge entries at or after this time')
+    print('         (YYYY-MM-DD HH:MM:SS[,fff]).')
+    print('     -u, --until <time>')
+    print('         Only merge entries at or before this time.')
+    print('     -t, --test <test>')
+    print('         Only merge entries from while the test ran (according')
+    print('         to the results directory\'s results.json file).')
+    print('     -l, --leeway')
+    print('         Set leeway time around a test (default +/- 5 seconds).')
+    print('     -o, --output <file>')
+    print('         Write the merged log to a file (default: stdout).')
+    print('     -n, --no-tags')
+    print('         Don\'t start each line with the name of its log file.')
+    print('   Log Files:')
+    print('     -r, --results-dir <dir>')
+    print('          Results directory for the test run, to merge the logs')
+    print('          in its full-logs directory (using the date formats')
+    print('          recorded when they were collated).  Log files can')
+    print('          also be given by name, and their formats are then')
+    print('          detected.')
+    if except_obj is not None:
+        raise except_obj
+
+
+def parse_time(value):
+    """
+    :type value: str
+    :return: datetime.datetime
+    """
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise exceptions.ArgMismatchException('Invalid time: ' + value)
+
+
+def get_results_sources(results_dir):
+    """
+    :type results_dir: str
+    :return: list[log_slicer.MergeSource] The collated logs in the results
+    directory, with their date formats if they were recorded
+    """
+    log_dir = results_dir + '/full-logs'
+    try:
+        with open(log_dir + '/' + log_manager.COLLATE_MANIFEST) as fp:
+            manifest = json.load(fp)
+    except (IOError, ValueError):
+        manifest = {}
+    formats = {e['file']: (e.get('date_format'), e.get('date_position', 0))
+               for e in manifest.values()}
+    sources = []
+    for log_file in sorted(cli.LinuxCLI.ls(log_dir + '/*')):
+        name = os.path.basename(log_file)
+        if name == log_manager.COLLATE_MANIFEST:
+            continue
+        date_format, date_pos = formats.get(name, (None, 0))
+        sources.append(log_slicer.MergeSource(log_file, date_format,
+                                              date_pos))
+    return sources
+
+
+try:
+    arg_map, extra_args = getopt.gnu_getopt(
+        sys.argv[1:],
+        (
+            'h'
+            'r:'
+            's:'
+            'u:'
+            't:'
+            'l:'
+            'o:'
+            'n'
+        ),
+        [
+            'help',
+            'results-dir=',
+            'since=',
+            'until=',
+            'test=',
+            'leeway=',
+            'output=',
+            'no-tags',
+        ])
+
+    # Defaults
+    results_dir = None
+    since = None
+    until = None
+    test_name = None
+    leeway = 5
+    output = None
+    tags = True
+
+    for arg, value in arg_map:
+        if arg in ('-h', '--help'):
+            usage(None)
+            sys.exit(0)
+        elif arg in ('-r', '--results-dir'):
+            results_dir = value
+        elif arg in ('-s', '--since'):
+            since = parse_time(value)
+        elif arg in ('-u', '--until'):
+            until = parse_time(value)
+        elif arg in ('-t', '--test'):
+            test_name = value
+        elif arg in ('-l', '--leeway'):
+            leeway = value
+        elif arg in ('-o', '--output'):
+            output = value
+        elif arg in ('-n', '--no-tags'):
+            tags = False
+        else:
+            raise exceptions.ArgMismatchException('Invalid argument' + arg)
+
+    if not results_dir and len(extra_args) == 0:
+        usage(exceptions.ArgMismatchException(
+            "A results directory or log files are required!"))
+
+    if test_name is not None:
+        if not results_dir:
+            usage(exceptions.ArgMismatchException(
+                "A results directory is required to merge a test's logs!"))
+        with open(results_dir + '/results.json', 'r') as fp:
+            result_map = json.load(fp)
+        testcases = [tc for tc in result_map['testsuite']['testcases']
+                     if tc['name'] == test_name]
+        if len(testcases) == 0:
+            raise exceptions.ObjectNotFoundException(
+                'No such test in results: ' + test_name)
+        leeway_delta = datetime.timedelta(seconds=float(leeway))
+        since = datetime.datetime.strptime(
+            testcases[0]['starttime'], '%Y-%m-%d %H:%M:%S,%f') - leeway_delta
+        until = datetime.datetime.strptime(
+            testcases[0]['stoptime'], '%Y-%m-%d %H:%M:%S,%f') + leeway_delta
+
+    sources = get_results_sources(results_dir) if results_dir else []
+    sources += [log_slicer.MergeSource(log_file) for log_file in extra_args]
+
+    out = open(output, 'w') if output is not None else sys.stdout
+    try:
+        log_slicer.merge_logs(sources, out, since, until, tags)
+    finally:
+        if output is not None:
+            out.close()
+
+except exceptions.ExitCleanException:
+    exit(1)
+except exceptions.ArgMismatchException as a:
+    print('Argument mismatch: ' + str(a))
+    exit(2)
+except exceptions.ObjectNotFoundException as e:
+    print('Object not found: ' + str(e))
+    exit(2)
+except exceptions.TestException as e:
+    print('Unknown exception: ' + str(e))
+    traceback.print_tb(sys.exc_traceback)
+    exit(2)
@@ -22,7 +22,6 @@ import traceback
 
 from zephyr.common import cli
 from zephyr.common import exceptions
-from zephyr.common import file_location
 from zephyr.common import log_slicer
 
 
@@ -32,6 +31,9 @@ def usage(except_obj):
     print('   Slice Options:')
     print('     -l, --leeway')
     print('         Set leeway time for logs (default +/- 5 seconds).')
+    print('     -j, --jobs <n>')
+    print('         Number of log files to slice at once (default: one')
+    print('         per CPU).')
     print('   Debug Options:')
     print('     -d, --debug')
     print('         Turn on DEBUG logging (and split log output to stdout).')
@@ -51,18 +53,21 @@ try:
             'd'
             'l:'
             'r:'
+            'j:'
         ),
         [
             'help',
             'leeway=',
             'debug',
             'results-dir=',
+            'jobs=',
         ])
 
     # Defaults
     debug = False
     results_dir = None
     leeway = 5
+    jobs = None
 
     for arg, value in arg_map:
         if arg in ('-h', '--help'):
@@ -74,6 +79,8 @@ try:
             debug = True
         elif arg in ('-l', '--leeway'):
             leeway = value
+        elif arg in ('-j', '--jobs'):
+            jobs = int(value)
         else:
             raise exceptions.ArgMismatchException('Invalid argument' + arg)
 
@@ -91,20 +98,25 @@ try:
     log_files = cli.LinuxCLI.ls(results_dir + '/full-logs/*')
     print('Slicing log files: ' + str(log_files))
 
+    leeway_delta = datetime.timedelta(seconds=float(leeway))
+    windows = []
     for tc in result_map['testsuite']['testcases']:
         start_time = tc["starttime"]
         stop_time = tc["stoptime"]
         tcname = tc["name"]
         print("Creating sliced log-files for test: " + tcname)
         cli.LinuxCLI(priv=False).mkdir(results_dir + '/' + tcname)
-        log_slicer.slice_log_files_by_time(
-            log_files=[file_location.FileLocation(f) for f in log_files],
+        windows.append(log_slicer.SliceWindow(
             out_dir=results_dir + '/' + tcname,
-            slice_start_time=datetime.datetime.strptime(
-                start_time, '%Y-%m-%d %H:%M:%S,%f'),
-            slice_stop_time=datetime.datetime.strptime(
-                stop_time, '%Y-%m-%d %H:%M:%S,%f'),
-            leeway=leeway)
+            start_time=datetime.datetime.strptime(
+                start_time, '%Y-%m-%d %H:%M:%S,%f') - leeway_delta,
+            stop_time=datetime.datetime.strptime(
+                stop_time, '%Y-%m-%d %H:%M:%S,%f') + leeway_delta))
+
+    # Each log file is read once for all of the tests, in parallel, and
+    # indexed first if it wasn't indexed when it was collated
+    log_slicer.slice_log_files_by_windows(log_files, windows,
+                                          processes=jobs, build_index=True)
 
 except exceptions.ExitCleanException:
     exit(1)
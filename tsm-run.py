@@ -20,12 +20,14 @@ import os
 import sys
 import traceback
 
+from zephyr.common.cmd_trace import CommandTracer
 from zephyr.common.exceptions import ArgMismatchException
 from zephyr.common.exceptions import ExitCleanException
 from zephyr.common.exceptions import ObjectNotFoundException
 from zephyr.common.exceptions import SubprocessFailedException
 from zephyr.common.exceptions import TestException
 from zephyr.common.log_manager import LogManager
+from zephyr.common.priv_broker import PrivBroker
 from zephyr.common import zephyr_constants as z_con
 from zephyr.tsm.test_case import TestCase
 from zephyr.tsm.test_system_manager import TestSystemManager
@@ -60,9 +62,17 @@ def usage(except_obj):
     print('         List of arguments to give the selected client.  These')
     print('         should be key=value pairs, separated by commas, with no')
     print('         spaces.')
+    print('   Privilege Options:')
+    print('     --priv-broker')
+    print('         Start a privileged broker for the run, to run allowed')
+    print('         privileged commands instead of using sudo for each.')
     print('   Debug Options:')
     print('     -d, --debug')
     print('         Turn on DEBUG logging (and split log output to stdout).')
+    print('     --trace-commands')
+    print('         Record the timing of every command run, and write')
+    print('         per-test and per-suite histograms to')
+    print('         command_trace.json next to the results.')
     print('   Output File Options:')
     print('     -l, --log-dir <dir>')
     print('         Log file directory (default: /tmp/zephyr/results)')
@@ -70,6 +80,8 @@ def usage(except_obj):
     print('         Results file directory (default: /tmp/zephyr/logs).')
     print('         Timestamp will be appended to prevent overwriting')
     print('         results.')
+    print('     --compress-logs <gzip|zstd>[:<level>]')
+    print('         Compress the collated log files.')
 
     if except_obj is not None:
         raise except_obj
@@ -100,7 +112,10 @@ try:
             'log-dir=',
             'debug',
             'results-dir=',
-            'debug-test'
+            'debug-test',
+            'priv-broker',
+            'trace-commands',
+            'compress-logs='
         ])
 
     # Defaults
@@ -111,6 +126,9 @@ try:
     underlay_config = z_con.DEFAULT_UNDERLAY_CONFIG
     debug = False
     test_debug = False
+    priv_broker = False
+    log_compression = None
+    log_compression_level = None
     log_dir = '/tmp/zephyr/logs'
     results_dir = '/tmp/zephyr/results'
     topology = '2z-3c-2edge.json'
@@ -140,6 +158,14 @@ try:
             debug = True
         elif arg in '--debug-test':
             test_debug = True
+        elif arg == '--priv-broker':
+            priv_broker = True
+        elif arg == '--trace-commands':
+            CommandTracer.enable()
+        elif arg == '--compress-logs':
+            log_compression, _, level = value.partition(':')
+            if level != '':
+                log_compression_level = int(level)
         elif arg in ('-r', '--results-dir'):
             results_dir = value
         elif arg == '--client-args':
@@ -168,6 +194,10 @@ try:
     root_dir = z_con.ZephyrInit.BIN_ROOT_DIR
     print('Setting root dir to: ' + root_dir)
 
+    if priv_broker:
+        print('Starting privileged broker')
+        PrivBroker.start_broker()
+
     client_impl = None
     base_client_args = dict()
     if client_impl_type == 'neutron':
@@ -266,7 +296,9 @@ try:
 
     finally:
         rdir = results_dir + '/' + name
-        tsm.create_results(results_dir=rdir)
+        tsm.create_results(results_dir=rdir,
+                           log_compression=log_compression,
+                           log_compression_level=log_compression_level)
 
 except ExitCleanException:
     exit(1)
@@ -0,0 +1,136 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent import futures
+import threading
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.exceptions import *
+
+ASYNC_POOL_SIZE = 128
+
+
+class AsyncPool(object):
+    """
+    Shared pool of worker threads for running blocking calls (commands,
+    pings, echo requests) in the background.  Each call returns a
+    concurrent.futures.Future straight away, so many calls can be started
+    and then waited on together with gather().
+    """
+    pool = None
+    """ :type: futures.ThreadPoolExecutor """
+    pool_lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls):
+        """
+        :return: futures.ThreadPoolExecutor
+        """
+        with cls.pool_lock:
+            if cls.pool is None:
+                cls.pool = futures.ThreadPoolExecutor(ASYNC_POOL_SIZE)
+            return cls.pool
+
+    @classmethod
+    def shutdown(cls):
+        with cls.pool_lock:
+            if cls.pool is not None:
+                cls.pool.shutdown(wait=True)
+                cls.pool = None
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the shared pool.
+    :type func: callable
+    :return: futures.Future
+    """
+    return AsyncPool.get_pool().submit(func, *args, **kwargs)
+
+
+def gather(future_list, timeout=None, return_exceptions=False):
+    """
+    Wait for all of the futures and return their results, in the same
+    order.  If any of them raised, the first exception (in list order) is
+    re-raised, unless return_exceptions is set, in which case exceptions
+    are returned in place of the results.  A SubprocessTimeoutException is
+    raised if they have not all finished within timeout seconds (the
+    unfinished calls keep running in the background).
+    :type future_list: list[futures.Future]
+    :type timeout: float
+    :type return_exceptions: bool
+    :return: list[T]
+    """
+    done, not_done = futures.wait(future_list, timeout=timeout)
+    if len(not_done) > 0:
+        raise SubprocessTimeoutException(
+            str(len(not_done)) + '/' + str(len(future_list)) +
+            ' calls did not finish within ' + str(timeout) + ' seconds')
+
+    results = []
+    for f in future_list:
+        error = f.exception()
+        if error is not None:
+            if not return_exceptions:
+                raise error
+            results.append(error)
+        else:
+            results.append(f.result())
+    return results
+
+
+class AsyncLinuxCLI(object):
+    """
+    Runs the commands of a LinuxCLI (or NetNSCLI) in the background.  Each
+    call returns a future for its CommandStatus, so for example:
+
+        acli = AsyncLinuxCLI(NetNSCLI('ns1'))
+        statuses = gather([acli.cmd('ping -c 1 ' + ip) for ip in ips])
+    """
+    def __init__(self, cli=None):
+        """
+        :type cli: LinuxCLI
+        """
+        self.cli = cli if cli is not None else LinuxCLI()
+        """ :type: LinuxCLI """
+
+    def cmd(self, cmd_line, timeout=None, verify=False):
+        """
+        :type cmd_line: str
+        :type timeout: int Kill the command after this many seconds
+        :type verify: bool
+        :return: futures.Future CommandStatus when done
+        """
+        return submit(self.cli.cmd, cmd_line, timeout=timeout,
+                      verify=verify)
+
+    def cmd_pipe(self, commands, timeout=None, verify=False):
+        """
+        :type commands: list[list[str]]
+        :type timeout: int Kill the commands after this many seconds
+        :type verify: bool
+        :return: futures.Future CommandStatus when done
+        """
+        return submit(self.cli.cmd_pipe, commands, timeout=timeout,
+                      verify=verify)
+
+    def cmd_all(self, cmd_lines, timeout=None, verify=False):
+        """
+        Run all of the commands at once and wait for them to finish.
+        :type cmd_lines: list[str]
+        :type timeout: int Kill each command after this many seconds
+        :type verify: bool
+        :return: list[CommandStatus]
+        """
+        return gather([self.cmd(c, timeout=timeout, verify=verify)
+                       for c in cmd_lines])
@@ -0,0 +1,541 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+import time
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.exceptions import *
+from zephyr.common.packet_buffer import OVERFLOW_DROP_OLDEST
+from zephyr.common.packet_buffer import PacketBuffer
+from zephyr.common import pcap
+from zephyr.common.pcap_file import PCAPStreamWriter
+from zephyr.common.pcap_packet import PCAPEthernet
+from zephyr.common.pcap_packet import PCAPSLL
+from zephyr.common.tcp_dump import TCPDump
+
+CAPTURE_DISPATCH_INTERVAL = 0.1
+DEFAULT_SUBSCRIBER = 'default'
+
+
+class CaptureSubscriber(object):
+    """
+    One consumer of a capture session, receiving only the packets which
+    match its filter (all packets if no filter is set) while it is
+    attached.  The callback, if set, is called for each received packet
+    from the session's dispatch thread.  Received packets are held in a
+    PacketBuffer, which can be bounded (see TCPDump.start_capture).
+    """
+    def __init__(self, name, pcap_filter=None, count=0, callback=None,
+                 callback_args=None, save_dump_file=False,
+                 save_dump_filename=None, buffer_packets=0, buffer_bytes=0,
+                 overflow_policy=OVERFLOW_DROP_OLDEST, spill_filename=None,
+                 prefiltered=False):
+        """
+        :type name: str
+        :type pcap_filter: pcap.Rule
+        :type count: int Number of packets to receive before detaching
+        automatically, or 0 to receive until detached
+        :type callback: callable
+        :type callback_args: list[T]
+        :type save_dump_file: bool
+        :type save_dump_filename: str
+        :type buffer_packets: int
+        :type buffer_bytes: int
+        :type overflow_policy: str
+        :type spill_filename: str
+        :type prefiltered: bool The subscriber has its own capture, which
+        only captures packets matching the filter, so it isn't matched
+        again (for filters which can't be compiled into a predicate)
+        """
+        self.name = name
+        self.pcap_filter = pcap_filter
+        self.prefiltered = prefiltered
+        self.count = count
+        self.callback = callback
+        self.callback_args = callback_args
+        self.packet_buffer = PacketBuffer(
+            max_packets=buffer_packets, max_bytes=buffer_bytes,
+            overflow_policy=overflow_policy, spill_filename=spill_filename)
+        self.packets_received = 0
+        self.attached = True
+        self.dump_writer = None
+        """ :type: PCAPStreamWriter """
+        if save_dump_file is True:
+            self.dump_writer = PCAPStreamWriter(
+                save_dump_filename if save_dump_filename is not None
+                else 'tcp.out.' + name + '.' + str(time.time()))
+
+    def deliver(self, packet):
+        """
+        Receive the packet if attached and it matches the filter.
+        :type packet: PCAPPacket
+        :return: bool True if the packet was received
+        """
+        if not self.attached:
+            return False
+        if (self.pcap_filter is not None and not self.prefiltered and
+                not self.pcap_filter.matches(packet)):
+            return False
+
+        self.packet_buffer.append(packet)
+        self.packets_received += 1
+        if self.dump_writer is not None:
+            self.dump_writer.write_packet(packet)
+        if self.callback is not None:
+            self.callback(packet,
+                          *(self.callback_args
+                            if self.callback_args is not None else ()))
+        if self.count != 0 and self.packets_received >= self.count:
+            self.detach()
+        return True
+
+    def detach(self):
+        """
+        Stop receiving packets.  Packets already received can still be
+        retrieved with wait_for_packets.
+        """
+        self.attached = False
+        if self.dump_writer is not None:
+            self.dump_writer.close()
+        self.packet_buffer.close()
+
+    def wait_for_packets(self, count=1, timeout=None):
+        """
+        Wait for and return a list of [count] received packets (0 means
+        just return what is buffered).  A SubprocessTimeoutException is
+        raised if the packets do not all arrive within the timeout, in
+        which case the packets received so far stay buffered.
+        :type count: int
+        :type timeout: float
+        :return: list[PCAPPacket]
+        """
+        return self.packet_buffer.get(count, timeout)
+
+
+def get_capture_time(packet):
+    """
+    :type packet: PCAPPacket
+    :return: float The time the packet was captured, in seconds since the
+    epoch (as from time.time())
+    """
+    return packet.capture_time[0] + packet.capture_time[1] / 1000000.0
+
+
+def get_filter_strs(pcap_filters):
+    """
+    :type pcap_filters: list[pcap.Rule]
+    :return: frozenset[str] The tcpdump expressions of the filters, or None
+    if any of them lets every packet through
+    """
+    filter_strs = set()
+    for pcap_filter in pcap_filters:
+        filter_str = (pcap_filter.to_str().strip()
+                      if pcap_filter is not None else '')
+        if filter_str == '':
+            return None
+        filter_strs.add(filter_str)
+    return frozenset(filter_strs)
+
+
+class SessionCapture(object):
+    """
+    One tcpdump run for a capture session, and the thread which hands its
+    packets to the session's subscribers (to one dedicated subscriber, or
+    to all of the others).  A capture can be limited to the packets
+    captured in a time window, so a new capture with a wider filter can
+    take over from an old one without a gap or duplicate packets: the new
+    capture only dispatches once the old one has finished, and from the
+    time it was known to be listening.
+    """
+    def __init__(self, session, pcap_filter=None, filter_strs=None,
+                 subscriber=None, previous=None):
+        """
+        :type session: CaptureSession
+        :type pcap_filter: pcap.Rule Filter for tcpdump (None for all
+        packets)
+        :type filter_strs: frozenset[str] The subscriber filters it covers
+        (None for all)
+        :type subscriber: CaptureSubscriber The dedicated subscriber (None
+        to dispatch to the session's shared subscribers)
+        :type previous: SessionCapture Capture to let finish before
+        dispatching anything
+        """
+        self.session = session
+        self.pcap_filter = pcap_filter
+        self.filter_strs = filter_strs
+        self.subscriber = subscriber
+        self.previous = previous
+        self.tcpdump = TCPDump()
+        self.start_time = None
+        """ :type: float """
+        self.stop_time = None
+        """ :type: float """
+        self.last_time = None
+        """ :type: float """
+        self.dispatch_stop = threading.Event()
+        self.dispatch_thread = None
+        """ :type: threading.Thread """
+
+    def covers(self, filter_strs):
+        """
+        :type filter_strs: frozenset[str]
+        :return: bool Whether the capture gets every packet matching the
+        filters
+        """
+        return self.filter_strs is None or (
+            filter_strs is not None and filter_strs <= self.filter_strs)
+
+    def start(self):
+        """
+        Start tcpdump (returning once it is listening), and the dispatch
+        thread.
+        """
+        self.tcpdump.start_capture(
+            cli=self.session.cli, interface=self.session.interface,
+            packet_type=self.session.packet_type,
+            pcap_filter=self.pcap_filter, max_size=self.session.max_size,
+            blocking=False)
+        self.dispatch_thread = threading.Thread(
+            target=self.dispatch_packets)
+        self.dispatch_thread.daemon = True
+        self.dispatch_thread.start()
+
+    def is_running(self):
+        """
+        :return: bool
+        """
+        return (self.dispatch_thread is not None and
+                self.dispatch_thread.is_alive() and
+                not self.dispatch_stop.is_set())
+
+    def stop(self, stop_time=None):
+        """
+        Stop tcpdump.  The dispatch thread finishes once it has dispatched
+        the packets already captured (see join).
+        :type stop_time: float Only dispatch the packets captured before
+        this time
+        """
+        self.stop_time = stop_time
+        if self.dispatch_thread is not None:
+            self.tcpdump.stop_capture()
+        self.dispatch_stop.set()
+
+    def join(self):
+        """
+        Wait for the dispatch thread to finish (after stop).
+        """
+        if (self.dispatch_thread is not None and
+                self.dispatch_thread is not threading.current_thread()):
+            self.dispatch_thread.join()
+
+    def in_window(self, packet):
+        """
+        :type packet: PCAPPacket
+        :return: bool
+        """
+        capture_time = get_capture_time(packet)
+        return ((self.start_time is None or
+                 capture_time >= self.start_time) and
+                (self.stop_time is None or capture_time < self.stop_time))
+
+    def dispatch_packets(self):
+        """
+        Dispatch thread: keep handing captured packets to the subscribers
+        until stopped, and then dispatch whatever is left over.  The
+        capture is stopped as soon as nobody is subscribed to it.
+        """
+        if self.previous is not None:
+            self.previous.join()
+            if (self.start_time is not None and
+                    self.previous.last_time is not None):
+                # Anything the old capture already dispatched from after
+                # the switch over isn't dispatched again
+                self.start_time = max(self.start_time,
+                                      self.previous.last_time + 0.000001)
+            self.previous = None
+
+        while True:
+            stopping = self.dispatch_stop.is_set()
+            packets = self.tcpdump.read_new_packets(
+                timeout=0 if stopping else CAPTURE_DISPATCH_INTERVAL)
+            if self.start_time is not None or self.stop_time is not None:
+                window_packets = [p for p in packets if self.in_window(p)]
+            else:
+                window_packets = packets
+            if len(window_packets) > 0:
+                self.last_time = get_capture_time(window_packets[-1])
+            if self.subscriber is not None:
+                self.session.dispatch(window_packets, [self.subscriber])
+            else:
+                self.session.dispatch(window_packets)
+            if stopping and len(packets) == 0:
+                break
+            if not stopping:
+                self.session.stop_unused_capture(self)
+
+
+class CaptureSession(object):
+    """
+    A capture on an interface, shared by any number of subscribers.  One
+    tcpdump is run for the subscribers, filtering (in the kernel) for the
+    packets matching any of their filters, and each packet is handed to
+    every attached subscriber whose own filter matches it.  Subscribers
+    can be attached and detached without restarting the capture, unless a
+    new subscriber needs packets the capture doesn't get, in which case a
+    capture with the wider filter takes over.  Filters which can't be
+    matched here (see pcap.Rule.compile_predicate) get a capture of their
+    own.  Captures are stopped as soon as they have no subscribers left.
+    """
+    def __init__(self, cli=LinuxCLI(), interface='any', packet_type='',
+                 max_size=0):
+        """
+        :type cli: LinuxCLI
+        :type interface: str
+        :type packet_type: str
+        :type max_size: int
+        """
+        self.cli = cli
+        self.interface = interface
+        self.packet_type = packet_type
+        self.max_size = max_size
+        self.link_layer = PCAPSLL if interface == 'any' else PCAPEthernet
+        self.subscribers = collections.OrderedDict()
+        """ :type: dict[str, CaptureSubscriber] """
+        self.subscriber_lock = threading.Lock()
+        self.started = False
+        self.capture = None
+        """ :type: SessionCapture """
+        self.last_capture = None
+        """ :type: SessionCapture """
+        self.dedicated_captures = {}
+        """ :type: dict[str, SessionCapture] """
+        self.capture_lock = threading.RLock()
+
+    def start(self):
+        """
+        Start capturing for the attached subscribers (and any attached
+        later on).  Starting a started session does nothing.
+        """
+        with self.capture_lock:
+            self.started = True
+            self.update_captures()
+
+    def is_running(self):
+        """
+        :return: bool
+        """
+        with self.capture_lock:
+            return any(c.is_running() for c in self.get_captures())
+
+    def get_captures(self):
+        """
+        :return: list[SessionCapture]
+        """
+        captures = list(self.dedicated_captures.values())
+        if self.capture is not None:
+            captures.append(self.capture)
+        return captures
+
+    def stop(self):
+        """
+        Stop capturing, once every packet captured has been dispatched to
+        the subscribers.
+        """
+        with self.capture_lock:
+            self.started = False
+            captures = self.get_captures()
+            self.capture = None
+            self.dedicated_captures = {}
+            for capture in captures:
+                capture.stop()
+        for capture in captures:
+            capture.join()
+
+    def update_captures(self):
+        """
+        Make sure every attached subscriber is covered by a capture.
+        """
+        with self.capture_lock:
+            if not self.started:
+                return
+            with self.subscriber_lock:
+                attached = [s for s in self.subscribers.values()
+                            if s.attached]
+            shared = [s for s in attached if not s.prefiltered]
+            if len(shared) > 0:
+                filter_strs = get_filter_strs(
+                    [s.pcap_filter for s in shared])
+                if self.capture is None or not self.capture.covers(
+                        filter_strs):
+                    self.replace_capture(
+                        pcap.Or([s.pcap_filter for s in shared])
+                        if filter_strs is not None else None,
+                        filter_strs)
+            for subscriber in attached:
+                if (subscriber.prefiltered and
+                        subscriber.name not in self.dedicated_captures):
+                    capture = SessionCapture(
+                        self, subscriber.pcap_filter, subscriber=subscriber)
+                    capture.start()
+                    self.dedicated_captures[subscriber.name] = capture
+
+    def replace_capture(self, pcap_filter, filter_strs):
+        """
+        Start a capture for the shared subscribers with a new filter, and
+        switch over to it from the current one (if any) once it is
+        listening.
+        :type pcap_filter: pcap.Rule
+        :type filter_strs: frozenset[str]
+        """
+        old_capture = self.capture
+        capture = SessionCapture(self, pcap_filter, filter_strs,
+                                 previous=self.last_capture)
+        capture.start()
+        if old_capture is not None:
+            switch_time = time.time()
+            capture.start_time = switch_time
+            old_capture.stop(stop_time=switch_time)
+        self.capture = capture
+        self.last_capture = capture
+
+    def stop_unused_capture(self, capture):
+        """
+        Stop the capture if none of its subscribers are attached anymore.
+        :type capture: SessionCapture
+        """
+        with self.capture_lock:
+            if capture.subscriber is not None:
+                if (capture.subscriber.attached or
+                        self.dedicated_captures.get(
+                            capture.subscriber.name) is not capture):
+                    return
+                del self.dedicated_captures[capture.subscriber.name]
+            else:
+                if (capture is not self.capture or
+                        self.has_attached_subscribers(prefiltered=False)):
+                    return
+                self.capture = None
+            capture.stop()
+
+    def subscribe(self, name=DEFAULT_SUBSCRIBER, pcap_filter=None, count=0,
+                  callback=None, callback_args=None, save_dump_file=False,
+                  save_dump_filename=None, buffer_packets=0, buffer_bytes=0,
+                  overflow_policy=OVERFLOW_DROP_OLDEST, spill_filename=None):
+        """
+        Attach a new subscriber, replacing any previous subscriber with
+        the same name.  If the session is started, a capture covering the
+        subscriber's filter is started before returning.
+        :type name: str
+        :type pcap_filter: pcap.Rule
+        :type count: int
+        :type callback: callable
+        :type callback_args: list[T]
+        :type save_dump_file: bool
+        :type save_dump_filename: str
+        :type buffer_packets: int
+        :type buffer_bytes: int
+        :type overflow_policy: str
+        :type spill_filename: str
+        :return: CaptureSubscriber
+        """
+        prefiltered = False
+        if pcap_filter is not None:
+            try:
+                pcap_filter.compile_predicate(self.link_layer)
+            except ArgMismatchException:
+                # Let tcpdump do the filtering on a capture of its own
+                prefiltered = True
+        subscriber = CaptureSubscriber(
+            name, pcap_filter=pcap_filter, count=count, callback=callback,
+            callback_args=callback_args, save_dump_file=save_dump_file,
+            save_dump_filename=save_dump_filename,
+            buffer_packets=buffer_packets, buffer_bytes=buffer_bytes,
+            overflow_policy=overflow_policy, spill_filename=spill_filename,
+            prefiltered=prefiltered)
+        with self.capture_lock:
+            old_capture = self.dedicated_captures.pop(name, None)
+            with self.subscriber_lock:
+                if name in self.subscribers:
+                    self.subscribers[name].detach()
+                self.subscribers[name] = subscriber
+            if old_capture is not None:
+                old_capture.stop()
+            self.update_captures()
+        return subscriber
+
+    def detach(self, name=DEFAULT_SUBSCRIBER):
+        """
+        Detach the named subscriber.  It stays available (through
+        get_subscriber) to retrieve the packets it already received.  If
+        it is the last subscriber of its capture, the capture is stopped
+        first, so the subscriber gets every packet captured up until now.
+        :type name: str
+        :return: CaptureSubscriber
+        """
+        subscriber = self.get_subscriber(name)
+        capture = None
+        with self.capture_lock:
+            if name in self.dedicated_captures:
+                capture = self.dedicated_captures.pop(name)
+            elif (self.capture is not None and not subscriber.prefiltered and
+                  not any(s.attached and not s.prefiltered
+                          for s in self.subscribers.values()
+                          if s is not subscriber)):
+                capture = self.capture
+                self.capture = None
+            if capture is not None:
+                capture.stop()
+        if capture is not None:
+            capture.join()
+        with self.subscriber_lock:
+            subscriber.detach()
+        return subscriber
+
+    def get_subscriber(self, name=DEFAULT_SUBSCRIBER):
+        """
+        :type name: str
+        :return: CaptureSubscriber
+        """
+        if name not in self.subscribers:
+            raise ObjectNotFoundException(
+                'No subscriber named ' + name + ' on capture session for ' +
+                'interface: ' + self.interface)
+        return self.subscribers[name]
+
+    def has_attached_subscribers(self, prefiltered=None):
+        """
+        :type prefiltered: bool Only count the subscribers with (True) or
+        without (False) a capture of their own
+        :return: bool
+        """
+        return any(s.attached for s in self.subscribers.values()
+                   if prefiltered is None or s.prefiltered == prefiltered)
+
+    def dispatch(self, packets, subscribers=None):
+        """
+        Hand each packet to every attached subscriber.
+        :type packets: list[PCAPPacket]
+        :type subscribers: list[CaptureSubscriber] The subscribers to hand
+        the packets to (the ones without a capture of their own by
+        default)
+        """
+        with self.subscriber_lock:
+            if subscribers is None:
+                subscribers = [s for s in self.subscribers.values()
+                               if not s.prefiltered]
+            subscribers = [s for s in subscribers if s.attached]
+            for packet in packets:
+                for subscriber in subscribers:
+                    subscriber.deliver(packet)
@@ -12,12 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import glob
 import os
+import pipes
 import pwd
+import re
+import shutil
+import signal
 import subprocess
+import tempfile
+import threading
 import time
+from zephyr.common.cmd_trace import CommandTracer
 from zephyr.common.exceptions import *
+from zephyr.common import file_ops
+from zephyr.common.netlink import NetlinkSocket
+from zephyr.common.netns_executor import NetNSExecutor
+from zephyr.common.priv_broker import PrivBroker
+from zephyr.common import process_table
+from zephyr.common.raw_sender import RawSocketSender
 
 
 def _create_ns(name):
@@ -25,6 +39,9 @@ def _create_ns(name):
 
 
 def _remove_ns(name):
+    NetNSExecutor.stop_executors(name)
+    NetlinkSocket.close_sockets(name)
+    RawSocketSender.close_sockets(name)
     LinuxCLI().cmd('ip netns del ' + name)
 
 
@@ -32,6 +49,55 @@ CREATENSCMD = _create_ns
 REMOVENSCMD = _remove_ns
 DEBUG = 0
 
+# Commands which cmd_batch can fold into a single 'ip -batch' or
+# 'iptables-restore --noflush' run
+IP_BATCH_COMMANDS = ['ip', '/sbin/ip', '/bin/ip']
+IP_BATCH_VERBS = ['add', 'del', 'delete', 'set', 'change', 'replace',
+                  'append', 'prepend', 'flush']
+IPTABLES_BATCH_COMMANDS = ['iptables', '/sbin/iptables']
+IPTABLES_BATCH_OPS = ['-A', '-D', '-I']
+SHELL_CHARS = set('|&;<>()$`\\"\'*?[]#~{}!\n')
+
+
+def get_batch_type(cmd_line):
+    """
+    Check whether a command can be folded into an 'ip -batch' run (a
+    mutating ip command with no global options) or an 'iptables-restore'
+    run (adding, inserting or deleting a rule).
+    :type cmd_line: str
+    :return: str 'ip', 'iptables' or None
+    """
+    if SHELL_CHARS.intersection(cmd_line):
+        return None
+    tokens = cmd_line.split()
+    if (len(tokens) > 2 and tokens[0] in IP_BATCH_COMMANDS and
+            not tokens[1].startswith('-') and tokens[1] != 'netns' and
+            tokens[2] in IP_BATCH_VERBS):
+        return 'ip'
+    if (len(tokens) > 2 and tokens[0] in IPTABLES_BATCH_COMMANDS and
+            parse_iptables_rule(tokens)[1].split()[0] in IPTABLES_BATCH_OPS):
+        return 'iptables'
+    return None
+
+
+def parse_iptables_rule(tokens):
+    """
+    Split an iptables command into its table and rule.
+    :type tokens: list[str]
+    :return: (str, str) Table and the rule (without the -t option)
+    """
+    table = 'filter'
+    rule = []
+    i = 1
+    while i < len(tokens):
+        if tokens[i] in ['-t', '--table'] and i + 1 < len(tokens):
+            table = tokens[i + 1]
+            i += 2
+            continue
+        rule.append(tokens[i])
+        i += 1
+    return table, ' '.join(rule) if len(rule) > 0 else '-'
+
 
 def terminate_process(process):
     """
@@ -62,6 +128,115 @@ def terminate_process(process):
     return None
 
 
+def kill_process_group(process, grace=3):
+    """
+    Send SIGTERM to a process's group (commands are started with setsid,
+    so this includes everything they started), and SIGKILL if the process
+    hasn't exited within grace seconds.  The process is reaped if it exits.
+    :type process: subprocess.Popen
+    :type grace: float
+    """
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        if process.poll() is not None:
+            return
+        try:
+            os.killpg(process.pid, sig)
+        except OSError:
+            # Already gone (or not ours to signal)
+            return
+        deadline = time.time() + grace
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.01)
+
+
+class OutputCollector(object):
+    """
+    Collects a command's output as it is read, handing each line to a
+    callback and/or writing it to a tee file as it arrives.  At most
+    max_bytes of the output (the most recent) are kept in memory, so very
+    large outputs can be streamed without holding all of it.  With
+    keep_output set to False, none of it is kept (only counted as dropped).
+    """
+    def __init__(self, max_bytes=0, tee_file=None, callback=None,
+                 keep_output=True):
+        """
+        :type max_bytes: int Maximum bytes to keep (0 for no limit)
+        :type tee_file: str|file File name or object to copy output to
+        :type callback: callable Called with each line of output
+        :type keep_output: bool Keep the output in memory at all
+        """
+        self.max_bytes = max_bytes
+        self.keep_output = keep_output
+        self.callback = callback
+        self.chunks = collections.deque()
+        """ :type: collections.deque[str] """
+        self.kept_bytes = 0
+        self.dropped_bytes = 0
+        self.tee = None
+        """ :type: file """
+        self.close_tee = False
+        if isinstance(tee_file, basestring):
+            self.tee = open(tee_file, 'w')
+            self.close_tee = True
+        elif tee_file is not None:
+            self.tee = tee_file
+
+    def add(self, line):
+        """
+        :type line: str
+        """
+        if self.tee is not None:
+            self.tee.write(line)
+        if self.callback is not None:
+            self.callback(line)
+        if not self.keep_output:
+            self.dropped_bytes += len(line)
+            return
+        self.chunks.append(line)
+        self.kept_bytes += len(line)
+        while self.max_bytes != 0 and self.kept_bytes > self.max_bytes:
+            extra = self.kept_bytes - self.max_bytes
+            old = self.chunks.popleft()
+            if len(old) > extra:
+                # Keep the end of a partly dropped line
+                self.chunks.appendleft(old[extra:])
+                old = old[:extra]
+            self.kept_bytes -= len(old)
+            self.dropped_bytes += len(old)
+
+    def read_lines(self, stream):
+        """
+        Read the stream until EOF, collecting each line, and yield them.
+        :type stream: file
+        :return: collections.Iterable[str]
+        """
+        for line in iter(stream.readline, b''):
+            self.add(line)
+            yield line
+        stream.close()
+
+    def read_all(self, stream):
+        """
+        :type stream: file
+        """
+        for _ in self.read_lines(stream):
+            pass
+
+    def close(self):
+        if self.tee is not None:
+            if self.close_tee:
+                self.tee.close()
+            else:
+                self.tee.flush()
+            self.tee = None
+
+    def get_output(self):
+        """
+        :return: str The kept output
+        """
+        return ''.join(self.chunks)
+
+
 class CommandStatus(object):
     def __init__(self, process=None, command='', ret_code=0, stdout='',
                  stderr='', process_array=None):
@@ -82,9 +257,14 @@ class CommandStatus(object):
         self.stderr = stderr
         self.process_array = process_array
         """ :type: list[subprocess.Popen]"""
+        self.stdout_dropped = 0
+        """ :type: int Bytes of stdout not kept, when streaming"""
+        self.stderr_dropped = 0
+        """ :type: int"""
 
     def __repr__(self):
-        return 'PID: ' + str(self.process.pid) + '\n' + \
+        return 'PID: ' + (str(self.process.pid) if self.process is not None
+                          else '') + '\n' + \
                'RETCODE: ' + str(self.ret_code) + '\n' + \
                'CMD: ' + self.command + '\n' + \
                'STDOUT: [' + self.stdout + ']' + '\n' + \
@@ -132,7 +312,8 @@ class LinuxCLI(object):
     def cmd_pipe(self, commands, timeout=None, blocking=True, verify=False,
                  stdin=subprocess.PIPE,
                  stdout=subprocess.PIPE,
-                 stderr=subprocess.PIPE):
+                 stderr=subprocess.PIPE,
+                 line_callback=None, tee_file=None, max_output=0):
         """
         Execute piped commands on the system without a shell.  The exact
         command will be transformed based on the timeout parameter and whether
@@ -146,13 +327,17 @@ class LinuxCLI(object):
         :param stdin: int File descriptor for std in (PIPE by default)
         :param stdout: int File descriptor for std in (PIPE by default)
         :param stderr: int File descriptor for std in (PIPE by default)
+        :param line_callback: callable Stream the output, see cmd
+        :param tee_file: str|file Stream the output, see cmd
+        :param max_output: int Stream the output, see cmd
         :return: zephyr.common.cli.CommandStatus
         """
         ret = CommandStatus()
         if len(commands) == 0:
             return ret
 
-        cmd_array = [(['timeout'] if timeout else []) +
+        timeout_prefix = ['timeout', str(timeout)] if timeout else []
+        cmd_array = [timeout_prefix +
                      self.priv_prefix().split() + self.cmd_prefix().split() +
                      commands[0]]
 
@@ -170,6 +355,20 @@ class LinuxCLI(object):
         if self.debug is True:
             return CommandStatus(command=cmd_str)
 
+        start_time = time.time()
+
+        streaming = (line_callback is not None or tee_file is not None or
+                     max_output != 0)
+        if (blocking is True and not streaming and
+                stdin == subprocess.PIPE and
+                stdout == subprocess.PIPE and stderr == subprocess.PIPE):
+            result = self.run_in_executor(
+                [timeout_prefix + commands[0]] + commands[1:], shell=False,
+                timeout=timeout)
+            if result is not None:
+                return self.process_result(cmd_str, timeout, verify,
+                                           *result, start_time=start_time)
+
         processes = []
         """ :type: list[subprocess.Popen]"""
 
@@ -195,42 +394,35 @@ class LinuxCLI(object):
             return CommandStatus(process=p, command=cmd_str,
                                  process_array=processes)
 
-        stdout, stderr = p.communicate()
-
-        # 'timeout' returns 124 on timeout
-        if p.returncode == 124 and timeout is not None:
-            raise SubprocessTimeoutException('Process timed out: ' + cmd_str)
-
-        out = ''
-        for line in stdout:
-            out += line
-
-        err = ''
-        for line in stderr:
-            err += line
-
-        if verify and p.returncode != 0:
-            raise SubprocessFailedException(
-                'Command: [' + str(cmd_str) + '] returned error: ' +
-                str(p.returncode) + ', output was stdout[' +
-                str(out) + ']/stderr[' + str(err) + ']')
-
-        if self.print_cmd_out:
-            print("stdout: " + str(out) + "/stderr: " + str(err))
-
-        return CommandStatus(process=p, command=cmd_str,
-                             ret_code=p.returncode,
-                             stdout=out, stderr=err,
-                             process_array=processes)
+        if streaming:
+            ret = self.stream_result(p, cmd_str, timeout, verify,
+                                     line_callback, tee_file, max_output,
+                                     start_time)
+        else:
+            stdout, stderr = p.communicate()
+            ret = self.process_result(cmd_str, timeout, verify,
+                                      p.returncode, stdout, stderr,
+                                      start_time)
+        ret.process = p
+        ret.process_array = processes
+        return ret
 
     def cmd(self, cmd_line, timeout=None, blocking=True,
             verify=False,
             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE):
+            stderr=subprocess.PIPE,
+            line_callback=None, tee_file=None, max_output=0):
         """
         Execute a shell command on the system.  The exact command will be
         transformed based on the timeout parameter and whether or not the
         command is being run against an IP net namespace.
+
+        By default, the whole output is read at once.  If a line callback,
+        tee file or maximum output size is given, the output is streamed
+        instead: each line is passed to the callback and copied to the tee
+        file as it is read, and only the last max_output bytes of stdout
+        and stderr are kept in the CommandStatus (with the number of bytes
+        dropped in stdout_dropped and stderr_dropped).
         :param cmd_line: str The base command to run
         :param timeout: int Timeout value, None for no timeout
         :param blocking: bool Block on this command or return the
@@ -239,6 +431,9 @@ class LinuxCLI(object):
         :param stdin: int File descriptor for std in (PIPE by default)
         :param stdout: int File descriptor for std in (PIPE by default)
         :param stderr: int File descriptor for std in (PIPE by default)
+        :param line_callback: callable Called with each line of stdout
+        :param tee_file: str|file File name or object to copy stdout to
+        :param max_output: int Bytes of output to keep (0 for no limit)
         :return: zephyr.common.cli.CommandStatus
         """
         cmd = (('timeout ' + str(timeout) + ' ' if timeout is not None
@@ -254,49 +449,434 @@ class LinuxCLI(object):
         if self.debug is True:
             return CommandStatus(command=cmd)
 
+        start_time = time.time()
+
+        streaming = (line_callback is not None or tee_file is not None or
+                     max_output != 0)
+        if (blocking is True and not streaming and
+                stdin == subprocess.PIPE and
+                stdout == subprocess.PIPE and stderr == subprocess.PIPE):
+            result = self.run_in_executor(
+                ('timeout ' + str(timeout) + ' ' if timeout is not None
+                 else '') + cmd_line, shell=True, timeout=timeout)
+            if result is not None:
+                return self.process_result(cmd, timeout, verify, *result,
+                                           start_time=start_time)
+
         p = subprocess.Popen(cmd, shell=True,
                              stdin=stdin, stdout=stdout, stderr=stderr,
                              env=self.env_map, preexec_fn=os.setsid)
         if blocking is False:
             return CommandStatus(process=p, command=cmd)
 
-        o, e = p.communicate()
+        if streaming:
+            ret = self.stream_result(p, cmd, timeout, verify, line_callback,
+                                     tee_file, max_output, start_time)
+        else:
+            o, e = p.communicate()
+            ret = self.process_result(cmd, timeout, verify, p.returncode,
+                                      o, e, start_time)
+        ret.process = p
+        return ret
 
-        # 'timeout' returns 124 on timeout
-        if p.returncode == 124 and timeout is not None:
-            raise SubprocessTimeoutException('Process timed out: ' + cmd)
+    def cmd_lines(self, cmd_line, timeout=None, verify=False, tee_file=None,
+                  max_output=0):
+        """
+        Run a shell command, and iterate over its output lines as they are
+        produced.  If verify is set, SubprocessFailedException is raised
+        at the end if the command failed.
+        :type cmd_line: str
+        :type timeout: int
+        :type verify: bool
+        :type tee_file: str|file
+        :type max_output: int Bytes of stderr to keep for the error
+        :return: collections.Iterable[str]
+        """
+        start_time = time.time()
+        status = self.cmd(cmd_line, timeout=timeout, blocking=False)
+        p = status.process
+        if p is None:
+            return
+        # The lines are handed to the caller, so none need keeping
+        out = OutputCollector(tee_file=tee_file, keep_output=False)
+        err = OutputCollector(max_bytes=max_output)
+        err_thread = threading.Thread(target=err.read_all, args=(p.stderr,))
+        err_thread.daemon = True
+        err_thread.start()
+        try:
+            for line in out.read_lines(p.stdout):
+                yield line
+        finally:
+            out.close()
+            if p.poll() is None and not p.stdout.closed:
+                # Stopped early, so don't wait for the rest of the output.
+                # The stderr thread is still reading, so the process is
+                # killed directly rather than with status.terminate(),
+                # which would read the output itself.
+                kill_process_group(p)
+            err_thread.join()
+            p.wait()
+            p.stdout.close()
+        self.process_result(status.command, timeout, verify, p.returncode,
+                            '', err.get_output(), start_time)
+
+    def stream_result(self, p, cmd, timeout, verify, line_callback=None,
+                      tee_file=None, max_output=0, start_time=None):
+        """
+        Read a running command's output as a stream (see cmd) until it
+        exits, and package up its result.
+        :type p: subprocess.Popen
+        :type cmd: str
+        :type timeout: int
+        :type verify: bool
+        :type line_callback: callable
+        :type tee_file: str|file
+        :type max_output: int
+        :type start_time: float
+        :return: zephyr.common.cli.CommandStatus
+        """
+        out = OutputCollector(max_bytes=max_output, tee_file=tee_file,
+                              callback=line_callback)
+        err = OutputCollector(max_bytes=max_output)
+        err_thread = None
+        if p.stderr is not None:
+            err_thread = threading.Thread(target=err.read_all,
+                                          args=(p.stderr,))
+            err_thread.daemon = True
+            err_thread.start()
+        try:
+            if p.stdout is not None:
+                out.read_all(p.stdout)
+        finally:
+            out.close()
+            if err_thread is not None:
+                err_thread.join()
+            p.wait()
+        ret = self.process_result(cmd, timeout, verify, p.returncode,
+                                  out.get_output(), err.get_output(),
+                                  start_time)
+        ret.stdout_dropped = out.dropped_bytes
+        ret.stderr_dropped = err.dropped_bytes
+        return ret
 
-        out = ''
-        for line in o if o else []:
-            out += line
+    def process_result(self, cmd, timeout, verify, ret_code, o, e,
+                       start_time=None):
+        """
+        Check a finished command's result, and package it up.
+        :type cmd: str
+        :type timeout: int
+        :type verify: bool
+        :type ret_code: int
+        :type o: str
+        :type e: str
+        :type start_time: float When the command was started (for tracing)
+        :return: zephyr.common.cli.CommandStatus
+        """
+        out = ''.join(o) if o else ''
+        err = ''.join(e) if e else ''
 
-        err = ''
-        for line in e if e else []:
-            err += line
+        if start_time is not None and CommandTracer.enabled:
+            CommandTracer.record(cmd, self.netns_name(),
+                                 time.time() - start_time, ret_code,
+                                 len(out) + len(err))
+
+        # 'timeout' returns 124 on timeout
+        if ret_code == 124 and timeout is not None:
+            raise SubprocessTimeoutException('Process timed out: ' + cmd)
 
-        if verify and p.returncode != 0:
+        if verify and ret_code != 0:
             raise SubprocessFailedException(
                 'Command: [' + str(cmd) + '] returned error: ' +
-                str(p.returncode) + ', output was stdout[' +
+                str(ret_code) + ', output was stdout[' +
                 str(out) + ']/stderr[' + str(err) + ']')
 
         if self.print_cmd_out:
             print("stdout: " + str(out) + "/stderr: " + str(err))
 
-        return CommandStatus(process=p, command=cmd, ret_code=p.returncode,
+        return CommandStatus(command=cmd, ret_code=ret_code,
                              stdout=out, stderr=err)
 
+    def run_in_executor(self, commands, shell=True, timeout=None):
+        """
+        Run a blocking command through a persistent command executor, if
+        this CLI has one (see NetNSCLI), or through the privileged broker
+        instead of sudo, if one was started (see priv_broker).
+        :type commands: str|list[list[str]]
+        :type shell: bool
+        :type timeout: int The command's timeout (already applied with a
+        'timeout' prefix), None for no timeout
+        :return: (int, str, str) Return code, stdout and stderr, or None if
+        the command must be run directly instead
+        """
+        if self.priv_prefix() == '':
+            return None
+        broker = PrivBroker.get_broker()
+        if broker is None:
+            return None
+        if shell:
+            commands = self.cmd_prefix() + commands
+        else:
+            commands = [self.cmd_prefix().split() + c for c in commands]
+        return broker.run(commands, shell=shell, env=self.env_map)
+
+    def cmd_batch(self, commands, stop_on_error=True, timeout=None):
+        """
+        Run a list of shell command lines with as few processes as
+        possible.  Runs of mutating 'ip' commands are folded into one
+        'ip -batch', runs of iptables rule changes into one
+        'iptables-restore --noflush' (falling back to the individual
+        commands if the restore fails, as it is all-or-nothing), and the
+        other commands are run together in one shell.
+        :type commands: list[str]
+        :type stop_on_error: bool Stop at the first failed command (else
+        run every command regardless)
+        :type timeout: int Timeout for each group of commands
+        :return: list[CommandStatus] One result per command that was run,
+        in order (with stop_on_error, the last one is the failure)
+        """
+        if self.debug is True:
+            return [self.cmd(c, timeout=timeout) for c in commands]
+
+        # Only group commands where more than one in a row can be folded
+        types = [get_batch_type(c) for c in commands]
+        for i, batch_type in enumerate(types):
+            if (batch_type is not None and
+                    (i == 0 or types[i - 1] != batch_type) and
+                    (i == len(types) - 1 or types[i + 1] != batch_type)):
+                types[i] = None
+
+        results = []
+        i = 0
+        while i < len(commands):
+            j = i + 1
+            while j < len(commands) and types[j] == types[i]:
+                j += 1
+            group = commands[i:j]
+            if types[i] == 'ip':
+                group_results = self.cmd_ip_batch(group, stop_on_error,
+                                                  timeout)
+            elif types[i] == 'iptables':
+                group_results = self.cmd_iptables_batch(group, stop_on_error,
+                                                        timeout)
+            else:
+                group_results = self.cmd_shell_batch(group, stop_on_error,
+                                                     timeout)
+            results += group_results
+            if stop_on_error and any(r.ret_code != 0 for r in group_results):
+                break
+            i = j
+        return results
+
+    def cmd_ip_batch(self, commands, stop_on_error=True, timeout=None):
+        """
+        Run ip commands with a single 'ip -batch' (see cmd_batch).
+        :type commands: list[str]
+        :type stop_on_error: bool
+        :type timeout: int
+        :return: list[CommandStatus]
+        """
+        batch_dir = tempfile.mkdtemp(prefix='zephyr-batch-')
+        try:
+            batch_file = os.path.join(batch_dir, 'ip.batch')
+            with open(batch_file, 'w') as f:
+                f.write(''.join(c.split(None, 1)[1] + '\n' for c in commands))
+            ret = self.cmd('ip ' + ('' if stop_on_error else '-force ') +
+                           '-batch ' + batch_file, timeout=timeout)
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+        # ip reports errors as the error output followed by
+        # 'Command failed <file>:<line>'
+        errors = {}
+        error_lines = []
+        for line in ret.stderr.splitlines():
+            failed = re.match('Command failed .*:(\\d+)$', line)
+            if failed is not None:
+                errors[int(failed.group(1))] = ''.join(
+                    l + '\n' for l in error_lines)
+                error_lines = []
+            else:
+                error_lines.append(line)
+        if ret.ret_code != 0 and len(errors) == 0:
+            return self.cmd_shell_batch(commands, stop_on_error, timeout)
+
+        results = []
+        for line_num, cmd_line in enumerate(commands, 1):
+            if line_num in errors:
+                results.append(CommandStatus(command=cmd_line,
+                                             ret_code=ret.ret_code,
+                                             stderr=errors[line_num]))
+                if stop_on_error:
+                    break
+            else:
+                results.append(CommandStatus(command=cmd_line))
+        return results
+
+    def cmd_iptables_batch(self, commands, stop_on_error=True,
+                           timeout=None):
+        """
+        Apply iptables rule changes with a single
+        'iptables-restore --noflush' (see cmd_batch).
+        :type commands: list[str]
+        :type stop_on_error: bool
+        :type timeout: int
+        :return: list[CommandStatus]
+        """
+        tables = {}
+        table_order = []
+        for cmd_line in commands:
+            table, rule = parse_iptables_rule(cmd_line.split())
+            if table not in tables:
+                tables[table] = []
+                table_order.append(table)
+            tables[table].append(rule)
+
+        batch_dir = tempfile.mkdtemp(prefix='zephyr-batch-')
+        try:
+            batch_file = os.path.join(batch_dir, 'iptables.batch')
+            with open(batch_file, 'w') as f:
+                for table in table_order:
+                    f.write('*' + table + '\n' +
+                            ''.join(r + '\n' for r in tables[table]) +
+                            'COMMIT\n')
+            ret = self.cmd('iptables-restore --noflush ' + batch_file,
+                           timeout=timeout)
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+        if ret.ret_code != 0:
+            # Nothing was applied, so find out which command(s) failed
+            return self.cmd_shell_batch(commands, stop_on_error, timeout)
+        return [CommandStatus(command=c) for c in commands]
+
+    def cmd_shell_batch(self, commands, stop_on_error=True, timeout=None):
+        """
+        Run commands together in one shell, capturing each one's output and
+        return code separately (see cmd_batch).
+        :type commands: list[str]
+        :type stop_on_error: bool
+        :type timeout: int
+        :return: list[CommandStatus]
+        """
+        if len(commands) == 1:
+            ret = self.cmd(commands[0], timeout=timeout)
+            return [CommandStatus(command=commands[0], ret_code=ret.ret_code,
+                                  stdout=ret.stdout, stderr=ret.stderr)]
+
+        batch_dir = tempfile.mkdtemp(prefix='zephyr-batch-')
+        try:
+            script_file = os.path.join(batch_dir, 'batch.sh')
+            with open(script_file, 'w') as f:
+                for num, cmd_line in enumerate(commands):
+                    out_file = os.path.join(batch_dir, str(num))
+                    f.write('( ' + cmd_line + '\n) > ' + out_file +
+                            '.out 2> ' + out_file + '.err < /dev/null\n' +
+                            'rc=$?; echo $rc > ' + out_file + '.rc\n')
+                    if stop_on_error:
+                        f.write('[ $rc -eq 0 ] || exit 0\n')
+            self.cmd('sh ' + pipes.quote(script_file), timeout=timeout)
+
+            results = []
+            for num, cmd_line in enumerate(commands):
+                out_file = os.path.join(batch_dir, str(num))
+                if not os.path.exists(out_file + '.rc'):
+                    break
+                results.append(CommandStatus(
+                    command=cmd_line,
+                    ret_code=int(self.read_from_file(out_file + '.rc')),
+                    stdout=self.read_from_file(out_file + '.out'),
+                    stderr=self.read_from_file(out_file + '.err')))
+            return results
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
     def cmd_prefix(self):
         return ''
 
+    def netns_name(self):
+        """
+        :return: str The network namespace commands run in (None for the
+        current namespace)
+        """
+        return None
+
+    def netlink(self):
+        """
+        Get a netlink socket for this CLI's network namespace, to use in
+        place of running 'ip' commands.
+        :return: NetlinkSocket, or None if netlink can't be used (dry runs,
+        or without root privileges), in which case the 'ip' commands should
+        be run instead
+        """
+        if self.debug is True or os.geteuid() != 0:
+            return None
+        try:
+            return NetlinkSocket.get_socket(self.netns_name())
+        except SubprocessFailedException:
+            return None
+
     def priv_prefix(self):
-        return 'sudo -E ' if self.priv else ''
+        # Already root (e.g. in ptm-host-ctl.py), so sudo would only add
+        # its start-up cost
+        return 'sudo -E ' if self.priv and os.geteuid() != 0 else ''
 
     @staticmethod
     def oscmd(*args, **kwargs):
         return LinuxCLI().cmd(*args, **kwargs).stdout
 
+    def run_file_op(self, path_args, func, *args):
+        """
+        Run a file operation in-process (see file_ops), if this CLI can.
+        :type path_args: list[str] Paths the operation touches
+        :type func: callable
+        :return: T The operation's result, or None if the command has to
+        be run instead (because it needs the shell, or more privileges)
+        """
+        if not self.can_run_in_process(path_args):
+            return None
+        try:
+            ret = func(*args)
+        except EnvironmentError:
+            return None
+        if ret is False:
+            return None
+        return ret
+
+    def can_run_in_process(self, path_args):
+        """
+        :type path_args: list[str]
+        :return: bool True if operations on the paths can be done in this
+        process, rather than by running a command
+        """
+        return self.debug is not True
+
+    def file_cmd(self, cmd_line):
+        """
+        Run a file command which couldn't be done in-process.  Commands
+        which need root go through a persistent privileged helper, rather
+        than a new sudo process each time.
+        :type cmd_line: str
+        :return: zephyr.common.cli.CommandStatus
+        """
+        if (self.priv and self.debug is not True and os.geteuid() != 0 and
+                self.netns_name() is None):
+            start_time = time.time()
+            try:
+                result = NetNSExecutor.get_executor(None, True).run(
+                    cmd_line, env=self.env_map)
+            except (ObjectNotFoundException, SubprocessFailedException):
+                result = None
+            if result is not None:
+                return self.process_result(
+                    self.priv_prefix() + cmd_line, None, False, *result,
+                    start_time=start_time)
+        return self.cmd(cmd_line)
+
     def grep_file(self, gfile, grep, options=''):
+        found = self.run_file_op([gfile], file_ops.grep_file, gfile,
+                                 grep, options)
+        if found is not None:
+            return found
         if self.cmd('grep -q ' + options + ' "' +
                     grep + '" ' + gfile).ret_code == 0:
             return True
@@ -318,49 +898,80 @@ class LinuxCLI(object):
             return int(self.cmd(cmd_line + '| grep -c "' + grep + '"').stdout)
 
     def mkdir(self, dir_name):
-        return self.cmd('mkdir -p ' + dir_name).stdout
+        if self.run_file_op([dir_name], file_ops.make_dirs, dir_name):
+            return ''
+        return self.file_cmd('mkdir -p ' + dir_name).stdout
 
     def chown(self, file_name, user_name, group_name):
-        return self.cmd('chown -R ' + user_name + '.' + group_name + ' ' +
-                        file_name).stdout
+        if self.run_file_op([file_name], file_ops.chown, file_name,
+                            user_name, group_name):
+            return ''
+        return self.file_cmd('chown -R ' + user_name + '.' + group_name +
+                             ' ' + file_name).stdout
 
     def regex_file(self, rfile, regex):
-        return self.cmd('sed -e "' + regex + '" -i ' + rfile).stdout
+        if self.run_file_op([rfile], file_ops.sed_file, rfile, regex):
+            return ''
+        return self.file_cmd('sed -e "' + regex + '" -i ' + rfile).stdout
 
     def regex_file_multi(self, rfile, *args):
         sed_str = ''.join(['-e "' + str(i) + '" ' for i in args])
         return self.cmd('sed ' + sed_str + ' -i ' + rfile).stdout
 
-    def get_running_pids(self):
+    def get_running_pids(self, max_age=0):
         """
         Gets all running processes' PIDS as a list
+        :type max_age: float Reuse a process table snapshot taken up to
+        this many seconds ago (0 always reads /proc)
         :return: list[str]
         """
-        return [i.strip()
-                for i in self.cmd(
-                "ps -aef | grep -v grep | awk '{print $2}'").stdout.split()]
+        return [p.pid
+                for p in process_table.ProcessTable.get_processes(max_age)]
 
-    def get_process_pids(self, process_name):
+    def get_process_pids(self, process_name, max_age=0):
         """
-        Gets all running processes' PIDS which match the process name as a list
+        Gets all running processes' PIDS which match the process name as a
+        list.  As with grepping 'ps -aef', the name is a regular expression
+        matched against the user, PID, PPID and command line.
+        :type process_name: str
+        :type max_age: float
         :return: list[str]
         """
-        awk_cmd = r'{printf "%s\n", $2}'
-        return [i.strip() for i in
-                self.cmd("ps -aef | grep -v grep | grep " + process_name +
-                         r" | awk '" + awk_cmd + r"'").stdout.split()]
-
-    def get_parent_pids(self, child_pid):
+        try:
+            pattern = re.compile(process_name)
+        except re.error:
+            pattern = re.compile(re.escape(process_name))
+        return [p.pid
+                for p in process_table.ProcessTable.get_processes(max_age)
+                if pattern.search(p.ps_line())]
+
+    def get_parent_pids(self, child_pid, max_age=0):
         """
-        Gets all running processes' PIDS which match the process name as a list
+        Gets the PIDS of all running processes whose parent is the given
+        PID as a list
+        :type child_pid: str|int
+        :type max_age: float
         :return: list[str]
         """
-        return [i.strip() for i in
-                self.cmd("ps -aef | grep -v grep | awk '{ if ($3==" +
-                         str(child_pid) + ") print $2 }'").stdout.split()]
+        return [p.pid
+                for p in process_table.ProcessTable.get_processes(max_age)
+                if p.ppid == str(child_pid).strip()]
 
     def is_pid_running(self, pid):
-        return str(pid) in self.get_running_pids()
+        """
+        :type pid: str|int
+        :return: bool True if the process exists and has not exited
+        """
+        return process_table.is_pid_running(pid)
+
+    def wait_for_pid_exit(self, pid, timeout=None):
+        """
+        Wait for the process to exit, raising SubprocessTimeoutException
+        if it is still running after timeout seconds.
+        :type pid: str|int
+        :type timeout: float
+        """
+        process_table.wait_for_pid_exit(pid, timeout)
 
     def replace_text_in_file(self, rfile, search_str, replace_str,
                              line_global_replace=False):
@@ -391,16 +1002,25 @@ class LinuxCLI(object):
         return self.cmd(sed_str).stdout
 
     def copy_dir(self, old_dir, new_dir):
-        return self.cmd('cp -RL --preserve=all ' + old_dir + ' ' +
-                        new_dir).stdout
+        if self.run_file_op([old_dir, new_dir], file_ops.copy_tree,
+                            old_dir, new_dir):
+            return ''
+        return self.file_cmd('cp -RL --preserve=all ' + old_dir + ' ' +
+                             new_dir).stdout
 
     def copy_file(self, old_file, new_file):
         tdir = os.path.dirname(new_file)
         if tdir != '' and tdir != '.' and not self.exists(tdir):
             self.mkdir(tdir)
-        return self.cmd('cp ' + old_file + ' ' + new_file).stdout
+        if self.run_file_op([old_file, new_file], file_ops.copy_file,
+                            old_file, new_file):
+            return ''
+        return self.file_cmd('cp ' + old_file + ' ' + new_file).stdout
 
     def move(self, old_file, new_file):
+        if self.run_file_op([old_file, new_file], file_ops.move,
+                            old_file, new_file):
+            return
         self.copy_dir(old_file, new_file)
         self.rm(old_file)
 
@@ -410,6 +1030,10 @@ class LinuxCLI(object):
         return file_ptr.read()
 
     def cat(self, file_path):
+        data = self.run_file_op([file_path], file_ops.read_file,
+                                file_path)
+        if data is not None:
+            return data
         return self.cmd('cat ' + file_path).stdout
 
     @staticmethod
@@ -422,7 +1046,11 @@ class LinuxCLI(object):
     def wc(self, wfile):
         if not self.exists(wfile):
             raise ObjectNotFoundException('File not found: ' + wfile)
-        line = map(int, self.cmd("wc " + wfile).stdout.split()[0:3])
+        counts = self.run_file_op([wfile], file_ops.count_file,
+                                  wfile)
+        if counts is not None:
+            return counts
+        line = map(int, self.file_cmd("wc " + wfile).stdout.split()[0:3])
         return dict(zip(['lines', 'words', 'chars'], line))
 
     def write_to_file(self, wfile, data, append=False):
@@ -452,15 +1080,20 @@ class LinuxCLI(object):
             raise ArgMismatchException(
                 'Not allowed to remove ' + old_file +
                 ' as it is listed as a vital system directory')
-        return self.cmd('rm -rf ' + old_file).stdout
+        if self.run_file_op([old_file], file_ops.remove, old_file):
+            return ''
+        return self.file_cmd('rm -rf ' + old_file).stdout
 
     def rm_files(self, root_dir, match_pattern=''):
+        if self.run_file_op([root_dir], file_ops.remove_files,
+                            root_dir, match_pattern):
+            return ''
         if match_pattern == '':
-            return self.cmd(
+            return self.file_cmd(
                 r'find ' + root_dir +
                 r' -type f -exec sudo rm -f {} \; || true').stdout
         else:
-            return self.cmd(
+            return self.file_cmd(
                 r'find ' + root_dir +
                 r' -name ' + match_pattern +
                 r' -exec sudo rm -f {} \; || true').stdout
@@ -525,10 +1158,52 @@ class LinuxCLI(object):
 
 class NetNSCLI(LinuxCLI):
     def __init__(self, name, priv=True, debug=(DEBUG >= 2),
-                 log_cmd=(DEBUG >= 2), logger=None):
+                 log_cmd=(DEBUG >= 2), logger=None, use_executor=True):
         super(NetNSCLI, self).__init__(priv, debug=debug,
                                        log_cmd=log_cmd, logger=logger)
         self.name = name
+        self.use_executor = use_executor
+        """ :type: bool"""
 
     def cmd_prefix(self):
         return 'ip netns exec ' + self.name + ' '
+
+    def netns_name(self):
+        return self.name
+
+    def can_run_in_process(self, path_args):
+        """
+        Commands run with 'ip netns exec' see the namespace's own /sys and
+        /proc/net, and any files in /etc/netns/<name> bind-mounted over
+        /etc, so those paths can only be accessed through a command.
+        """
+        if not super(NetNSCLI, self).can_run_in_process(path_args):
+            return False
+        netns_dirs = ['/sys', '/proc'] + (
+            ['/etc'] if os.path.isdir('/etc/netns/' + self.name) else [])
+        for path in (os.path.abspath(os.path.expanduser(p))
+                     for a in path_args for p in a.split()):
+            if any(path == d or path.startswith(d + '/')
+                   for d in netns_dirs):
+                return False
+        return True
+
+    def run_in_executor(self, commands, shell=True, timeout=None):
+        """
+        Run the command through the namespace's persistent executor
+        (rather than a new sudo + 'ip netns exec' process), falling back
+        to the privileged broker, or to running it directly, if the
+        executor is busy or can't be used.
+        """
+        if self.use_executor is not True:
+            return super(NetNSCLI, self).run_in_executor(commands, shell,
+                                                         timeout)
+        try:
+            result = NetNSExecutor.get_executor(self.name, self.priv).run(
+                commands, shell=shell, env=self.env_map, timeout=timeout)
+        except (ObjectNotFoundException, SubprocessFailedException):
+            result = None
+        if result is None:
+            result = super(NetNSCLI, self).run_in_executor(commands, shell,
+                                                           timeout)
+        return result
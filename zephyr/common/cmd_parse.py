@@ -0,0 +1,63 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import shlex
+
+# 'ip' objects, by every abbreviation ip accepts for them
+IP_OBJECTS = {'l': 'link', 'li': 'link', 'lin': 'link', 'link': 'link',
+              'a': 'addr', 'ad': 'addr', 'add': 'addr', 'addr': 'addr',
+              'addre': 'addr', 'addres': 'addr', 'address': 'addr',
+              'r': 'route', 'ro': 'route', 'rou': 'route', 'rout': 'route',
+              'route': 'route',
+              'n': 'neigh', 'ne': 'neigh', 'nei': 'neigh', 'neig': 'neigh',
+              'neigh': 'neigh', 'neighbor': 'neigh', 'neighbour': 'neigh',
+              'netns': 'netns'}
+# Operators between the simple commands of a command line, and output
+# redirects (with the '&' of a descriptor duplication, and the file)
+COMMAND_SEPARATORS = re.compile(r'\|\|?|&&|;|\n')
+REDIRECTS = re.compile(r'[0-9&]?>>?(&?)\s*([^\s|;&]*)')
+
+
+def split_command(cmd_line, netns=None):
+    """
+    Split a shell command line into the argument lists of its simple
+    commands, along with the namespace each one runs in (best effort, this
+    is not a full shell parser).
+    :type cmd_line: str
+    :type netns: str
+    :return: list[(str, list[str])]
+    """
+    commands = []
+    for part in COMMAND_SEPARATORS.split(REDIRECTS.sub('', cmd_line)):
+        try:
+            args = shlex.split(part)
+        except ValueError:
+            args = part.split()
+        cmd_netns = netns
+        # Skip over wrappers which run the rest of the line as a command
+        while True:
+            if len(args) > 0 and args[0] in ('sudo', 'timeout', 'nohup'):
+                args = args[1:]
+                while len(args) > 0 and (args[0].startswith('-') or
+                                         args[0].replace('.', '').isdigit()):
+                    args = args[1:]
+            elif args[0:3] == ['ip', 'netns', 'exec'] and len(args) > 3:
+                cmd_netns = args[3]
+                args = args[4:]
+            else:
+                break
+        if len(args) > 0:
+            commands.append((cmd_netns, args))
+    return commands
@@ -0,0 +1,197 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import os
+import threading
+from zephyr.common.cmd_parse import IP_OBJECTS
+from zephyr.common.cmd_parse import split_command
+
+# Upper bounds (in seconds) of the latency histogram buckets, with a last
+# bucket for anything slower
+TRACE_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                 1.0, 2.0, 5.0, 10.0, 30.0, 60.0]
+# Commands run outside of any test (e.g. suite set up)
+NO_TEST = '(no test)'
+
+
+def get_command_family(cmd_line):
+    """
+    The kind of command a command line runs, for grouping: the name of
+    the first command (after wrappers like sudo, timeout and 'ip netns
+    exec'), plus the object for 'ip' commands (e.g. 'ip addr').
+    :type cmd_line: str
+    :return: str
+    """
+    commands = split_command(cmd_line)
+    if len(commands) == 0:
+        return ''
+    args = commands[0][1]
+    name = os.path.basename(args[0])
+    if name == 'ip':
+        objs = [a for a in args[1:] if not a.startswith('-')]
+        if len(objs) > 0:
+            return name + ' ' + IP_OBJECTS.get(objs[0], objs[0])
+    return name
+
+
+class CommandStats(object):
+    """
+    Aggregate timings for a group of commands, with a latency histogram.
+    """
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.output_bytes = 0
+        self.buckets = [0] * (len(TRACE_BUCKETS) + 1)
+        """ :type: list[int] """
+        self.namespaces = {}
+        """ :type: dict[str, int] """
+
+    def add(self, netns, duration, ret_code, output_size):
+        """
+        :type netns: str
+        :type duration: float
+        :type ret_code: int
+        :type output_size: int
+        """
+        self.count += 1
+        if ret_code != 0:
+            self.failures += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.output_bytes += output_size
+        self.buckets[bisect.bisect_left(TRACE_BUCKETS, duration)] += 1
+        netns = netns if netns is not None else ''
+        self.namespaces[netns] = self.namespaces.get(netns, 0) + 1
+
+    def merge(self, other):
+        """
+        :type other: CommandStats
+        """
+        self.count += other.count
+        self.failures += other.failures
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.output_bytes += other.output_bytes
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        for netns, count in other.namespaces.items():
+            self.namespaces[netns] = self.namespaces.get(netns, 0) + count
+
+    def to_map(self):
+        """
+        :return: dict
+        """
+        return {'count': self.count,
+                'failures': self.failures,
+                'total_time': self.total_time,
+                'mean_time': (self.total_time / self.count
+                              if self.count > 0 else 0.0),
+                'max_time': self.max_time,
+                'output_bytes': self.output_bytes,
+                'histogram': [{'le': le, 'count': c} for le, c in
+                              zip(TRACE_BUCKETS + ['inf'], self.buckets)],
+                'namespaces': self.namespaces}
+
+
+class CommandTracer(object):
+    """
+    Opt-in tracing of the commands run by the CLIs.  Once enabled, each
+    blocking command's family, namespace, duration, exit code and output
+    size is recorded against the test currently running (set by the
+    TestResult), and can be summed up per test and per suite.
+    """
+    enabled = False
+    suite = None
+    """ :type: str """
+    test = None
+    """ :type: str """
+    stats = {}
+    """ :type: dict[str, dict[str, dict[str, CommandStats]]] """
+    stats_lock = threading.Lock()
+
+    @classmethod
+    def enable(cls, enabled=True):
+        """
+        :type enabled: bool
+        """
+        cls.enabled = enabled
+
+    @classmethod
+    def set_test(cls, suite, test=None):
+        """
+        Record the following commands against the given suite and test.
+        :type suite: str
+        :type test: str
+        """
+        cls.suite = suite
+        cls.test = test
+
+    @classmethod
+    def record(cls, cmd_line, netns, duration, ret_code, output_size):
+        """
+        :type cmd_line: str
+        :type netns: str
+        :type duration: float
+        :type ret_code: int
+        :type output_size: int
+        """
+        if not cls.enabled:
+            return
+        family = get_command_family(cmd_line)
+        with cls.stats_lock:
+            tests = cls.stats.setdefault(cls.suite, {})
+            families = tests.setdefault(
+                cls.test if cls.test is not None else NO_TEST, {})
+            if family not in families:
+                families[family] = CommandStats()
+            families[family].add(netns, duration, ret_code, output_size)
+
+    @classmethod
+    def get_suite_trace(cls, suite):
+        """
+        :type suite: str
+        :return: dict The suite's totals, per command family and overall,
+        and the same for each of its tests (or None if nothing was traced)
+        """
+        with cls.stats_lock:
+            tests = cls.stats.get(suite)
+            if tests is None:
+                return None
+            suite_families = {}
+            suite_all = CommandStats()
+            test_maps = {}
+            for test, families in tests.items():
+                test_all = CommandStats()
+                for family, stats in families.items():
+                    test_all.merge(stats)
+                    if family not in suite_families:
+                        suite_families[family] = CommandStats()
+                    suite_families[family].merge(stats)
+                suite_all.merge(test_all)
+                test_maps[test] = {
+                    'all': test_all.to_map(),
+                    'families': {f: s.to_map()
+                                 for f, s in families.items()}}
+            return {'suite': {'all': suite_all.to_map(),
+                              'families': {f: s.to_map() for f, s in
+                                           suite_families.items()}},
+                    'tests': test_maps}
+
+    @classmethod
+    def clear(cls):
+        with cls.stats_lock:
+            cls.stats.clear()
@@ -12,17 +12,85 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
 import os.path
+import shutil
+import subprocess
 from zephyr.common.cli import LinuxCLI
+from zephyr.common.exceptions import *
+
+# Extensions added to files compressed with each supported compression
+COMPRESSION_EXTS = {'gzip': '.gz', 'zstd': '.zst'}
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def compress_file(src, dest, compression, level=None):
+    """
+    Compress a file into a new file, streaming it in chunks.  gzip is done
+    in-process, zstd with the zstd command.
+    :type src: str
+    :type dest: str
+    :type compression: str One of COMPRESSION_EXTS
+    :type level: int Compression level (the compressor's default if None)
+    """
+    if compression not in COMPRESSION_EXTS:
+        raise ArgMismatchException('Unknown compression: ' +
+                                   str(compression))
+    tmp_dest = dest + '.tmp'
+    if compression == 'gzip':
+        with open(src, 'rb') as in_file:
+            out_file = gzip.open(tmp_dest, 'wb',
+                                 level if level is not None else 6)
+            try:
+                shutil.copyfileobj(in_file, out_file, COPY_CHUNK_SIZE)
+            finally:
+                out_file.close()
+    else:
+        with open(tmp_dest, 'wb') as out_file:
+            try:
+                ret = subprocess.call(
+                    ['zstd', '-q', '-c'] +
+                    (['-' + str(level)] if level is not None else []) +
+                    [src], stdout=out_file)
+            except OSError as e:
+                ret = str(e)
+        if ret != 0:
+            os.remove(tmp_dest)
+            raise SubprocessFailedException(
+                'zstd failed to compress ' + src + ': ' + str(ret))
+    os.rename(tmp_dest, dest)
 
 
 class FileAccessor(object):
     def __init__(self):
         super(FileAccessor, self).__init__()
 
-    def copy_file(self, far_path, far_filename, near_path, near_filename):
-        LinuxCLI(priv=False).copy_file(far_path + '/' + far_filename,
-                                       near_path + '/' + near_filename)
+    def copy_file(self, far_path, far_filename, near_path, near_filename,
+                  compression=None, level=None):
+        """
+        Copy the file, compressing it on the way if compression is set (in
+        which case the copy gets the compression's extension added).
+        """
+        if compression is None:
+            LinuxCLI(priv=False).copy_file(far_path + '/' + far_filename,
+                                           near_path + '/' + near_filename)
+            return
+        if not os.path.isdir(near_path):
+            LinuxCLI(priv=False).mkdir(near_path)
+        compress_file(far_path + '/' + far_filename,
+                      near_path + '/' + near_filename +
+                      COMPRESSION_EXTS[compression], compression, level)
+
+    def get_stat(self, far_path, far_filename):
+        """
+        :return: (int, float) The file's size and mtime, or None if they
+        can't be found
+        """
+        try:
+            st = os.stat(far_path + '/' + far_filename)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
 
     def fetch_file(self, far_path, far_filename):
         cli = LinuxCLI()
@@ -38,7 +106,8 @@ class SSHFileAccessor(FileAccessor):
         self.remote_server = remote_server
         self.remote_username = remote_username
 
-    def copy_file(self, far_path, far_filename, near_path, near_filename):
+    def copy_file(self, far_path, far_filename, near_path, near_filename,
+                  compression=None, level=None):
         # For SSH, we must have an absolute path
         if far_path == '.':
             # If path is current dir, expand with PWD
@@ -57,6 +126,17 @@ class SSHFileAccessor(FileAccessor):
             self.remote_username + '@' +
             self.remote_server + ':' + far_f + ' ' +
             near_f)
+        if compression is not None:
+            # Compress the local copy, rather than needing the compressor
+            # on the remote server
+            compress_file(near_f, near_f + COMPRESSION_EXTS[compression],
+                          compression, level)
+            LinuxCLI(priv=False).rm(near_f)
+
+    def get_stat(self, far_path, far_filename):
+        # Only recorded in the collation manifest (see
+        # LogManager.collate_logs), so not worth an SSH round trip
+        return None
 
     def fetch_file(self, far_path, far_filename):
         self.copy_file(far_path=far_path,
@@ -81,10 +161,16 @@ class FileLocation(object):
         self.filename = os.path.basename(filename)
         self.default_accessor = default_accessor
 
-    def copy_file(self, accessor=None, near_path='.', near_filename=None):
+    def copy_file(self, accessor=None, near_path='.', near_filename=None,
+                  compression=None, level=None):
         near_fn = near_filename if near_filename is not None else self.filename
         curr_acc = accessor if accessor is not None else self.default_accessor
-        curr_acc.copy_file(self.path, self.filename, near_path, near_fn)
+        curr_acc.copy_file(self.path, self.filename, near_path, near_fn,
+                           compression=compression, level=level)
+
+    def get_stat(self, accessor=None):
+        curr_acc = accessor if accessor is not None else self.default_accessor
+        return curr_acc.get_stat(self.path, self.filename)
 
     def fetch_file(self, accessor=None):
         curr_acc = accessor if accessor is not None else self.default_accessor
@@ -0,0 +1,508 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import fnmatch
+import glob
+import grp
+import os
+import pwd
+import re
+import shlex
+import shutil
+import tempfile
+
+# In-process versions of the file commands LinuxCLI used to run (cat, cp,
+# rm, mkdir, chown, wc, grep and sed).  Each function takes its arguments
+# as they would have appeared on the command line, and returns None (or
+# False) if they need a real shell (variables, unsupported options or
+# regex syntax, etc.), so the caller runs the command instead.  Errors are
+# raised as EnvironmentError, so the caller can retry the command with
+# more privileges.
+
+# Characters which need the shell, other than globs and '~'
+SHELL_ONLY_CHARS = set('|&;<>()$`\\"\'#{}!=%\n')
+GLOB_CHARS = set('*?[')
+
+
+def expand_paths(path_arg):
+    """
+    Expand a string of shell arguments into paths, as the shell would
+    (splitting on whitespace, expanding '~' and globs).
+    :type path_arg: str
+    :return: list[str] Or None if it needs a real shell
+    """
+    if SHELL_ONLY_CHARS.intersection(path_arg):
+        return None
+    paths = []
+    for arg in path_arg.split():
+        arg = os.path.expanduser(arg)
+        if GLOB_CHARS.intersection(arg):
+            # As in the shell, a glob with no matches is left as it is
+            paths += sorted(glob.glob(arg)) or [arg]
+        else:
+            paths.append(arg)
+    return paths
+
+
+def expand_path(path_arg):
+    """
+    :type path_arg: str
+    :return: str The single path the argument expands to, or None
+    """
+    paths = expand_paths(path_arg)
+    return paths[0] if paths is not None and len(paths) == 1 else None
+
+
+def unquote_double(text):
+    """
+    :type text: str
+    :return: str The text as the shell passes '"' + text + '"' on to a
+    command, or None if that needs a real shell
+    """
+    if '`' in text or re.search(r'\$[\w{(@*#?$!-]', text):
+        return None
+    try:
+        args = shlex.split('"' + text + '"')
+    except ValueError:
+        return None
+    return args[0] if len(args) == 1 else None
+
+
+def read_file(path_arg):
+    """
+    :type path_arg: str
+    :return: str Contents of the files, concatenated, or None
+    """
+    paths = expand_paths(path_arg)
+    if paths is None:
+        return None
+    data = []
+    for path in paths:
+        with open(path, 'r') as f:
+            data.append(f.read())
+    return ''.join(data)
+
+
+def copy_file(old_arg, new_arg):
+    """
+    Same as 'cp old new'.
+    :type old_arg: str
+    :type new_arg: str
+    :return: bool False if it needs a real shell
+    """
+    old_paths = expand_paths(old_arg)
+    new_path = expand_path(new_arg)
+    if old_paths is None or new_path is None:
+        return False
+    if len(old_paths) > 1 and not os.path.isdir(new_path):
+        return False
+    for old_path in old_paths:
+        shutil.copy(old_path, new_path)
+    return True
+
+
+def copy_tree(old_arg, new_arg):
+    """
+    Same as 'cp -RL --preserve=all old new', except for extended
+    attributes.
+    :type old_arg: str
+    :type new_arg: str
+    :return: bool False if it needs a real shell
+    """
+    old_paths = expand_paths(old_arg)
+    new_path = expand_path(new_arg)
+    if old_paths is None or new_path is None:
+        return False
+    if len(old_paths) > 1 and not os.path.isdir(new_path):
+        return False
+    for old_path in old_paths:
+        target = (os.path.join(new_path, os.path.basename(old_path))
+                  if os.path.isdir(new_path) else new_path)
+        if os.path.isdir(old_path):
+            if os.path.exists(target):
+                # cp merges into an existing tree, which copytree can't
+                return False
+            shutil.copytree(old_path, target, symlinks=False)
+            for root, dirs, files in os.walk(old_path, followlinks=True):
+                for name in [''] + dirs + files:
+                    copy_owner(os.path.join(root, name),
+                               os.path.join(
+                                   target,
+                                   os.path.relpath(root, old_path), name))
+        else:
+            shutil.copy2(old_path, target)
+            copy_owner(old_path, target)
+    return True
+
+
+def copy_owner(old_path, new_path):
+    """
+    Copy the owner of the file, if running as root (as cp --preserve does).
+    :type old_path: str
+    :type new_path: str
+    """
+    if os.geteuid() == 0:
+        st = os.stat(old_path)
+        os.chown(new_path.rstrip('/'), st.st_uid, st.st_gid)
+
+
+def move(old_arg, new_arg):
+    """
+    Same as 'mv old new' (for a single source).
+    :type old_arg: str
+    :type new_arg: str
+    :return: bool False if it needs a real shell
+    """
+    old_path = expand_path(old_arg)
+    new_path = expand_path(new_arg)
+    if old_path is None or new_path is None:
+        return False
+    shutil.move(old_path, new_path)
+    return True
+
+
+def remove(path_arg):
+    """
+    Same as 'rm -rf path'.
+    :type path_arg: str
+    :return: bool False if it needs a real shell
+    """
+    paths = expand_paths(path_arg)
+    if paths is None:
+        return False
+    for path in paths:
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    return True
+
+
+def remove_files(root_arg, match_pattern=''):
+    """
+    Remove the files under root_dir (matching the pattern, if given), as
+    with 'find root_dir [-name pattern] -exec rm -f {} \\;'.
+    :type root_arg: str
+    :type match_pattern: str
+    :return: bool False if it needs a real shell
+    """
+    roots = expand_paths(root_arg)
+    if roots is None:
+        return False
+    if SHELL_ONLY_CHARS.intersection(match_pattern):
+        return False
+    for root_dir in roots:
+        for root, dirs, files in os.walk(root_dir):
+            for name in files:
+                if match_pattern == '' or fnmatch.fnmatch(name,
+                                                          match_pattern):
+                    os.remove(os.path.join(root, name))
+    return True
+
+
+def make_dirs(path_arg):
+    """
+    Same as 'mkdir -p path'.
+    :type path_arg: str
+    :return: bool False if it needs a real shell
+    """
+    paths = expand_paths(path_arg)
+    if paths is None:
+        return False
+    for path in paths:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    return True
+
+
+def chown(path_arg, user_name, group_name):
+    """
+    Same as 'chown -R user.group path'.
+    :type path_arg: str
+    :type user_name: str
+    :type group_name: str
+    :return: bool False if it needs a real shell
+    """
+    paths = expand_paths(path_arg)
+    if paths is None:
+        return False
+    try:
+        uid = pwd.getpwnam(user_name).pw_uid
+        gid = grp.getgrnam(group_name).gr_gid
+    except KeyError:
+        return False
+    for path in paths:
+        os.lchown(path, uid, gid)
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    os.lchown(os.path.join(root, name), uid, gid)
+    return True
+
+
+def count_file(path_arg):
+    """
+    Same as 'wc file', for a single file.
+    :type path_arg: str
+    :return: dict[str, int] Lines, words and chars, or None
+    """
+    path = expand_path(path_arg)
+    if path is None:
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    return {'lines': data.count(b'\n'), 'words': len(data.split()),
+            'chars': len(data)}
+
+
+def bre_to_re(pattern):
+    """
+    Convert a POSIX basic regular expression (with the GNU extensions)
+    to a Python regular expression.
+    :type pattern: str
+    :return: str Or None if it uses syntax which is not supported here
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        at_start = len(out) == 0 or out[-1] in ('(', '|')
+        if c == '\\':
+            if i + 1 >= len(pattern):
+                return None
+            n = pattern[i + 1]
+            if n in '(){}|+?':
+                out.append(n)
+            elif n.isdigit() or n in '.*[]^$\\/wWsSbB':
+                out.append('\\' + n)
+            elif n == 'n':
+                out.append('\\n')
+            elif n == 't':
+                out.append('\\t')
+            else:
+                return None
+            i += 2
+        elif c == '[':
+            j = i + 1
+            if j < len(pattern) and pattern[j] == '^':
+                j += 1
+            if j < len(pattern) and pattern[j] == ']':
+                j += 1
+            while j < len(pattern) and pattern[j] != ']':
+                j += 1
+            body = pattern[i + 1:j]
+            if j >= len(pattern) or any(s in body
+                                        for s in ('[:', '[=', '[.')):
+                return None
+            # Backslashes are not special in POSIX bracket expressions
+            out.append('[' + body.replace('\\', '\\\\') + ']')
+            i = j + 1
+        elif c in '(){}|+?':
+            out.append('\\' + c)
+            i += 1
+        elif c == '*' and (at_start or out[-1] == '^'):
+            out.append('\\*')
+            i += 1
+        elif c == '^' and not at_start:
+            out.append('\\^')
+            i += 1
+        elif c == '$' and not (i == len(pattern) - 1 or
+                               pattern[i + 1:i + 3] in ('\\)', '\\|')):
+            out.append('\\$')
+            i += 1
+        else:
+            out.append(re.escape(c) if not c.isalnum() and c not in '.*^$'
+                       else c)
+            i += 1
+    return ''.join(out)
+
+
+def grep_file(path_arg, grep, options=''):
+    """
+    Same as 'grep -q [options] "grep" file'.  Supports the -i, -w and -v
+    options.
+    :type path_arg: str
+    :type grep: str
+    :type options: str
+    :return: bool Whether any line matched, or None
+    """
+    paths = expand_paths(path_arg)
+    grep = unquote_double(grep)
+    opts = set(''.join(o[1:] for o in options.split() if o.startswith('-')))
+    if (paths is None or grep is None or
+            not opts.issubset(set('iwv')) or
+            any(not o.startswith('-') for o in options.split())):
+        return None
+    regex = bre_to_re(grep)
+    if regex is None:
+        return None
+    if 'w' in opts:
+        regex = r'(?<!\w)(?:' + regex + r')(?!\w)'
+    matcher = re.compile(regex, re.IGNORECASE if 'i' in opts else 0)
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                if (matcher.search(line.rstrip('\n')) is None) == ('v' in
+                                                                   opts):
+                    return True
+    return False
+
+
+def split_sed_fields(text, delim, count):
+    """
+    Split text on the unescaped delimiter.
+    :type text: str
+    :type delim: str
+    :type count: int Number of fields to split off
+    :return: (list[str], str) The fields and the remaining text, or None
+    """
+    fields = []
+    current = []
+    i = 0
+    while i < len(text) and len(fields) < count:
+        c = text[i]
+        if c == '\\' and i + 1 < len(text):
+            if text[i + 1] == delim and delim not in '.*[]^$\\':
+                current.append(delim if delim != '/' else '\\/')
+            else:
+                current.append(text[i:i + 2])
+            i += 2
+        elif c == delim:
+            fields.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(c)
+            i += 1
+    if len(fields) < count:
+        return None
+    return fields, text[i:]
+
+
+def parse_sed_replacement(replacement):
+    """
+    :type replacement: str sed replacement text
+    :return: list[str|int] Literal text and group numbers
+    """
+    parts = []
+    i = 0
+    while i < len(replacement):
+        c = replacement[i]
+        if c == '\\' and i + 1 < len(replacement):
+            n = replacement[i + 1]
+            parts.append(int(n) if n.isdigit()
+                         else '\n' if n == 'n'
+                         else '\t' if n == 't' else n)
+            i += 2
+        elif c == '&':
+            parts.append(0)
+            i += 1
+        else:
+            parts.append(c)
+            i += 1
+    return parts
+
+
+def parse_sed_script(script):
+    """
+    Parse a single sed command, of the form '[/address/]s/re/repl/[g]' or
+    '/address/d'.
+    :type script: str
+    :return: (re.RegexObject, str, re.RegexObject, list[str|int], bool)
+    The address (None for all lines), the command ('s' or 'd'), the
+    pattern and replacement for 's', and the global flag, or None if the
+    command is not supported
+    """
+    address = None
+    if script.startswith('/'):
+        split = split_sed_fields(script[1:], '/', 1)
+        if split is None:
+            return None
+        address_re = bre_to_re(split[0][0])
+        if address_re is None:
+            return None
+        address = re.compile(address_re)
+        script = split[1]
+    if address is not None and script == 'd':
+        return address, 'd', None, None, False
+    if len(script) < 2 or script[0] != 's' or script[1].isspace():
+        return None
+    split = split_sed_fields(script[2:], script[1], 2)
+    if split is None or split[1] not in ('', 'g'):
+        return None
+    pattern = bre_to_re(split[0][0])
+    if pattern is None:
+        return None
+    pattern = re.compile(pattern)
+    replacement = parse_sed_replacement(split[0][1])
+    if any(isinstance(p, int) and p > pattern.groups for p in replacement):
+        return None
+    return address, 's', pattern, replacement, split[1] == 'g'
+
+
+def sed_file(path_arg, script):
+    """
+    Same as 'sed -e "script" -i file', for a single, simple sed command
+    (see parse_sed_script).
+    :type path_arg: str
+    :type script: str
+    :return: bool False if it needs the real sed
+    """
+    path = expand_path(path_arg)
+    script = unquote_double(script)
+    if path is None or script is None:
+        return False
+    parsed = parse_sed_script(script)
+    if parsed is None:
+        return False
+    address, command, pattern, replacement, global_flag = parsed
+
+    def replace(match):
+        return ''.join((match.group(p) or '') if isinstance(p, int) else p
+                       for p in replacement)
+
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    out = []
+    for line in lines:
+        body = line.rstrip('\n')
+        ending = line[len(body):]
+        if address is not None and address.search(body) is None:
+            out.append(line)
+        elif command == 'd':
+            continue
+        else:
+            out.append(pattern.sub(replace, body,
+                                   count=0 if global_flag else 1) + ending)
+
+    # Replace the file as 'sed -i' does, keeping its mode and owner
+    st = os.stat(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(
+        path)), prefix='.sed')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(''.join(out))
+        os.chmod(tmp_path, st.st_mode & 0o7777)
+        if os.geteuid() == 0:
+            os.chown(tmp_path, st.st_uid, st.st_gid)
+        os.rename(tmp_path, path)
+    except EnvironmentError:
+        os.remove(tmp_path)
+        raise
+    return True
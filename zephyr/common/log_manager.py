@@ -12,13 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Imported up front: in Python 2, the first strptime call imports it
+# lazily, which fails when the collate threads race to do it
+import _strptime
+from concurrent import futures
 import datetime
+import json
 import logging
 import logging.handlers
 import os
+from zephyr.common.cli import LinuxCLI
 from zephyr.common.exceptions import *
 from zephyr.common.file_location import *
-from zephyr.common.cli import LinuxCLI
+from zephyr.common import log_slicer
+
+COLLATE_WORKERS = 8
+COLLATE_MANIFEST = 'manifest.json'
 
 
 # TODO(micucci):  CT-159: Clean up logging
@@ -299,26 +308,130 @@ class LogManager(object):
         self.open_log_files[location].append((logger, file_handler,
                                               date_format, date_position))
 
-    def collate_logs(self, dest_path):
+    def collate_logs(self, dest_path, index_logs=True, compression=None,
+                     level=None, workers=COLLATE_WORKERS):
         """
-        Gather all the log files into one place
+        Gather all the log files into one place.  The files are copied
+        concurrently (by up to 'workers' threads), and optionally
+        compressed on the way ('gzip' or 'zstd', at the given level).
+        A manifest of the collated files (with their sources, sizes, mtimes
+        and date formats) is written to dest_path, and a timestamp index is
+        built next to each uncompressed one (see log_slicer.LogIndex), so
+        slicing them later doesn't have to search the whole file.  Every
+        file is copied each time, even if it hasn't changed since the last
+        collation into dest_path (the results directory is removed before
+        collating anyway), so the manifest is not used to skip files.
+        :type dest_path: str
+        :type index_logs: bool
+        :type compression: str
+        :type level: int
+        :type workers: int
         :return:
         """
+        if (compression is not None and
+                compression not in COMPRESSION_EXTS):
+            raise ArgMismatchException('Unknown compression: ' +
+                                       str(compression))
+        jobs = []
         for loc, logger_infos in self.open_log_files.iteritems():
             (l, fh, date_format, date_pos) = logger_infos[0]
-            loc.copy_file(near_path=dest_path)
-            self.collated_log_files.add(
-                (FileLocation(dest_path + '/' + loc.filename),
-                 date_format, date_pos))
+            jobs.append((loc, loc.filename, date_format, date_pos))
 
         for loc, num_id, date_format, date_pos in self.external_log_files:
             new_file_name = loc.filename if num_id == '' \
                 else loc.filename + '.' + str(num_id)
-            loc.copy_file(near_path=dest_path, near_filename=new_file_name)
+            jobs.append((loc, new_file_name, date_format, date_pos))
+
+        if not os.path.isdir(dest_path):
+            LinuxCLI(priv=False).mkdir(dest_path)
+
+        def collate(job):
+            loc, new_file_name, date_format, date_pos = job
+            return self._collate_log_file(
+                loc, dest_path, new_file_name, date_format, date_pos,
+                index_logs, compression, level)
+
+        pool = futures.ThreadPoolExecutor(
+            max_workers=max(1, min(workers, len(jobs))))
+        try:
+            entries = list(pool.map(collate, jobs))
+        finally:
+            pool.shutdown()
+
+        for (loc, new_file_name, date_format, date_pos), entry in zip(
+                jobs, entries):
             self.collated_log_files.add(
-                (FileLocation(dest_path + '/' + new_file_name),
+                (FileLocation(dest_path + '/' + entry['file']),
                  date_format, date_pos))
 
+        with open(dest_path + '/' + COLLATE_MANIFEST, 'w') as f:
+            json.dump({e['name']: e for e in entries}, f, indent=2,
+                      sort_keys=True)
+
+    def merge_collated_logs(self, out, start_time=None, stop_time=None,
+                            tag=True):
+        """
+        Merge all of the collated log files into one stream, in timestamp
+        order (see log_slicer.merge_logs), using each log's date format.
+        :type out: file
+        :type start_time: datetime.datetime
+        :type stop_time: datetime.datetime
+        :type tag: bool Start each line with its log's file name
+        :return: int The number of log entries written
+        """
+        sources = [log_slicer.MergeSource(loc.full_path(), date_format,
+                                          date_pos)
+                   for loc, date_format, date_pos in sorted(
+                       self.collated_log_files,
+                       key=lambda c: c[0].full_path())]
+        return log_slicer.merge_logs(sources, out, start_time, stop_time,
+                                     tag)
+
+    @staticmethod
+    def _collate_log_file(loc, dest_path, new_file_name, date_format,
+                          date_pos, index_logs, compression, level):
+        """
+        Copy one log file for collate_logs.
+        :type loc: FileLocation
+        :type dest_path: str
+        :type new_file_name: str
+        :type date_format: str
+        :type date_pos: int
+        :type index_logs: bool
+        :type compression: str
+        :type level: int
+        :return: dict The file's manifest entry
+        """
+        dest_file = new_file_name + (COMPRESSION_EXTS[compression]
+                                     if compression is not None else '')
+        stat = loc.get_stat()
+        entry = {'name': new_file_name,
+                 'source': loc.full_path(),
+                 'file': dest_file,
+                 'size': stat[0] if stat is not None else None,
+                 'mtime': stat[1] if stat is not None else None,
+                 'compression': compression,
+                 'level': level,
+                 'date_format': date_format,
+                 'date_position': date_pos}
+        loc.copy_file(near_path=dest_path, near_filename=new_file_name,
+                      compression=compression, level=level)
+
+        dest_full_path = dest_path + '/' + dest_file
+        entry['collated_size'] = (os.path.getsize(dest_full_path)
+                                  if os.path.exists(dest_full_path)
+                                  else None)
+        if (index_logs and compression is None and
+                os.path.isfile(dest_full_path) and
+                log_slicer.LogIndex.load(dest_full_path) is None):
+            try:
+                log_slicer.LogIndex.build(dest_full_path, date_format,
+                                          date_pos)
+            except (IOError, OSError):
+                # The index is only an optimization
+                pass
+        return entry
+
     def _rollover_file(self, file_path, backup_dir=None,
                        date_pattern='%Y%m%d%H%M%S', zip_file=True):
         cli = LinuxCLI(priv=False)
@@ -12,8 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import bisect
 import datetime
-from zephyr.common import cli
+import errno
+import gzip
+import heapq
+import json
+import multiprocessing
+import os
+import re
 
 COMMON_FORMATS = [
     ('%Y.%m.%d %H:%M:%S.%f', 0),
@@ -22,6 +30,605 @@ COMMON_FORMATS = [
     ('%b %d, %Y %I:%M:%S %p', 0),
     ('%Y/%m/%d %H:%M:%S', 0)
 ]
+# Number of lines at the top of a file to look through for a timestamp
+# in one of the common formats
+FORMAT_DETECT_LINES = 20
+# A timestamp index entry is kept every INDEX_LINE_INTERVAL lines or
+# INDEX_TIME_INTERVAL seconds of log, whichever comes first
+INDEX_LINE_INTERVAL = 1000
+INDEX_TIME_INTERVAL = 10
+INDEX_EXT = '.tsidx'
+EPOCH = datetime.datetime(1970, 1, 1)
+# strptime directives the fast parser handles, as regex groups
+FAST_DIRECTIVES = {'Y': r'(?P<Y>\d{4})', 'm': r'(?P<m>\d{1,2})',
+                   'd': r'(?P<d>\d{1,2})', 'H': r'(?P<H>\d{1,2})',
+                   'M': r'(?P<M>\d{1,2})', 'S': r'(?P<S>\d{1,2})',
+                   'f': r'(?P<f>\d{1,6})'}
+
+
+class TimestampParser(object):
+    """
+    Parses the timestamp at a given field position of log lines in a
+    given strptime format.  Numeric formats are matched with a compiled
+    regex and built into a datetime directly, which is much faster than
+    strptime; anything else falls back to strptime.  Parsers are cached
+    per format (see get_parser).
+    """
+    parsers = {}
+    """ :type: dict[(str, int), TimestampParser] """
+
+    def __init__(self, fmt, pos):
+        """
+        :type fmt: str
+        :type pos: int Index of the first space-separated field of the
+        timestamp
+        """
+        self.fmt = fmt
+        self.pos = pos
+        self.fields = fmt.count(' ') + 1
+        self.regex = None
+        """ :type: re.RegexObject """
+        pattern = ''
+        for i, part in enumerate(re.split(r'%(.)', fmt)):
+            if i % 2 == 0:
+                pattern += re.escape(part)
+            elif part in FAST_DIRECTIVES:
+                pattern += FAST_DIRECTIVES[part]
+            else:
+                return
+        self.regex = re.compile(pattern + '$')
+
+    @classmethod
+    def get_parser(cls, fmt, pos):
+        """
+        :type fmt: str
+        :type pos: int
+        :return: TimestampParser
+        """
+        if (fmt, pos) not in cls.parsers:
+            cls.parsers[(fmt, pos)] = TimestampParser(fmt, pos)
+        return cls.parsers[(fmt, pos)]
+
+    def parse(self, line):
+        """
+        :type line: str
+        :return: datetime.datetime The line's timestamp, or None if it
+        doesn't have one in this format
+        """
+        dateline = ' '.join(line.split(' ', self.pos + self.fields)
+                            [self.pos:self.pos + self.fields]).rstrip('\n')
+        if self.regex is None:
+            try:
+                return datetime.datetime.strptime(dateline, self.fmt)
+            except ValueError:
+                return None
+        match = self.regex.match(dateline)
+        if match is None:
+            return None
+        g = match.groupdict()
+        try:
+            return datetime.datetime(
+                int(g.get('Y', 1900)), int(g.get('m', 1)),
+                int(g.get('d', 1)), int(g.get('H', 0)), int(g.get('M', 0)),
+                int(g.get('S', 0)),
+                int(g['f'].ljust(6, '0')) if 'f' in g else 0)
+        except ValueError:
+            return None
+
+
+def detect_format(log_file, parsers=None):
+    """
+    Find which of the common timestamp formats an open log file uses.
+    :type log_file: file
+    :type parsers: list[TimestampParser] Parsers to try (those for the
+    common formats by default)
+    :return: TimestampParser Or None if no format matches
+    """
+    if parsers is None:
+        parsers = [TimestampParser.get_parser(fmt, pos)
+                   for fmt, pos in COMMON_FORMATS]
+    log_file.seek(0)
+    for _ in range(FORMAT_DETECT_LINES):
+        line = log_file.readline()
+        if not line:
+            break
+        for parser in parsers:
+            if parser.parse(line) is not None:
+                return parser
+    return None
+
+
+def get_index_path(log_path):
+    """
+    :type log_path: str
+    :return: str The path of the log's timestamp index (a hidden file next
+    to it, so globs over the log directory don't pick it up)
+    """
+    return os.path.join(os.path.dirname(log_path),
+                        '.' + os.path.basename(log_path) + INDEX_EXT)
+
+
+def to_seconds(timestamp):
+    """
+    :type timestamp: datetime.datetime
+    :return: float
+    """
+    return (timestamp - EPOCH).total_seconds()
+
+
+class LogIndex(object):
+    """
+    A sparse index of a log file's timestamps: the byte offset of a line
+    and its timestamp, every so many lines or seconds.  It is stored in a
+    sidecar file (see get_index_path) as a JSON header line, followed by
+    the entries as an array of doubles (timestamp in seconds, offset).
+    The header records the log's size and mtime, so an index for a log
+    which has since changed is not used.
+    """
+    indexes = {}
+    """ :type: dict[str, LogIndex] """
+
+    def __init__(self, log_path, fmt, pos, size, mtime, entries):
+        """
+        :type log_path: str
+        :type fmt: str
+        :type pos: int
+        :type size: int
+        :type mtime: float
+        :type entries: array.array Timestamps and offsets, interleaved
+        """
+        self.log_path = log_path
+        self.fmt = fmt
+        self.pos = pos
+        self.size = size
+        self.mtime = mtime
+        self.times = entries[0::2]
+        """ :type: array.array """
+        self.offsets = entries[1::2]
+        """ :type: array.array """
+
+    @classmethod
+    def build(cls, log_path, fmt=None, pos=0,
+              line_interval=INDEX_LINE_INTERVAL,
+              time_interval=INDEX_TIME_INTERVAL):
+        """
+        Index a log file and write the index next to it.
+        :type log_path: str
+        :type fmt: str Timestamp format (detected if None, or if the lines
+        don't match it)
+        :type pos: int
+        :type line_interval: int
+        :type time_interval: float
+        :return: LogIndex Or None if the log has no known timestamp format
+        """
+        with open(log_path, 'rb') as log_file:
+            parser = None
+            if fmt is not None:
+                parser = TimestampParser.get_parser(fmt, pos)
+                if detect_format(log_file, [parser]) is None:
+                    parser = None
+            if parser is None:
+                parser = detect_format(log_file)
+            if parser is None:
+                return None
+
+            stat = os.fstat(log_file.fileno())
+            entries = array.array('d')
+            log_file.seek(0)
+            offset = 0
+            lines = 0
+            last_time = None
+            for line in log_file:
+                lines += 1
+                timestamp = parser.parse(line)
+                if timestamp is not None:
+                    seconds = to_seconds(timestamp)
+                    if (last_time is None or lines >= line_interval or
+                            seconds - last_time >= time_interval):
+                        entries.append(seconds)
+                        entries.append(offset)
+                        last_time = seconds
+                        lines = 0
+                offset += len(line)
+
+        index = LogIndex(log_path, parser.fmt, parser.pos, stat.st_size,
+                         stat.st_mtime, entries)
+        index.write()
+        return index
+
+    def write(self):
+        entries = array.array('d')
+        for t, o in zip(self.times, self.offsets):
+            entries.append(t)
+            entries.append(o)
+        index_path = get_index_path(self.log_path)
+        with open(index_path + '.tmp', 'wb') as index_file:
+            index_file.write(json.dumps({
+                'format': self.fmt, 'position': self.pos, 'size': self.size,
+                'mtime': self.mtime, 'entries': len(self.times)}) + '\n')
+            entries.tofile(index_file)
+        os.rename(index_path + '.tmp', index_path)
+        LogIndex.indexes[self.log_path] = self
+
+    @classmethod
+    def load(cls, log_path):
+        """
+        :type log_path: str
+        :return: LogIndex The log's index, or None if it has none, or the
+        log has changed since it was indexed
+        """
+        try:
+            stat = os.stat(log_path)
+        except OSError:
+            return None
+        index = cls.indexes.get(log_path)
+        if index is None:
+            try:
+                with open(get_index_path(log_path), 'rb') as index_file:
+                    header = json.loads(index_file.readline())
+                    entries = array.array('d')
+                    entries.fromfile(index_file, header['entries'] * 2)
+            except (IOError, OSError, EOFError, ValueError, KeyError):
+                return None
+            index = LogIndex(log_path, header['format'], header['position'],
+                             header['size'], header['mtime'], entries)
+            cls.indexes[log_path] = index
+        if index.size != stat.st_size or index.mtime != stat.st_mtime:
+            return None
+        return index
+
+    def get_parser(self):
+        """
+        :return: TimestampParser
+        """
+        return TimestampParser.get_parser(self.fmt, self.pos)
+
+    def get_search_range(self, start_time):
+        """
+        :type start_time: datetime.datetime
+        :return: (int, int) Offsets between which the first line at or
+        after the time is (the second is None for the end of the file)
+        """
+        i = bisect.bisect_left(self.times, to_seconds(start_time))
+        low = int(self.offsets[i - 1]) if i > 0 else 0
+        high = int(self.offsets[i]) if i < len(self.offsets) else None
+        return low, high
+
+
+def next_timestamp(log_file, offset, parser):
+    """
+    Find the first line with a timestamp which starts at or after the
+    offset (moving to the start of the next line if the offset is in the
+    middle of one).  The file is left positioned after that line.
+    :type log_file: file
+    :type offset: int
+    :type parser: TimestampParser
+    :return: (int, datetime.datetime) The line's offset and timestamp, or
+    (None, None) if there are no more
+    """
+    if offset > 0:
+        log_file.seek(offset - 1)
+        log_file.readline()
+    else:
+        log_file.seek(0)
+    while True:
+        line_offset = log_file.tell()
+        line = log_file.readline()
+        if not line:
+            return None, None
+        timestamp = parser.parse(line)
+        if timestamp is not None:
+            return line_offset, timestamp
+
+
+def find_time_offset(log_file, parser, start_time, low=0, high=None):
+    """
+    Binary search a log file (whose timestamps are in order) for the start
+    of the first line timestamped at or after the given time.
+    :type log_file: file
+    :type parser: TimestampParser
+    :type start_time: datetime.datetime
+    :type low: int Offset of a line start known to be at or before it
+    :type high: int Offset known to be after it (end of file by default)
+    :return: int
+    """
+    if high is None:
+        log_file.seek(0, os.SEEK_END)
+        high = log_file.tell()
+    while low < high:
+        mid = (low + high) // 2
+        line_offset, timestamp = next_timestamp(log_file, mid, parser)
+        if line_offset is None or timestamp >= start_time:
+            high = mid
+        else:
+            low = log_file.tell()
+    return low
+
+
+def open_log(log_path):
+    """
+    :type log_path: str
+    :return: file The log opened for reading, decompressing it if it is
+    gzipped
+    """
+    if log_path.endswith('.gz'):
+        return gzip.open(log_path, 'rb')
+    return open(log_path, 'rb')
+
+
+def read_log_entries(log_path, fmt=None, pos=0, start_time=None,
+                     stop_time=None):
+    """
+    Stream a log's entries in order: each line with a timestamp, together
+    with any lines after it which have none (e.g. stack traces).  Lines
+    before the first timestamp are skipped.  The start of the entries is
+    found with a binary search (helped by the log's index, if it has
+    one), except for gzipped logs, which are read from the start.
+    :type log_path: str
+    :type fmt: str Timestamp format (detected if None, or if the lines
+    don't match it)
+    :type pos: int
+    :type start_time: datetime.datetime None for the start of the log
+    :type stop_time: datetime.datetime None for the end of the log
+    :return: generator of (datetime.datetime, list[str])
+    """
+    if not os.path.isfile(log_path):
+        return
+    compressed = log_path.endswith('.gz')
+    index = LogIndex.load(log_path) if not compressed else None
+    with open_log(log_path) as log_file:
+        parser = None
+        if fmt is not None:
+            parser = TimestampParser.get_parser(fmt, pos)
+            if detect_format(log_file, [parser]) is None:
+                parser = None
+        if parser is None:
+            parser = (index.get_parser() if index is not None
+                      else detect_format(log_file))
+        if parser is None:
+            return
+
+        offset = 0
+        if start_time is not None and not compressed:
+            low, high = (index.get_search_range(start_time)
+                         if index is not None else (0, None))
+            offset = find_time_offset(log_file, parser, start_time,
+                                      low=low, high=high)
+        log_file.seek(offset)
+
+        timestamp = None
+        lines = []
+        for line in iter(log_file.readline, b''):
+            line_time = parser.parse(line)
+            if line_time is None:
+                if timestamp is not None:
+                    lines.append(line)
+                continue
+            if timestamp is not None and (start_time is None or
+                                          timestamp >= start_time):
+                yield timestamp, lines
+            if stop_time is not None and line_time > stop_time:
+                return
+            timestamp = line_time
+            lines = [line]
+        if timestamp is not None and (start_time is None or
+                                      timestamp >= start_time):
+            yield timestamp, lines
+
+
+class MergeSource(object):
+    """
+    A log file to merge (see merge_logs), and the tag to mark its lines
+    with.
+    """
+    def __init__(self, log_path, fmt=None, pos=0, tag=None):
+        """
+        :type log_path: str
+        :type fmt: str Timestamp format (detected if None)
+        :type pos: int
+        :type tag: str The log's file name by default
+        """
+        self.log_path = log_path
+        self.fmt = fmt
+        self.pos = pos
+        self.tag = tag if tag is not None else os.path.basename(log_path)
+
+    def read_entries(self, num, start_time=None, stop_time=None):
+        """
+        :type num: int The source's number, to keep the order of entries
+        with the same timestamp stable
+        :type start_time: datetime.datetime
+        :type stop_time: datetime.datetime
+        :return: generator of (datetime.datetime, int, list[str])
+        """
+        for timestamp, lines in read_log_entries(
+                self.log_path, self.fmt, self.pos, start_time, stop_time):
+            yield timestamp, num, lines
+
+
+def merge_logs(sources, out, start_time=None, stop_time=None, tag=True):
+    """
+    Merge log files into one, in timestamp order.  The logs are streamed
+    through a k-way heap merge, so only one entry per log is held at a
+    time, however big they are.  Entries with the same timestamp are
+    written in the order of their sources.
+    :type sources: list[MergeSource]
+    :type out: file
+    :type start_time: datetime.datetime None for the start of the logs
+    :type stop_time: datetime.datetime None for the end of the logs
+    :type tag: bool Start each line with its source's tag in brackets
+    :return: int The number of entries written
+    """
+    count = 0
+    for timestamp, num, lines in heapq.merge(
+            *[source.read_entries(num, start_time, stop_time)
+              for num, source in enumerate(sources)]):
+        prefix = '[' + sources[num].tag + '] ' if tag else ''
+        for line in lines:
+            out.write(prefix + line)
+            if not line.endswith('\n'):
+                out.write('\n')
+        count += 1
+    return count
+
+
+class SliceWindow(object):
+    """
+    A time window to slice out of log files, and where to write the
+    slices.
+    """
+    def __init__(self, out_dir, start_time=None, stop_time=None,
+                 ext='.slice'):
+        """
+        :type out_dir: str
+        :type start_time: datetime.datetime None for the start of the log
+        :type stop_time: datetime.datetime None for the end of the log
+        :type ext: str
+        """
+        self.out_dir = out_dir
+        self.start_time = start_time
+        self.stop_time = stop_time
+        self.ext = ext
+
+    def make_out_dir(self):
+        """
+        Create the output directory, if it doesn't exist yet (other pool
+        processes may be creating it at the same time).
+        """
+        try:
+            os.makedirs(self.out_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def open_slice(self, log_path):
+        """
+        :type log_path: str
+        :return: file The slice file for the log, with its header written
+        """
+        self.make_out_dir()
+        out = open(self.out_dir + '/' + os.path.basename(log_path) +
+                   self.ext, 'wb')
+        out.write('SLICE OF LOG [' + log_path + '] FROM [' +
+                  str(self.start_time) + '] TO [' + str(self.stop_time) +
+                  ']\n')
+        return out
+
+
+def slice_log_file(log_path, windows, build_index=False):
+    """
+    Slice a log file for any number of time windows, reading it only once:
+    the windows are handled in order of start time, skipping (with a
+    binary search, see find_time_offset) over any part of the file no
+    window covers, and each line is written to the slice of every window
+    it is in.  Lines without a timestamp (e.g. stack traces) go with the
+    timestamped line before them.  A window with no lines in the log gets
+    no slice file.  Gzipped logs (as collated with compression) can be
+    sliced too, but they have to be read from the start.
+    :type log_path: str
+    :type windows: list[SliceWindow]
+    :type build_index: bool Index the log (see LogIndex) if it has no
+    index yet
+    :return: list[str] The slice files written
+    """
+    if not os.path.isfile(log_path):
+        return []
+    compressed = log_path.endswith('.gz')
+    index = None
+    if not compressed:
+        index = LogIndex.load(log_path)
+        if index is None and build_index:
+            index = LogIndex.build(log_path)
+    with open_log(log_path) as log_file:
+        parser = (index.get_parser() if index is not None
+                  else detect_format(log_file))
+        if parser is None:
+            # No appropriate formats, so skip file
+            return []
+
+        pending = sorted(windows, key=lambda w: (w.start_time is not None,
+                                                 w.start_time))
+        """ :type: list[SliceWindow] """
+        active = []
+        """ :type: list[(SliceWindow, file)] """
+        written = []
+        while len(pending) > 0:
+            # Nothing to write until the next window starts, so skip ahead
+            start_time = pending[0].start_time
+            offset = 0
+            if start_time is not None and not compressed:
+                low, high = (index.get_search_range(start_time)
+                             if index is not None else (0, None))
+                offset = find_time_offset(log_file, parser, start_time,
+                                          low=low, high=high)
+            log_file.seek(offset)
+            started = False
+
+            for line in iter(log_file.readline, b''):
+                timestamp = parser.parse(line)
+                if timestamp is not None:
+                    while len(pending) > 0 and (
+                            pending[0].start_time is None or
+                            pending[0].start_time <= timestamp):
+                        active.append((pending.pop(0), None))
+                        started = True
+                    for window, out in [a for a in active
+                                        if a[0].stop_time is not None and
+                                        timestamp > a[0].stop_time]:
+                        active.remove((window, out))
+                        if out is not None:
+                            out.close()
+                    if len(active) == 0 and started and not compressed:
+                        break
+                for i, (window, out) in enumerate(active):
+                    if out is None:
+                        out = window.open_slice(log_path)
+                        active[i] = (window, out)
+                        written.append(out.name)
+                    out.write(line)
+            else:
+                # End of the log
+                break
+
+        for window, out in active:
+            if out is not None:
+                out.close()
+        return written
+
+
+def slice_log_file_task(args):
+    """
+    slice_log_file, with its arguments as a tuple (for a process pool).
+    :type args: (str, list[SliceWindow], bool)
+    :return: list[str]
+    """
+    return slice_log_file(*args)
+
+
+def slice_log_files_by_windows(log_paths, windows, processes=None,
+                               build_index=False):
+    """
+    Slice many log files for many time windows, with each file handled
+    (and read once for all of the windows) by a separate task in a
+    process pool.
+    :type log_paths: list[str]
+    :type windows: list[SliceWindow]
+    :type processes: int Number of processes (one per CPU by default, or
+    1 to slice in this process)
+    :type build_index: bool Index any log which has no index yet
+    :return: list[str] The slice files written
+    """
+    tasks = [(log_path, windows, build_index) for log_path in log_paths]
+    if processes == 1 or len(tasks) <= 1:
+        results = [slice_log_file_task(t) for t in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(slice_log_file_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return [f for r in results for f in r]
 
 
 def slice_log_files_by_time(log_files, out_dir, slice_start_time=None,
@@ -33,6 +640,12 @@ def slice_log_files_by_time(log_files, out_dir, slice_start_time=None,
     to the end.  The leeway parameter will move the slice to n seconds
     before start and n seconds after the end time.
 
+    Each file's timestamp format is detected from its first lines, and the
+    start of the slice is found with a binary search on the file, so only
+    the slice itself is read.  If the file has a timestamp index (see
+    LogIndex), the format comes from it, and only the part of the file
+    between two index entries is searched.
+
     Use 'ext' to set the extension on the slice files (defaults to .slice)
     :type log_files: list[FileLocation]
     :type out_dir: str
@@ -43,53 +656,14 @@ def slice_log_files_by_time(log_files, out_dir, slice_start_time=None,
     :return:
     """
 
-    concrete_start_time = slice_start_time - datetime.timedelta(seconds=leeway)
-    concrete_stop_time = slice_stop_time + datetime.timedelta(seconds=leeway)
-
-    log_file_set = log_files
-
-    for filepath in log_file_set:
-        lines_to_write = []
-        if cli.LinuxCLI(priv=False).exists(filepath.full_path()):
-            with open(filepath.full_path(), 'r') as cf:
-                firstline = cf.readline()
-                current_format = None
-                current_pos = None
-                for fmt, pos in COMMON_FORMATS:
-                    try:
-                        current_format = fmt
-                        current_pos = pos
-                        dateline = ' '.join(
-                            firstline.split(' ')[current_pos:current_pos + 2])
-                        datetime.datetime.strptime(dateline, current_format)
-                        break
-                    except ValueError:
-                        continue
-                if not current_format:
-                    # No appropriate formats, so skip file
-                    continue
-
-                for line in cf.readlines():
-                    dateline = ' '.join(
-                        line.split(' ')[current_pos:current_pos + 2])
-                    try:
-                        current_time = datetime.datetime.strptime(
-                            dateline, current_format)
-                        if current_time < concrete_start_time:
-                            continue
-                        elif current_time > concrete_stop_time:
-                            break
-                        else:
-                            lines_to_write.append(line)
-                    except ValueError:
-                        continue
-
-            if len(lines_to_write) != 0:
-                filename = out_dir + '/' + filepath.filename + ext
-                cli.LinuxCLI(priv=False).write_to_file(
-                    filename,
-                    'SLICE OF LOG [' + filepath.full_path() + '] FROM [' +
-                    str(concrete_start_time) + '] TO [' +
-                    str(concrete_stop_time) + ']\n')
-                cli.LinuxCLI(priv=False).write_to_file(
-                    filename, ''.join(lines_to_write), append=True)
+    leeway_delta = datetime.timedelta(seconds=float(leeway))
+    window = SliceWindow(
+        out_dir,
+        slice_start_time - leeway_delta
+        if slice_start_time is not None else None,
+        slice_stop_time + leeway_delta
+        if slice_stop_time is not None else None,
+        ext)
+
+    for filepath in log_files:
+        slice_log_file(filepath.full_path(), [window])
@@ -0,0 +1,520 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from zephyr.common.exceptions import *
+from zephyr.common.ip import IP
+from zephyr.common.netns_executor import call_in_netns
+from zephyr.common.netns_executor import get_netns_id
+from zephyr.common.netns_executor import NETNS_RUN_DIR
+
+NETLINK_ROUTE = 0
+AF_NETLINK = getattr(socket, 'AF_NETLINK', 16)
+RECV_SIZE = 65536
+
+# Message types
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+
+# Message flags
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+# Multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+# Attributes
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_LINK = 5
+IFLA_MASTER = 10
+IFLA_LINKINFO = 18
+IFLA_NET_NS_FD = 28
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+VETH_INFO_PEER = 1
+IFLA_VLAN_ID = 1
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+NDA_DST = 1
+NLA_F_NESTED = 0x8000
+
+IFF_UP = 0x1
+NUD_NOARP = 0x40
+NUD_PERMANENT = 0x80
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RTN_UNICAST = 1
+
+NLMSG_HEADER = struct.Struct('=IHHII')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTMSG = struct.Struct('=BBBBBBBBI')
+NDMSG = struct.Struct('=BxxxiHBB')
+RTATTR = struct.Struct('=HH')
+
+
+class NetlinkException(SubprocessFailedException):
+    def __init__(self, info, err=0):
+        super(NetlinkException, self).__init__(info)
+        self.errno = err
+
+
+def align(length):
+    return (length + 3) & ~3
+
+
+def pack_attr(attr_type, data):
+    """
+    :type attr_type: int
+    :type data: bytes
+    :return: bytes
+    """
+    length = RTATTR.size + len(data)
+    return (RTATTR.pack(length, attr_type) + data +
+            b'\x00' * (align(length) - length))
+
+
+def pack_str_attr(attr_type, value):
+    return pack_attr(attr_type, value.encode('utf-8') + b'\x00')
+
+
+def pack_int_attr(attr_type, value):
+    return pack_attr(attr_type, struct.pack('=I', value))
+
+
+def parse_attrs(data, offset=0):
+    """
+    :type data: bytes
+    :type offset: int
+    :return: dict[int, bytes]
+    """
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type & ~NLA_F_NESTED] = \
+            data[offset + RTATTR.size:offset + length]
+        offset += align(length)
+    return attrs
+
+
+def parse_prefix(prefix):
+    """
+    :type prefix: IP|str 'default', or an address with optional prefix
+    length
+    :return: (str, int)
+    """
+    if isinstance(prefix, IP):
+        return prefix.ip, int(prefix.subnet)
+    if prefix == 'default':
+        return '0.0.0.0', 0
+    parts = str(prefix).split('/')
+    return parts[0], int(parts[1]) if len(parts) > 1 else 32
+
+
+def format_mac(raw):
+    return ':'.join('%02x' % ord(raw[i:i + 1]) for i in range(len(raw)))
+
+
+class NetlinkSocket(object):
+    """
+    A minimal rtnetlink client for link, address, route and neighbour
+    operations, which replaces running (and parsing the output of) 'ip'
+    commands.  The socket is opened in the given network namespace, and
+    sockets are cached per namespace (see get_socket), until the namespace
+    is removed or re-created.
+    """
+    sockets = {}
+    """ :type: dict[str, NetlinkSocket] """
+    sockets_lock = threading.Lock()
+
+    def __init__(self, netns=None):
+        """
+        :type netns: str Network namespace (None for the current one)
+        """
+        self.netns = netns
+        self.netns_id = get_netns_id(netns)
+        self.sock = self.open(0)
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_socket(cls, netns=None):
+        """
+        :type netns: str
+        :return: NetlinkSocket
+        """
+        with cls.sockets_lock:
+            # A namespace with the same name may have been re-created
+            # since the socket was opened (without close_sockets)
+            if (netns in cls.sockets and
+                    cls.sockets[netns].netns_id != get_netns_id(netns)):
+                cls.sockets.pop(netns).sock.close()
+            if netns not in cls.sockets:
+                cls.sockets[netns] = NetlinkSocket(netns)
+            return cls.sockets[netns]
+
+    @classmethod
+    def close_sockets(cls, netns):
+        """
+        Close the cached socket for a namespace which is being removed.
+        :type netns: str
+        """
+        with cls.sockets_lock:
+            if netns in cls.sockets:
+                cls.sockets.pop(netns).sock.close()
+
+    def open(self, groups):
+        """
+        :type groups: int Multicast groups to subscribe to
+        :return: socket.socket
+        """
+        def open_netlink():
+            sock = socket.socket(AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.bind((0, groups))
+            return sock
+
+        try:
+            return call_in_netns(self.netns, open_netlink)
+        except (OSError, IOError, socket.error) as e:
+            raise NetlinkException(
+                'Could not open netlink socket' +
+                (' in netns ' + self.netns if self.netns else '') + ': ' +
+                str(e), getattr(e, 'errno', 0))
+
+    def request(self, msg_type, flags, body):
+        """
+        Send a request and collect the replies, until the ack (or the end of
+        the dump).
+        :type msg_type: int
+        :type flags: int
+        :type body: bytes
+        :return: list[(int, bytes)] Type and payload of each reply
+        """
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            self.sock.send(NLMSG_HEADER.pack(
+                NLMSG_HEADER.size + len(body), msg_type,
+                flags | NLM_F_REQUEST | NLM_F_ACK, seq, 0) + body)
+            replies = []
+            while True:
+                data = self.sock.recv(RECV_SIZE)
+                offset = 0
+                while offset + NLMSG_HEADER.size <= len(data):
+                    length, reply_type, _, reply_seq, _ = \
+                        NLMSG_HEADER.unpack_from(data, offset)
+                    payload = data[offset + NLMSG_HEADER.size:
+                                   offset + length]
+                    offset += align(length)
+                    if reply_seq != seq:
+                        continue
+                    if reply_type == NLMSG_DONE:
+                        return replies
+                    if reply_type == NLMSG_ERROR:
+                        err = -struct.unpack_from('=i', payload)[0]
+                        if err == 0:
+                            return replies
+                        raise NetlinkException(
+                            'Netlink request failed: ' + os.strerror(err),
+                            err)
+                    replies.append((reply_type, payload))
+
+    def get_links(self):
+        """
+        :return: list[dict[str, T]] Index, name, flags and MAC of each link
+        """
+        links = []
+        for _, payload in self.request(RTM_GETLINK, NLM_F_DUMP,
+                                       IFINFOMSG.pack(0, 0, 0, 0, 0)):
+            links.append(self.parse_link(payload))
+        return links
+
+    @staticmethod
+    def parse_link(payload):
+        _, _, index, flags, _ = IFINFOMSG.unpack_from(payload)
+        attrs = parse_attrs(payload, IFINFOMSG.size)
+        return {'index': index,
+                'name': attrs.get(IFLA_IFNAME, b'').rstrip(b'\x00')
+                .decode('utf-8'),
+                'flags': flags,
+                'mac': format_mac(attrs.get(IFLA_ADDRESS, b''))}
+
+    def get_link_index(self, ifname):
+        """
+        :type ifname: str
+        :return: int
+        """
+        try:
+            replies = self.request(
+                RTM_GETLINK, 0, IFINFOMSG.pack(0, 0, 0, 0, 0) +
+                pack_str_attr(IFLA_IFNAME, ifname))
+        except NetlinkException as e:
+            if e.errno == errno.ENODEV:
+                raise NetlinkException('No such interface: ' + ifname,
+                                       e.errno)
+            raise
+        return self.parse_link(replies[0][1])['index']
+
+    def get_addresses(self, ifname=None):
+        """
+        :type ifname: str Interface (None for all interfaces)
+        :return: list[IP] IPv4 addresses, in the order the kernel lists them
+        """
+        index = self.get_link_index(ifname) if ifname is not None else None
+        addresses = []
+        for _, payload in self.request(
+                RTM_GETADDR, NLM_F_DUMP,
+                IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)):
+            address = self.parse_address(payload)
+            if index is None or address[0] == index:
+                addresses.append(address[1])
+        return addresses
+
+    @staticmethod
+    def parse_address(payload):
+        """
+        :return: (int, IP) Interface index and address
+        """
+        _, prefix_len, _, _, index = IFADDRMSG.unpack_from(payload)
+        attrs = parse_attrs(payload, IFADDRMSG.size)
+        addr = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        return index, IP(socket.inet_ntoa(addr), str(prefix_len))
+
+    def modify_address(self, msg_type, flags, ifname, ip_addr):
+        ip, prefix_len = parse_prefix(ip_addr)
+        packed = socket.inet_aton(ip)
+        self.request(msg_type, flags,
+                     IFADDRMSG.pack(socket.AF_INET, prefix_len, 0, 0,
+                                    self.get_link_index(ifname)) +
+                     pack_attr(IFA_LOCAL, packed) +
+                     pack_attr(IFA_ADDRESS, packed))
+
+    def add_address(self, ifname, ip_addr):
+        """
+        :type ifname: str
+        :type ip_addr: IP|str
+        """
+        self.modify_address(RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL,
+                            ifname, ip_addr)
+
+    def del_address(self, ifname, ip_addr):
+        """
+        :type ifname: str
+        :type ip_addr: IP|str
+        """
+        self.modify_address(RTM_DELADDR, 0, ifname, ip_addr)
+
+    def modify_link(self, ifname, flags=0, change=0, attrs=b''):
+        self.request(RTM_NEWLINK, 0,
+                     IFINFOMSG.pack(0, 0, self.get_link_index(ifname),
+                                    flags, change) + attrs)
+
+    def set_link_up(self, ifname, up=True):
+        """
+        :type ifname: str
+        :type up: bool
+        """
+        self.modify_link(ifname, IFF_UP if up else 0, IFF_UP)
+
+    def set_link_address(self, ifname, mac):
+        """
+        :type ifname: str
+        :type mac: str
+        """
+        self.modify_link(ifname, attrs=pack_attr(
+            IFLA_ADDRESS,
+            bytes(bytearray(int(o, 16) for o in mac.split(':')))))
+
+    def set_link_master(self, ifname, master=None):
+        """
+        Add an interface to a bridge (or remove it if master is None).
+        :type ifname: str
+        :type master: str
+        """
+        self.modify_link(ifname, attrs=pack_int_attr(
+            IFLA_MASTER,
+            self.get_link_index(master) if master is not None else 0))
+
+    def set_link_netns(self, ifname, netns, new_name=None):
+        """
+        Move an interface to another namespace, optionally renaming it.
+        :type ifname: str
+        :type netns: str
+        :type new_name: str
+        """
+        with open(os.path.join(NETNS_RUN_DIR, netns)) as ns_file:
+            self.modify_link(
+                ifname,
+                attrs=pack_int_attr(IFLA_NET_NS_FD, ns_file.fileno()) +
+                (pack_str_attr(IFLA_IFNAME, new_name)
+                 if new_name is not None else b''))
+
+    def create_link(self, ifname, kind, peer_name=None, link=None,
+                    vlan_id=None):
+        """
+        :type ifname: str
+        :type kind: str 'veth', 'bridge', 'vlan', etc.
+        :type peer_name: str Peer name for veth pairs
+        :type link: str Parent interface for vlans
+        :type vlan_id: int
+        """
+        info_data = b''
+        if peer_name is not None:
+            info_data = pack_attr(
+                VETH_INFO_PEER | NLA_F_NESTED,
+                IFINFOMSG.pack(0, 0, 0, 0, 0) +
+                pack_str_attr(IFLA_IFNAME, peer_name))
+        elif vlan_id is not None:
+            info_data = pack_attr(IFLA_VLAN_ID,
+                                  struct.pack('=H', int(vlan_id)))
+        link_info = pack_str_attr(IFLA_INFO_KIND, kind)
+        if info_data:
+            link_info += pack_attr(IFLA_INFO_DATA | NLA_F_NESTED, info_data)
+        self.request(
+            RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL,
+            IFINFOMSG.pack(0, 0, 0, 0, 0) +
+            pack_str_attr(IFLA_IFNAME, ifname) +
+            (pack_int_attr(IFLA_LINK, self.get_link_index(link))
+             if link is not None else b'') +
+            pack_attr(IFLA_LINKINFO | NLA_F_NESTED, link_info))
+
+    def delete_link(self, ifname):
+        """
+        :type ifname: str
+        """
+        self.request(RTM_DELLINK, 0,
+                     IFINFOMSG.pack(0, 0, self.get_link_index(ifname), 0, 0))
+
+    def modify_route(self, msg_type, flags, dest, gateway=None, ifname=None):
+        dest_ip, dest_len = parse_prefix(dest)
+        attrs = b''
+        if dest_len > 0:
+            attrs += pack_attr(RTA_DST, socket.inet_aton(dest_ip))
+        if gateway is not None:
+            attrs += pack_attr(RTA_GATEWAY, socket.inet_aton(
+                gateway.ip if isinstance(gateway, IP) else gateway))
+        if ifname is not None:
+            attrs += pack_int_attr(RTA_OIF, self.get_link_index(ifname))
+        scope = (RT_SCOPE_LINK
+                 if gateway is None and msg_type == RTM_NEWROUTE
+                 else RT_SCOPE_UNIVERSE)
+        self.request(msg_type, flags,
+                     RTMSG.pack(socket.AF_INET, dest_len, 0, 0,
+                                RT_TABLE_MAIN, RTPROT_BOOT, scope,
+                                RTN_UNICAST, 0) + attrs)
+
+    def add_route(self, dest='default', gateway=None, ifname=None):
+        """
+        :type dest: IP|str
+        :type gateway: IP|str
+        :type ifname: str
+        """
+        if gateway is None and ifname is None:
+            raise ArgMismatchException(
+                'Must specify either next-hop GW or device to add a route')
+        self.modify_route(RTM_NEWROUTE, NLM_F_CREATE | NLM_F_EXCL, dest,
+                          gateway, ifname)
+
+    def del_route(self, dest):
+        """
+        :type dest: IP|str
+        """
+        self.modify_route(RTM_DELROUTE, 0, dest)
+
+    def flush_neighbours(self):
+        """
+        Remove all dynamic neighbour (ARP) entries, as
+        'ip neighbour flush all' does.
+        """
+        for _, payload in self.request(RTM_GETNEIGH, NLM_F_DUMP,
+                                       NDMSG.pack(0, 0, 0, 0, 0)):
+            family, index, state, flags, nd_type = \
+                NDMSG.unpack_from(payload)
+            if state & (NUD_NOARP | NUD_PERMANENT):
+                continue
+            attrs = parse_attrs(payload, NDMSG.size)
+            try:
+                self.request(RTM_DELNEIGH, 0,
+                             NDMSG.pack(family, index, state, flags,
+                                        nd_type) +
+                             pack_attr(NDA_DST, attrs[NDA_DST]))
+            except NetlinkException:
+                # Entries can expire while flushing
+                pass
+
+    def wait_for_address(self, ifname, timeout=10):
+        """
+        Wait for an IPv4 address to be added to the interface, using an
+        address-change subscription rather than polling.
+        :type ifname: str
+        :type timeout: float
+        :return: IP The first address on the interface
+        """
+        events = self.open(RTMGRP_IPV4_IFADDR)
+        try:
+            # Subscribe before checking, so no new address can be missed
+            addresses = self.get_addresses(ifname)
+            if len(addresses) > 0:
+                return addresses[0]
+            index = self.get_link_index(ifname)
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not select.select([events], [], [],
+                                                       remaining)[0]:
+                    raise SubprocessTimeoutException(
+                        'No IP address on ' + ifname + ' within timeout')
+                data = events.recv(RECV_SIZE)
+                offset = 0
+                while offset + NLMSG_HEADER.size <= len(data):
+                    length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(
+                        data, offset)
+                    payload = data[offset + NLMSG_HEADER.size:
+                                   offset + length]
+                    offset += align(length)
+                    if msg_type == RTM_NEWADDR:
+                        address = self.parse_address(payload)
+                        if address[0] == index:
+                            return address[1]
+        finally:
+            events.close()
@@ -0,0 +1,371 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import base64
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+from zephyr.common.exceptions import *
+
+CLONE_NEWNET = 0x40000000
+NETNS_RUN_DIR = '/var/run/netns'
+
+# Commands run with a timeout (which the caller enforces with the
+# 'timeout' command) are killed by the helper if they are still running
+# this long after it (with a return code of 124, like 'timeout'), so a
+# command which ignores SIGTERM can't tie up the namespace's helper.  If
+# the helper itself doesn't answer within the same grace period after
+# that, it is killed and restarted.
+EXECUTOR_KILL_GRACE = 5
+EXECUTOR_TIMEOUT_RET_CODE = 124
+
+# Shell command lines with any of these characters may run more than one
+# command (pipes, lists, substitutions) or redirect the output.  With
+# 'ip netns exec', only the first command runs in the namespace (and as
+# root), so these are run directly rather than through the helper.
+SHELL_CONTROL_CHARS = set('|&;<>()$`\n')
+
+# The helper runs inside the namespace, reading length-prefixed JSON
+# requests on stdin and writing length-prefixed JSON responses on stdout,
+# until stdin is closed.  A request is {'commands': <shell string, or list
+# of argv lists to pipe together>, 'shell': bool, 'env': dict|None,
+# 'timeout': seconds|None}, and the response is {'ret_code': int,
+# 'stdout': b64, 'stderr': b64}.
+EXECUTOR_HELPER = r'''
+import base64, json, os, shlex, signal, struct, subprocess, sys, threading
+SHELL_CHARS = set('|&;<>()$`\\"\'*?[]#~=%{}!\n')
+inp = getattr(sys.stdin, 'buffer', sys.stdin)
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+null = open(os.devnull, 'r+b')
+
+def read_exact(n):
+    data = b''
+    while len(data) < n:
+        chunk = inp.read(n - len(data))
+        if not chunk:
+            sys.exit(0)
+        data += chunk
+    return data
+
+def run(req):
+    shell = bool(req.get('shell'))
+    cmds = [req['commands']] if shell else req['commands']
+    # Skip the shell for simple command lines
+    if shell and not SHELL_CHARS.intersection(cmds[0]):
+        cmds, shell = [shlex.split(cmds[0])], False
+    procs = []
+    for i, c in enumerate(cmds):
+        last = i == len(cmds) - 1
+        procs.append(subprocess.Popen(
+            c, shell=shell,
+            stdin=null if i == 0 else procs[-1].stdout,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE if last else null,
+            env=req.get('env'), preexec_fn=os.setsid))
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        for p in procs:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except OSError:
+                pass
+    timer = None
+    if req.get('timeout') is not None:
+        timer = threading.Timer(req['timeout'], kill)
+        timer.start()
+    try:
+        o, e = procs[-1].communicate()
+        for p in procs[:-1]:
+            p.stdout.close()
+            p.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if timed_out:
+        return 124, o, e + b'Command timed out\n'
+    return procs[-1].returncode, o, e
+
+while True:
+    req = json.loads(read_exact(
+        struct.unpack('!I', read_exact(4))[0]).decode('utf-8'))
+    try:
+        ret, o, e = run(req)
+    except OSError as err:
+        ret, o, e = 127, b'', str(err).encode('utf-8')
+    resp = json.dumps({'ret_code': ret,
+                       'stdout': base64.b64encode(o).decode('ascii'),
+                       'stderr': base64.b64encode(e).decode('ascii')})
+    resp = resp.encode('utf-8')
+    out.write(struct.pack('!I', len(resp)) + resp)
+    out.flush()
+'''
+
+
+def call_in_netns(netns, func):
+    """
+    Call func in a short-lived thread which has entered the network
+    namespace (with setns), so the caller stays in its own namespace.
+    Sockets created by func stay in the namespace they were created in, so
+    this is a cheap way to get, for example, a netlink or raw socket in
+    another namespace.  Requires CAP_SYS_ADMIN if netns is set.
+    :type netns: str Name of the namespace (None for the current one)
+    :type func: callable
+    :return: T The return value of func
+    """
+    if netns is None:
+        return func()
+
+    result = {}
+
+    def run_in_netns():
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                               use_errno=True)
+            with open(os.path.join(NETNS_RUN_DIR, netns)) as ns_file:
+                if libc.setns(ns_file.fileno(), CLONE_NEWNET) != 0:
+                    raise OSError(ctypes.get_errno(),
+                                  'setns failed for netns: ' + netns)
+            result['value'] = func()
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run_in_netns)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+def is_single_command(cmd_line):
+    """
+    :type cmd_line: str
+    :return: bool True if the shell command line can only run one command,
+    without redirecting its output
+    """
+    return not SHELL_CONTROL_CHARS.intersection(cmd_line)
+
+
+def get_netns_id(name):
+    """
+    :type name: str
+    :return: (int, int) Device and inode of the namespace's bind mount, or
+    None if it does not exist (or name is None)
+    """
+    if name is None:
+        return None
+    try:
+        st = os.stat(os.path.join(NETNS_RUN_DIR, name))
+        return st.st_dev, st.st_ino
+    except OSError:
+        return None
+
+
+class NetNSExecutor(object):
+    """
+    A long-lived helper process inside a network namespace, which runs
+    commands sent to it over a pipe.  It is started (through sudo and
+    'ip netns exec', so commands see the same environment as before)
+    the first time it is used, which saves each command the cost of the
+    sudo, namespace switch and process start-up.  If the namespace is
+    deleted or re-created, the helper is restarted.  With a name of None,
+    the helper runs in the current namespace, which gives a persistent
+    privileged helper for commands that need root.
+
+    Only the command itself runs in the namespace: a shell command line
+    which could run more than one command is left to the caller, as is a
+    command sent while the helper is busy with another one (run() returns
+    None, so the caller can run it directly instead).  Commands given a
+    timeout are killed if they outlive it by EXECUTOR_KILL_GRACE seconds.
+    """
+    executors = {}
+    """ :type: dict[(str, bool), NetNSExecutor] """
+    executors_lock = threading.Lock()
+
+    def __init__(self, name, priv=True):
+        """
+        :type name: str
+        :type priv: bool
+        """
+        self.name = name
+        self.priv = priv
+        self.process = None
+        """ :type: subprocess.Popen """
+        self.netns_id = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls, name, priv=True):
+        """
+        :type name: str
+        :type priv: bool
+        :return: NetNSExecutor
+        """
+        with cls.executors_lock:
+            if (name, priv) not in cls.executors:
+                cls.executors[(name, priv)] = NetNSExecutor(name, priv)
+            return cls.executors[(name, priv)]
+
+    @classmethod
+    def stop_executors(cls, name=None):
+        """
+        Stop the helpers for the given namespace (all namespaces if None).
+        :type name: str
+        """
+        with cls.executors_lock:
+            for key in list(cls.executors.keys()):
+                if name is None or key[0] == name:
+                    cls.executors.pop(key).stop()
+
+    def is_running(self):
+        """
+        :return: bool
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def get_command(self):
+        """
+        :return: list[str] The command line which starts the helper (with
+        sudo only if it needs root and isn't root already, as with
+        LinuxCLI.priv_prefix)
+        """
+        return ((['sudo', '-E'] if self.priv and os.geteuid() != 0
+                 else []) +
+                (['ip', 'netns', 'exec', self.name]
+                 if self.name is not None else []) +
+                [sys.executable, '-c', EXECUTOR_HELPER])
+
+    def start(self):
+        self.netns_id = get_netns_id(self.name)
+        if self.name is not None and self.netns_id is None:
+            raise ObjectNotFoundException(
+                'Network namespace not found: ' + self.name)
+        try:
+            with open(os.devnull, 'w') as devnull:
+                self.process = subprocess.Popen(
+                    self.get_command(),
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                    stderr=devnull, preexec_fn=os.setsid)
+        except OSError as e:
+            raise SubprocessFailedException(
+                'Could not start command executor for netns ' +
+                str(self.name) + ': ' + str(e))
+
+    def kill(self):
+        """
+        Stop a helper which isn't responding.
+        """
+        if self.process is not None:
+            try:
+                self.process.terminate()
+            except OSError:
+                pass
+        self.stop()
+
+    def stop(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait()
+            except (IOError, OSError):
+                pass
+            self.process = None
+
+    def run(self, commands, shell=True, env=None, timeout=None):
+        """
+        Run a single shell command (or a list of argv lists piped together,
+        with shell=False, each of which is run in the namespace) in the
+        namespace.
+        :type commands: str|list[list[str]]
+        :type shell: bool
+        :type env: dict[str, str]
+        :type timeout: float The command's own timeout (None to wait for it
+        however long it takes)
+        :return: (int, str, str) Return code, stdout and stderr, or None if
+        the helper is busy, or the shell command line could run more than
+        one command
+        """
+        if shell and not is_single_command(commands):
+            return None
+        if not self.lock.acquire(False):
+            return None
+        try:
+            if (self.is_running() and
+                    self.netns_id != get_netns_id(self.name)):
+                self.stop()
+            if not self.is_running():
+                self.start()
+            helper_timeout = deadline = None
+            if timeout is not None:
+                helper_timeout = timeout + EXECUTOR_KILL_GRACE
+                deadline = time.time() + helper_timeout + EXECUTOR_KILL_GRACE
+            request = json.dumps({'commands': commands, 'shell': shell,
+                                  'env': env,
+                                  'timeout': helper_timeout}).encode('utf-8')
+            try:
+                self.process.stdin.write(struct.pack('!I', len(request)) +
+                                         request)
+                self.process.stdin.flush()
+                length = self.read_exact(4, deadline)
+                response = json.loads(self.read_exact(
+                    struct.unpack('!I', length)[0],
+                    deadline).decode('utf-8'))
+            except SubprocessTimeoutException as e:
+                self.kill()
+                return (EXECUTOR_TIMEOUT_RET_CODE, b'',
+                        (e.info + '\n').encode('utf-8'))
+            except (IOError, OSError, ValueError, struct.error) as e:
+                self.stop()
+                raise SubprocessFailedException(
+                    'Command executor for netns ' + str(self.name) +
+                    ' failed: ' + str(e))
+            return (response['ret_code'],
+                    base64.b64decode(response['stdout']),
+                    base64.b64decode(response['stderr']))
+        finally:
+            self.lock.release()
+
+    def read_exact(self, size, deadline):
+        """
+        :type size: int
+        :type deadline: float Time to give up waiting for the helper (None
+        to wait indefinitely)
+        :return: bytes
+        """
+        fd = self.process.stdout.fileno()
+        data = b''
+        while len(data) < size:
+            remaining = (max(0, deadline - time.time())
+                         if deadline is not None else None)
+            if not select.select([fd], [], [], remaining)[0]:
+                raise SubprocessTimeoutException(
+                    'Command executor for netns ' + str(self.name) +
+                    ' timed out')
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise IOError('Command executor exited')
+            data += chunk
+        return data
+
+
+atexit.register(NetNSExecutor.stop_executors)
@@ -0,0 +1,178 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+import time
+from zephyr.common.exceptions import *
+from zephyr.common.pcap_file import PCAPStreamWriter
+
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_SPILL = 'spill'
+OVERFLOW_POLICIES = [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST,
+                     OVERFLOW_SPILL]
+
+
+class PacketBuffer(object):
+    """
+    Thread-safe buffer of captured packets waiting to be retrieved.  By
+    default the buffer is unbounded.  If a packet and/or byte limit is
+    set, it acts as a ring buffer once full, and the overflow policy
+    decides what happens to the extra packets:
+
+    drop_oldest: The oldest buffered packets are discarded
+    drop_newest: The arriving packets are discarded
+    spill: The oldest buffered packets are moved out to a pcap file
+
+    The number of packets (and bytes) discarded or spilled are counted.
+    """
+    def __init__(self, max_packets=0, max_bytes=0,
+                 overflow_policy=OVERFLOW_DROP_OLDEST, spill_filename=None):
+        """
+        :type max_packets: int Maximum packets to buffer (0 for no limit)
+        :type max_bytes: int Maximum bytes of packet data to buffer (0 for
+        no limit)
+        :type overflow_policy: str
+        :type spill_filename: str File to spill packets to with the
+        'spill' policy (use tcp.spill.<timestamp> if name not provided)
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ArgMismatchException(
+                'Unknown packet buffer overflow policy: ' + overflow_policy)
+        self.max_packets = max_packets
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+        self.packets = collections.deque()
+        """ :type: collections.deque[PCAPPacket] """
+        self.buffered_bytes = 0
+        self.dropped_packets = 0
+        self.dropped_bytes = 0
+        self.spilled_packets = 0
+        self.spilled_bytes = 0
+        self.spill_writer = None
+        """ :type: PCAPStreamWriter """
+        if overflow_policy == OVERFLOW_SPILL:
+            self.spill_writer = PCAPStreamWriter(
+                spill_filename if spill_filename is not None
+                else 'tcp.spill.' + str(time.time()))
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.packets)
+
+    def is_full(self, extra_bytes=0):
+        """
+        :type extra_bytes: int
+        :return: bool True if the buffer would be over its limits with
+        one more packet of the given size
+        """
+        return ((self.max_packets != 0 and
+                 len(self.packets) + 1 > self.max_packets) or
+                (self.max_bytes != 0 and
+                 self.buffered_bytes + extra_bytes > self.max_bytes))
+
+    def extend(self, packets):
+        """
+        Add packets to the buffer, applying the overflow policy if it is
+        full, and wake up anything waiting for them.
+        :type packets: list[PCAPPacket]
+        """
+        with self.condition:
+            for packet in packets:
+                size = len(packet.packet_data)
+                if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                    if self.is_full(size):
+                        self.dropped_packets += 1
+                        self.dropped_bytes += size
+                        continue
+                else:
+                    while len(self.packets) > 0 and self.is_full(size):
+                        old_packet = self.packets.popleft()
+                        old_size = len(old_packet.packet_data)
+                        self.buffered_bytes -= old_size
+                        if self.spill_writer is not None:
+                            self.spill_writer.write_packet(old_packet)
+                            self.spilled_packets += 1
+                            self.spilled_bytes += old_size
+                        else:
+                            self.dropped_packets += 1
+                            self.dropped_bytes += old_size
+                self.packets.append(packet)
+                self.buffered_bytes += size
+            self.condition.notify_all()
+
+    def append(self, packet):
+        """
+        :type packet: PCAPPacket
+        """
+        self.extend([packet])
+
+    def get(self, count=1, timeout=None):
+        """
+        Wait for and return the next [count] packets (0 means just return
+        whatever is buffered).  A SubprocessTimeoutException is raised if
+        they do not all arrive within the timeout, in which case the
+        packets stay buffered.
+        :type count: int
+        :type timeout: float
+        :return: list[PCAPPacket]
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            while len(self.packets) < count:
+                remaining = (deadline - time.time()
+                             if deadline is not None else None)
+                if remaining is not None and remaining <= 0:
+                    received = len(self.packets)
+                    raise SubprocessTimeoutException(
+                        (('Only ' + str(received) + '/')
+                         if received != 0 else '0/') +
+                        str(count) + ' packets received within timeout')
+                self.condition.wait(remaining)
+            return self.take(count if count != 0 else len(self.packets))
+
+    def get_available(self, timeout=0):
+        """
+        Wait up to timeout seconds for a packet to arrive (if none are
+        buffered yet), and return all of the buffered packets, which may
+        be an empty list.
+        :type timeout: float
+        :return: list[PCAPPacket]
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while len(self.packets) == 0 and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+            return self.take(len(self.packets))
+
+    def take(self, count):
+        """
+        Remove and return the oldest [count] packets (the buffer's lock
+        must be held).
+        :type count: int
+        :return: list[PCAPPacket]
+        """
+        ret = [self.packets.popleft() for _ in range(count)]
+        self.buffered_bytes -= sum(len(p.packet_data) for p in ret)
+        return ret
+
+    def close(self):
+        """
+        Close the spill file, if there is one.
+        """
+        with self.condition:
+            if self.spill_writer is not None:
+                self.spill_writer.close()
+                self.spill_writer = None
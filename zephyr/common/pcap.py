@@ -12,17 +12,188 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
+import socket
+import struct
 from zephyr.common.exceptions import *
+from zephyr.common.pcap_packet import PCAPEthernet
+from zephyr.common.pcap_packet import PCAPSLL
+
+ETHER_TYPE_IP = 0x0800
+ETHER_TYPE_ARP = 0x0806
+ETHER_TYPE_RARP = 0x8035
+ETHER_TYPE_IP6 = 0x86dd
+
+ETHER_PROTOCOLS = {'ip': ETHER_TYPE_IP,
+                   'arp': ETHER_TYPE_ARP,
+                   'rarp': ETHER_TYPE_RARP,
+                   'ip6': ETHER_TYPE_IP6}
+IP_PROTOCOLS = {'icmp': 1, 'igmp': 2, 'tcp': 6, 'udp': 17, 'sctp': 132}
+
+SLL_TYPE_BROADCAST = 1
+SLL_TYPE_MULTICAST = 2
+
+UCHAR = struct.Struct('!B')
+USHORT = struct.Struct('!H')
+UINT = struct.Struct('!I')
+LOAD_SIZES = {1: UCHAR, 2: USHORT, 4: UINT}
+
+LOAD_EXPRESSION = re.compile(
+    r'^\s*(\w+)\s*\[\s*(\w+)\s*(?::\s*([124])\s*)?\]'
+    r'(?:\s*&\s*(\w+))?\s*$')
+
+
+def link_offsets(link_layer):
+    """
+    Get the fixed offsets of the ether type and of the network-layer header
+    in frames captured with the given link-layer.
+    :type link_layer: PCAPEthernet | PCAPSLL
+    :return: (int, int)
+    """
+    if link_layer is PCAPSLL:
+        return 14, 16
+    return 12, 14
+
+
+def parse_ip_address(host):
+    """
+    :type host: str Dotted-quad IPv4 address or resolvable host name
+    :return: int
+    """
+    try:
+        return UINT.unpack(socket.inet_aton(host))[0]
+    except socket.error:
+        return UINT.unpack(socket.inet_aton(socket.gethostbyname(host)))[0]
+
+
+def parse_mac_address(mac):
+    """
+    :type mac: str
+    :return: bytes
+    """
+    octets = re.split('[:.-]', mac)
+    if len(octets) != 6:
+        raise ArgMismatchException('Invalid MAC address: ' + mac)
+    return struct.pack('!6B', *[int(o, 16) for o in octets])
+
+
+def parse_int(value):
+    """
+    Parse an integer constant in a filter expression (decimal, or hex/octal
+    in C notation).
+    :type value: str | int
+    :return: int
+    """
+    value = str(value)
+    if value.startswith('0x') or value.startswith('0X'):
+        return int(value, 16)
+    if len(value) > 1 and value.startswith('0'):
+        return int(value, 8)
+    return int(value)
+
+
+def ether_type_check(link_layer, ether_types):
+    """
+    :type link_layer: PCAPEthernet | PCAPSLL
+    :type ether_types: list[int]
+    :return: callable
+    """
+    type_offset, _ = link_offsets(link_layer)
+    if len(ether_types) == 1:
+        ether_type = ether_types[0]
+        return lambda d: USHORT.unpack_from(d, type_offset)[0] == ether_type
+    return lambda d: USHORT.unpack_from(d, type_offset)[0] in ether_types
+
+
+def ip_proto_check(link_layer, protos):
+    """
+    :type link_layer: PCAPEthernet | PCAPSLL
+    :type protos: list[int]
+    :return: callable
+    """
+    is_ip = ether_type_check(link_layer, [ETHER_TYPE_IP])
+    _, net_offset = link_offsets(link_layer)
+    return lambda d: (is_ip(d) and
+                      UCHAR.unpack_from(d, net_offset + 9)[0] in protos)
+
+
+def transport_offset(link_layer):
+    """
+    Get a function returning the offset of the transport-layer header
+    (following the variable-length IPv4 header) in a frame.
+    :type link_layer: PCAPEthernet | PCAPSLL
+    :return: callable
+    """
+    _, net_offset = link_offsets(link_layer)
+    return lambda d: (net_offset +
+                      (UCHAR.unpack_from(d, net_offset)[0] & 0xf) * 4)
+
+
+def unfragmented_check(link_layer):
+    """
+    Match only the first fragment of an IPv4 packet, which is the only one
+    carrying the transport-layer header.
+    :type link_layer: PCAPEthernet | PCAPSLL
+    :return: callable
+    """
+    _, net_offset = link_offsets(link_layer)
+    return lambda d: USHORT.unpack_from(d, net_offset + 6)[0] & 0x1fff == 0
 
 
 class Rule(object):
+    """
+    A packet filter rule which can be rendered as a tcpdump filter
+    expression with to_str, or compiled into a predicate over the raw bytes
+    of captured frames with compile_predicate.  Predicates only read fields
+    at fixed offsets (as BPF does) and support IPv4 only.
+    """
     def __init__(self):
-        pass
+        self.compiled_predicates = {}
 
     def to_str(self):
         raise ArgMismatchException(
             'All Rules should override the "to_str" method!')
 
+    def make_predicate(self, link_layer):
+        """
+        Build the predicate for this rule.  Reads past the end of the
+        frame are allowed to raise struct.error here, and are treated as a
+        non-match by compile_predicate.
+        :type link_layer: PCAPEthernet | PCAPSLL
+        :return: callable
+        """
+        raise ArgMismatchException(
+            'Rule cannot be compiled to a predicate: ' + self.to_str())
+
+    def compile_predicate(self, link_layer=PCAPEthernet):
+        """
+        Compile this rule into a function which takes a captured frame's
+        raw data (bytes, bytearray or memoryview) and returns whether the
+        frame matches the rule, without parsing any of the layers.
+        :type link_layer: PCAPEthernet | PCAPSLL
+        :return: callable
+        """
+        if link_layer not in self.compiled_predicates:
+            predicate = self.make_predicate(link_layer)
+
+            def check(packet_data):
+                try:
+                    return predicate(packet_data)
+                except (struct.error, IndexError):
+                    # Like BPF, reject frames too short for the filter
+                    return False
+
+            self.compiled_predicates[link_layer] = check
+        return self.compiled_predicates[link_layer]
+
+    def matches(self, packet):
+        """
+        Check whether a captured packet matches this rule.
+        :type packet: PCAPPacket
+        :return: bool
+        """
+        return self.compile_predicate(packet.link_layer)(packet.packet_data)
+
 
 class Simple(Rule):
     def __init__(self, val):
@@ -40,6 +211,9 @@ class Null(Simple):
     def __init__(self):
         super(Null, self).__init__(val='')
 
+    def make_predicate(self, link_layer):
+        return lambda d: True
+
 
 class _PrimitiveBinaryBoolean(Rule):
     def __init__(self, operation, rule_set):
@@ -57,6 +231,13 @@ class _PrimitiveBinaryBoolean(Rule):
         return (' ' + self.operation + ' ').join(['( ' + i.to_str() + ' )'
                                                   for i in self.rule_set])
 
+    def make_predicates(self, link_layer):
+        """
+        :type link_layer: PCAPEthernet | PCAPSLL
+        :return: list[callable]
+        """
+        return [i.make_predicate(link_layer) for i in self.rule_set]
+
 
 class And(_PrimitiveBinaryBoolean):
     def __init__(self, rule_set):
@@ -65,6 +246,10 @@ class And(_PrimitiveBinaryBoolean):
         """
         super(And, self).__init__('and', rule_set)
 
+    def make_predicate(self, link_layer):
+        predicates = self.make_predicates(link_layer)
+        return lambda d: all(p(d) for p in predicates)
+
 
 class Or(_PrimitiveBinaryBoolean):
     def __init__(self, rule_set):
@@ -73,6 +258,13 @@ class Or(_PrimitiveBinaryBoolean):
         """
         super(Or, self).__init__('or', rule_set)
 
+    def make_predicate(self, link_layer):
+        predicates = self.make_predicates(link_layer)
+        if len(predicates) == 0:
+            # An empty filter matches everything
+            return lambda d: True
+        return lambda d: any(p(d) for p in predicates)
+
 
 class Not(Rule):
     def __init__(self, rule):
@@ -85,6 +277,10 @@ class Not(Rule):
     def to_str(self):
         return 'not ( ' + self.rule.to_str() + r' )'
 
+    def make_predicate(self, link_layer):
+        predicate = self.rule.make_predicate(link_layer)
+        return lambda d: not predicate(d)
+
 
 class _PrimitiveComparison(Rule):
     def __init__(self, operation, lhs, rhs):
@@ -101,6 +297,77 @@ class _PrimitiveComparison(Rule):
     def to_str(self):
         return str(self.lhs) + ' ' + str(self.operation) + ' ' + str(self.rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        """
+        :type lhs_value: int
+        :type rhs_value: int
+        :return: bool
+        """
+        raise ArgMismatchException(
+            'All comparisons should override the "compare" method!')
+
+    @staticmethod
+    def make_operand(operand, link_layer):
+        """
+        Build a function reading an operand's value from a frame, or
+        returning None if the frame does not have the operand's protocol.
+        Supported operands are integer constants, 'len', and loads of the
+        form 'proto[offset]' or 'proto[offset:size]', optionally masked
+        with '& value'.
+        :type operand: str | int
+        :type link_layer: PCAPEthernet | PCAPSLL
+        :return: callable
+        """
+        operand = str(operand).strip()
+        if operand == 'len':
+            return lambda d: len(d)
+        if re.match(r'^\w+$', operand):
+            value = parse_int(operand)
+            return lambda d: value
+
+        match = LOAD_EXPRESSION.match(operand)
+        if match is None:
+            raise ArgMismatchException(
+                'Unsupported operand in filter comparison: ' + operand)
+        proto = match.group(1)
+        offset = parse_int(match.group(2))
+        load = LOAD_SIZES[int(match.group(3) or 1)]
+        mask = parse_int(match.group(4)) if match.group(4) else None
+
+        _, net_offset = link_offsets(link_layer)
+        if proto in ['ether', 'link']:
+            has_proto = lambda d: True
+            base_offset = lambda d: 0
+        elif proto in ['ip', 'arp', 'rarp']:
+            has_proto = ether_type_check(link_layer, [ETHER_PROTOCOLS[proto]])
+            base_offset = lambda d: net_offset
+        elif proto in ['tcp', 'udp', 'icmp']:
+            is_proto = ip_proto_check(link_layer, [IP_PROTOCOLS[proto]])
+            is_first = unfragmented_check(link_layer)
+            has_proto = lambda d: is_proto(d) and is_first(d)
+            base_offset = transport_offset(link_layer)
+        else:
+            raise ArgMismatchException(
+                'Unsupported protocol in filter comparison: ' + proto)
+
+        def read(d):
+            if not has_proto(d):
+                return None
+            value = load.unpack_from(d, base_offset(d) + offset)[0]
+            return value & mask if mask is not None else value
+        return read
+
+    def make_predicate(self, link_layer):
+        lhs = self.make_operand(self.lhs, link_layer)
+        rhs = self.make_operand(self.rhs, link_layer)
+
+        def check(d):
+            lhs_value = lhs(d)
+            rhs_value = rhs(d)
+            return (lhs_value is not None and rhs_value is not None and
+                    self.compare(lhs_value, rhs_value))
+        return check
+
 
 class GreaterThanEqual(_PrimitiveComparison):
     def __init__(self, lhs, rhs):
@@ -110,6 +377,9 @@ class GreaterThanEqual(_PrimitiveComparison):
         """
         super(GreaterThanEqual, self).__init__('>=', lhs, rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        return lhs_value >= rhs_value
+
 
 class GreaterThan(_PrimitiveComparison):
     def __init__(self, lhs, rhs):
@@ -119,6 +389,9 @@ class GreaterThan(_PrimitiveComparison):
         """
         super(GreaterThan, self).__init__('>', lhs, rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        return lhs_value > rhs_value
+
 
 class Equal(_PrimitiveComparison):
     def __init__(self, lhs, rhs):
@@ -128,6 +401,9 @@ class Equal(_PrimitiveComparison):
         """
         super(Equal, self).__init__('=', lhs, rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        return lhs_value == rhs_value
+
 
 class NotEqual(_PrimitiveComparison):
     def __init__(self, lhs, rhs):
@@ -137,6 +413,9 @@ class NotEqual(_PrimitiveComparison):
         """
         super(NotEqual, self).__init__('!=', lhs, rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        return lhs_value != rhs_value
+
 
 class LessThan(_PrimitiveComparison):
     def __init__(self, lhs, rhs):
@@ -146,6 +425,9 @@ class LessThan(_PrimitiveComparison):
         """
         super(LessThan, self).__init__('<', lhs, rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        return lhs_value < rhs_value
+
 
 class LessThanEqual(_PrimitiveComparison):
     def __init__(self, lhs, rhs):
@@ -155,6 +437,9 @@ class LessThanEqual(_PrimitiveComparison):
         """
         super(LessThanEqual, self).__init__('<=', lhs, rhs)
 
+    def compare(self, lhs_value, rhs_value):
+        return lhs_value <= rhs_value
+
 
 class _PrimitiveTypeRule(Rule):
     def __init__(self, param, proto='', source=False, dest=False):
@@ -181,6 +466,86 @@ class _PrimitiveTypeRule(Rule):
             cmd += 'src and dst '
         return cmd + self.param
 
+    def make_directional(self, source_check, dest_check):
+        """
+        Combine the checks on a frame's source and destination according
+        to the rule's direction.
+        :type source_check: callable
+        :type dest_check: callable
+        :return: callable
+        """
+        if self.source and self.dest:
+            return lambda d: source_check(d) and dest_check(d)
+        elif self.source:
+            return source_check
+        elif self.dest:
+            return dest_check
+        return lambda d: source_check(d) or dest_check(d)
+
+    def make_address_predicate(self, link_layer, address, mask=0xffffffff):
+        """
+        Build a predicate matching IPv4 source/destination addresses (in
+        either the IP or the ARP headers, depending on the proto) against
+        an address and mask.
+        :type link_layer: PCAPEthernet | PCAPSLL
+        :type address: int
+        :type mask: int
+        :return: callable
+        """
+        _, net_offset = link_offsets(link_layer)
+        address &= mask
+        ip_protos = ['ip', 'arp', 'rarp'] if self.proto == '' else [self.proto]
+        if any(p not in ['ip', 'arp', 'rarp'] for p in ip_protos):
+            raise ArgMismatchException(
+                'Unsupported protocol for address filter: ' + self.proto)
+
+        def field_check(offset):
+            return lambda d: UINT.unpack_from(d, offset)[0] & mask == address
+
+        def proto_check(proto, source_offset, dest_offset):
+            is_proto = ether_type_check(link_layer, [ETHER_PROTOCOLS[proto]])
+            check = self.make_directional(
+                field_check(net_offset + source_offset),
+                field_check(net_offset + dest_offset))
+            return lambda d: is_proto(d) and check(d)
+
+        checks = []
+        if 'ip' in ip_protos:
+            checks.append(proto_check('ip', 12, 16))
+        if 'arp' in ip_protos:
+            checks.append(proto_check('arp', 14, 24))
+        if 'rarp' in ip_protos:
+            checks.append(proto_check('rarp', 14, 24))
+        return lambda d: any(c(d) for c in checks)
+
+    def make_port_predicate(self, link_layer, start_port, end_port):
+        """
+        Build a predicate matching TCP/UDP source/destination ports against
+        a range of ports.
+        :type link_layer: PCAPEthernet | PCAPSLL
+        :type start_port: int
+        :type end_port: int
+        :return: callable
+        """
+        if self.proto == '':
+            protos = [IP_PROTOCOLS['tcp'], IP_PROTOCOLS['udp']]
+        elif self.proto in ['tcp', 'udp']:
+            protos = [IP_PROTOCOLS[self.proto]]
+        else:
+            raise ArgMismatchException(
+                'Unsupported protocol for port filter: ' + self.proto)
+        is_proto = ip_proto_check(link_layer, protos)
+        is_first = unfragmented_check(link_layer)
+        get_offset = transport_offset(link_layer)
+
+        def field_check(offset):
+            return lambda d: (start_port <=
+                              USHORT.unpack_from(d, get_offset(d) + offset)[0]
+                              <= end_port)
+
+        check = self.make_directional(field_check(0), field_check(2))
+        return lambda d: is_proto(d) and is_first(d) and check(d)
+
 
 class Host(_PrimitiveTypeRule):
     def __init__(self, host, proto='', source=False, dest=False):
@@ -191,6 +556,20 @@ class Host(_PrimitiveTypeRule):
         :param dest: bool
         """
         super(Host, self).__init__('host ' + host, proto, source, dest)
+        self.host = host
+
+    def make_predicate(self, link_layer):
+        if self.proto != 'ether':
+            return self.make_address_predicate(
+                link_layer, parse_ip_address(self.host))
+
+        mac = parse_mac_address(self.host)
+        if link_layer is PCAPSLL:
+            # Cooked captures only keep the source address
+            return self.make_directional(lambda d: d[6:12] == mac,
+                                         lambda d: False)
+        return self.make_directional(lambda d: d[6:12] == mac,
+                                     lambda d: d[0:6] == mac)
 
 
 class PortRange(_PrimitiveTypeRule):
@@ -206,6 +585,12 @@ class PortRange(_PrimitiveTypeRule):
         super(PortRange, self).__init__('portrange ' + str(start_port) +
                                         '-' + str(end_port),
                                         proto, source, dest)
+        self.start_port = start_port
+        self.end_port = end_port
+
+    def make_predicate(self, link_layer):
+        return self.make_port_predicate(
+            link_layer, int(self.start_port), int(self.end_port))
 
 
 class Port(_PrimitiveTypeRule):
@@ -218,6 +603,11 @@ class Port(_PrimitiveTypeRule):
         """
         super(Port, self).__init__('port ' + str(port), proto,
                                    source, dest)
+        self.port = port
+
+    def make_predicate(self, link_layer):
+        return self.make_port_predicate(
+            link_layer, int(self.port), int(self.port))
 
 
 class Net(_PrimitiveTypeRule):
@@ -231,6 +621,26 @@ class Net(_PrimitiveTypeRule):
         super(Net, self).__init__(
             'net ' + net + (' mask ' + mask if mask != '' else ''),
             proto, source, dest)
+        self.net = net
+        self.mask = mask
+
+    def make_predicate(self, link_layer):
+        net = self.net
+        if '/' in net:
+            net, prefix_length = net.split('/')
+            prefix_length = int(prefix_length)
+        else:
+            # Like tcpdump, a partial address ('192.168.0') gives
+            # the prefix length
+            prefix_length = 8 * len(net.split('.'))
+        octets = net.split('.')
+        address = UINT.unpack(socket.inet_aton(
+            '.'.join(octets + ['0'] * (4 - len(octets)))))[0]
+        if self.mask != '':
+            mask = parse_ip_address(self.mask)
+        else:
+            mask = (0xffffffff << (32 - prefix_length)) & 0xffffffff
+        return self.make_address_predicate(link_layer, address, mask)
 
 
 class _PrimitiveProtoRule(Rule):
@@ -247,6 +657,21 @@ class _PrimitiveProtoRule(Rule):
     def to_str(self):
         return self.base_proto + ' proto ' + self.filter_proto
 
+    @staticmethod
+    def proto_number(proto, names):
+        """
+        :type proto: str Protocol name or number
+        :type names: dict[str, int]
+        :return: int
+        """
+        proto = proto.lstrip('\\')
+        if proto in names:
+            return names[proto]
+        try:
+            return parse_int(proto)
+        except ValueError:
+            raise ArgMismatchException('Unknown protocol: ' + proto)
+
 
 class IPProto(_PrimitiveProtoRule):
     def __init__(self, proto):
@@ -255,6 +680,10 @@ class IPProto(_PrimitiveProtoRule):
         """
         super(IPProto, self).__init__('ip', '\\' + proto)
 
+    def make_predicate(self, link_layer):
+        return ip_proto_check(
+            link_layer, [self.proto_number(self.filter_proto, IP_PROTOCOLS)])
+
 
 class EtherProto(_PrimitiveProtoRule):
     def __init__(self, proto):
@@ -263,6 +692,16 @@ class EtherProto(_PrimitiveProtoRule):
         """
         super(EtherProto, self).__init__('ether', proto)
 
+    def make_predicate(self, link_layer):
+        if self.filter_proto.lstrip('\\') == 'stp':
+            # STP is carried in 802.3 frames with an LLC SAP of 0x42
+            type_offset, net_offset = link_offsets(link_layer)
+            return lambda d: (USHORT.unpack_from(d, type_offset)[0] <= 1500 and
+                              USHORT.unpack_from(d, net_offset)[0] == 0x4242)
+        return ether_type_check(
+            link_layer,
+            [self.proto_number(self.filter_proto, ETHER_PROTOCOLS)])
+
 
 class _PrimitiveSimpleProto(Rule):
     def __init__(self, proto):
@@ -275,6 +714,9 @@ class _PrimitiveSimpleProto(Rule):
     def to_str(self):
         return self.proto
 
+    def make_predicate(self, link_layer):
+        return ip_proto_check(link_layer, [IP_PROTOCOLS[self.proto]])
+
 
 class ICMPProto(_PrimitiveSimpleProto):
     def __init__(self):
@@ -310,6 +752,30 @@ class _PrimitiveCast(Rule):
     def to_str(self):
         return self.proto + ' ' + self.type
 
+    def make_predicate(self, link_layer):
+        if self.proto == 'ip':
+            is_ip = ether_type_check(link_layer, [ETHER_TYPE_IP])
+            _, net_offset = link_offsets(link_layer)
+            if self.type == 'broadcast':
+                return lambda d: (is_ip(d) and
+                                  UINT.unpack_from(d, net_offset + 16)[0] ==
+                                  0xffffffff)
+            return lambda d: (is_ip(d) and
+                              UCHAR.unpack_from(d, net_offset + 16)[0] & 0xf0
+                              == 0xe0)
+
+        if link_layer is PCAPSLL:
+            # Cooked captures record the destination type instead of the
+            # destination address
+            if self.type == 'broadcast':
+                return lambda d: (USHORT.unpack_from(d, 0)[0] ==
+                                  SLL_TYPE_BROADCAST)
+            return lambda d: (USHORT.unpack_from(d, 0)[0] in
+                              [SLL_TYPE_BROADCAST, SLL_TYPE_MULTICAST])
+        if self.type == 'broadcast':
+            return lambda d: d[0:6] == b'\xff' * 6
+        return lambda d: UCHAR.unpack_from(d, 0)[0] & 0x1 == 0x1
+
 
 class Multicast(_PrimitiveCast):
     def __init__(self, proto='ether'):
@@ -0,0 +1,198 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import time
+from zephyr.common.exceptions import *
+from zephyr.common.pcap_packet import *
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+PCAP_LINK_TYPE_ETHERNET = 1
+PCAP_LINK_TYPE_LINUX_SLL = 113
+
+PCAP_GLOBAL_HEADER_LENGTH = 24
+PCAP_RECORD_HEADER_LENGTH = 16
+
+PCAP_GLOBAL_HEADER = {'<': struct.Struct('<IHHiIII'),
+                      '>': struct.Struct('>IHHiIII')}
+PCAP_RECORD_HEADER = {'<': struct.Struct('<IIII'),
+                      '>': struct.Struct('>IIII')}
+
+PCAP_LINK_LAYERS = {PCAP_LINK_TYPE_ETHERNET: PCAPEthernet,
+                    PCAP_LINK_TYPE_LINUX_SLL: PCAPSLL}
+PCAP_LINK_TYPES = {PCAPEthernet: PCAP_LINK_TYPE_ETHERNET,
+                   PCAPSLL: PCAP_LINK_TYPE_LINUX_SLL}
+
+
+def format_pcap_timestamp(seconds, useconds):
+    """
+    Format a capture time the way tcpdump prints it
+    (HH:MM:SS.uuuuuu, local time).
+    :type seconds: int
+    :type useconds: int
+    :return: str
+    """
+    return (time.strftime('%H:%M:%S', time.localtime(seconds)) +
+            '.{0:06d}'.format(useconds))
+
+
+class PCAPStreamReader(object):
+    """
+    Incremental reader for the libpcap file format (as written by
+    'tcpdump -w').  Raw data can be fed in any size chunks as it arrives,
+    and each call returns the PCAPPackets completed by that data.
+    Partial records are buffered until the rest of the data arrives.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.byte_order = None
+        """ :type: str """
+        self.nsec_resolution = False
+        self.version = None
+        """ :type: (int, int) """
+        self.snap_length = 0
+        self.link_type = None
+        """ :type: int """
+        self.link_layer = PCAPEthernet
+        self.packets_read = 0
+
+    def feed(self, data):
+        """
+        Add raw pcap data to the stream and return any packets completed.
+        :type data: bytes | bytearray
+        :return: list[PCAPPacket]
+        """
+        self.buffer.extend(data)
+        packets = []
+        pos = 0
+
+        if self.byte_order is None:
+            if len(self.buffer) < PCAP_GLOBAL_HEADER_LENGTH:
+                return packets
+            self.read_global_header()
+            pos = PCAP_GLOBAL_HEADER_LENGTH
+
+        record_header = PCAP_RECORD_HEADER[self.byte_order]
+        buffer_length = len(self.buffer)
+        while buffer_length - pos >= PCAP_RECORD_HEADER_LENGTH:
+            ts_sec, ts_frac, cap_length, orig_length = \
+                record_header.unpack_from(self.buffer, pos)
+
+            # Only the captured portion of the packet (which will be
+            # smaller than the original length when truncated by the
+            # snap length) follows the header
+            data_start = pos + PCAP_RECORD_HEADER_LENGTH
+            data_end = data_start + cap_length
+            if data_end > buffer_length:
+                break
+
+            if self.nsec_resolution:
+                ts_frac //= 1000
+
+            packet = PCAPPacket(bytes(self.buffer[data_start:data_end]),
+                                format_pcap_timestamp(ts_sec, ts_frac))
+            packet.link_layer = self.link_layer
+            packet.capture_time = (ts_sec, ts_frac)
+            packet.original_length = orig_length
+            packets.append(packet)
+            pos = data_end
+
+        del self.buffer[:pos]
+        self.packets_read += len(packets)
+        return packets
+
+    def read_global_header(self):
+        """
+        Read the pcap file's global header from the start of the buffer,
+        setting the byte order, time resolution, and link-layer type.
+        """
+        magic = 0
+        for byte_order in ['<', '>']:
+            magic = PCAP_GLOBAL_HEADER[byte_order].unpack_from(
+                self.buffer, 0)[0]
+            if magic in [PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC]:
+                self.byte_order = byte_order
+                break
+        else:
+            raise PacketParsingException(
+                'Unknown pcap file magic number [0x' +
+                '{0:08x}'.format(magic) + ']', fatal=True)
+
+        (magic, ver_major, ver_minor, tz_offset, sigfigs,
+         self.snap_length, self.link_type) = \
+            PCAP_GLOBAL_HEADER[self.byte_order].unpack_from(self.buffer, 0)
+        self.version = (ver_major, ver_minor)
+        self.nsec_resolution = magic == PCAP_MAGIC_NSEC
+        self.link_layer = PCAP_LINK_LAYERS.get(self.link_type, PCAPEthernet)
+
+
+class PCAPStreamWriter(object):
+    """
+    Writer for the libpcap file format, to save packets (such as a
+    filtered subset of a capture) in a file readable by tcpdump or
+    wireshark.  The global header is written with the first packet, using
+    that packet's link-layer type.
+    """
+    def __init__(self, file_name, snap_length=65535):
+        """
+        :type file_name: str
+        :type snap_length: int
+        """
+        self.file_name = file_name
+        self.snap_length = snap_length
+        self.dump_file = None
+        """ :type: file """
+        self.packets_written = 0
+
+    def write_packet(self, packet):
+        """
+        :type packet: PCAPPacket
+        """
+        if self.dump_file is None:
+            self.dump_file = open(self.file_name, 'wb')
+            self.dump_file.write(PCAP_GLOBAL_HEADER['<'].pack(
+                PCAP_MAGIC_USEC, 2, 4, 0, 0, self.snap_length,
+                PCAP_LINK_TYPES.get(packet.link_layer,
+                                    PCAP_LINK_TYPE_ETHERNET)))
+
+        if packet.capture_time is not None:
+            ts_sec, ts_usec = packet.capture_time
+        else:
+            now = time.time()
+            ts_sec, ts_usec = int(now), int((now - int(now)) * 1000000)
+        packet_data = bytes(packet.packet_data)
+        self.dump_file.write(PCAP_RECORD_HEADER['<'].pack(
+            ts_sec, ts_usec, len(packet_data),
+            packet.original_length if packet.original_length is not None
+            else len(packet_data)))
+        self.dump_file.write(packet_data)
+        self.packets_written += 1
+
+    def close(self):
+        if self.dump_file is not None:
+            self.dump_file.close()
+            self.dump_file = None
+
+
+def read_pcap_file(file_name):
+    """
+    Read all packets from a saved pcap file.
+    :type file_name: str
+    :return: list[PCAPPacket]
+    """
+    reader = PCAPStreamReader()
+    with open(file_name, 'rb') as f:
+        return reader.feed(f.read())
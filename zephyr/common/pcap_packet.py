@@ -12,8 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import struct
 from zephyr.common.exceptions import *
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # Python 2
+    from collections import Mapping
+
 ETHERNET_PROTOCOL_TYPE_IP4 = 0x0800
 ETHERNET_PROTOCOL_TYPE_ARP = 0x0806
 ETHERNET_PROTOCOL_TYPE_RARP = 0x8035
@@ -59,6 +66,33 @@ ICMP_PROTOCOL_DU_CODE_COMM_PROHIBIT = 13
 ICMP_PROTOCOL_DU_CODE_HOST_PRECEDENCE_VIOLATION = 14
 ICMP_PROTOCOL_DU_CODE_PRECEDENCE_CUTOFF = 15
 
+# Precompiled header unpackers (network byte order).  Layers decode
+# straight out of the captured buffer at an offset, so no per-layer
+# copies of the packet data are ever made.
+ETHERNET_HEADER = struct.Struct('!6B6BH')
+SLL_HEADER = struct.Struct('!6x6B2xH')
+IP4_HEADER = struct.Struct('!B8xB2x4B4B')
+ARP_HEADER = struct.Struct('!HHBBH')
+TCP_HEADER = struct.Struct('!HHIIBBH')
+UDP_HEADER = struct.Struct('!HHH')
+ICMP_HEADER = struct.Struct('!BB2x4B')
+
+MAC_ADDRESS_FORMAT = '{0:02x}:{1:02x}:{2:02x}:{3:02x}:{4:02x}:{5:02x}'
+IP4_ADDRESS_FORMAT = '{0}.{1}.{2}.{3}'
+
+
+def to_packet_buffer(packet_data):
+    """
+    Returns an object supporting the buffer protocol for the given packet
+    data.  Raw bytes, bytearrays and memoryviews are used as-is (no copy),
+    while the legacy list-of-ints form is converted once into a bytearray.
+    :type packet_data: list[int] | bytes | bytearray | memoryview
+    :return: bytes | bytearray | memoryview
+    """
+    if isinstance(packet_data, list):
+        return bytearray(packet_data)
+    return packet_data
+
 
 class PCAPPacket(object):
 
@@ -122,22 +156,50 @@ class PCAPPacket(object):
 
     def __init__(self, packet_data, timestamp):
         """
-        :param packet_data: list[int]
+        :param packet_data: list[int] | bytes | bytearray | memoryview
         :param timestamp: str
         """
         self.timestamp = timestamp
         self.packet_data = packet_data
-        self.layer_data = {}
-        """ :type: dict[str, PCAPEncapsulatedLayer] """
+        self.layer_data = PCAPLayerMap(self)
+        """ :type: PCAPLayerMap """
         self.extra_data = {}
         """ :type: dict[str, list[str]] """
+        self.link_layer = PCAPEthernet
+        """ :type: class """
+        self.capture_time = None
+        """ :type: (int, int) """
+        self.original_length = None
+        """ :type: int """
+
+        # Parsing state.  Layers are only decoded when they are first
+        # accessed, so these track how far down the stack we have gotten.
+        self.parsed_layers = {}
+        """ :type: dict[str, PCAPEncapsulatedLayer] """
+        self.packet_buffer = None
+        self.parse_offset = 0
+        self.parse_class_stack = None
+        """ :type: list[class] """
+        self.next_parse_class = None
 
     def __iter__(self):
         return iter(self.layer_data)
 
+    def __contains__(self, layer_name):
+        return layer_name in self.layer_data
+
+    def __getitem__(self, layer_name):
+        """
+        Return the named layer, decoding the packet only as far as needed
+        to reach it.
+        :type layer_name: str
+        :return: PCAPEncapsulatedLayer
+        """
+        return self.layer_data[layer_name]
+
     def to_str(self):
         ret_str = 'PACKET { time[' + str(self.timestamp) + '] '
-        for n, l in self.layer_data.iteritems():
+        for n, l in self.parsed_layers.iteritems():
             ret_str += '<layer [' + n + '] ' + l.to_str() + '>'
         ret_str += '}'
         return ret_str
@@ -145,83 +207,130 @@ class PCAPPacket(object):
     def get_data(self):
         return self.layer_data
 
-    def parse(self, parse_class_stack=None):
+    def parse(self, parse_class_stack=None, lazy=False):
         """
+        Parse the packet using the given stack of classes.  By default,
+        every layer is decoded right away.  If lazy is set, the parse is
+        only set up, and each layer is decoded the first time it (or a
+        layer above it) is accessed through layer_data or packet[name].
+        Packets which are never parsed explicitly are parsed lazily
+        with the default stack on first access.
         :param parse_class_stack: list[class] Stack of classes to parse
         packet (highest layer first in list)
-        :return: dict[str, PCAPEncapsulatedLayer]
+        :param lazy: bool Defer decoding each layer until first access
+        :return: PCAPLayerMap
         """
-
         self.extra_data['parse_classes'] = []
         self.extra_data['parse_types'] = []
+        self.parsed_layers = {}
+
+        # Start parsing with the whole packet (starting from Link-Layer).
+        # Every layer decodes in-place from this single buffer, advancing
+        # the offset to where its payload begins.
+        self.packet_buffer = to_packet_buffer(self.packet_data)
+        self.parse_offset = 0
 
-        # Start parsing with the whole packet (starting from Link-Layer)
-        current_data = self.packet_data
+        # Work on a copy, as the stack is consumed as layers are parsed.
+        self.parse_class_stack = \
+            list(parse_class_stack) if parse_class_stack is not None else []
 
         # By default, the parsing stack is None, which tells us to figure
-        # it out automatically, so let's start with Ethernet_II, as it's
-        # the most common link player protocol. If it is empty at any point,
-        # that means to just use the recommended parser, which in this case
-        #  would mean to use Ethernet, since it's the first step.
-        if parse_class_stack is None or len(parse_class_stack) == 0:
-            parse_class_name = PCAPEthernet
+        # it out automatically, so let's start with the packet's link
+        # layer, which is Ethernet_II unless the capture said otherwise, as
+        # it's the most common link player protocol. If it is empty at any
+        # point, that means to just use the recommended parser, which in
+        # this case would mean to use the link layer, since it's the first
+        # step.
+        if len(self.parse_class_stack) == 0:
+            self.next_parse_class = self.link_layer
         else:
             # Otherwise, let's pop the first parsing class and continue
-            parse_class_name = parse_class_stack.pop()
+            self.next_parse_class = self.parse_class_stack.pop()
+
+        if lazy is False:
+            self.parse_to_layer()
+
+        return self.layer_data
+
+    def parse_to_layer(self, layer_name=None):
+        """
+        Decode layers until the named layer is parsed, or until the whole
+        stack is parsed if no name is given.  Layers already decoded are
+        not parsed again.
+        :type layer_name: str
+        :return: bool True if the layer was found in the packet
+        """
+        if self.packet_buffer is None:
+            self.parse(lazy=True)
 
         # If there are no more parsers to run in the stack, finish up
-        while parse_class_name is not None:
-
-            # Check type and set up some extra information about the classes
-            # used to parse
-            if not isinstance(parse_class_name(), PCAPEncapsulatedLayer):
-                raise ArgMismatchException(
-                    'Parsing classes must be of type "PCAPEncapsulatedLayer"')
-
-            self.extra_data['parse_classes'].append(
-                parse_class_name.__name__)
-            self.extra_data['parse_types'].append(
-                parse_class_name.layer_name())
+        while (layer_name is None or
+               layer_name not in self.parsed_layers) and \
+                self.next_parse_class is not None:
+            self.parse_next_layer()
+
+        return layer_name is None or layer_name in self.parsed_layers
+
+    def parse_next_layer(self):
+        """
+        Decode the next layer in the stack, and figure out which parser
+        should run after it.
+        :return: PCAPEncapsulatedLayer
+        """
+        parse_class_name = self.next_parse_class
+
+        # Instantiate the object based on the class given as the
+        # "next parser"
+        link_obj = parse_class_name()
+        """ :type: PCAPEncapsulatedLayer"""
+
+        # Check type and set up some extra information about the classes
+        # used to parse
+        if not isinstance(link_obj, PCAPEncapsulatedLayer):
+            self.next_parse_class = None
+            raise ArgMismatchException(
+                'Parsing classes must be of type "PCAPEncapsulatedLayer"')
+
+        self.extra_data['parse_classes'].append(
+            parse_class_name.__name__)
+        self.extra_data['parse_types'].append(
+            parse_class_name.layer_name())
+        self.extra_data['parse_errors.' +
+                        parse_class_name.layer_name()] = []
+
+        try:
+            # Parse the current layer and set the returned offset as
+            # the start of the data for the next layer to parse.
+            self.parse_offset = link_obj.parse_layer_at(self.packet_buffer,
+                                                        self.parse_offset)
+        except PacketParsingException as e:
             self.extra_data['parse_errors.' +
-                            parse_class_name.layer_name()] = []
-
-            # Instantiate the object based on the class given as the
-            # "next parser"
-            link_obj = parse_class_name()
-            """ :type: PCAPEncapsulatedLayer"""
-
-            try:
-                # Parse the current packet data and set the result as the
-                # new packet data for the
-                #  next layer to parse.
-                current_data = link_obj.parse_layer(current_data)
-            except PacketParsingException as e:
-                self.extra_data['parse_errors.' +
-                                parse_class_name.layer_name()].append(e.info)
-                if e.fatal is True:
-                    raise e
-
-            # Set the item in the data map with the parsed object keyed to
-            # the name the object itself uses to access the data
-            self.layer_data[parse_class_name.layer_name()] = link_obj
-
-            # If the last parser recommended a parser for the rest of the
-            # data and there were no other parsers configured manually to
-            # run, then add the recommended parser for the next step,
-            # otherwise, just use whatever we were told to use.
-
-            # Get the next parser's class name.  If stack is empty (or not
-            # defined), use the next recommended parser. If the next
-            # recommended parser is "None", that means we are finished
-            # parsing and exit the loop.
-            if parse_class_stack is None or len(parse_class_stack) == 0:
-                parse_class_name = link_obj.next_parse_recommendation
-            else:
-                # If the stack has a next step, use that instead.  If it's "
-                # None", that signals us to stop parsing and finish the loop.
-                parse_class_name = parse_class_stack.pop()
+                            parse_class_name.layer_name()].append(e.info)
+            if e.fatal is True:
+                # Nothing further down can be parsed
+                self.next_parse_class = None
+                raise e
+
+        # Set the item in the data map with the parsed object keyed to
+        # the name the object itself uses to access the data
+        self.parsed_layers[parse_class_name.layer_name()] = link_obj
+
+        # If the last parser recommended a parser for the rest of the
+        # data and there were no other parsers configured manually to
+        # run, then add the recommended parser for the next step,
+        # otherwise, just use whatever we were told to use.
+
+        # Get the next parser's class name.  If stack is empty, use the
+        # next recommended parser. If the next recommended parser is
+        # "None", that means we are finished parsing.
+        if len(self.parse_class_stack) == 0:
+            self.next_parse_class = link_obj.next_parse_recommendation
+        else:
+            # If the stack has a next step, use that instead.  If it's "
+            # None", that signals us to stop parsing.
+            self.next_parse_class = self.parse_class_stack.pop()
 
-        return self.layer_data
+        return link_obj
 
     def __str__(self):
         return self.to_str()
@@ -230,6 +339,40 @@ class PCAPPacket(object):
         return self.to_str()
 
 
+class PCAPLayerMap(Mapping):
+    """
+    Read-only map of layer name to parsed layer for a PCAPPacket.  Looking
+    up a layer decodes the packet only down to that layer, and iterating
+    decodes the whole stack.
+    """
+    def __init__(self, packet):
+        """
+        :type packet: PCAPPacket
+        """
+        self.packet = packet
+
+    def __getitem__(self, layer_name):
+        if not self.packet.parse_to_layer(layer_name):
+            raise KeyError(layer_name)
+        return self.packet.parsed_layers[layer_name]
+
+    def __contains__(self, layer_name):
+        # A layer the packet can't be decoded down to isn't in it (Mapping
+        # only turns a KeyError into False)
+        try:
+            return self.packet.parse_to_layer(layer_name)
+        except PacketParsingException:
+            return False
+
+    def __iter__(self):
+        self.packet.parse_to_layer()
+        return iter(self.packet.parsed_layers)
+
+    def __len__(self):
+        self.packet.parse_to_layer()
+        return len(self.packet.parsed_layers)
+
+
 class PCAPEncapsulatedLayer(object):
 
     @staticmethod
@@ -250,9 +393,24 @@ class PCAPEncapsulatedLayer(object):
 
     def parse_layer(self, packet_data):
         """
-        :param packet_data: list[int] Array of int representing the bytes in
-        the packet
-        :return: list[int]
+        Parse this layer from the start of the given data and return the
+        remaining (encapsulated) data.  The returned data is a slice of the
+        same type as the data passed in (a memoryview slice is zero-copy).
+        :param packet_data: list[int] | bytes | bytearray | memoryview Bytes
+        in the packet, starting with this layer's header
+        :return: list[int] | bytes | bytearray | memoryview
+        """
+        return packet_data[self.parse_layer_at(
+            to_packet_buffer(packet_data), 0):]
+
+    def parse_layer_at(self, packet_buffer, offset):
+        """
+        Parse this layer from the given offset in the packet buffer and
+        return the offset where the encapsulated data begins.
+        :param packet_buffer: bytes | bytearray | memoryview Raw bytes of the
+        whole packet
+        :param offset: int Offset of this layer's header in the buffer
+        :return: int
         """
         raise PacketParsingException(
             "Base layer class shouldn't be used directly.  "
@@ -283,10 +441,11 @@ class PCAPEthernet(PCAPEncapsulatedLayer):
                self.dest_mac + '] ' + \
                'type[0x' + '{0:04x}'.format(self.type) + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
         Ethernet_II frame structure:
         6 bytes - dest_mac
@@ -295,15 +454,17 @@ class PCAPEthernet(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 14:
+        data_length = len(packet_buffer) - offset
+        if data_length < 14:
             raise PacketParsingException(
                 'Ethernet layer data must at least be 14 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        self.dest_mac = PCAPPacket.char8_to_mac_address(*packet_data[0:6])
-        self.source_mac = PCAPPacket.char8_to_mac_address(*packet_data[6:12])
-        self.type = PCAPPacket.char8_to_int16(*packet_data[12:14])
+        fields = ETHERNET_HEADER.unpack_from(packet_buffer, offset)
+        self.dest_mac = MAC_ADDRESS_FORMAT.format(*fields[0:6])
+        self.source_mac = MAC_ADDRESS_FORMAT.format(*fields[6:12])
+        self.type = fields[12]
 
         # Otherwise, judge based on the type from our built-ins
         if self.type == 0x0800:
@@ -315,7 +476,7 @@ class PCAPEthernet(PCAPEncapsulatedLayer):
                 "No known handler for Ethernet type: " +
                 str(self.type), fatal=False)
 
-        return packet_data[14:]
+        return offset + 14
 
 
 class PCAPSLL(PCAPEncapsulatedLayer):
@@ -341,10 +502,11 @@ class PCAPSLL(PCAPEncapsulatedLayer):
                self.dest_mac + '] ' + \
                'type[0x' + '{0:04x}'.format(self.type) + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
         If Linux-Cooked (SLL) link-layer (i.e. the 'any' interface was used):
         6 bytes - Linux Cooked Protocol info
@@ -354,15 +516,17 @@ class PCAPSLL(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 16:
+        data_length = len(packet_buffer) - offset
+        if data_length < 16:
             raise PacketParsingException(
                 "'Linux-cooked' layer data must at least be 16 bytes, "
                 "but packet size is [" +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        self.dest_mac = PCAPPacket.char8_to_mac_address(*([0] * 6))
-        self.source_mac = PCAPPacket.char8_to_mac_address(*packet_data[6:12])
-        self.type = PCAPPacket.char8_to_int16(packet_data[14], packet_data[15])
+        fields = SLL_HEADER.unpack_from(packet_buffer, offset)
+        self.dest_mac = MAC_ADDRESS_FORMAT.format(*([0] * 6))
+        self.source_mac = MAC_ADDRESS_FORMAT.format(*fields[0:6])
+        self.type = fields[6]
 
         # Otherwise, judge based on the type from our built-ins
         if self.type == 0x0800:
@@ -374,7 +538,7 @@ class PCAPSLL(PCAPEncapsulatedLayer):
                 "Encapsulated type [" +
                 str(self.type) + "] unknown", fatal=False)
 
-        return packet_data[16:]
+        return offset + 16
 
 
 class PCAPIP4(PCAPEncapsulatedLayer):
@@ -406,10 +570,11 @@ class PCAPIP4(PCAPEncapsulatedLayer):
                self.source_ip + '] ' + \
                'd_ip[' + self.dest_ip + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
         If IP, the packet will look like this with word, word offset, and
         total offset followed by size of field):
@@ -429,13 +594,15 @@ class PCAPIP4(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 20:
+        data_length = len(packet_buffer) - offset
+        if data_length < 20:
             raise PacketParsingException(
                 'IP layer data must at least be 20 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        self.version = (packet_data[0] & 0xf0) >> 4
+        fields = IP4_HEADER.unpack_from(packet_buffer, offset)
+        self.version = (fields[0] & 0xf0) >> 4
 
         # Version must be either 4 or 6, no exceptions
         if self.version != 4 and self.version != 6:
@@ -443,7 +610,7 @@ class PCAPIP4(PCAPEncapsulatedLayer):
                 'IP version must be either 4 or 6, but it was [' +
                 str(self.version) + ']', fatal=True)
 
-        self.header_length = packet_data[0] & 0x0f
+        self.header_length = fields[0] & 0x0f
 
         # Do a sanity check on header length vs. packet size
         if self.header_length < 5:
@@ -451,13 +618,13 @@ class PCAPIP4(PCAPEncapsulatedLayer):
                 'IP header length field must be at least 5, but it was [' +
                 str(self.header_length), fatal=True)
 
-        if (self.header_length * 4) > len(packet_data):
+        if (self.header_length * 4) > data_length:
             raise PacketParsingException(
                 'IP header length field specifies length [' +
                 str(self.header_length) + '] longer than the packet size [' +
-                str(len(packet_data)) + ']!', fatal=True)
+                str(data_length) + ']!', fatal=True)
 
-        self.protocol = packet_data[9]
+        self.protocol = fields[1]
 
         # Otherwise, judge based on the type from our built-ins
         if self.protocol == IP4_PROTOCOL_TCP:
@@ -471,18 +638,12 @@ class PCAPIP4(PCAPEncapsulatedLayer):
                 "IP protocol [" +
                 str(self.protocol) + "] unknown", fatal=False)
 
-        self.source_ip = PCAPPacket.char8_to_ip4(packet_data[12],
-                                                 packet_data[13],
-                                                 packet_data[14],
-                                                 packet_data[15])
-        self.dest_ip = PCAPPacket.char8_to_ip4(packet_data[16],
-                                               packet_data[17],
-                                               packet_data[18],
-                                               packet_data[19])
+        self.source_ip = IP4_ADDRESS_FORMAT.format(*fields[2:6])
+        self.dest_ip = IP4_ADDRESS_FORMAT.format(*fields[6:10])
 
         # Remember, header length is in 4-octet words, so multiply by 4 to
         # get the data's starting byte
-        return packet_data[(self.header_length * 4):]
+        return offset + (self.header_length * 4)
 
 
 class PCAPARP(PCAPEncapsulatedLayer):
@@ -532,10 +693,11 @@ class PCAPARP(PCAPEncapsulatedLayer):
                self.sender_ip_addr + '] ' + \
                'd_ip[' + self.target_ip_addr + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
         If IP, the packet will look like this with word, word offset, and
         total offset followed by size of field):
@@ -553,71 +715,72 @@ class PCAPARP(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 12:
+        data_length = len(packet_buffer) - offset
+        if data_length < 12:
             raise PacketParsingException(
                 'ARP layer data must at least be 12 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        self.hw_type = PCAPPacket.char8_to_int16(packet_data[0],
-                                                 packet_data[1])
-        self.proto_type = PCAPPacket.char8_to_int16(packet_data[2],
-                                                    packet_data[3])
-        self.hw_addr_length = packet_data[4]
-        self.proto_addr_length = packet_data[5]
-        self.operation = PCAPPacket.char8_to_int16(packet_data[6],
-                                                   packet_data[7])
+        (self.hw_type, self.proto_type, self.hw_addr_length,
+         self.proto_addr_length, self.operation) = \
+            ARP_HEADER.unpack_from(packet_buffer, offset)
 
         # Sanity check on packet length now that we know the sizes of the
         # HW and Protocol addresses
         expected_size = (8 + (2 * self.hw_addr_length) +
                          (2 * self.proto_addr_length))
-        if len(packet_data) < expected_size:
+        if data_length < expected_size:
             raise PacketParsingException(
                 'ARP packet size is expected to be [' + str(expected_size) +
                 '] based on set HW and Proto address lengths, '
                 'but the real packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        sender_hw_addr_base = 8
+        sender_hw_addr_base = offset + 8
         sender_proto_addr_base = sender_hw_addr_base + self.hw_addr_length
         target_hw_addr_base = sender_proto_addr_base + self.proto_addr_length
         target_proto_addr_base = target_hw_addr_base + self.hw_addr_length
         target_proto_addr_finish = \
             target_proto_addr_base + self.proto_addr_length
 
+        # The address fields are variable-length, so unpack each one with
+        # a format sized from the header's length fields
+        hw_addr = struct.Struct('!' + str(self.hw_addr_length) + 'B')
+        proto_addr = struct.Struct('!' + str(self.proto_addr_length) + 'B')
         self.sender_hw_addr_raw = \
-            packet_data[sender_hw_addr_base:sender_proto_addr_base]
+            list(hw_addr.unpack_from(packet_buffer, sender_hw_addr_base))
         self.sender_proto_addr_raw = \
-            packet_data[sender_proto_addr_base:target_hw_addr_base]
+            list(proto_addr.unpack_from(packet_buffer, sender_proto_addr_base))
         self.target_hw_addr_raw = \
-            packet_data[target_hw_addr_base:target_proto_addr_base]
+            list(hw_addr.unpack_from(packet_buffer, target_hw_addr_base))
         self.target_proto_addr_raw = \
-            packet_data[target_proto_addr_base:target_proto_addr_finish]
+            list(proto_addr.unpack_from(packet_buffer, target_proto_addr_base))
 
         if self.hw_type == ARP_PROTOCOL_HW_TYPE_EHTERNET:
             self.sender_hw_addr_ether = \
-                PCAPPacket.char8_to_mac_address(*self.sender_hw_addr_raw)
+                MAC_ADDRESS_FORMAT.format(*self.sender_hw_addr_raw)
             self.target_hw_addr_ether = \
-                PCAPPacket.char8_to_mac_address(*self.target_hw_addr_raw)
+                MAC_ADDRESS_FORMAT.format(*self.target_hw_addr_raw)
 
         if self.proto_type == ETHERNET_PROTOCOL_TYPE_IP4:
             self.sender_ip_addr = \
-                PCAPPacket.char8_to_ip4(*self.sender_proto_addr_raw)
+                IP4_ADDRESS_FORMAT.format(*self.sender_proto_addr_raw)
             self.target_ip_addr = \
-                PCAPPacket.char8_to_ip4(*self.target_proto_addr_raw)
+                IP4_ADDRESS_FORMAT.format(*self.target_proto_addr_raw)
 
         self.next_parse_recommendation = None
 
-        if len(packet_data) > target_proto_addr_finish:
+        if len(packet_buffer) > target_proto_addr_finish:
             raise PacketParsingException(
                 'ARP packet has junk data at end of packet [' +
                 ', '.join(['0x{0:02x}'.format(i)
-                           for i in packet_data[target_proto_addr_finish:]]),
+                           for i in bytearray(
+                               packet_buffer[target_proto_addr_finish:])]),
                 fatal=False)
 
-        # Should be empty, but just in case...
-        return []
+        # Should be the end of the packet, but just in case...
+        return target_proto_addr_finish
 
 
 class PCAPTCP(PCAPEncapsulatedLayer):
@@ -658,10 +821,11 @@ class PCAPTCP(PCAPEncapsulatedLayer):
                'flags[0x' + '{0:02x}'.format(self.flags) + '] ' + \
                'w_size[' + str(self.window_size) + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
         If TCP, the packet will look like this:
         word 1, 0: total 0:  2 bytes - Source port
@@ -679,25 +843,17 @@ class PCAPTCP(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least
         # long enough for the header
-        if len(packet_data) < 20:
+        data_length = len(packet_buffer) - offset
+        if data_length < 20:
             raise PacketParsingException(
                 'TCP layer data must at least be 20 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
-
-        self.source_port = PCAPPacket.char8_to_int16(packet_data[0],
-                                                     packet_data[1])
-        self.dest_port = PCAPPacket.char8_to_int16(packet_data[2],
-                                                   packet_data[3])
-        self.seq = PCAPPacket.char8_to_int32(packet_data[4],
-                                             packet_data[5],
-                                             packet_data[6],
-                                             packet_data[7])
-        self.ack = PCAPPacket.char8_to_int32(packet_data[8],
-                                             packet_data[9],
-                                             packet_data[10],
-                                             packet_data[11])
-        self.data_offset = (packet_data[12] & 0xF0) >> 4
+                str(data_length) + ']', fatal=True)
+
+        (self.source_port, self.dest_port, self.seq, self.ack,
+         offset_ns, flags_low, self.window_size) = \
+            TCP_HEADER.unpack_from(packet_buffer, offset)
+        self.data_offset = (offset_ns & 0xF0) >> 4
 
         # Sanity check on data offset
         if self.data_offset < 5:
@@ -705,15 +861,15 @@ class PCAPTCP(PCAPEncapsulatedLayer):
                 'TCP data offset field must be at least 5, but it was [' +
                 str(self.data_offset), fatal=True)
 
-        if self.data_offset > len(packet_data):
+        if self.data_offset > data_length:
             raise PacketParsingException(
                 'TCP data offset field specifies length [' +
                 str(self.data_offset) + '] longer than the packet size [' +
-                str(len(packet_data)) + ']!', fatal=True)
+                str(data_length) + ']!', fatal=True)
 
-        self.flags = ((packet_data[12] & 0x1) * 0xFF) + packet_data[13]
-        self.window_size = PCAPPacket.char8_to_int16(packet_data[14],
-                                                     packet_data[15])
+        # The NS flag is the low bit of the data offset byte, which puts
+        # it just above the other eight flags (see TCP_PROTOCOL_FLAG_NS)
+        self.flags = ((offset_ns & 0x1) << 8) | flags_low
 
         # TCP is the last parsed packet in our stack.
         # Can add Layer 5-7 here (HTTP, SOAP, etc.)
@@ -721,7 +877,7 @@ class PCAPTCP(PCAPEncapsulatedLayer):
 
         # Remember, header length is in 4-octet words, so multiply
         # by 4 to get the data's starting byte
-        return packet_data[(self.data_offset * 4):]
+        return offset + (self.data_offset * 4)
 
 
 class PCAPUDP(PCAPEncapsulatedLayer):
@@ -747,10 +903,11 @@ class PCAPUDP(PCAPEncapsulatedLayer):
                str(self.dest_port) + '] ' + \
                'len[' + str(self.length) + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
         If UDP, the packet will look like this:
         word 1, 0: total 0:  2 bytes - Source port
@@ -761,25 +918,21 @@ class PCAPUDP(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 8:
+        data_length = len(packet_buffer) - offset
+        if data_length < 8:
             raise PacketParsingException(
                 'UDP layer data must at least be 8 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        self.source_port = PCAPPacket.char8_to_int16(packet_data[0],
-                                                     packet_data[1])
-        self.dest_port = PCAPPacket.char8_to_int16(packet_data[2],
-                                                   packet_data[3])
-        self.length = PCAPPacket.char8_to_int16(packet_data[4],
-                                                packet_data[5])
+        self.source_port, self.dest_port, self.length = \
+            UDP_HEADER.unpack_from(packet_buffer, offset)
 
         # UDP is the last parsing step in the standard TCP/IP stack
         self.next_parse_recommendation = None
 
-        # Remember, header length is in 4-octet words, so multiply by
-        # 4 to get the data's starting byte
-        return packet_data[8:]
+        # The UDP header is a fixed 8 bytes
+        return offset + 8
 
 
 class PCAPICMP(PCAPEncapsulatedLayer):
@@ -805,12 +958,13 @@ class PCAPICMP(PCAPEncapsulatedLayer):
                str(self.code) + '] ' + \
                'h_data[' + str(self.header_data) + ']'
 
-    def parse_layer(self, packet_data):
+    def parse_layer_at(self, packet_buffer, offset):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_buffer: bytes | bytearray | memoryview
+        :type offset: int
+        :return: int
 
-        If UDP, the packet will look like this:
+        If ICMP, the packet will look like this:
         word 1, 0: total 0: 1 byte  - Type
         word 1, 1: total 1: 1 byte  - Code
         word 1, 2: total 2: 2 bytes - Checksum
@@ -819,19 +973,20 @@ class PCAPICMP(PCAPEncapsulatedLayer):
         """
         # First, check length of packet to make sure it is at least
         # long enough for the header
-        if len(packet_data) < 8:
+        data_length = len(packet_buffer) - offset
+        if data_length < 8:
             raise PacketParsingException(
                 'ICMP layer data must at least be 8 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(data_length) + ']', fatal=True)
 
-        self.type = packet_data[0]
-        self.code = packet_data[1]
-        self.header_data = packet_data[4:8]
+        fields = ICMP_HEADER.unpack_from(packet_buffer, offset)
+        self.type = fields[0]
+        self.code = fields[1]
+        self.header_data = list(fields[2:6])
 
         # ICMP is the last parsing step in the standard TCP/IP stack
         self.next_parse_recommendation = None
 
-        # Remember, header length is in 4-octet words, so multiply by
-        # 4 to get the data's starting byte
-        return packet_data[8:]
+        # The ICMP header is a fixed 8 bytes
+        return offset + 8
@@ -0,0 +1,460 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import base64
+import getopt
+import json
+import os
+import pipes
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from zephyr.common.cmd_parse import REDIRECTS
+from zephyr.common.cmd_parse import split_command
+from zephyr.common.exceptions import *
+
+# Set to the broker's socket path once it is started, so CLIs in this
+# process and its children (e.g. ptm-host-ctl.py) can find it
+BROKER_SOCKET_ENV = 'ZEPHYR_PRIV_BROKER'
+BROKER_START_TIMEOUT = 10
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+# Command families the broker will run as root.  Shells and interpreters
+# are left out on purpose (they could run anything), as are commands which
+# can run other programs or scripts (find, awk, sed, sort, tcpdump -z,
+# modprobe -C, dhclient -sf, nc -e, hping3, service, sysctl through
+# kernel.core_pattern) or write or replace arbitrary files (tee, cp, mv,
+# ln, install, chmod, chown, truncate, uniq, mount, umount), so commands
+# using them still go through sudo.
+BROKER_ALLOWED_COMMANDS = {
+    'ip', 'tc', 'brctl', 'bridge', 'ethtool', 'arp', 'route', 'ifconfig',
+    'iptables', 'ip6tables', 'iptables-save', 'iptables-restore',
+    'ebtables', 'ovs-vsctl', 'ovs-ofctl', 'ovs-dpctl', 'ovs-appctl',
+    'mm-dpctl', 'mm-ctl', 'mn-conf', 'lsmod', 'ping', 'ping6', 'arping',
+    'kill', 'pkill', 'killall', 'ps', 'cat', 'tac', 'head', 'tail', 'wc',
+    'ls', 'stat', 'echo', 'true', 'false', 'test', 'touch', 'rm', 'mkdir',
+    'rmdir', 'grep', 'egrep', 'fgrep', 'cut', 'tr', 'date'}
+# Options of allowed commands which run commands the allowlist can't see
+# (matched the way the command matches them, so abbreviations count)
+BROKER_REFUSED_OPTIONS = {'ip': ['batch']}
+# Shell syntax which runs commands the allowlist can't see
+BROKER_REFUSED_SYNTAX = ['`', '$(', '<(', '>(']
+# Environment variables which are never passed on (as with sudo)
+BROKER_UNSAFE_ENV_PREFIXES = ('LD_', 'PYTHON')
+
+
+def get_command_names(commands, shell=True):
+    """
+    :type commands: str|list[list[str]]
+    :type shell: bool
+    :return: list[str] The names of all of the commands a request would
+    run, or None if they can't be determined
+    """
+    if not shell:
+        commands = ' | '.join(' '.join(pipes.quote(a) for a in c)
+                              for c in commands)
+    if any(s in commands for s in BROKER_REFUSED_SYNTAX):
+        return None
+    # With sudo, redirects are done by the caller's shell, so the files
+    # would end up owned by root if the broker did them instead
+    if any(dup == '' and f not in ('', '/dev/null')
+           for dup, f in REDIRECTS.findall(commands)):
+        return None
+    names = []
+    for netns, args in split_command(commands):
+        name = os.path.basename(args[0])
+        for arg in args[1:]:
+            option = arg.lstrip('-')
+            if (arg.startswith('-') and option != '' and
+                    any(o.startswith(option)
+                        for o in BROKER_REFUSED_OPTIONS.get(name, []))):
+                return None
+        names.append(name)
+    return names
+
+
+def is_allowed(commands, shell=True, allowed=BROKER_ALLOWED_COMMANDS):
+    """
+    :type commands: str|list[list[str]]
+    :type shell: bool
+    :type allowed: set[str]
+    :return: bool
+    """
+    names = get_command_names(commands, shell)
+    return (names is not None and len(names) > 0 and
+            all(n in allowed for n in names))
+
+
+def run_commands(commands, shell=True, env=None, cwd=None):
+    """
+    Run a shell command line (or a list of argv lists piped together,
+    with shell=False) to completion.
+    :type commands: str|list[list[str]]
+    :type shell: bool
+    :type env: dict[str, str]
+    :type cwd: str
+    :return: (int, str, str) Return code, stdout and stderr
+    """
+    cmds = [commands] if shell else commands
+    procs = []
+    with open(os.devnull, 'r+b') as null:
+        for i, c in enumerate(cmds):
+            last = i == len(cmds) - 1
+            procs.append(subprocess.Popen(
+                c, shell=shell,
+                stdin=null if i == 0 else procs[-1].stdout,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE if last else null,
+                env=env, cwd=cwd, preexec_fn=os.setsid))
+        o, e = procs[-1].communicate()
+        for p in procs[:-1]:
+            p.stdout.close()
+            p.wait()
+    return procs[-1].returncode, o, e
+
+
+def send_message(sock, message):
+    """
+    :type sock: socket.socket
+    :type message: dict
+    """
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+
+def receive_message(sock):
+    """
+    :type sock: socket.socket
+    :return: dict The message, or None if the socket was closed
+    """
+    length = receive_exact(sock, 4)
+    if length is None:
+        return None
+    data = receive_exact(sock, struct.unpack('!I', length)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def receive_exact(sock, size):
+    """
+    :type sock: socket.socket
+    :type size: int
+    :return: bytes
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class PrivBrokerServer(object):
+    """
+    The root side of the broker.  It listens on a Unix socket which only
+    the allowed users can reach, checks each connection's credentials
+    (with SO_PEERCRED) and namespaces, and runs the allowed commands it is
+    sent, the same way 'sudo -E' would have run them.  It exits when its
+    stdin is closed (i.e. when the process which started it exits).
+    """
+    def __init__(self, socket_path, allowed_uids,
+                 allowed_commands=BROKER_ALLOWED_COMMANDS):
+        """
+        :type socket_path: str
+        :type allowed_uids: list[int]
+        :type allowed_commands: set[str]
+        """
+        self.socket_path = socket_path
+        self.allowed_uids = set(allowed_uids) | {0}
+        self.allowed_commands = allowed_commands
+        self.sock = None
+        """ :type: socket.socket """
+        self.stopped = False
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        owner = [uid for uid in self.allowed_uids if uid != 0]
+        if len(owner) > 0 and os.geteuid() == 0:
+            os.chown(self.socket_path, owner[0], -1)
+        self.sock.listen(64)
+
+    def stop(self):
+        self.stopped = True
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
+            self.sock = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def serve_forever(self):
+        while not self.stopped:
+            try:
+                conn, _ = self.sock.accept()
+            except (socket.error, AttributeError):
+                if self.stopped:
+                    break
+                raise
+            thread = threading.Thread(target=self.handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def check_peer(self, conn):
+        """
+        :type conn: socket.socket
+        :return: str Why the peer may not use the broker, or None
+        """
+        pid, uid, gid = struct.unpack(
+            '3i', conn.getsockopt(socket.SOL_SOCKET, SO_PEERCRED,
+                                  struct.calcsize('3i')))
+        if uid not in self.allowed_uids:
+            return 'user ' + str(uid) + ' is not allowed'
+        # The broker's commands run in its own namespaces, so they would
+        # act on the wrong interfaces and mounts for anyone else
+        for ns in ('net', 'mnt'):
+            try:
+                if (os.readlink('/proc/' + str(pid) + '/ns/' + ns) !=
+                        os.readlink('/proc/self/ns/' + ns)):
+                    return 'client is in a different ' + ns + ' namespace'
+            except OSError:
+                return 'could not check the client namespaces'
+        return None
+
+    def handle(self, conn):
+        """
+        :type conn: socket.socket
+        """
+        try:
+            refused = self.check_peer(conn)
+            while True:
+                req = receive_message(conn)
+                if req is None:
+                    break
+                if refused is None and not is_allowed(
+                        req['commands'], req.get('shell', True),
+                        self.allowed_commands):
+                    send_message(conn, {'refused': 'command not allowed'})
+                    continue
+                if refused is not None:
+                    send_message(conn, {'refused': refused})
+                    continue
+                env = req.get('env')
+                if env is not None:
+                    env = {k: v for k, v in env.items()
+                           if not k.startswith(BROKER_UNSAFE_ENV_PREFIXES)}
+                    # Commands are looked up in root's PATH, like sudo's
+                    # secure_path
+                    env['PATH'] = os.environ.get('PATH', os.defpath)
+                try:
+                    ret, o, e = run_commands(req['commands'],
+                                             req.get('shell', True), env,
+                                             req.get('cwd'))
+                except OSError as err:
+                    ret, o, e = 127, b'', str(err).encode('utf-8')
+                send_message(conn, {
+                    'ret_code': ret,
+                    'stdout': base64.b64encode(o).decode('ascii'),
+                    'stderr': base64.b64encode(e).decode('ascii')})
+        except (socket.error, ValueError, KeyError, struct.error):
+            pass
+        finally:
+            conn.close()
+
+
+class PrivBroker(object):
+    """
+    The client side of the privileged command broker: an optional root
+    process, started once per run, which runs privileged commands for
+    LinuxCLI (and NetNSCLI) instead of a new 'sudo -E' for each one.  Each
+    thread keeps its own connection to the broker.  Commands the broker
+    refuses (or any failure to reach it) make run() return None, so the
+    caller can fall back to sudo.
+    """
+    broker = None
+    """ :type: PrivBroker """
+    broker_lock = threading.Lock()
+    process = None
+    """ :type: subprocess.Popen """
+
+    def __init__(self, socket_path):
+        """
+        :type socket_path: str
+        """
+        self.socket_path = socket_path
+        self.local = threading.local()
+
+    @classmethod
+    def get_broker(cls):
+        """
+        :return: PrivBroker The broker for this process, or None if no
+        broker is running
+        """
+        socket_path = os.environ.get(BROKER_SOCKET_ENV)
+        if socket_path is None:
+            return None
+        with cls.broker_lock:
+            if cls.broker is None or cls.broker.socket_path != socket_path:
+                cls.broker = PrivBroker(socket_path)
+            return cls.broker
+
+    @classmethod
+    def start_broker(cls, socket_path=None):
+        """
+        Start the broker as root (through sudo, once), and point this
+        process and its children at it.
+        :type socket_path: str
+        :return: PrivBroker
+        """
+        if cls.process is not None and cls.process.poll() is None:
+            return cls.get_broker()
+        if socket_path is None:
+            socket_path = os.path.join(
+                tempfile.mkdtemp(prefix='zephyr-broker-'), 'broker.sock')
+        zephyr_root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        try:
+            cls.process = subprocess.Popen(
+                (['sudo', '-E'] if os.geteuid() != 0 else []) +
+                ['env', 'PYTHONPATH=' + zephyr_root, sys.executable, '-m',
+                 'zephyr.common.priv_broker', '-s', socket_path,
+                 '-u', str(os.getuid())],
+                stdin=subprocess.PIPE, preexec_fn=os.setsid)
+        except OSError as e:
+            raise SubprocessFailedException(
+                'Could not start privileged broker: ' + str(e))
+
+        deadline = time.time() + BROKER_START_TIMEOUT
+        while not os.path.exists(socket_path):
+            if cls.process.poll() is not None or time.time() > deadline:
+                cls.stop_broker()
+                raise SubprocessFailedException(
+                    'Privileged broker failed to start on: ' + socket_path)
+            time.sleep(0.05)
+        os.environ[BROKER_SOCKET_ENV] = socket_path
+        return cls.get_broker()
+
+    @classmethod
+    def stop_broker(cls):
+        socket_path = os.environ.pop(BROKER_SOCKET_ENV, None)
+        with cls.broker_lock:
+            cls.broker = None
+        if cls.process is not None:
+            try:
+                cls.process.stdin.close()
+                cls.process.wait()
+            except (IOError, OSError):
+                pass
+            cls.process = None
+            if socket_path is not None:
+                shutil.rmtree(os.path.dirname(socket_path),
+                              ignore_errors=True)
+
+    def connect(self):
+        """
+        :return: socket.socket
+        """
+        sock = getattr(self.local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            self.local.sock = sock
+        return sock
+
+    def disconnect(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+    def run(self, commands, shell=True, env=None):
+        """
+        Run a shell command line (or a list of argv lists piped together,
+        with shell=False) as root.
+        :type commands: str|list[list[str]]
+        :type shell: bool
+        :type env: dict[str, str] Environment (this process's if None)
+        :return: (int, str, str) Return code, stdout and stderr, or None if
+        the command must be run through sudo instead
+        """
+        if not is_allowed(commands, shell):
+            return None
+        request = {'commands': commands, 'shell': shell,
+                   'env': dict(env if env is not None else os.environ),
+                   'cwd': os.getcwd()}
+        for retry in (True, False):
+            try:
+                sock = self.connect()
+                send_message(sock, request)
+                response = receive_message(sock)
+            except (socket.error, ValueError, struct.error):
+                response = None
+            if response is not None:
+                break
+            # The connection may have gone stale, so try a new one
+            self.disconnect()
+            if not retry:
+                return None
+        if 'refused' in response:
+            return None
+        return (response['ret_code'],
+                base64.b64decode(response['stdout']),
+                base64.b64decode(response['stderr']))
+
+
+def main(argv):
+    arg_map, extra_args = getopt.getopt(argv, 's:u:',
+                                        ['socket=', 'uid='])
+    socket_path = None
+    allowed_uids = []
+    for arg, value in arg_map:
+        if arg in ('-s', '--socket'):
+            socket_path = value
+        elif arg in ('-u', '--uid'):
+            allowed_uids.append(int(value))
+    if socket_path is None:
+        raise ArgMismatchException('Must specify the broker socket path')
+
+    server = PrivBrokerServer(socket_path, allowed_uids)
+    server.start()
+
+    def wait_for_parent():
+        # The parent closes our stdin (or exits) when the run is over
+        sys.stdin.read()
+        server.stop()
+
+    watcher = threading.Thread(target=wait_for_parent)
+    watcher.daemon = True
+    watcher.start()
+    server.serve_forever()
+    watcher.join()
+
+atexit.register(PrivBroker.stop_broker)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
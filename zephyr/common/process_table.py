@@ -0,0 +1,241 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import pwd
+import select
+import threading
+import time
+from zephyr.common.exceptions import *
+
+PROC_DIR = '/proc'
+PID_POLL_MIN_INTERVAL = 0.005
+PID_POLL_MAX_INTERVAL = 0.25
+# pidfd_open(2), Linux 5.3+ (the number is shared by all common arches)
+PIDFD_OPEN_SYSCALL = 434
+
+
+class ProcessInfo(object):
+    """
+    One process, as read from /proc/<pid>.
+    """
+    def __init__(self, pid, ppid, state, user, cmdline):
+        """
+        :type pid: str
+        :type ppid: str
+        :type state: str Single-letter state, as in /proc/<pid>/stat
+        :type user: str
+        :type cmdline: str Command line, or '[<comm>]' for kernel threads
+        """
+        self.pid = pid
+        self.ppid = ppid
+        self.state = state
+        self.user = user
+        self.cmdline = cmdline
+
+    def is_zombie(self):
+        """
+        :return: bool
+        """
+        return self.state in ('Z', 'X')
+
+    def ps_line(self):
+        """
+        :return: str The user, pid, ppid and command, like the matching
+        columns in 'ps -aef'
+        """
+        return ' '.join([self.user, self.pid, self.ppid, self.cmdline])
+
+    def __repr__(self):
+        return 'ProcessInfo(' + self.ps_line() + ')'
+
+
+def get_user_name(uid, user_cache):
+    """
+    :type uid: int
+    :type user_cache: dict[int, str]
+    :return: str
+    """
+    if uid not in user_cache:
+        try:
+            user_cache[uid] = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            user_cache[uid] = str(uid)
+    return user_cache[uid]
+
+
+def read_process(pid, proc_dir=PROC_DIR, user_cache=None):
+    """
+    Read a single process from /proc.
+    :type pid: str
+    :type proc_dir: str
+    :type user_cache: dict[int, str]
+    :return: ProcessInfo Or None if the process does not exist (anymore)
+    """
+    pid_dir = os.path.join(proc_dir, str(pid))
+    try:
+        uid = os.stat(pid_dir).st_uid
+        with open(os.path.join(pid_dir, 'stat')) as f:
+            stat = f.read()
+        with open(os.path.join(pid_dir, 'cmdline')) as f:
+            cmdline = f.read()
+    except (IOError, OSError):
+        return None
+
+    # The command name is in parentheses and may itself contain spaces
+    # or parentheses, so split the rest of the fields after the last ')'
+    comm_end = stat.rfind(')')
+    comm = stat[stat.find('(') + 1:comm_end]
+    fields = stat[comm_end + 2:].split()
+    if len(fields) < 2:
+        return None
+
+    cmdline = cmdline.rstrip('\0').replace('\0', ' ')
+    return ProcessInfo(
+        pid=str(pid), ppid=fields[1], state=fields[0],
+        user=get_user_name(uid, user_cache if user_cache is not None
+                           else {}),
+        cmdline=cmdline if cmdline != '' else '[' + comm + ']')
+
+
+def read_process_table(proc_dir=PROC_DIR):
+    """
+    Read every process from /proc, in PID order.
+    :type proc_dir: str
+    :return: list[ProcessInfo]
+    """
+    user_cache = {}
+    procs = []
+    for pid in sorted((d for d in os.listdir(proc_dir) if d.isdigit()),
+                      key=int):
+        proc = read_process(pid, proc_dir, user_cache)
+        if proc is not None:
+            procs.append(proc)
+    return procs
+
+
+class ProcessTable(object):
+    """
+    Snapshot of the process table, shared so that repeated lookups (such
+    as finding a process' PID and then its children) within max_age
+    seconds of each other only scan /proc once.  A max_age of 0 always
+    takes a fresh snapshot.
+    """
+    snapshot = None
+    """ :type: list[ProcessInfo] """
+    snapshot_time = 0.0
+    snapshot_lock = threading.Lock()
+
+    @classmethod
+    def get_processes(cls, max_age=0):
+        """
+        :type max_age: float
+        :return: list[ProcessInfo]
+        """
+        with cls.snapshot_lock:
+            now = time.time()
+            if (cls.snapshot is None or max_age <= 0 or
+                    now - cls.snapshot_time > max_age):
+                cls.snapshot = read_process_table()
+                cls.snapshot_time = now
+            return cls.snapshot
+
+    @classmethod
+    def invalidate(cls):
+        with cls.snapshot_lock:
+            cls.snapshot = None
+
+
+def is_pid_running(pid, proc_dir=PROC_DIR):
+    """
+    :type pid: str|int
+    :type proc_dir: str
+    :return: bool True if the process exists and is not a zombie
+    """
+    if not str(pid).strip().isdigit():
+        return False
+    proc = read_process(str(pid).strip(), proc_dir)
+    return proc is not None and not proc.is_zombie()
+
+
+def open_pidfd(pid):
+    """
+    Open a pidfd for the process, which becomes readable when it exits.
+    :type pid: int
+    :return: int The file descriptor, -1 if the process is already gone,
+    or None if pidfds are not supported (so the caller has to poll)
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.syscall(PIDFD_OPEN_SYSCALL, int(pid), 0)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        if ctypes.get_errno() == errno.ESRCH:
+            return -1
+        return None
+    return fd
+
+
+def wait_for_pid_exit(pid, timeout=None):
+    """
+    Wait for the process to exit, using a pidfd where the kernel supports
+    it, and polling /proc with an increasing interval otherwise.  A
+    SubprocessTimeoutException is raised if it is still running after
+    timeout seconds (None waits forever).
+    :type pid: str|int
+    :type timeout: float
+    """
+    deadline = time.time() + timeout if timeout is not None else None
+    pid = str(pid).strip()
+    if not is_pid_running(pid):
+        return
+
+    fd = open_pidfd(pid)
+    if fd == -1:
+        return
+    if fd is not None:
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        try:
+            while True:
+                remaining = (deadline - time.time()
+                             if deadline is not None else None)
+                if remaining is not None and remaining <= 0:
+                    break
+                try:
+                    if poller.poll(int(remaining * 1000) + 1
+                                   if remaining is not None else None):
+                        return
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+        finally:
+            os.close(fd)
+    else:
+        interval = PID_POLL_MIN_INTERVAL
+        while deadline is None or time.time() < deadline:
+            if not is_pid_running(pid):
+                return
+            time.sleep(interval if deadline is None
+                       else max(0, min(interval, deadline - time.time())))
+            interval = min(interval * 2, PID_POLL_MAX_INTERVAL)
+
+    if is_pid_running(pid):
+        raise SubprocessTimeoutException(
+            'Process ' + pid + ' did not exit within ' + str(timeout) +
+            ' seconds')
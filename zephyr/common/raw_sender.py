@@ -0,0 +1,371 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from zephyr.common.exceptions import *
+from zephyr.common.netns_executor import call_in_netns
+
+SIOCGIFADDR = 0x8915
+SIOCGIFHWADDR = 0x8927
+
+ETHER_TYPE_IP = 0x0800
+ETHER_TYPE_ARP = 0x0806
+IP_PROTO_ICMP = 1
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+BROADCAST_MAC = b'\xff' * 6
+BROADCAST_IP = '255.255.255.255'
+
+# Defaults follow mausezahn (mz), which the frame options are modeled on
+DEFAULT_TTL = 255
+DEFAULT_TCP_WINDOW = 100
+TCP_FLAGS = {'fin': 0x01, 'syn': 0x02, 'rst': 0x04, 'psh': 0x08,
+             'ack': 0x10, 'urg': 0x20, 'ece': 0x40, 'cwr': 0x80}
+ICMP_COMMANDS = {'ping': (8, 0), 'echo-request': (8, 0),
+                 'reply': (0, 0), 'echo-reply': (0, 0),
+                 'unreach': (3, 0), 'redirect': (5, 0)}
+ARP_COMMANDS = {'request': 1, 'reply': 2}
+
+
+def parse_mac(mac, interface_mac=None):
+    """
+    Parse a MAC address, which may also be 'bc' (broadcast), 'rand', or
+    'own' (the interface's address), as accepted by mz.
+    :type mac: str
+    :type interface_mac: bytes
+    :return: bytes
+    """
+    if mac in ['bc', 'bcast']:
+        return BROADCAST_MAC
+    if mac == 'rand':
+        # Random, but unicast and locally administered
+        return struct.pack('!6B', *([random.randint(0, 255) & 0xfe | 0x02] +
+                                    [random.randint(0, 255)
+                                     for _ in range(5)]))
+    if mac == 'own':
+        return interface_mac
+    octets = re.split('[:.-]', mac)
+    if len(octets) != 6:
+        raise ArgMismatchException('Invalid MAC address: ' + mac)
+    return struct.pack('!6B', *[int(o, 16) for o in octets])
+
+
+def parse_byte_data(byte_data):
+    """
+    Parse hex byte data as accepted by mz ('de:ad:be:ef', 'de ad be ef',
+    or 'deadbeef').
+    :type byte_data: str
+    :return: bytes
+    """
+    hex_str = re.sub('[\\s:.-]', '', byte_data)
+    if len(hex_str) % 2 != 0 or re.search('[^0-9a-fA-F]', hex_str):
+        raise ArgMismatchException('Invalid byte data: ' + byte_data)
+    return bytes(bytearray(int(hex_str[i:i + 2], 16)
+                           for i in range(0, len(hex_str), 2)))
+
+
+def checksum(data):
+    """
+    Internet (one's complement) checksum.
+    :type data: bytes
+    :return: int
+    """
+    if len(data) % 2 != 0:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def build_ip_header(source_ip, dest_ip, proto, payload_length,
+                    options=None):
+    """
+    :type source_ip: str
+    :type dest_ip: str
+    :type proto: int
+    :type payload_length: int
+    :type options: dict[str, str]
+    :return: bytes
+    """
+    options = options if options is not None else {}
+    header = struct.pack(
+        '!BBHHHBBH4s4s', 0x45, int(options.get('tos', 0)),
+        int(options.get('len', 20 + payload_length)),
+        int(options.get('id', 0)),
+        0x4000 if options.get('df', '0') in ['1', 1, True] else 0,
+        int(options.get('ttl', DEFAULT_TTL)),
+        int(options.get('proto', proto)), 0,
+        socket.inet_aton(source_ip), socket.inet_aton(dest_ip))
+    return header[:10] + struct.pack('!H', checksum(header)) + header[12:]
+
+
+def build_transport_checksum(source_ip, dest_ip, proto, segment):
+    """
+    Checksum a TCP/UDP segment with the IPv4 pseudo-header.
+    :type source_ip: str
+    :type dest_ip: str
+    :type proto: int
+    :type segment: bytes
+    :return: int
+    """
+    return checksum(socket.inet_aton(source_ip) + socket.inet_aton(dest_ip) +
+                    struct.pack('!BBH', 0, proto, len(segment)) + segment)
+
+
+def build_frame(packet_type=None, source_mac=None, dest_mac=None,
+                source_ip=None, dest_ip=None, source_port=None,
+                dest_port=None, packet_options=None, byte_data=None,
+                payload=None, interface_mac=None, interface_ip=None):
+    """
+    Build an Ethernet frame with the same parameters TCPSender.send_packet
+    takes (mirroring the options of mz).  If packet_type is None, the frame
+    is the raw byte_data (after the MAC addresses, if either is given).
+    Otherwise, packet_type is one of 'arp', 'icmp', 'tcp', 'udp', or 'ip',
+    and packet_options holds the per-type options:
+
+    arp: command (request/reply), smac, tmac, sip, tip
+    icmp: command (ping, reply, unreach, ...), type, code, id, seq
+    tcp: flags (e.g. 'syn|ack'), s (sequence), a (ack number), win
+    ip: len, proto, ttl, tos, id, df (also applies to icmp/tcp/udp)
+
+    :type packet_type: str
+    :type source_mac: str
+    :type dest_mac: str
+    :type source_ip: str
+    :type dest_ip: str
+    :type source_port: int
+    :type dest_port: int
+    :type packet_options: dict[str, str]
+    :type byte_data: str
+    :type payload: str
+    :type interface_mac: bytes Default source MAC
+    :type interface_ip: str Default source IP
+    :return: bytes
+    """
+    options = dict(packet_options) if packet_options is not None else {}
+    interface_mac = interface_mac \
+        if interface_mac is not None else b'\x00' * 6
+    src_mac = parse_mac(source_mac, interface_mac) \
+        if source_mac is not None else interface_mac
+    dst_mac = parse_mac(dest_mac, interface_mac) \
+        if dest_mac is not None else BROADCAST_MAC
+
+    if packet_type is None:
+        if byte_data is None:
+            raise ArgMismatchException(
+                'The "byte_data" parameter is required if "packet_type" '
+                'is not present')
+        data = parse_byte_data(byte_data)
+        if source_mac is None and dest_mac is None:
+            return data
+        return dst_mac + src_mac + data
+
+    src_ip = source_ip if source_ip is not None else \
+        (interface_ip if interface_ip is not None else '0.0.0.0')
+    dst_ip = dest_ip if dest_ip is not None else BROADCAST_IP
+    data = payload.encode('utf-8') if payload is not None else b''
+
+    if packet_type == 'arp':
+        if 'command' not in options:
+            raise ArgMismatchException('arp and icmp packets need a '
+                                       'command or type')
+        command = options.pop('command')
+        if command not in ARP_COMMANDS:
+            raise ArgMismatchException('Unknown arp command: ' + command)
+        arp_smac = parse_mac(options['smac'], interface_mac) \
+            if 'smac' in options else src_mac
+        arp_tmac = parse_mac(options['tmac'], interface_mac) \
+            if 'tmac' in options else \
+            (b'\x00' * 6 if command == 'request' else dst_mac)
+        body = (struct.pack('!HHBBH', 1, ETHER_TYPE_IP, 6, 4,
+                            ARP_COMMANDS[command]) +
+                arp_smac + socket.inet_aton(options.get('sip', src_ip)) +
+                arp_tmac + socket.inet_aton(options.get('tip', dst_ip)))
+        return dst_mac + src_mac + struct.pack('!H', ETHER_TYPE_ARP) + body
+
+    if packet_type == 'icmp':
+        if 'command' not in options and 'type' not in options:
+            raise ArgMismatchException('arp and icmp packets need a '
+                                       'command or type')
+        icmp_type, icmp_code = ICMP_COMMANDS.get(
+            options.pop('command', None), (0, 0))
+        icmp_type = int(options.get('type', icmp_type))
+        icmp_code = int(options.get('code', icmp_code))
+        # The id here is the ICMP echo id, not the IP header's
+        header = struct.pack('!BBHHH', icmp_type, icmp_code, 0,
+                             int(options.pop('id', 0)),
+                             int(options.pop('seq', 0)))
+        segment = header + data
+        segment = (segment[:2] + struct.pack('!H', checksum(segment)) +
+                   segment[4:])
+        proto = IP_PROTO_ICMP
+    elif packet_type == 'tcp':
+        flags = 0
+        for flag in str(options.get('flags', 'syn')).lower().split('|'):
+            if flag.strip() not in TCP_FLAGS:
+                raise ArgMismatchException('Unknown TCP flag: ' + flag)
+            flags |= TCP_FLAGS[flag.strip()]
+        header = struct.pack('!HHIIBBHHH',
+                             int(source_port or 0), int(dest_port or 0),
+                             int(options.get('s', 0)),
+                             int(options.get('a', 0)),
+                             5 << 4, flags,
+                             int(options.get('win', DEFAULT_TCP_WINDOW)),
+                             0, 0)
+        segment = header + data
+        segment = (segment[:16] +
+                   struct.pack('!H', build_transport_checksum(
+                       src_ip, dst_ip, IP_PROTO_TCP, segment)) +
+                   segment[18:])
+        proto = IP_PROTO_TCP
+    elif packet_type == 'udp':
+        segment = struct.pack('!HHHH', int(source_port or 0),
+                              int(dest_port or 0), 8 + len(data), 0) + data
+        segment = (segment[:6] +
+                   struct.pack('!H', build_transport_checksum(
+                       src_ip, dst_ip, IP_PROTO_UDP, segment) or 0xffff) +
+                   segment[8:])
+        proto = IP_PROTO_UDP
+    elif packet_type == 'ip':
+        segment = data
+        proto = 0
+    else:
+        raise ArgMismatchException(
+            'Unsupported packet type for raw sending: ' + str(packet_type))
+
+    return (dst_mac + src_mac + struct.pack('!H', ETHER_TYPE_IP) +
+            build_ip_header(src_ip, dst_ip, proto, len(segment), options) +
+            segment)
+
+
+class RawSocketSender(object):
+    """
+    Sends frames through AF_PACKET raw sockets, which are opened inside
+    the target network namespace (see call_in_netns), and cached per
+    namespace and interface afterwards.
+    Requires CAP_NET_RAW (and CAP_SYS_ADMIN to enter namespaces).
+    """
+    sockets = {}
+    """ :type: dict[(str, str), (socket.socket, bytes, str)] """
+    socket_lock = threading.Lock()
+
+    @staticmethod
+    def open_socket(interface, netns=None):
+        """
+        Open a raw socket bound to the interface, and look up the
+        interface's MAC and IPv4 address (None if it has none).
+        :type interface: str
+        :type netns: str Name of the network namespace (None for the
+        current one)
+        :return: (socket.socket, bytes, str)
+        """
+        def open_raw_socket():
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            sock.bind((interface, 0))
+
+            ifreq = struct.pack('256s', interface[:15].encode('utf-8'))
+            mac = fcntl.ioctl(sock.fileno(), SIOCGIFHWADDR, ifreq)[18:24]
+            ip_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                ip = socket.inet_ntoa(fcntl.ioctl(
+                    ip_sock.fileno(), SIOCGIFADDR, ifreq)[20:24])
+            except IOError:
+                ip = None
+            finally:
+                ip_sock.close()
+            return sock, mac, ip
+
+        try:
+            return call_in_netns(netns, open_raw_socket)
+        except (OSError, IOError, socket.error) as e:
+            raise SubprocessFailedException(
+                'Could not open raw socket on interface ' + interface +
+                (' in netns ' + netns if netns is not None else '') +
+                ': ' + str(e))
+
+    @classmethod
+    def get_socket(cls, interface, netns=None, reopen=False):
+        """
+        :type interface: str
+        :type netns: str
+        :type reopen: bool
+        :return: (socket.socket, bytes, str)
+        """
+        key = (netns, interface)
+        with cls.socket_lock:
+            if reopen and key in cls.sockets:
+                cls.sockets.pop(key)[0].close()
+            if key not in cls.sockets:
+                cls.sockets[key] = cls.open_socket(interface, netns)
+            return cls.sockets[key]
+
+    @classmethod
+    def close_sockets(cls, netns):
+        """
+        Close the cached sockets for a namespace which is being removed
+        (an open socket keeps the namespace, and its interfaces, alive).
+        :type netns: str
+        """
+        with cls.socket_lock:
+            for key in [k for k in cls.sockets if k[0] == netns]:
+                cls.sockets.pop(key)[0].close()
+
+    @classmethod
+    def send(cls, interface, netns=None, count=1, delay=None, **kwargs):
+        """
+        Build a frame (see build_frame for the arguments) and send it
+        [count] times, waiting [delay] microseconds between each.
+        :type interface: str
+        :type netns: str
+        :type count: int
+        :type delay: int
+        :return: int Number of frames sent
+        """
+        sock, mac, ip = cls.get_socket(interface, netns)
+        frame = build_frame(interface_mac=mac, interface_ip=ip, **kwargs)
+        for i in range(count):
+            if i > 0 and delay:
+                time.sleep(delay / 1000000.0)
+            cls.send_frame(interface, frame, netns)
+        return count
+
+    @classmethod
+    def send_frame(cls, interface, frame, netns=None):
+        """
+        Send a complete, already built frame.
+        :type interface: str
+        :type frame: bytes
+        :type netns: str
+        """
+        sock = cls.get_socket(interface, netns)[0]
+        try:
+            sock.send(frame)
+        except socket.error:
+            # The interface may have been re-created since the socket
+            # was opened, so retry once with a fresh socket
+            sock = cls.get_socket(interface, netns, reopen=True)[0]
+            try:
+                sock.send(frame)
+            except socket.error as e:
+                raise SubprocessFailedException(
+                    'Could not send on interface ' + interface + ': ' +
+                    str(e))
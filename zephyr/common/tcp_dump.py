@@ -12,18 +12,41 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fcntl import F_GETFL
-from fcntl import F_SETFL
-from fcntl import fcntl
+import binascii
 import multiprocessing
 import os
 import Queue
+import select
+import struct
 import threading
 import time
 from zephyr.common.cli import LinuxCLI
+from zephyr.common.packet_buffer import OVERFLOW_DROP_OLDEST
+from zephyr.common.packet_buffer import PacketBuffer
+from zephyr.common.pcap import link_offsets
+from zephyr.common.pcap_file import PCAP_GLOBAL_HEADER_LENGTH
+from zephyr.common.pcap_file import PCAP_RECORD_HEADER_LENGTH
+from zephyr.common.pcap_file import PCAPStreamReader
 from zephyr.common.pcap_packet import *
+from zephyr.common.raw_sender import RawSocketSender
 
 TCPDUMP_LISTEN_START_TIMEOUT = 10
+TCPDUMP_POLL_INTERVAL = 0.1
+PCAP_READ_SIZE = 65536
+PCAP_BATCH_SIZE = 262144
+PCAP_BATCH_INTERVAL = 0.05
+
+# Once tcpdump is listening, a marker frame is sent on the interface until
+# it shows up in the capture, which proves the capture is live.  It uses
+# the local experimental ether type, and is never returned as a packet
+# (nor are the markers of any other capture).  If the marker can't be
+# sent or doesn't come back, the capture is taken as live after the
+# timeout (the fixed wait used before markers).
+TCPDUMP_READY_PROBE_INTERVAL = 0.1
+TCPDUMP_READY_PROBE_TIMEOUT = 1
+READY_MARKER_ETHER_TYPE = 0x88b5
+READY_MARKER_PREFIX = b'ZEPHYR-TCPDUMP-READY:'
+READY_MARKER_FRAME_LENGTH = 60
 
 
 def sig_handler():
@@ -32,17 +55,48 @@ def sig_handler():
     raise IOError("I/O error")
 
 
-def parse_line_to_byte_array(line):
-    byte_data = []
-    data = [l.strip() for l in line.split(':', 2)]
-    if len(data) == 2:
-        for octet_pair in data[1].split():
-            lbyte = int(octet_pair[0:2], 16)
-            byte_data.append(lbyte)
-            if len(octet_pair) > 2:
-                hbyte = int(octet_pair[2:4], 16)
-                byte_data.append(hbyte)
-    return byte_data
+def make_ready_marker():
+    """
+    Create a unique payload for the readiness marker frame of a capture.
+    :return: bytes
+    """
+    return READY_MARKER_PREFIX + binascii.hexlify(os.urandom(8))
+
+
+def send_ready_marker(cli, interface, marker):
+    """
+    Send the readiness marker frame on the interface through a raw socket,
+    in the namespace the CLI runs commands in (loopback is used for the
+    'any' interface).
+    :type cli: LinuxCLI
+    :type interface: str
+    :type marker: bytes
+    :return: bool False if it couldn't be sent (e.g. without the
+    privileges to open a raw socket)
+    """
+    frame = (b'\x02\x00\x00\x00\x00\x00' * 2 +
+             struct.pack('!H', READY_MARKER_ETHER_TYPE) + marker)
+    frame += b'\x00' * max(0, READY_MARKER_FRAME_LENGTH - len(frame))
+    try:
+        RawSocketSender.send_frame('lo' if interface == 'any' else interface,
+                                   frame, netns=cli.netns_name())
+    except SubprocessFailedException:
+        return False
+    return True
+
+
+def is_ready_marker(packet, marker=READY_MARKER_PREFIX):
+    """
+    :type packet: PCAPPacket
+    :type marker: bytes The marker to look for (any capture's marker by
+    default)
+    :return: bool
+    """
+    type_offset, net_offset = link_offsets(packet.link_layer)
+    data = packet.packet_data
+    return (data[type_offset:type_offset + 2] ==
+            struct.pack('!H', READY_MARKER_ETHER_TYPE) and
+            data[net_offset:net_offset + len(marker)] == marker)
 
 
 def tcpdump_start(kwarg_map):
@@ -63,6 +117,14 @@ class TCPDump(object):
 
         self.data_queue = None
         self.subprocess_info_queue = None
+        self.packet_reader = None
+        """ :type: PCAPStreamReader"""
+        self.packet_buffer = PacketBuffer()
+        """ :type: PacketBuffer"""
+        self.collector_thread = None
+        """ :type: threading.Thread"""
+        self.ready_marker = None
+        """ :type: bytes"""
         self.tcpdump_ready = None
         self.tcpdump_error = None
         self.tcpdump_stop = None
@@ -72,7 +134,10 @@ class TCPDump(object):
                       count=0, packet_type='', pcap_filter=None,
                       max_size=0, timeout=None, callback=None,
                       callback_args=None, blocking=False,
-                      save_dump_file=False, save_dump_filename=None):
+                      save_dump_file=False, save_dump_filename=None,
+                      buffer_packets=0, buffer_bytes=0,
+                      overflow_policy=OVERFLOW_DROP_OLDEST,
+                      spill_filename=None):
         """
         Capture <count> packets using tcpdump and add them to a Queue
         of PCAPPackets. Use wait_for_packets to retrieve the packets
@@ -86,8 +151,15 @@ class TCPDump(object):
         will limit the blocking call to timeout seconds.  This time
         limit only applies to the execution of tcpdump if blocking is
         set to True.  The optional save_dump_file parameter can be set
-        to true to save the temporary packet capture file to the given
-        save file name (use tcp.out.<timestamp> if name not provided)
+        to true to save the raw packet capture (in pcap format) to the
+        given save file name (use tcp.out.<timestamp> if name not provided)
+
+        Captured packets are held in memory until retrieved.  To bound the
+        memory used by long captures, a packet and/or byte limit can be
+        set, along with the policy to apply once the limit is hit
+        ('drop_oldest', 'drop_newest', or 'spill' the oldest packets
+        to the pcap file spill_filename).  The packet_buffer keeps count
+        of the packets dropped or spilled.
 
         :type cli: LinuxCLI
         :type interface: str
@@ -101,15 +173,26 @@ class TCPDump(object):
         :type blocking: bool
         :type save_dump_file: bool
         :type save_dump_filename: str
+        :type buffer_packets: int
+        :type buffer_bytes: int
+        :type overflow_policy: str
+        :type spill_filename: str
         :return:
         """
         # Don't run twice in a row
         if self.process is not None:
             raise SubprocessFailedException('tcpdump process already started')
 
-        # Set up synchronization queues and events
+        # Set up synchronization queues and events.  The capture process
+        # sends the raw pcap stream over the data queue in batches, which
+        # a collector thread here turns into packets in the packet buffer.
         self.data_queue = multiprocessing.Queue()
         self.subprocess_info_queue = multiprocessing.Queue()
+        self.packet_reader = PCAPStreamReader()
+        self.packet_buffer = PacketBuffer(
+            max_packets=buffer_packets, max_bytes=buffer_bytes,
+            overflow_policy=overflow_policy, spill_filename=spill_filename)
+        self.ready_marker = make_ready_marker()
 
         self.tcpdump_ready = multiprocessing.Event()
         self.tcpdump_error = multiprocessing.Event()
@@ -135,13 +218,19 @@ class TCPDump(object):
                      'callback': callback,
                      'callback_args': callback_args,
                      'save_dump_file': save_dump_file,
-                     'save_dump_filename': save_dump_filename
+                     'save_dump_filename': save_dump_filename,
+                     'raw_batches': True,
+                     'ready_marker': self.ready_marker
                      }
         self.process = multiprocessing.Process(target=tcpdump_start,
                                                args=(kwarg_map,))
         self.process.start()
+        self.collector_thread = threading.Thread(
+            target=self.collect_packets, args=(self.process,))
+        self.collector_thread.daemon = True
+        self.collector_thread.start()
         deadline_time = time.time() + TCPDUMP_LISTEN_START_TIMEOUT
-        while not self.tcpdump_ready.is_set():
+        while not self.tcpdump_ready.wait(TCPDUMP_POLL_INTERVAL):
             if time.time() > deadline_time:
                 self.process.terminate()
                 raise SubprocessFailedException("tcpdump failed to start "
@@ -156,7 +245,6 @@ class TCPDump(object):
                         'stdout [' + error_info['stdout'] + '] ' +
                         'stderr [' + error_info['stderr'] + '] }')
                 raise SubprocessFailedException('tcpdump error UNKNOWN')
-            time.sleep(0)
 
         if blocking is True:
             self.process.join(timeout)
@@ -165,35 +253,52 @@ class TCPDump(object):
                                                  'packets within timeout')
 
     def wait_for_packets(self, count=1, timeout=None):
-        ret = []
-        start_time = time.time()
+        # 0 count means just return waiting buffer, or empty list
+        # if nothing is present.  Packets already received stay buffered
+        # for the next call if this one times out.
+        return self.packet_buffer.get(count, timeout)
 
-        if count == 0:
-            # 0 count means just return waiting buffer, or empty list
-            # if nothing is present
-            try:
-                while True:
-                    item = self.data_queue.get_nowait()
-                    ret.append(item)
-            except Queue.Empty:
-                pass
-            return ret
+    def read_new_packets(self, timeout=0):
+        """
+        Wait up to timeout seconds for more packets to arrive (if none are
+        buffered yet), and return all of the packets received so far,
+        which may be an empty list.
+        :type timeout: float
+        :return: list[PCAPPacket]
+        """
+        return self.packet_buffer.get_available(timeout)
 
-        while len(ret) < count:
+    def collect_packets(self, process):
+        """
+        Collector thread: read the batches sent by the capture process
+        into the packet buffer until the process has exited and every
+        batch it sent has been read.
+        :type process: multiprocessing.Process
+        """
+        while True:
             try:
-                item = self.data_queue.get_nowait()
+                self.read_packet_batch(
+                    self.data_queue.get(timeout=TCPDUMP_POLL_INTERVAL))
             except Queue.Empty:
-                if timeout is not None:
-                    if time.time() > start_time + timeout:
-                        raise SubprocessTimeoutException(
-                            (('Only ' + str(len(ret)) + '/')
-                             if len(ret) != 0 else '0/') +
-                            str(count) + ' packets received within timeout')
-                time.sleep(0)
-            else:
-                ret.append(item)
-
-        return ret
+                if not process.is_alive():
+                    # The queue is flushed before the process can exit, but
+                    # a last batch may have arrived since the get timed out
+                    while True:
+                        try:
+                            self.read_packet_batch(
+                                self.data_queue.get_nowait())
+                        except Queue.Empty:
+                            return
+
+    def read_packet_batch(self, batch):
+        """
+        Add a batch of raw pcap stream data from the capture process to
+        the buffer of received packets.
+        :type batch: bytes
+        """
+        self.packet_buffer.extend(
+            packet for packet in self.packet_reader.feed(batch)
+            if not is_ready_marker(packet))
 
     def stop_capture(self):
         """
@@ -209,6 +314,10 @@ class TCPDump(object):
             return None
 
         self.process.join(5)
+        if self.collector_thread is not None:
+            self.collector_thread.join(5)
+            self.collector_thread = None
+        self.packet_buffer.close()
         ret = self.process
         self.process = None
         return ret
@@ -217,10 +326,20 @@ class TCPDump(object):
     def read_packet(cli=LinuxCLI(), flag_set=None, interface='any',
                     count=1, packet_type='', pcap_filter=None, max_size=0,
                     packet_queues=None, callback=None, callback_args=None,
-                    save_dump_file=False, save_dump_filename=None):
-
-        tmp_dump_filename = './.tcpdump.out.' + str(time.time())
-        tcp_processes = []
+                    save_dump_file=False, save_dump_filename=None,
+                    raw_batches=False, ready_marker=None):
+        """
+        Run tcpdump and read the captured packets.  By default, each
+        packet is put on the packet queue as a PCAPPacket.  If raw_batches
+        is set, the raw pcap stream is put on the queue instead, in
+        batches bounded by PCAP_BATCH_SIZE bytes and PCAP_BATCH_INTERVAL
+        seconds, to be read with a PCAPStreamReader by the consumer.  The
+        raw stream (and the saved dump file) will also contain the
+        readiness marker frames, which the consumer should skip with
+        is_ready_marker.
+        """
+        tcp_processes = None
+        dump_file = None
         try:
             # If flag set provided, use them instead, for synch with
             # external functions
@@ -240,172 +359,192 @@ class TCPDump(object):
             status_queue = Queue.Queue() \
                 if packet_queues is None else packet_queues[1]
 
-            cmd1 = ['tcpdump', '-n', '-xx', '-l']
-            cmd1 += ['-c', str(count)] \
-                if count > 0 else []
+            # Have tcpdump write the raw capture in pcap format to stdout,
+            # flushing each packet as it is captured (-U), rather than
+            # printing the packets as hex text.
+            # The packet count is checked here rather than with '-c', so
+            # the readiness marker frame is not counted, and the filter
+            # has to let the marker through.
+            marker = ready_marker \
+                if ready_marker is not None else make_ready_marker()
+            filter_str = pcap_filter.to_str().strip() \
+                if pcap_filter is not None else ''
+            cmd1 = ['tcpdump', '-n', '-U', '-w', '-']
             cmd1 += ['-i', interface]
             cmd1 += ['-s', str(max_size)] \
                 if max_size != 0 else []
             cmd1 += ['-T', packet_type] \
                 if packet_type != '' else []
-            cmd1 += [pcap_filter.to_str()] \
-                if pcap_filter is not None else []
+            cmd1 += ['( ' + filter_str + ' ) or ( ether proto ' +
+                     hex(READY_MARKER_ETHER_TYPE) + ' )'] \
+                if filter_str != '' else []
 
-            cmd2 = ['tee', '-a', tmp_dump_filename]
+            if save_dump_file is True:
+                dump_file = open(
+                    save_dump_filename if save_dump_filename is not None
+                    else 'tcp.out.' + str(time.time()), 'wb')
 
             # FLAG STATE: ready[clear], stop[clear], finished[clear]
-            with open(name=tmp_dump_filename, mode='w') as f:
-                f.write("--START--\n")
-
-            tcp_processes = cli.cmd_pipe(commands=[cmd1, cmd2],
-                                         blocking=False)
-            tcp_piped_process = tcp_processes.process
-            tcp_actual_process = tcp_processes.process_array[0]
-
-            # set current p.stderr flags to NONBLOCK
-            # Note that as stderr is NOT redirected through pipes, we
-            # must listen on the actual tcpdump process's stderr
-            # (not the tee process!)
-            flags_se = fcntl(tcp_actual_process.stderr, F_GETFL)
-            fcntl(tcp_actual_process.stderr, F_SETFL, flags_se | os.O_NONBLOCK)
+            tcp_processes = cli.cmd_pipe(commands=[cmd1], blocking=False)
+            tcp_process = tcp_processes.process
 
+            # Wait (without spinning) for tcpdump to write to stderr,
+            # waking up periodically to check whether it has exited
+            stderr_fd = tcp_process.stderr.fileno()
             err_out = ''
-            while not tcp_ready.is_set():
-                try:
-                    line = os.read(tcp_actual_process.stderr.fileno(), 256)
-                    if line.find('listening on') != -1:
-                        # TODO(micucci): Replace sleep after TCPDump s
-                        # starts with a real check # This is dangerous,
-                        # and might not actually be enough to signal the
-                        # tcpdump is actually running.  Instead, let's
-                        # create a Cython module that passes calls through
-                        # to libpcap (there are 0 good libpcap implementations
-                        # for Python that are maintained, documented,
-                        # and simple).
-                        time.sleep(1)
-                        tcp_ready.set()
-                    else:
-                        err_out += line
-                        if tcp_piped_process.poll() is not None:
-                            out, err = tcp_piped_process.communicate()
-                            status_queue.put(
-                                {'error': 'tcpdump exited abnormally',
-                                 'returncode': tcp_piped_process.returncode,
-                                 'stdout': out,
-                                 'stderr': err_out})
-                            tcp_error.set()
-
-                            raise SubprocessFailedException(
-                                'tcpdump exited abnormally with status: ' +
-                                str(tcp_piped_process.returncode) +
-                                ', out: ' + out +
-                                ', err: ' + err +
-                                ', err_out: ' + err_out)
-                        time.sleep(0)
-
-                except OSError:
-                    pass
-
-            # FLAG STATE: ready[set], stop[clear], finished[clear]
-            # tcpdump return output format:
-            # hh:mm:ss.tick L3Proto <Proto-specific fields>\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # (eight quads of hexadecimal numbers representing 16
-            # bytes or 4 32-bit words)
-            #
-            # hh:mm:ss.tick L3Proto <Proto-specific fields>\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # (Next packet)
+            listening = False
+            while not listening:
+                readable, _, _ = select.select(
+                    [stderr_fd], [], [], TCPDUMP_POLL_INTERVAL)
+                line = os.read(stderr_fd, 256) if readable else ''
+                if line.find('listening on') != -1:
+                    # tcpdump has opened the interface, but the capture
+                    # is only known to be live once the readiness marker
+                    # comes through it (checked while reading packets).
+                    listening = True
+                else:
+                    err_out += line
+                    if tcp_process.poll() is not None:
+                        out, err = tcp_process.communicate()
+                        status_queue.put(
+                            {'error': 'tcpdump exited abnormally',
+                             'returncode': tcp_process.returncode,
+                             'stdout': '',
+                             'stderr': err_out})
+                        tcp_error.set()
+
+                        raise SubprocessFailedException(
+                            'tcpdump exited abnormally with status: ' +
+                            str(tcp_process.returncode) +
+                            ', err: ' + err +
+                            ', err_out: ' + err_out)
 
-            packet_data = []
-            timestamp = ''
-            with open(tmp_dump_filename, 'r+') as f:
-                # Prepare for the first packet by reading the file
-                # until the first packet's lines arrive (or until
-                # stopped by a stop_capture call)
-                if f.readline().rstrip() != '--START--':
-                    status_queue.put(
-                        {'error': 'Expected --START-- tag at '
-                                  'beginning of dumpfile',
-                         'returncode': tcp_piped_process.returncode,
-                         'stdout': '',
-                         'stderr': ''})
-                    tcp_error.set()
-                    raise ArgMismatchException(
-                        'Expected --START-- tag at beginning of dumpfile')
-
-                while True:
-                    # Read the lines and either append data,
-                    # start a new packet, or finish
-                    line = f.readline()
-                    if line == '':
-                        # EOF
-
-                        # Is the tcpdump process finished or
-                        # signaled to finish?
-                        if tcp_piped_process.poll() is not None \
-                                or tcp_stop.is_set():
-                            # If we finished with packet data buffered up,
-                            # append that packet to the queue
-                            if len(packet_data) > 0:
-                                # Create and parse the packet and push it
-                                # onto the return list, calling
-                                # the callback function if one is set.
-                                packet = PCAPPacket(packet_data, timestamp)
-                                packet_queue.put(packet)
-                                if callback is not None:
-                                    callback(packet,
-                                             *(callback_args
-                                               if callback_args is not None
-                                               else ()))
-
-                            # Stop packet collection and exit
+            # FLAG STATE: ready[clear], stop[clear], finished[clear]
+            # tcpdump output is a pcap file stream:
+            # global header (magic, version, snaplen, link-type)
+            # record header (ts_sec, ts_usec, caplen, len) + caplen bytes
+            # record header (ts_sec, ts_usec, caplen, len) + caplen bytes
+            # (Next packet)
+            #
+            # The stream reader buffers any partial record until the rest
+            # arrives, and hands back each packet once it is complete.
+            # Packets need to be built here until the readiness marker
+            # is seen, and afterwards only if they are queued individually,
+            # counted, or for the callback.
+            reader = PCAPStreamReader()
+            reader_needed = (not raw_batches or callback is not None or
+                             count > 0)
+            stdout_fd = tcp_process.stdout.fileno()
+            batch = bytearray()
+            batch_deadline = None
+            stream_length = 0
+            parsed_length = PCAP_GLOBAL_HEADER_LENGTH
+            packets_captured = 0
+            probe_deadline = time.time() + TCPDUMP_READY_PROBE_TIMEOUT
+            next_probe_time = 0
+            finished = False
+            while not finished:
+                if not tcp_ready.is_set():
+                    now = time.time()
+                    if now > probe_deadline:
+                        # The marker never came back (e.g. the interface
+                        # is down), so there is nothing left to wait for
+                        tcp_ready.set()
+                    elif now >= next_probe_time:
+                        if send_ready_marker(cli, interface, marker):
+                            next_probe_time = \
+                                now + TCPDUMP_READY_PROBE_INTERVAL
+                        else:
+                            # Without a marker, just wait out the timeout
+                            next_probe_time = probe_deadline
+
+                # Block until tcpdump writes data (or exits, which makes
+                # the pipe readable at EOF), waking up periodically to
+                # check the stop flag, to send off a pending batch, and to
+                # re-send the readiness marker.  Once signaled to stop,
+                # only read what is already buffered in the pipe and then
+                # finish.
+                stopping = tcp_stop.is_set()
+                wait_time = 0 if stopping else TCPDUMP_POLL_INTERVAL
+                if batch_deadline is not None:
+                    wait_time = min(wait_time, batch_deadline - time.time())
+                if not tcp_ready.is_set():
+                    wait_time = min(wait_time, next_probe_time - time.time())
+                readable, _, _ = select.select(
+                    [stdout_fd], [], [], max(0, wait_time))
+                data = os.read(stdout_fd, PCAP_READ_SIZE) \
+                    if readable else ''
+
+                if len(data) > 0 and reader is not None:
+                    # Push each completed packet onto the return queue
+                    # (unless sending raw batches), calling the callback
+                    # function if one is set.
+                    for packet in reader.feed(data):
+                        parsed_length += (PCAP_RECORD_HEADER_LENGTH +
+                                          len(packet.packet_data))
+                        if is_ready_marker(packet):
+                            # Markers (including those of other captures
+                            # on the same link) are never returned
+                            if is_ready_marker(packet, marker):
+                                tcp_ready.set()
+                            continue
+
+                        packets_captured += 1
+                        if not raw_batches:
+                            packet_queue.put(packet)
+                        if callback is not None:
+                            callback(packet,
+                                     *(callback_args
+                                       if callback_args is not None
+                                       else ()))
+                        if 0 < count <= packets_captured:
+                            # Drop anything after the last packet wanted
+                            data = data[:parsed_length - stream_length]
+                            finished = True
                             break
 
-                        # Otherwise, we need to wait for data
-                        time.sleep(0)
-
-                    elif line.startswith('\t'):
-                        # Normal packet data: buffer into current packet
-                        packet_data += parse_line_to_byte_array(line)
-                    else:
-                        # We hit the end of the packet and will start
-                        # a new packet Only run if we had packet data
-                        # buffered
-                        if len(packet_data) > 0:
-                            # Create and parse the packet and push it onto
-                            # the return list, calling the callback function
-                            # if one is set.
-                            packet = PCAPPacket(packet_data, timestamp)
-                            packet_queue.put(packet)
-                            if callback is not None:
-                                callback(packet,
-                                         *(callback_args
-                                           if callback_args is not None
-                                           else []))
-                            packet_data = []
-
-                        # Start the new packet by reading the timestamp
-                        timestamp = line.split(' ', 2)[0]
+                    if tcp_ready.is_set() and not reader_needed:
+                        reader = None
+
+                if len(data) > 0:
+                    stream_length += len(data)
+                    if dump_file is not None:
+                        dump_file.write(data)
+
+                    if raw_batches:
+                        batch.extend(data)
+                        if batch_deadline is None:
+                            batch_deadline = \
+                                time.time() + PCAP_BATCH_INTERVAL
+
+                # Send the pending batch once it is big enough or old
+                # enough, or when there is nothing more to read right now
+                if len(batch) > 0 and (len(data) == 0 or finished or
+                                       len(batch) >= PCAP_BATCH_SIZE or
+                                       time.time() >= batch_deadline):
+                    packet_queue.put(bytes(batch))
+                    batch = bytearray()
+                    batch_deadline = None
+
+                if readable and len(data) == 0:
+                    # EOF, tcpdump has exited
+                    break
+                if not readable and stopping:
+                    break
         finally:
-            # Save the tcpdump output (if requested), and delete the
-            # temporary file
-            if save_dump_file is True:
-                LinuxCLI().copy_file(
-                    tmp_dump_filename,
-                    save_dump_filename if save_dump_filename is not None
-                    else 'tcp.out.' + str(time.time()))
-            LinuxCLI().rm(tmp_dump_filename)
-            tcp_processes.terminate()
+            # Close the saved pcap file (if requested)
+            if dump_file is not None:
+                dump_file.close()
+            if tcp_processes is not None:
+                tcp_processes.terminate()
 
         status_queue.put({'success': '',
-                          'returncode': tcp_piped_process.returncode,
-                          'stdout': tcp_piped_process.stdout,
-                          'stderr': tcp_piped_process.stderr})
+                          'returncode': tcp_process.returncode,
+                          'stdout': '',
+                          'stderr': err_out})
 
         # FLAG STATE: ready[set], stop[set], finished[clear]
+        tcp_ready.set()
         tcp_finished.set()
 
         # FLAG STATE: ready[set], stop[set], finished[set]
@@ -12,12 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from zephyr.common.cli import CommandStatus
 from zephyr.common.cli import LinuxCLI
 from zephyr.common.exceptions import ArgMismatchException
 from zephyr.common.exceptions import SubprocessFailedException
+from zephyr.common.raw_sender import RawSocketSender
 
 import multiprocessing
 
+RAW_PACKET_TYPES = [None, 'arp', 'icmp', 'tcp', 'udp', 'ip']
+
 
 def send_packet(tcp_event, **kwargs):
     TCPSender.send_packet(tcp_ready=tcp_event, **kwargs)
@@ -84,6 +88,28 @@ class TCPSender(object):
         :return: CommandStatus
         """
 
+        # Build and send the frames in-process when possible, only running
+        # mz for dry runs, unsupported packet types, endless sends (a count
+        # of 0, as with mz -c 0), or if the raw socket can't be opened.
+        # Once the socket is open, a failure part way through the frames
+        # is raised rather than sending them all again with mz.
+        if (cli.debug is not True and interface != 'any' and
+                packet_type in RAW_PACKET_TYPES and count != 0):
+            try:
+                RawSocketSender.get_socket(interface, cli.netns_name())
+                raw_socket = True
+            except SubprocessFailedException:
+                raw_socket = False
+            if raw_socket:
+                return TCPSender.send_raw_packet(
+                    cli=cli, tcp_ready=tcp_ready, interface=interface,
+                    packet_type=packet_type, source_port=source_port,
+                    dest_port=dest_port, source_ip=source_ip,
+                    dest_ip=dest_ip, source_mac=source_mac,
+                    dest_mac=dest_mac, packet_options=packet_options,
+                    count=count, delay=delay, byte_data=byte_data,
+                    payload=payload)
+
         count_str = '-c %(c)d' % {'c': count} \
             if count is not None else ''
         src_mac_str = '-a %(a)s' % {'a': source_mac} \
@@ -158,3 +184,40 @@ class TCPSender(object):
             tcp_ready.set()
         cli.log_cmd = prev
         return out
+
+    @staticmethod
+    def send_raw_packet(cli=LinuxCLI(), tcp_ready=None,
+                        interface='any', packet_type=None,
+                        source_port=None, dest_port=None,
+                        source_ip=None, dest_ip=None, source_mac=None,
+                        dest_mac=None, packet_options=None, count=None,
+                        delay=None, byte_data=None, payload=None):
+        """
+        Send the packet(s) through a raw socket on the interface (in the
+        CLI's network namespace) rather than with mz.  The parameters are
+        the same as send_packet, except that a count of 0 (send forever)
+        is only supported by mz.  A SubprocessFailedException is raised if
+        the raw socket cannot be opened, or a frame cannot be sent.
+        :return: CommandStatus
+        """
+        if count == 0:
+            raise ArgMismatchException(
+                'A count of 0 (send forever) needs mz')
+        netns = cli.netns_name()
+        desc = ('raw-send ' + interface +
+                (' (netns ' + netns + ')' if netns is not None else '') +
+                ' ' + (packet_type if packet_type is not None else 'bytes') +
+                ' x' + str(count if count is not None else 1))
+        if cli.logger is not None:
+            cli.logger.debug('>>>' + desc)
+        RawSocketSender.send(
+            interface, netns=netns,
+            count=count if count is not None else 1, delay=delay,
+            packet_type=packet_type, source_mac=source_mac,
+            dest_mac=dest_mac, source_ip=source_ip, dest_ip=dest_ip,
+            source_port=source_port, dest_port=dest_port,
+            packet_options=packet_options, byte_data=byte_data,
+            payload=payload)
+        if tcp_ready is not None:
+            tcp_ready.set()
+        return CommandStatus(command=desc)
@@ -0,0 +1,59 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+from zephyr.common import async_cli
+from zephyr.common.async_cli import AsyncLinuxCLI
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.exceptions import *
+from zephyr.common.utils import run_unit_test
+
+
+class AsyncCLITest(unittest.TestCase):
+    def test_cmd(self):
+        acli = AsyncLinuxCLI(LinuxCLI(priv=False))
+        start = time.time()
+        futures = [acli.cmd('sleep 0.5; echo ' + str(i)) for i in range(20)]
+        futures.append(acli.cmd_pipe([['echo', 'foo bar'], ['wc', '-w']]))
+        results = async_cli.gather(futures)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual([str(i) for i in range(20)],
+                         [r.stdout.strip() for r in results[:20]])
+        self.assertEqual('2', results[20].stdout.strip())
+
+    def test_cmd_timeout(self):
+        acli = AsyncLinuxCLI(LinuxCLI(priv=False))
+        self.assertRaises(SubprocessTimeoutException,
+                          acli.cmd('sleep 5', timeout=1).result)
+        self.assertRaises(SubprocessFailedException,
+                          acli.cmd('false', verify=True).result)
+
+        status = acli.cmd_all(['true', 'false'])
+        self.assertEqual([0, 1], [s.ret_code for s in status])
+
+    def test_gather(self):
+        def fail():
+            raise ArgMismatchException('fail')
+
+        futures = [async_cli.submit(lambda: 1), async_cli.submit(fail)]
+        self.assertRaises(ArgMismatchException, async_cli.gather, futures)
+        results = async_cli.gather(futures, return_exceptions=True)
+        self.assertEqual(1, results[0])
+        self.assertIsInstance(results[1], ArgMismatchException)
+
+        self.assertRaises(SubprocessTimeoutException, async_cli.gather,
+                          [async_cli.submit(time.sleep, 1)], timeout=0.1)
+
+run_unit_test(AsyncCLITest)
@@ -0,0 +1,204 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+from zephyr.common.capture_session import CaptureSession
+from zephyr.common.capture_session import get_filter_strs
+from zephyr.common.capture_session import SessionCapture
+from zephyr.common.exceptions import *
+from zephyr.common import pcap
+from zephyr.common.pcap_file import read_pcap_file
+from zephyr.common.pcap_packet import PCAPPacket
+from zephyr.common.pcap_packet import PCAPSLL
+from zephyr.common.utils import run_unit_test
+
+# 10.0.2.15:22 -> 10.0.2.2:53748 (TCP)
+TCP_PACKET = bytes(bytearray(
+    [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+     0x00, 0x28, 0x93, 0x06, 0x40, 0x00, 0x40, 0x06,
+     0x8f, 0x75, 0x0a, 0x00, 0x02, 0x0f, 0x0a, 0x00,
+     0x02, 0x02, 0x00, 0x16, 0xd1, 0xf4, 0x52, 0x1a,
+     0x58, 0x7c, 0x58, 0x25, 0x2e, 0x9b, 0x50, 0x18,
+     0x9f, 0xb0, 0x18, 0x5f, 0x00, 0x00]))
+
+# Broadcast ARP request: who-has 10.0.2.2 tell 10.0.2.15
+ARP_PACKET = bytes(bytearray(
+    [0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x08, 0x06, 0x00, 0x01,
+     0x08, 0x00, 0x06, 0x04, 0x00, 0x01, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x0a, 0x00, 0x02, 0x0f,
+     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x0a, 0x00,
+     0x02, 0x02]))
+
+
+def make_packets(*packet_data):
+    packets = []
+    for i, data in enumerate(packet_data):
+        packet = PCAPPacket(data, '00:00:00.00000' + str(i))
+        packet.capture_time = (1000, i)
+        packets.append(packet)
+    return packets
+
+
+class CaptureSessionTest(unittest.TestCase):
+    def test_dispatch_by_filter(self):
+        session = CaptureSession(interface='eth0')
+        tcp_sub = session.subscribe('tcp', pcap_filter=pcap.TCPProto())
+        arp_sub = session.subscribe('arp', pcap_filter=pcap.EtherProto('arp'))
+        all_sub = session.subscribe('all')
+
+        session.dispatch(make_packets(TCP_PACKET, ARP_PACKET, TCP_PACKET))
+
+        self.assertEqual(2, len(tcp_sub.wait_for_packets(count=2, timeout=0)))
+        arp_packets = arp_sub.wait_for_packets(count=0)
+        self.assertEqual(1, len(arp_packets))
+        self.assertEqual('10.0.2.2', arp_packets[0]['arp'].target_ip_addr)
+        self.assertEqual(3, len(all_sub.wait_for_packets(count=0)))
+
+    def test_attach_and_detach(self):
+        session = CaptureSession(interface='eth0')
+        first = session.subscribe('first')
+        session.dispatch(make_packets(TCP_PACKET))
+        second = session.subscribe('second')
+        session.detach('first')
+        session.dispatch(make_packets(ARP_PACKET))
+
+        self.assertEqual(1, len(first.wait_for_packets(count=0)))
+        self.assertEqual([ARP_PACKET],
+                         [p.packet_data
+                          for p in second.wait_for_packets(count=0)])
+        self.assertFalse(session.get_subscriber('first').attached)
+        self.assertTrue(session.has_attached_subscribers())
+        self.assertRaises(ObjectNotFoundException,
+                          session.get_subscriber, 'third')
+
+        # Re-subscribing replaces the old subscriber and its packets
+        session.dispatch(make_packets(TCP_PACKET))
+        self.assertEqual(1, len(second.wait_for_packets(count=0)))
+        session.subscribe('second')
+        self.assertEqual(
+            0, len(session.get_subscriber('second').wait_for_packets(0)))
+        self.assertFalse(second.attached)
+
+    def test_count_and_callback(self):
+        received = []
+
+        def callback(packet, extra):
+            received.append((packet.timestamp, extra))
+
+        session = CaptureSession(interface='eth0')
+        sub = session.subscribe(pcap_filter=pcap.Port(22), count=2,
+                                callback=callback, callback_args=['foo'])
+        session.dispatch(make_packets(TCP_PACKET, ARP_PACKET,
+                                      TCP_PACKET, TCP_PACKET))
+
+        self.assertFalse(sub.attached)
+        self.assertEqual([('00:00:00.000000', 'foo'),
+                          ('00:00:00.000002', 'foo')], received)
+
+        # Partial results stay buffered when the wait times out
+        self.assertRaises(SubprocessTimeoutException,
+                          sub.wait_for_packets, count=3, timeout=0.1)
+        self.assertEqual(2, len(sub.wait_for_packets(count=2, timeout=0)))
+
+    def test_save_dump_file(self):
+        session = CaptureSession(interface='eth0')
+        session.subscribe(pcap_filter=pcap.EtherProto('arp'),
+                          save_dump_file=True,
+                          save_dump_filename='capture_session_test.pcap')
+        session.dispatch(make_packets(TCP_PACKET, ARP_PACKET, ARP_PACKET))
+        session.detach()
+
+        packets = read_pcap_file('capture_session_test.pcap')
+        self.assertEqual(2, len(packets))
+        self.assertEqual(ARP_PACKET, packets[1].packet_data)
+        self.assertEqual((1000, 2), packets[1].capture_time)
+
+    def test_prefiltered_subscriber(self):
+        session = CaptureSession(interface='eth0')
+        ip6_sub = session.subscribe('ip6', pcap_filter=pcap.Simple('ip6'))
+        tcp_sub = session.subscribe('tcp', pcap_filter=pcap.TCPProto())
+        self.assertTrue(ip6_sub.prefiltered)
+        self.assertFalse(tcp_sub.prefiltered)
+
+        # Filtering is left to its own capture's tcpdump
+        session.dispatch(make_packets(TCP_PACKET, ARP_PACKET))
+        self.assertEqual(0, len(ip6_sub.wait_for_packets(count=0)))
+        session.dispatch(make_packets(ARP_PACKET), [ip6_sub])
+        self.assertEqual(1, len(ip6_sub.wait_for_packets(count=0)))
+        self.assertEqual(1, len(tcp_sub.wait_for_packets(count=0)))
+
+        self.assertEqual(PCAPSLL, CaptureSession(interface='any').link_layer)
+        self.assertFalse(
+            CaptureSession(interface='any').subscribe(
+                pcap_filter=pcap.Host('10.0.0.1')).prefiltered)
+
+    def test_combined_filter(self):
+        tcp = pcap.TCPProto()
+        arp = pcap.EtherProto('arp')
+        self.assertEqual(frozenset([tcp.to_str(), arp.to_str()]),
+                         get_filter_strs([tcp, arp, tcp]))
+        self.assertIsNone(get_filter_strs([tcp, None]))
+        self.assertIsNone(get_filter_strs([pcap.Null()]))
+
+        session = CaptureSession(interface='eth0')
+        capture = SessionCapture(session, pcap.Or([tcp, arp]),
+                                 get_filter_strs([tcp, arp]))
+        self.assertTrue(capture.covers(get_filter_strs([arp])))
+        self.assertFalse(capture.covers(get_filter_strs([pcap.Port(22)])))
+        self.assertFalse(capture.covers(None))
+        self.assertTrue(SessionCapture(session).covers(None))
+
+        # Only packets captured in the window are dispatched
+        capture.start_time = 1000.000001
+        capture.stop_time = 1000.000002
+        self.assertEqual([False, True, False],
+                         [capture.in_window(p) for p in make_packets(
+                             TCP_PACKET, TCP_PACKET, TCP_PACKET)])
+
+    def test_stop_unused_capture(self):
+        session = CaptureSession(interface='eth0')
+        sub = session.subscribe(count=1)
+        other = session.subscribe('other', pcap_filter=pcap.Port(22))
+        capture = SessionCapture(session)
+        session.capture = capture
+
+        # The capture keeps running while anyone is subscribed
+        session.dispatch(make_packets(ARP_PACKET))
+        self.assertFalse(sub.attached)
+        session.stop_unused_capture(capture)
+        self.assertIs(capture, session.capture)
+
+        session.detach('other')
+        self.assertIsNone(session.capture)
+        self.assertTrue(capture.dispatch_stop.is_set())
+        self.assertFalse(other.attached)
+
+        dedicated = session.subscribe('ip6', pcap_filter=pcap.Simple('ip6'),
+                                      count=1)
+        capture = SessionCapture(session, dedicated.pcap_filter,
+                                 subscriber=dedicated)
+        session.dedicated_captures['ip6'] = capture
+        session.dispatch(make_packets(TCP_PACKET), [dedicated])
+        session.stop_unused_capture(capture)
+        self.assertEqual({}, session.dedicated_captures)
+        self.assertTrue(capture.dispatch_stop.is_set())
+
+    def tearDown(self):
+        if os.path.exists('capture_session_test.pcap'):
+            os.remove('capture_session_test.pcap')
+
+run_unit_test(CaptureSessionTest)
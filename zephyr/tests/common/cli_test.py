@@ -12,8 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import sys
+import threading
 import unittest
+from zephyr.common.cli import CREATENSCMD
+from zephyr.common.cli import get_batch_type
 from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.cli import REMOVENSCMD
+from zephyr.common.exceptions import *
+from zephyr.common import netns_executor
+from zephyr.common.netns_executor import NetNSExecutor
 from zephyr.common.utils import run_unit_test
 
 
@@ -159,6 +169,44 @@ class CLITest(unittest.TestCase):
         finally:
             cli.rm('test-file6')
 
+    def test_cmd_streaming(self):
+        cli = LinuxCLI(priv=False)
+        lines = []
+        ret = cli.cmd('seq 1 5; echo err >&2', line_callback=lines.append)
+        self.assertEqual(['1\n', '2\n', '3\n', '4\n', '5\n'], lines)
+        self.assertEqual('1\n2\n3\n4\n5\n', ret.stdout)
+        self.assertEqual('err\n', ret.stderr)
+        self.assertEqual(0, ret.stdout_dropped)
+
+        ret = cli.cmd('seq 1 1000', max_output=8)
+        self.assertEqual('\n999\n1000\n'[-8:], ret.stdout)
+        self.assertEqual(len('\n'.join(str(i) for i in range(1, 1001))) +
+                         1 - 8, ret.stdout_dropped)
+
+        try:
+            ret = cli.cmd_pipe([['seq', '1', '3'], ['grep', '-v', '2']],
+                               tee_file='test-tee')
+            self.assertEqual('1\n3\n', ret.stdout)
+            self.assertEqual('1\n3\n', cli.read_from_file('test-tee'))
+        finally:
+            cli.rm('test-tee')
+
+        self.assertEqual(['1\n', '2\n'],
+                         list(cli.cmd_lines('seq 1 2', verify=True)))
+        for line in cli.cmd_lines('seq 1 1000000'):
+            # Stopping early must not wait for the rest of the output
+            break
+
+        # Closing the iterator early kills and reaps the command
+        threads = threading.active_count()
+        lines = cli.cmd_lines('echo $$; exec seq 1 1000000')
+        pid = next(lines).strip()
+        lines.close()
+        self.assertFalse(os.path.exists('/proc/' + pid))
+        self.assertEqual(threads, threading.active_count())
+        self.assertRaises(SubprocessFailedException, list,
+                          cli.cmd_lines('echo a; false', verify=True))
+
     def test_host_file_replacement(self):
         cli = LinuxCLI()
         if cli.exists('/etc/hosts.backup'):
@@ -280,6 +328,107 @@ class CLITest(unittest.TestCase):
                 cli.copy_file('/etc/hosts', '/tmp/hosts.tested')
                 cli.move('/etc/hosts.backup', '/etc/hosts')
 
+    def test_batch_type(self):
+        self.assertEqual('ip', get_batch_type('ip link set dev eth0 up'))
+        self.assertEqual('ip', get_batch_type('ip addr add 1.1.1.1 dev a'))
+        self.assertIsNone(get_batch_type('ip addr show'))
+        self.assertIsNone(get_batch_type('ip -4 addr add 1.1.1.1 dev a'))
+        self.assertIsNone(get_batch_type('ip netns add foo'))
+        self.assertIsNone(get_batch_type('ip link set dev a up | cat'))
+        self.assertEqual('iptables', get_batch_type(
+            'iptables -t nat -A POSTROUTING -o eth0 -j MASQUERADE'))
+        self.assertEqual('iptables', get_batch_type(
+            '/sbin/iptables -D FORWARD -i a -o b -j ACCEPT'))
+        self.assertIsNone(get_batch_type('iptables -L'))
+
+    def test_cmd_batch(self):
+        cli = LinuxCLI(priv=False)
+        results = cli.cmd_batch(['echo foo', 'echo bar >&2; exit 2',
+                                 'echo baz'])
+        self.assertEqual(2, len(results))
+        self.assertEqual('echo foo', results[0].command)
+        self.assertEqual(0, results[0].ret_code)
+        self.assertEqual('foo\n', results[0].stdout)
+        self.assertEqual(2, results[1].ret_code)
+        self.assertEqual('bar\n', results[1].stderr)
+
+        results = cli.cmd_batch(['false', 'echo baz'], stop_on_error=False)
+        self.assertEqual([1, 0], [r.ret_code for r in results])
+        self.assertEqual('baz\n', results[1].stdout)
+
+        results = cli.cmd_batch(
+            ['ip link set dev test-no-dev1 up',
+             'ip link set dev test-no-dev2 up',
+             'echo done'], stop_on_error=False)
+        self.assertEqual(3, len(results))
+        self.assertNotEqual(0, results[0].ret_code)
+        self.assertTrue('test-no-dev1' in results[0].stderr)
+        self.assertTrue('test-no-dev2' in results[1].stderr)
+        self.assertEqual('done\n', results[2].stdout)
+
+    def test_netns_executor(self):
+        CREATENSCMD('test-ns-exec')
+        try:
+            cli = NetNSCLI('test-ns-exec')
+            ret = cli.cmd('ip link show')
+            self.assertEqual(0, ret.ret_code)
+            self.assertTrue('lo' in ret.stdout)
+            self.assertTrue('ip netns exec test-ns-exec' in ret.command)
+            executor = NetNSExecutor.get_executor('test-ns-exec')
+            self.assertTrue(executor.is_running())
+
+            ret2 = cli.cmd_pipe([['ip', 'link', 'show'], ['grep', '-c', ':']])
+            self.assertEqual(0, ret2.ret_code)
+            self.assertEqual('2', ret2.stdout.strip())
+
+            ret3 = cli.cmd('echo err >&2; exit 3')
+            self.assertEqual(3, ret3.ret_code)
+            self.assertEqual('err\n', ret3.stderr)
+            self.assertRaises(SubprocessTimeoutException,
+                              cli.cmd, 'sleep 5', timeout=1)
+            self.assertRaises(SubprocessFailedException,
+                              cli.cmd, 'false', verify=True)
+        finally:
+            REMOVENSCMD('test-ns-exec')
+
+        self.assertFalse(executor.is_running())
+
+        # Without a namespace, the helper runs in the current one
+        root_executor = NetNSExecutor.get_executor(None, priv=False)
+        kill_grace = netns_executor.EXECUTOR_KILL_GRACE
+        try:
+            self.assertEqual((0, 'foo\n', ''), root_executor.run('echo foo'))
+            # Compound command lines are left to the caller
+            self.assertIsNone(root_executor.run('echo foo | cat'))
+            self.assertIsNone(root_executor.run('echo foo > /dev/null'))
+            # Commands which outlive their timeout are killed, and the
+            # helper can still be used; others run to completion
+            netns_executor.EXECUTOR_KILL_GRACE = 1
+            self.assertEqual(124, root_executor.run('sleep 30',
+                                                    timeout=0.5)[0])
+            self.assertEqual((0, 'bar\n', ''), root_executor.run('echo bar'))
+            self.assertEqual((0, '', ''), root_executor.run('sleep 2.5'))
+        finally:
+            netns_executor.EXECUTOR_KILL_GRACE = kill_grace
+            NetNSExecutor.stop_executors()
+
+    def test_netns_executor_command(self):
+        executor = NetNSExecutor('test-ns-exec')
+        geteuid = os.geteuid
+        try:
+            # sudo is only used to become root, as with priv_prefix
+            os.geteuid = lambda: 1000
+            self.assertEqual(['sudo', '-E', 'ip', 'netns', 'exec',
+                              'test-ns-exec'], executor.get_command()[:6])
+            os.geteuid = lambda: 0
+            self.assertEqual(['ip', 'netns', 'exec', 'test-ns-exec'],
+                             executor.get_command()[:4])
+            self.assertEqual(
+                [sys.executable, '-c'],
+                NetNSExecutor(None, priv=False).get_command()[:2])
+        finally:
+            os.geteuid = geteuid
+
     def test_pid_functions(self):
         cli = LinuxCLI()
         root_pids = cli.get_process_pids("root")
@@ -289,6 +438,11 @@ class CLITest(unittest.TestCase):
         self.assertTrue(len(root_pids) > 0)
         self.assertTrue(len(pids) > 0)
         self.assertTrue(len(ppids) > 0)
+        self.assertIn(str(os.getpid()), pids)
+        self.assertIn(str(os.getpid()),
+                      cli.get_parent_pids(os.getppid(), max_age=5))
+        self.assertTrue(cli.is_pid_running(os.getpid()))
+        self.assertFalse(cli.is_pid_running('no-such-pid'))
 
     def test_grep_count(self):
         cli = LinuxCLI()
@@ -0,0 +1,36 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from zephyr.common.cmd_parse import split_command
+from zephyr.common.utils import run_unit_test
+
+
+class CmdParseTest(unittest.TestCase):
+    def test_split_command(self):
+        self.assertEqual(
+            [('ns1', ['ip', 'addr', 'show', 'dev', 'eth0']),
+             ('ns1', ['grep', '-w', 'inet']),
+             ('ns1', ['awk', '{print $2}'])],
+            split_command("ip addr show dev eth0 | grep -w inet | "
+                          "awk '{print $2}'", 'ns1'))
+        self.assertEqual(
+            [('ns2', ['ip', 'r']), (None, ['echo', 'done'])],
+            split_command('sudo -E timeout 10 ip netns exec ns2 ip r && '
+                          'echo done'))
+        self.assertEqual([(None, ['cp', '/tmp/a', '/tmp/b'])],
+                         split_command('cp /tmp/a /tmp/b 2>&1 >> /tmp/c'))
+        self.assertEqual([], split_command(''))
+
+run_unit_test(CmdParseTest)
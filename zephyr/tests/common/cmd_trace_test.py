@@ -0,0 +1,73 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cmd_trace import CommandTracer
+from zephyr.common.cmd_trace import get_command_family
+from zephyr.common.cmd_trace import NO_TEST
+from zephyr.common.exceptions import *
+from zephyr.common.utils import run_unit_test
+
+
+class CommandTraceTest(unittest.TestCase):
+    def tearDown(self):
+        CommandTracer.enable(False)
+        CommandTracer.set_test(None)
+        CommandTracer.clear()
+
+    def test_command_family(self):
+        self.assertEqual('ip addr', get_command_family(
+            'timeout 10 sudo -E ip netns exec ns1 ip -4 a show dev eth0'))
+        self.assertEqual('ip netns', get_command_family('ip netns add ns1'))
+        self.assertEqual('cat', get_command_family('cat /tmp/x | grep y'))
+        self.assertEqual('', get_command_family(''))
+
+    def test_trace(self):
+        cli = LinuxCLI(priv=False)
+        cli.cmd('true')
+        self.assertIsNone(CommandTracer.get_suite_trace('suite1'))
+
+        CommandTracer.enable()
+        CommandTracer.set_test('suite1')
+        cli.cmd('echo foo')
+        CommandTracer.set_test('suite1', 'test1')
+        cli.cmd('echo foo')
+        cli.cmd_pipe([['echo', 'bar'], ['cat']])
+        cli.cmd('false')
+        self.assertRaises(SubprocessTimeoutException, cli.cmd, 'sleep 2',
+                          timeout=0.2)
+        CommandTracer.set_test('suite2', 'test2')
+        cli.cmd('true')
+
+        trace = CommandTracer.get_suite_trace('suite1')
+        self.assertEqual({NO_TEST, 'test1'}, set(trace['tests'].keys()))
+        test1 = trace['tests']['test1']
+        self.assertEqual(4, test1['all']['count'])
+        self.assertEqual(2, test1['all']['failures'])
+        self.assertEqual(1, test1['families']['sleep']['count'])
+        self.assertGreaterEqual(test1['families']['sleep']['max_time'], 0.2)
+        self.assertEqual({'': 4}, test1['all']['namespaces'])
+
+        suite = trace['suite']
+        self.assertEqual(5, suite['all']['count'])
+        self.assertEqual(3, suite['families']['echo']['count'])
+        self.assertEqual(12, suite['families']['echo']['output_bytes'])
+        self.assertEqual(5, sum(b['count'] for b in
+                                suite['all']['histogram']))
+        self.assertEqual('inf', suite['all']['histogram'][-1]['le'])
+        self.assertEqual(1, CommandTracer.get_suite_trace('suite2')[
+            'suite']['all']['count'])
+
+run_unit_test(CommandTraceTest)
@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import distutils.spawn
+import gzip
+import os
+import subprocess
 import unittest
 from zephyr.common.cli import LinuxCLI
 from zephyr.common.file_location import FileAccessor
@@ -43,4 +47,28 @@ class FileLocationTest(unittest.TestCase):
             LinuxCLI().rm('test_copy')
             LinuxCLI().rm('test2_copy')
 
+    def test_copy_compressed(self):
+        try:
+            cli = LinuxCLI(priv=False)
+            data = ''.join('line ' + str(i) + '\n' for i in range(10000))
+            cli.write_to_file('test', data)
+            fl = FileLocation('test')
+            self.assertEqual((len(data), os.path.getmtime('test')),
+                             fl.get_stat())
+            self.assertIsNone(FileLocation('missing').get_stat())
+
+            fl.copy_file(near_path='testdir', compression='gzip', level=1)
+            f = gzip.open('testdir/test.gz')
+            self.assertEqual(data, f.read())
+            f.close()
+            self.assertFalse(cli.exists('testdir/test.gz.tmp'))
+
+            if distutils.spawn.find_executable('zstd') is not None:
+                fl.copy_file(near_path='testdir', compression='zstd')
+                self.assertEqual(data, subprocess.check_output(
+                    ['zstd', '-d', '-c', 'testdir/test.zst']))
+        finally:
+            LinuxCLI().rm('test')
+            LinuxCLI().rm('testdir')
+
 run_unit_test(FileLocationTest)
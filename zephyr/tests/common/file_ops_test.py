@@ -0,0 +1,120 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import file_ops
+from zephyr.common.utils import run_unit_test
+
+TEST_DATA = ('MAX_HEAP_SIZE=1G\n'
+             '# runjdwp 1414\n'
+             '[haproxy_health_monitor]\n'
+             '10.0.0.1 host1\n'
+             'foo (bar) a+b\n'
+             'Foo food\n')
+
+
+class FileOpsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.dir, 'test')
+        with open(self.file, 'w') as f:
+            f.write(TEST_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def shell(self, cmd_line):
+        return subprocess.call(cmd_line, shell=True)
+
+    def test_expand_paths(self):
+        open(os.path.join(self.dir, 'test2'), 'w').close()
+        self.assertEqual([self.file, self.file + '2'],
+                         file_ops.expand_paths(self.dir + '/test*'))
+        self.assertEqual(['a', 'b'], file_ops.expand_paths('a b'))
+        self.assertEqual([os.path.expanduser('~/x')],
+                         file_ops.expand_paths('~/x'))
+        self.assertIsNone(file_ops.expand_paths('$HOME/x'))
+        self.assertIsNone(file_ops.expand_path('a b'))
+
+    def test_grep_file(self):
+        for pattern, options in [
+                ('MAX_HEAP', ''), ('\\[haproxy_health_monitor\\]', ''),
+                ('^# runjdwp', ''), ('1414$', ''), ('(bar)', ''),
+                ('a+b', ''), ('\\(foo\\|bar\\) (', ''), ('foo', '-w'),
+                ('food', '-i -w'), ('fo\\+d', ''), ('F.*d$', '-v'),
+                ('10.0.0.1 host1', ''), ('missing', ''), ('x*', '')]:
+            expected = self.shell('grep -q ' + options + ' "' + pattern +
+                                  '" ' + self.file) == 0
+            self.assertEqual(
+                expected,
+                file_ops.grep_file(self.file, pattern, options),
+                'grep ' + options + ' "' + pattern + '"')
+        self.assertIsNone(file_ops.grep_file(self.file, 'x', '-E'))
+        self.assertIsNone(file_ops.grep_file(self.file, '[[:digit:]]'))
+
+    def test_sed_file(self):
+        for script in ['s/MAX_HEAP_SIZE=.*/MAX_HEAP_SIZE="300M"/',
+                       '/runjdwp/s/^# //g',
+                       '/runjdwp/s/141[0-9]/1415/',
+                       '/10.0.0.1 host1/d',
+                       's/10.0.0.1 host1/10.0.0.2 host1/g',
+                       's/o/0/', 's/o/0/g', 's|\\(bar\\)|\\1 [&]|',
+                       's/\\(f\\)\\(o*\\)/\\2\\1/g']:
+            expected_file = self.file + '.expected'
+            shutil.copy(self.file, expected_file)
+            self.shell('sed -e "' + script + '" -i ' + expected_file)
+            self.assertTrue(file_ops.sed_file(self.file, script), script)
+            with open(expected_file) as f:
+                expected = f.read()
+            with open(self.file) as f:
+                self.assertEqual(expected, f.read(), script)
+
+        self.assertFalse(file_ops.sed_file(self.file, '/a/,/b/ s/x/y/'))
+        self.assertFalse(file_ops.sed_file(self.file, 's/a/b/;s/c/d/'))
+        self.assertFalse(file_ops.sed_file(self.file, 's/a/\\1/'))
+
+    def test_cli_file_ops(self):
+        cli = LinuxCLI(priv=False)
+        sub_dir = os.path.join(self.dir, 'a', 'b')
+        cli.mkdir(sub_dir)
+        self.assertTrue(os.path.isdir(sub_dir))
+
+        cli.copy_file(self.file, os.path.join(sub_dir, 'c', 'test'))
+        self.assertEqual(TEST_DATA, cli.cat(os.path.join(sub_dir, 'c',
+                                                         'test')))
+        wc = subprocess.check_output(['wc', self.file]).split()
+        self.assertEqual({'lines': int(wc[0]), 'words': int(wc[1]),
+                          'chars': int(wc[2])},
+                         cli.wc(self.file))
+
+        cli.copy_dir(os.path.join(self.dir, 'a'),
+                     os.path.join(self.dir, 'd'))
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'd', 'b', 'c',
+                                                    'test')))
+        cli.move(os.path.join(self.dir, 'd'), os.path.join(self.dir, 'e'))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'd')))
+
+        cli.rm_files(self.dir, 'tes*')
+        self.assertFalse(os.path.exists(self.file))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'e', 'b',
+                                                     'c', 'test')))
+        cli.rm(os.path.join(self.dir, '*'))
+        self.assertEqual([], os.listdir(self.dir))
+
+run_unit_test(FileOpsTest)
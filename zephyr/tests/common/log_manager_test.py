@@ -13,13 +13,18 @@
 # limitations under the License.
 
 import datetime
+import gzip
+import json
 import logging
 import os
+import StringIO
 import unittest
+from zephyr.common.exceptions import ArgMismatchException
 from zephyr.common.exceptions import ObjectAlreadyAddedException
 from zephyr.common.exceptions import ObjectNotFoundException
 from zephyr.common.file_location import *
 from zephyr.common.log_manager import LogManager
+from zephyr.common import log_slicer
 from zephyr.common.utils import run_unit_test
 
 
@@ -355,6 +360,11 @@ class LogManagerTest(unittest.TestCase):
             self.assertTrue(LinuxCLI().exists('./logs-all/test2.log'))
             self.assertTrue(LinuxCLI().exists('./logs-all/test3.log.0'))
             self.assertTrue(LinuxCLI().exists('./logs-all/test3.log.1'))
+            # Timestamped logs are indexed, others are not
+            self.assertTrue(LinuxCLI().exists('./logs-all/.test-log.log' +
+                                              log_slicer.INDEX_EXT))
+            self.assertFalse(LinuxCLI().exists('./logs-all/.test2.log' +
+                                               log_slicer.INDEX_EXT))
         finally:
             LinuxCLI().rm('./logs-all')
             LinuxCLI().rm('./logs')
@@ -362,6 +372,61 @@ class LogManagerTest(unittest.TestCase):
             LinuxCLI().rm('./logs3')
             LinuxCLI().rm('./logs4')
 
+    def test_collate_compressed(self):
+        LinuxCLI().rm('./logs-all')
+        LinuxCLI().rm('./logs')
+        LinuxCLI().rm('./logs2')
+        LinuxCLI(priv=False).mkdir('./logs2')
+
+        try:
+            LinuxCLI(priv=False).write_to_file('./logs2/test2.log', 'data')
+            lm = LogManager('./logs')
+            lm.set_default_log_level(logging.DEBUG)
+            log1 = lm.add_file_logger('test-log.log')
+            lm.add_external_log_file(FileLocation('./logs2/test2.log'), '')
+            log1.info('test')
+
+            lm.collate_logs('./logs-all', compression='gzip', workers=2)
+            f = gzip.open('./logs-all/test2.log.gz')
+            self.assertEqual('data', f.read())
+            f.close()
+            self.assertTrue(LinuxCLI().exists('./logs-all/test-log.log.gz'))
+            self.assertFalse(LinuxCLI().exists('./logs-all/test2.log'))
+            # Compressed logs can't be indexed
+            self.assertFalse(LinuxCLI().exists(
+                './logs-all/.test-log.log.gz' + log_slicer.INDEX_EXT))
+
+            with open('./logs-all/manifest.json') as f:
+                manifest = json.load(f)
+            self.assertEqual({'test-log.log', 'test2.log'},
+                             set(manifest.keys()))
+            self.assertEqual('test2.log.gz', manifest['test2.log']['file'])
+            self.assertEqual(4, manifest['test2.log']['size'])
+            self.assertEqual('%Y-%m-%d %H:%M:%S,%f',
+                             manifest['test-log.log']['date_format'])
+
+            # Collating again picks up the new entries
+            log1.info('test again')
+            lm.collate_logs('./logs-all', compression='gzip')
+            f = gzip.open('./logs-all/test-log.log.gz')
+            self.assertTrue('test again' in f.read())
+            f.close()
+
+            # The collated logs merge back into one, by time
+            out = StringIO.StringIO()
+            self.assertEqual(2, lm.merge_collated_logs(out))
+            lines = out.getvalue().splitlines()
+            self.assertTrue(lines[0].startswith('[test-log.log.gz] '))
+            self.assertTrue(lines[0].endswith(' - test'))
+            self.assertTrue(lines[1].endswith(' - test again'))
+
+            self.assertRaises(ArgMismatchException, lm.collate_logs,
+                              './logs-all', compression='lzma')
+        finally:
+            LinuxCLI().rm('./logs-all')
+            LinuxCLI().rm('./logs')
+            LinuxCLI().rm('./logs2')
+
     @classmethod
     def tearDownClass(cls):
         LinuxCLI().rm('log_file.txt')
@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import datetime
+import gzip
 import logging
 import os
+import StringIO
 import time
 import unittest
 from zephyr.common import exceptions
@@ -129,6 +131,228 @@ class LogSlicerTest(unittest.TestCase):
             LinuxCLI().rm('./sliced-logs')
             pass
 
+    def test_timestamp_parser(self):
+        for fmt, pos in log_slicer.COMMON_FORMATS:
+            parser = log_slicer.TimestampParser.get_parser(fmt, pos)
+            when = datetime.datetime(2016, 3, 4, 15, 6, 7, 89000)
+            if '%f' not in fmt:
+                when = when.replace(microsecond=0)
+            line = ('x ' * pos) + when.strftime(fmt) + ' INFO msg\n'
+            self.assertEqual(when, parser.parse(line), fmt)
+            self.assertIsNone(parser.parse('  at foo.Bar(Bar.java:12)\n'))
+        self.assertIsNone(log_slicer.TimestampParser.get_parser(
+            '%Y-%m-%d %H:%M:%S,%f', 0).parse('2016-13-01 00:00:00,0 x'))
+
+    def test_slicing_search(self):
+        LinuxCLI().rm('./logs')
+        LinuxCLI().rm('./sliced-logs')
+
+        try:
+            LinuxCLI().mkdir('./logs')
+            base = datetime.datetime(2016, 1, 1)
+            with open('./logs/big-log', 'w') as f:
+                for i in range(0, 5000):
+                    f.write((base + datetime.timedelta(seconds=i)).strftime(
+                        '%Y-%m-%d %H:%M:%S,%f')[:-3] + ' INFO line ' +
+                        str(i) + '\n')
+                    if i % 7 == 0:
+                        f.write('Traceback for ' + str(i) + '\n')
+
+            log_slicer.slice_log_files_by_time(
+                log_files=[FileLocation('./logs/big-log')],
+                out_dir='./sliced-logs',
+                slice_start_time=base + datetime.timedelta(seconds=1000),
+                slice_stop_time=base + datetime.timedelta(seconds=1999),
+                leeway=1)
+
+            with open('./sliced-logs/big-log.slice') as f:
+                lines = f.readlines()
+            self.assertTrue(lines[0].startswith('SLICE OF LOG'))
+            self.assertTrue(lines[1].endswith(' line 999\n'))
+            self.assertIn('Traceback for 1001\n', lines)
+            self.assertTrue(lines[-1].endswith(' line 2000\n'))
+            self.assertEqual(1 + 1002 + len(range(1001, 2000, 7)),
+                             len(lines))
+
+            log_slicer.slice_log_files_by_time(
+                log_files=[FileLocation('./logs/big-log')],
+                out_dir='./sliced-logs',
+                slice_start_time=base + datetime.timedelta(seconds=9000),
+                slice_stop_time=base + datetime.timedelta(seconds=9999),
+                ext='.none')
+            self.assertFalse(os.path.exists('./sliced-logs/big-log.none'))
+
+        finally:
+            LinuxCLI().rm('./logs')
+            LinuxCLI().rm('./sliced-logs')
+
+    def test_slicing_index(self):
+        LinuxCLI().rm('./logs')
+        LinuxCLI().rm('./sliced-logs')
+
+        try:
+            LinuxCLI().mkdir('./logs')
+            base = datetime.datetime(2016, 1, 1)
+            with open('./logs/big-log', 'w') as f:
+                for i in range(0, 20000):
+                    f.write((base + datetime.timedelta(
+                        milliseconds=i * 100)).strftime(
+                        '%Y-%m-%d %H:%M:%S,%f')[:-3] + ' INFO line ' +
+                        str(i) + '\n')
+
+            index = log_slicer.LogIndex.build('./logs/big-log',
+                                              line_interval=500,
+                                              time_interval=3600)
+            self.assertEqual(40, len(index.times))
+            self.assertEqual(index.offsets.tolist(),
+                             log_slicer.LogIndex.load(
+                                 './logs/big-log').offsets.tolist())
+            self.assertFalse('.big-log' + log_slicer.INDEX_EXT in
+                             LinuxCLI.ls('./logs/*'))
+
+            for start, stop in [(0, 10), (95.05, 95.5), (1999, 2100),
+                                (-10, -5)]:
+                log_slicer.slice_log_files_by_time(
+                    log_files=[FileLocation('./logs/big-log')],
+                    out_dir='./sliced-logs',
+                    slice_start_time=base + datetime.timedelta(
+                        seconds=start),
+                    slice_stop_time=base + datetime.timedelta(seconds=stop),
+                    ext='.' + str(start))
+                log_slicer.LogIndex.indexes.clear()
+                os.rename('./logs/.big-log' + log_slicer.INDEX_EXT,
+                          './logs/big-log.idx')
+                log_slicer.slice_log_files_by_time(
+                    log_files=[FileLocation('./logs/big-log')],
+                    out_dir='./sliced-logs',
+                    slice_start_time=base + datetime.timedelta(
+                        seconds=start),
+                    slice_stop_time=base + datetime.timedelta(seconds=stop),
+                    ext='.noindex.' + str(start))
+                os.rename('./logs/big-log.idx',
+                          './logs/.big-log' + log_slicer.INDEX_EXT)
+                if start < 0:
+                    self.assertFalse(os.path.exists(
+                        './sliced-logs/big-log.' + str(start)))
+                    continue
+                with open('./sliced-logs/big-log.' + str(start)) as f:
+                    indexed = f.readlines()
+                with open('./sliced-logs/big-log.noindex.' +
+                          str(start)) as f:
+                    self.assertEqual(f.readlines(), indexed)
+                self.assertTrue(indexed[1].endswith(
+                    ' line ' + str(int(round(start * 10 + 0.49))) + '\n'))
+
+            # A changed log's index is not used
+            with open('./logs/big-log', 'a') as f:
+                f.write('more\n')
+            self.assertIsNone(log_slicer.LogIndex.load('./logs/big-log'))
+
+        finally:
+            LinuxCLI().rm('./logs')
+            LinuxCLI().rm('./sliced-logs')
+
+    def test_slicing_windows(self):
+        LinuxCLI().rm('./logs')
+        LinuxCLI().rm('./sliced-logs')
+
+        try:
+            LinuxCLI().mkdir('./logs')
+            base = datetime.datetime(2016, 1, 1)
+            for name in ['log1', 'log2', 'log3']:
+                with open('./logs/' + name, 'w') as f:
+                    for i in range(0, 3000):
+                        f.write((base + datetime.timedelta(
+                            seconds=i)).strftime(
+                            '%Y-%m-%d %H:%M:%S,%f')[:-3] + ' ' + name +
+                            ' line ' + str(i) + '\n')
+
+            def window(test, start, stop):
+                return log_slicer.SliceWindow(
+                    './sliced-logs/' + test,
+                    base + datetime.timedelta(seconds=start),
+                    base + datetime.timedelta(seconds=stop))
+
+            # Overlapping, out of order, and empty windows
+            windows = [window('t3', 2500, 2510), window('t1', 10, 19),
+                       window('t2', 15, 30), window('t4', 5000, 5010)]
+            written = log_slicer.slice_log_files_by_windows(
+                ['./logs/log1', './logs/log2', './logs/log3'], windows,
+                processes=3, build_index=True)
+            self.assertEqual(9, len(written))
+            self.assertFalse(os.path.exists('./sliced-logs/t4'))
+            self.assertIsNotNone(log_slicer.LogIndex.load('./logs/log2'))
+
+            for test, start, stop in [('t1', 10, 19), ('t2', 15, 30),
+                                      ('t3', 2500, 2510)]:
+                for name in ['log1', 'log2', 'log3']:
+                    with open('./sliced-logs/' + test + '/' + name +
+                              '.slice') as f:
+                        lines = f.readlines()
+                    self.assertEqual(
+                        [name + ' line ' + str(i) + '\n'
+                         for i in range(start, stop + 1)],
+                        [l.split(' ', 2)[2] for l in lines[1:]])
+
+        finally:
+            LinuxCLI().rm('./logs')
+            LinuxCLI().rm('./sliced-logs')
+
+    def test_merging(self):
+        LinuxCLI().rm('./logs')
+
+        try:
+            LinuxCLI().mkdir('./logs')
+            base = datetime.datetime(2016, 1, 1)
+            with open('./logs/log1', 'w') as f:
+                for i in range(0, 100, 2):
+                    f.write((base + datetime.timedelta(seconds=i)).strftime(
+                        '%Y-%m-%d %H:%M:%S,%f')[:-3] + ' log1 ' + str(i) +
+                        '\n')
+                    if i == 10:
+                        f.write('Traceback:\n  at line 1\n')
+            f = gzip.open('./logs/log2.gz', 'wb')
+            f.write('log2 header\n')
+            for i in range(1, 100, 2):
+                f.write((base + datetime.timedelta(seconds=i)).strftime(
+                    '%Y.%m.%d %H:%M:%S.%f')[:-3] + ' log2 ' + str(i) + '\n')
+            f.close()
+            with open('./logs/log3', 'w') as f:
+                f.write('- - ' + base.strftime('%Y-%m-%d %H:%M:%S,%f') +
+                        ' log3 0')
+
+            sources = [log_slicer.MergeSource('./logs/log1'),
+                       log_slicer.MergeSource('./logs/log2.gz', tag='two'),
+                       log_slicer.MergeSource('./logs/log3',
+                                              '%Y-%m-%d %H:%M:%S,%f', 2)]
+            out = StringIO.StringIO()
+            self.assertEqual(101, log_slicer.merge_logs(sources, out))
+            lines = out.getvalue().splitlines()
+            self.assertEqual(103, len(lines))
+            self.assertEqual('[log1] ', lines[0][:7])
+            self.assertTrue(lines[1].startswith('[log3] - - '))
+            self.assertTrue(lines[2].startswith('[two] '))
+            self.assertEqual(['[log1] Traceback:', '[log1]   at line 1'],
+                             lines[12:14])
+            self.assertEqual(
+                [str(i) for i in range(0, 100)],
+                [l.split(' ')[-1] for l in lines
+                 if ' log1 ' in l or ' log2 ' in l])
+
+            # A window, without tags
+            out = StringIO.StringIO()
+            self.assertEqual(11, log_slicer.merge_logs(
+                sources, out, base + datetime.timedelta(seconds=5),
+                base + datetime.timedelta(seconds=15), tag=False))
+            lines = out.getvalue().splitlines()
+            self.assertEqual('log2 5', lines[0].split(' ', 2)[2])
+            self.assertEqual('log1 10', lines[5].split(' ', 2)[2])
+            self.assertEqual('Traceback:', lines[6])
+            self.assertEqual('log2 15', lines[-1].split(' ', 2)[2])
+
+        finally:
+            LinuxCLI().rm('./logs')
+
     @classmethod
     def tearDownClass(cls):
         LinuxCLI().rm('log_file.txt')
@@ -0,0 +1,103 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import threading
+import time
+import unittest
+from zephyr.common.cli import CREATENSCMD
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.cli import REMOVENSCMD
+from zephyr.common.exceptions import *
+from zephyr.common.ip import IP
+from zephyr.common import netlink
+from zephyr.common.utils import run_unit_test
+
+
+class NetlinkTest(unittest.TestCase):
+    def test_attrs(self):
+        data = (netlink.pack_str_attr(netlink.IFLA_IFNAME, 'eth0') +
+                netlink.pack_int_attr(netlink.IFLA_MASTER, 7))
+        self.assertEqual(0, len(data) % 4)
+        attrs = netlink.parse_attrs(data)
+        self.assertEqual(b'eth0\x00', attrs[netlink.IFLA_IFNAME])
+        self.assertEqual(
+            7, struct.unpack('=I', attrs[netlink.IFLA_MASTER])[0])
+
+    def test_parse_prefix(self):
+        self.assertEqual(('0.0.0.0', 0), netlink.parse_prefix('default'))
+        self.assertEqual(('10.0.0.0', 8), netlink.parse_prefix('10.0.0.0/8'))
+        self.assertEqual(('10.0.0.1', 32), netlink.parse_prefix('10.0.0.1'))
+        self.assertEqual(('10.0.0.0', 24),
+                         netlink.parse_prefix(IP('10.0.0.0', '24')))
+
+    def test_netns_operations(self):
+        CREATENSCMD('test-netlink')
+        try:
+            nl = NetNSCLI('test-netlink').netlink()
+            self.assertIsNotNone(nl)
+            nl.create_link('test-veth', 'veth', peer_name='test-veth.p')
+            nl.set_link_up('test-veth')
+            nl.set_link_address('test-veth', '02:00:00:00:00:01')
+            nl.add_address('test-veth', IP('10.55.0.1', '24'))
+            nl.add_route(IP('10.56.0.0', '16'), gateway='10.55.0.254')
+
+            links = dict((l['name'], l) for l in nl.get_links())
+            self.assertTrue('test-veth.p' in links)
+            self.assertEqual('02:00:00:00:00:01', links['test-veth']['mac'])
+            self.assertEqual([IP('10.55.0.1', '24')],
+                             nl.get_addresses('test-veth'))
+            self.assertRaises(netlink.NetlinkException, nl.add_address,
+                              'test-veth', IP('10.55.0.1', '24'))
+            self.assertRaises(netlink.NetlinkException,
+                              nl.get_link_index, 'test-no-dev')
+
+            def add_address_later():
+                time.sleep(0.2)
+                nl.add_address('test-veth.p', IP('10.55.0.2', '24'))
+
+            threading.Thread(target=add_address_later).start()
+            self.assertEqual(IP('10.55.0.2', '24'),
+                             nl.wait_for_address('test-veth.p', timeout=5))
+            self.assertRaises(SubprocessTimeoutException,
+                              nl.wait_for_address, 'lo', timeout=0.2)
+
+            nl.del_route(IP('10.56.0.0', '16'))
+            nl.del_address('test-veth', IP('10.55.0.1', '24'))
+            self.assertEqual([], nl.get_addresses('test-veth'))
+            nl.delete_link('test-veth')
+            self.assertFalse('test-veth' in
+                             [l['name'] for l in nl.get_links()])
+        finally:
+            REMOVENSCMD('test-netlink')
+
+    def test_netns_recreated(self):
+        CREATENSCMD('test-netlink2')
+        try:
+            get_socket = netlink.NetlinkSocket.get_socket
+            nl = get_socket('test-netlink2')
+            self.assertIs(nl, get_socket('test-netlink2'))
+            nl.create_link('test-veth2', 'veth', peer_name='test-veth2.p')
+
+            # Re-create the namespace behind the cache's back
+            LinuxCLI().cmd('ip netns del test-netlink2')
+            LinuxCLI().cmd('ip netns add test-netlink2')
+            nl2 = get_socket('test-netlink2')
+            self.assertIsNot(nl, nl2)
+            self.assertEqual(['lo'], [l['name'] for l in nl2.get_links()])
+        finally:
+            REMOVENSCMD('test-netlink2')
+
+run_unit_test(NetlinkTest)
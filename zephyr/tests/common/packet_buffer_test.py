@@ -0,0 +1,95 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import unittest
+from zephyr.common.exceptions import *
+from zephyr.common import packet_buffer
+from zephyr.common.pcap_file import read_pcap_file
+from zephyr.common.pcap_packet import PCAPPacket
+from zephyr.common.utils import run_unit_test
+
+
+def make_packets(count, size=60):
+    return [PCAPPacket(bytes(bytearray([i % 256] * size)), str(i))
+            for i in range(count)]
+
+
+class PacketBufferTest(unittest.TestCase):
+    def test_unbounded(self):
+        buf = packet_buffer.PacketBuffer()
+        buf.extend(make_packets(100))
+
+        self.assertEqual(100, len(buf))
+        self.assertEqual(['0', '1'], [p.timestamp for p in buf.get(2)])
+        self.assertEqual(98, len(buf.get(0)))
+        self.assertEqual(0, buf.buffered_bytes)
+        self.assertEqual(0, buf.dropped_packets)
+
+    def test_drop_oldest(self):
+        buf = packet_buffer.PacketBuffer(max_packets=10)
+        buf.extend(make_packets(25))
+
+        self.assertEqual(10, len(buf))
+        self.assertEqual(15, buf.dropped_packets)
+        self.assertEqual(15 * 60, buf.dropped_bytes)
+        self.assertEqual('15', buf.get(1)[0].timestamp)
+
+    def test_drop_newest(self):
+        buf = packet_buffer.PacketBuffer(
+            max_bytes=250, overflow_policy=packet_buffer.OVERFLOW_DROP_NEWEST)
+        buf.extend(make_packets(6))
+
+        self.assertEqual(4, len(buf))
+        self.assertEqual(240, buf.buffered_bytes)
+        self.assertEqual(2, buf.dropped_packets)
+        self.assertEqual(['0', '1', '2', '3'],
+                         [p.timestamp for p in buf.get(0)])
+
+    def test_spill(self):
+        buf = packet_buffer.PacketBuffer(
+            max_packets=3, overflow_policy=packet_buffer.OVERFLOW_SPILL,
+            spill_filename='packet_buffer_test.pcap')
+        buf.extend(make_packets(5))
+        buf.close()
+
+        self.assertEqual(3, len(buf))
+        self.assertEqual(2, buf.spilled_packets)
+        self.assertEqual(0, buf.dropped_packets)
+        spilled = read_pcap_file('packet_buffer_test.pcap')
+        self.assertEqual([b'\x00' * 60, b'\x01' * 60],
+                         [p.packet_data for p in spilled])
+
+    def test_wait_and_timeout(self):
+        buf = packet_buffer.PacketBuffer()
+        buf.extend(make_packets(1))
+
+        self.assertRaises(SubprocessTimeoutException, buf.get, 2, 0.1)
+        self.assertEqual(1, len(buf))
+
+        timer = threading.Timer(0.1, buf.extend, [make_packets(1)])
+        timer.start()
+        self.assertEqual(2, len(buf.get(2, timeout=5)))
+        self.assertEqual([], buf.get_available(timeout=0.1))
+
+    def test_bad_policy(self):
+        self.assertRaises(ArgMismatchException, packet_buffer.PacketBuffer,
+                          overflow_policy='foo')
+
+    def tearDown(self):
+        if os.path.exists('packet_buffer_test.pcap'):
+            os.remove('packet_buffer_test.pcap')
+
+run_unit_test(PacketBufferTest)
@@ -0,0 +1,123 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import struct
+import unittest
+from zephyr.common import pcap_file
+from zephyr.common import pcap_packet
+from zephyr.common.utils import run_unit_test
+
+ETHERNET_TCP_PACKET = bytearray(
+    [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+     0x00, 0x28, 0x93, 0x06, 0x40, 0x00, 0x40, 0x06,
+     0x8f, 0x75, 0x0a, 0x00, 0x02, 0x0f, 0x0a, 0x00,
+     0x02, 0x02, 0x00, 0x16, 0xd1, 0xf4, 0x52, 0x1a,
+     0x58, 0x7c, 0x58, 0x25, 0x2e, 0x9b, 0x50, 0x18,
+     0x9f, 0xb0, 0x18, 0x5f, 0x00, 0x00])
+
+SLL_TCP_PACKET = bytearray(
+    [0x00, 0x04, 0x00, 0x01, 0x00, 0x06, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x00, 0x00, 0x08, 0x00]) + \
+    ETHERNET_TCP_PACKET[14:]
+
+
+def make_pcap_stream(packets, link_type=pcap_file.PCAP_LINK_TYPE_ETHERNET,
+                     byte_order='<', snap_length=65535):
+    data = struct.pack(byte_order + 'IHHiIII', pcap_file.PCAP_MAGIC_USEC,
+                       2, 4, 0, 0, snap_length, link_type)
+    for i, packet in enumerate(packets):
+        cap_data = bytes(packet[:snap_length])
+        data += struct.pack(byte_order + 'IIII', 1000 + i, 250 + i,
+                            len(cap_data), len(packet))
+        data += cap_data
+    return data
+
+
+class PCAPFileTest(unittest.TestCase):
+
+    def test_read_stream(self):
+        data = make_pcap_stream([ETHERNET_TCP_PACKET, ETHERNET_TCP_PACKET])
+
+        reader = pcap_file.PCAPStreamReader()
+        packets = reader.feed(data)
+
+        self.assertEqual(2, len(packets))
+        self.assertEqual(pcap_file.PCAP_LINK_TYPE_ETHERNET, reader.link_type)
+        self.assertEqual((2, 4), reader.version)
+        self.assertEqual(
+            pcap_file.format_pcap_timestamp(1001, 251), packets[1].timestamp)
+        self.assertTrue(packets[1].timestamp.endswith('.000251'))
+        self.assertEqual('10.0.2.15', packets[0]['ip'].source_ip)
+        self.assertEqual(53748, packets[1]['tcp'].dest_port)
+
+    def test_read_stream_partial_chunks(self):
+        data = make_pcap_stream([ETHERNET_TCP_PACKET] * 3, byte_order='>')
+
+        reader = pcap_file.PCAPStreamReader()
+        packets = []
+        for i in range(0, len(data), 7):
+            packets += reader.feed(data[i:i + 7])
+
+        self.assertEqual(3, len(packets))
+        self.assertEqual(3, reader.packets_read)
+        self.assertEqual(0, len(reader.buffer))
+        for packet in packets:
+            self.assertEqual(
+                bytes(ETHERNET_TCP_PACKET), packet.packet_data)
+            self.assertEqual(22, packet['tcp'].source_port)
+
+    def test_read_stream_link_type_sll(self):
+        data = make_pcap_stream([SLL_TCP_PACKET],
+                                link_type=pcap_file.PCAP_LINK_TYPE_LINUX_SLL)
+
+        packets = pcap_file.PCAPStreamReader().feed(data)
+
+        self.assertEqual(1, len(packets))
+        self.assertEqual(pcap_packet.PCAPSLL, type(packets[0]['ethernet']))
+        self.assertEqual('08:00:27:c6:25:01',
+                         packets[0]['ethernet'].source_mac)
+        self.assertEqual('10.0.2.2', packets[0]['ip'].dest_ip)
+
+    def test_read_stream_truncated_capture(self):
+        data = make_pcap_stream([ETHERNET_TCP_PACKET], snap_length=34)
+
+        packets = pcap_file.PCAPStreamReader().feed(data)
+
+        self.assertEqual(1, len(packets))
+        self.assertEqual(34, len(packets[0].packet_data))
+        self.assertEqual('10.0.2.2', packets[0]['ip'].dest_ip)
+        self.assertRaises(pcap_packet.PacketParsingException,
+                          packets[0].__getitem__, 'tcp')
+
+    def test_read_stream_bad_magic(self):
+        reader = pcap_file.PCAPStreamReader()
+        self.assertRaises(pcap_packet.PacketParsingException,
+                          reader.feed, b'\x00' * 24)
+
+    def test_read_pcap_file(self):
+        with open('pcap_file_test.pcap', 'wb') as f:
+            f.write(make_pcap_stream([ETHERNET_TCP_PACKET] * 2))
+
+        packets = pcap_file.read_pcap_file('pcap_file_test.pcap')
+
+        self.assertEqual(2, len(packets))
+        self.assertEqual('10.0.2.15', packets[1]['ip'].source_ip)
+
+    def tearDown(self):
+        if os.path.exists('pcap_file_test.pcap'):
+            os.remove('pcap_file_test.pcap')
+
+run_unit_test(PCAPFileTest)
@@ -723,5 +723,103 @@ class PCAPPacketTest(unittest.TestCase):
         self.assertEqual(
             pcap_packet.PCAPIP4, pmap['ethernet'].next_parse_recommendation)
 
+    def test_raw_buffer_packet_parsing(self):
+        full_eii_packet_data = bytearray(
+            [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+             0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+             0x00, 0x2c, 0x93, 0x06, 0x40, 0x00, 0x40, 0x06,
+             0x8f, 0x75, 0x0a, 0x00, 0x02, 0x0f, 0x0a, 0x00,
+             0x02, 0x02, 0x00, 0x16, 0xd1, 0xf4, 0x52, 0x1a,
+             0x58, 0x7c, 0x58, 0x25, 0x2e, 0x9b, 0x51, 0x18,
+             0x9f, 0xb0, 0x18, 0x5f, 0x00, 0x00, 0xDE, 0xAD,
+             0xBE, 0xEF])
+
+        for packet_data in [bytes(full_eii_packet_data),
+                            full_eii_packet_data,
+                            memoryview(full_eii_packet_data)]:
+            packet = pcap_packet.PCAPPacket(packet_data, '13:00')
+            pmap = packet.parse()
+
+            self.assertEqual(
+                '52:54:00:12:35:02', pmap['ethernet'].dest_mac)
+            self.assertEqual(
+                '10.0.2.15', pmap['ip'].source_ip)
+            self.assertEqual(
+                '10.0.2.2', pmap['ip'].dest_ip)
+            self.assertEqual(
+                53748, pmap['tcp'].dest_port)
+            self.assertEqual(
+                1478831771, pmap['tcp'].ack)
+            self.assertEqual(
+                True,
+                pmap['tcp'].is_flag_set(pcap_packet.TCP_PROTOCOL_FLAG_NS))
+            self.assertEqual(
+                True,
+                pmap['tcp'].is_flag_set(pcap_packet.TCP_PROTOCOL_FLAG_ACK))
+
+        # Remaining data comes back as a (zero-copy) view of the buffer
+        view = memoryview(full_eii_packet_data)
+        new_data = pcap_packet.PCAPEthernet().parse_layer(view)
+        self.assertEqual(memoryview, type(new_data))
+        self.assertEqual(
+            bytearray([0xDE, 0xAD, 0xBE, 0xEF]), bytearray(new_data[-4:]))
+
+    def test_lazy_packet_parsing(self):
+        full_eii_packet_data = \
+            [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+             0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+             0x00, 0x28, 0x93, 0x06, 0x40, 0x00, 0x40, 0x06,
+             0x8f, 0x75, 0x0a, 0x00, 0x02, 0x0f, 0x0a, 0x00,
+             0x02, 0x02, 0x00, 0x16, 0xd1, 0xf4, 0x52, 0x1a,
+             0x58, 0x7c, 0x58, 0x25, 0x2e, 0x9b, 0x50, 0x18,
+             0x9f, 0xb0, 0x18, 0x5f, 0x00, 0x00]
+
+        # Nothing is decoded until a layer is accessed
+        packet = pcap_packet.PCAPPacket(full_eii_packet_data, '13:00')
+        self.assertEqual(0, len(packet.parsed_layers))
+
+        # Only the layers up to the requested one are decoded
+        self.assertEqual('10.0.2.15', packet['ip'].source_ip)
+        self.assertEqual(['ethernet', 'ip'],
+                         sorted(packet.parsed_layers.keys()))
+
+        self.assertEqual(22, packet.layer_data['tcp'].source_port)
+        self.assertTrue('tcp' in packet)
+        self.assertFalse('udp' in packet)
+        self.assertEqual(['ethernet', 'ip', 'tcp'], sorted(packet))
+
+        # Explicit lazy parse with a set stack
+        packet = pcap_packet.PCAPPacket(full_eii_packet_data, '13:00')
+        pmap = packet.parse([pcap_packet.PCAPEthernet], lazy=True)
+        self.assertEqual(0, len(packet.parsed_layers))
+        self.assertEqual(
+            pcap_packet.PCAPEthernet, type(pmap['ethernet']))
+        self.assertEqual(['ethernet'], list(packet.parsed_layers.keys()))
+        self.assertEqual(53748, pmap['tcp'].dest_port)
+
+    def test_lazy_packet_parsing_bad_length(self):
+        full_eii_packet_data = \
+            [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+             0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+             0x00, 0x5c, 0x93, 0x06]
+
+        # A fatal parse error means the layer isn't there
+        packet = pcap_packet.PCAPPacket(full_eii_packet_data, '13:00')
+        self.assertFalse('tcp' in packet)
+        self.assertEqual(
+            1, len(packet.extra_data['parse_errors.ip']))
+
+        packet = pcap_packet.PCAPPacket(full_eii_packet_data, '13:00')
+        self.assertEqual(
+            '08:00:27:c6:25:01', packet['ethernet'].source_mac)
+        self.assertRaises(
+            pcap_packet.PacketParsingException, packet.__getitem__, 'tcp')
+
+        emap = packet.extra_data
+        self.assertEqual(
+            1, len(emap['parse_errors.ip']))
+        self.assertFalse('tcp' in packet)
+        self.assertTrue('ethernet' in packet)
+
 
 run_unit_test(PCAPPacketTest)
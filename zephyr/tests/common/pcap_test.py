@@ -13,9 +13,36 @@
 # limitations under the License.
 
 import unittest
+from zephyr.common.exceptions import *
 from zephyr.common import pcap
+from zephyr.common import pcap_packet
 from zephyr.common.utils import run_unit_test
 
+# 10.0.2.15:22 -> 10.0.2.2:53748 (TCP)
+# 08:00:27:c6:25:01 -> 52:54:00:12:35:02
+ETHERNET_TCP_PACKET = bytearray(
+    [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+     0x00, 0x28, 0x93, 0x06, 0x40, 0x00, 0x40, 0x06,
+     0x8f, 0x75, 0x0a, 0x00, 0x02, 0x0f, 0x0a, 0x00,
+     0x02, 0x02, 0x00, 0x16, 0xd1, 0xf4, 0x52, 0x1a,
+     0x58, 0x7c, 0x58, 0x25, 0x2e, 0x9b, 0x50, 0x18,
+     0x9f, 0xb0, 0x18, 0x5f, 0x00, 0x00])
+
+# Broadcast ARP request: who-has 10.0.2.2 tell 10.0.2.15
+ETHERNET_ARP_PACKET = bytearray(
+    [0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x08, 0x06, 0x00, 0x01,
+     0x08, 0x00, 0x06, 0x04, 0x00, 0x01, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x0a, 0x00, 0x02, 0x0f,
+     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x0a, 0x00,
+     0x02, 0x02])
+
+SLL_TCP_PACKET = bytearray(
+    [0x00, 0x04, 0x00, 0x01, 0x00, 0x06, 0x08, 0x00,
+     0x27, 0xc6, 0x25, 0x01, 0x00, 0x00, 0x08, 0x00]) + \
+    ETHERNET_TCP_PACKET[14:]
+
 
 class PCAPTest(unittest.TestCase):
     def test_host_rules(self):
@@ -205,4 +232,116 @@ class PCAPTest(unittest.TestCase):
 
         self.assertEqual(expected_str, complex_rule.to_str())
 
+    def test_compile_host_rules(self):
+        tcp = bytes(ETHERNET_TCP_PACKET)
+        arp = bytes(ETHERNET_ARP_PACKET)
+
+        host = pcap.Host('10.0.2.2').compile_predicate()
+        self.assertTrue(host(tcp))
+        self.assertTrue(host(arp))
+        self.assertFalse(pcap.Host('10.0.2.3').compile_predicate()(tcp))
+
+        self.assertFalse(
+            pcap.Host('10.0.2.2', source=True).compile_predicate()(tcp))
+        self.assertTrue(
+            pcap.Host('10.0.2.2', dest=True).compile_predicate()(tcp))
+        self.assertFalse(
+            pcap.Host('10.0.2.2', source=True,
+                      dest=True).compile_predicate()(tcp))
+        self.assertFalse(
+            pcap.Host('10.0.2.2', proto='ip').compile_predicate()(arp))
+        self.assertTrue(
+            pcap.Host('10.0.2.15', proto='arp',
+                      source=True).compile_predicate()(arp))
+
+        self.assertTrue(
+            pcap.Host('08:00:27:c6:25:01', proto='ether',
+                      source=True).compile_predicate()(tcp))
+        self.assertFalse(
+            pcap.Host('08:00:27:c6:25:01', proto='ether',
+                      dest=True).compile_predicate()(tcp))
+
+        self.assertTrue(pcap.Net('10.0.2').compile_predicate()(tcp))
+        self.assertTrue(pcap.Net('10.0.2.0/24', source=True)
+                        .compile_predicate()(tcp))
+        self.assertFalse(pcap.Net('10.0.3.0', '255.255.255.0')
+                         .compile_predicate()(tcp))
+
+    def test_compile_port_and_proto_rules(self):
+        tcp = bytes(ETHERNET_TCP_PACKET)
+        arp = bytes(ETHERNET_ARP_PACKET)
+
+        self.assertTrue(pcap.Port(22).compile_predicate()(tcp))
+        self.assertTrue(pcap.Port(53748, dest=True).compile_predicate()(tcp))
+        self.assertFalse(pcap.Port(22, dest=True).compile_predicate()(tcp))
+        self.assertFalse(pcap.Port(22, proto='udp').compile_predicate()(tcp))
+        self.assertFalse(pcap.Port(22).compile_predicate()(arp))
+        self.assertTrue(pcap.PortRange(50000, 60000).compile_predicate()(tcp))
+        self.assertFalse(
+            pcap.PortRange(50000, 60000, source=True).compile_predicate()(tcp))
+        self.assertRaises(ArgMismatchException,
+                          pcap.Port(22, proto='ether').compile_predicate)
+
+        self.assertTrue(pcap.TCPProto().compile_predicate()(tcp))
+        self.assertFalse(pcap.UDPProto().compile_predicate()(tcp))
+        self.assertTrue(pcap.IPProto('tcp').compile_predicate()(tcp))
+        self.assertFalse(pcap.IPProto('icmp').compile_predicate()(tcp))
+        self.assertTrue(pcap.EtherProto('arp').compile_predicate()(arp))
+        self.assertFalse(pcap.EtherProto('ip').compile_predicate()(arp))
+
+        self.assertTrue(pcap.Broadcast().compile_predicate()(arp))
+        self.assertTrue(pcap.Multicast().compile_predicate()(arp))
+        self.assertFalse(pcap.Broadcast().compile_predicate()(tcp))
+        self.assertFalse(pcap.Broadcast('ip').compile_predicate()(tcp))
+
+    def test_compile_boolean_and_comparison_rules(self):
+        tcp = bytes(ETHERNET_TCP_PACKET)
+        arp = bytes(ETHERNET_ARP_PACKET)
+
+        rule = pcap.And([
+            pcap.Not(pcap.Multicast()),
+            pcap.Or([pcap.Port(80), pcap.Port(22)]),
+            pcap.GreaterThan('len', '50'),
+            pcap.Equal('ip[0] & 0xf', '5'),
+            pcap.Equal('tcp[13]', '0x18'),
+            pcap.LessThanEqual('ip[2:2]', 40)
+        ])
+        predicate = rule.compile_predicate()
+        self.assertTrue(predicate(tcp))
+        self.assertTrue(predicate(ETHERNET_TCP_PACKET))
+        self.assertTrue(predicate(memoryview(ETHERNET_TCP_PACKET)))
+        self.assertFalse(predicate(arp))
+        self.assertFalse(
+            pcap.Equal('tcp[13]', '0x18').compile_predicate()(arp))
+
+        self.assertTrue(pcap.And([]).compile_predicate()(arp))
+        self.assertTrue(pcap.Or([]).compile_predicate()(arp))
+        self.assertTrue(pcap.Null().compile_predicate()(arp))
+        self.assertRaises(ArgMismatchException,
+                          pcap.Not(pcap.Simple('foo')).compile_predicate)
+        self.assertRaises(ArgMismatchException,
+                          pcap.Equal('len + 1', '5').compile_predicate)
+
+    def test_compile_sll_and_short_frames(self):
+        sll = bytes(SLL_TCP_PACKET)
+        rule = pcap.And([pcap.Host('10.0.2.15', source=True),
+                         pcap.Port(22, proto='tcp')])
+        self.assertTrue(rule.compile_predicate(pcap_packet.PCAPSLL)(sll))
+        self.assertFalse(rule.compile_predicate()(sll))
+        self.assertTrue(
+            pcap.Host('08:00:27:c6:25:01', proto='ether')
+            .compile_predicate(pcap_packet.PCAPSLL)(sll))
+        self.assertFalse(
+            pcap.Multicast().compile_predicate(pcap_packet.PCAPSLL)(sll))
+
+        packet = pcap_packet.PCAPPacket(sll, '00:00:00.000000')
+        packet.link_layer = pcap_packet.PCAPSLL
+        self.assertTrue(rule.matches(packet))
+
+        # Frames too short for the fields being checked never match
+        self.assertFalse(rule.compile_predicate()(
+            bytes(ETHERNET_TCP_PACKET[:30])))
+        self.assertTrue(pcap.Not(pcap.Port(22)).compile_predicate()(
+            bytes(ETHERNET_TCP_PACKET[:30])) is False)
+
 run_unit_test(PCAPTest)
@@ -0,0 +1,84 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from zephyr.common import priv_broker
+from zephyr.common.priv_broker import PrivBroker
+from zephyr.common.priv_broker import PrivBrokerServer
+from zephyr.common.utils import run_unit_test
+
+
+class PrivBrokerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = PrivBrokerServer(os.path.join(self.dir, 'sock'),
+                                       [os.getuid()])
+        self.server.start()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        shutil.rmtree(self.dir)
+
+    def test_is_allowed(self):
+        self.assertTrue(priv_broker.is_allowed('ip link show'))
+        self.assertTrue(priv_broker.is_allowed(
+            'timeout 10 ip netns exec ns1 ip addr | grep inet'))
+        self.assertTrue(priv_broker.is_allowed('rm -f /tmp/x 2>/dev/null'))
+        self.assertTrue(priv_broker.is_allowed([['ip', 'r'], ['wc', '-l']],
+                                               shell=False))
+        self.assertFalse(priv_broker.is_allowed('bash -c "ip link"'))
+        self.assertFalse(priv_broker.is_allowed('echo $(id)'))
+        self.assertFalse(priv_broker.is_allowed('ip r; python -c 1'))
+        self.assertFalse(priv_broker.is_allowed('echo foo > /tmp/x'))
+        self.assertFalse(priv_broker.is_allowed('echo foo | tee /tmp/x'))
+        self.assertFalse(priv_broker.is_allowed('find / -exec id \\;'))
+        self.assertFalse(priv_broker.is_allowed('ip -force -batch /tmp/x'))
+        self.assertFalse(priv_broker.is_allowed('ip -b /tmp/x'))
+        self.assertTrue(priv_broker.is_allowed('ip -br link'))
+        self.assertFalse(priv_broker.is_allowed(''))
+
+    def test_run(self):
+        broker = PrivBroker(self.server.socket_path)
+        self.assertEqual((0, 'foo\n', ''), broker.run('echo foo'))
+        self.assertEqual((0, '2\n', ''),
+                         broker.run([['echo', 'a b'], ['wc', '-w']],
+                                    shell=False))
+        self.assertEqual(1, broker.run('false')[0])
+        self.assertEqual((0, os.getcwd() + '\n', ''), broker.run(
+            'echo $PWD', env={'PWD': os.getcwd(), 'LD_PRELOAD': 'x'}))
+        self.assertIsNone(broker.run('sh -c true'))
+
+        # A dropped connection is replaced
+        broker.local.sock.close()
+        self.assertEqual((0, 'bar\n', ''), broker.run('echo bar'))
+
+    def test_refused(self):
+        self.server.allowed_commands = {'true'}
+        broker = PrivBroker(self.server.socket_path)
+        self.assertEqual((0, '', ''), broker.run('true'))
+        self.assertIsNone(broker.run('echo foo'))
+
+        self.server.allowed_uids = set()
+        broker.disconnect()
+        self.assertIsNone(broker.run('true'))
+
+run_unit_test(PrivBrokerTest)
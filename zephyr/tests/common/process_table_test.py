@@ -0,0 +1,82 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from zephyr.common.exceptions import *
+from zephyr.common import process_table
+from zephyr.common.utils import run_unit_test
+
+
+class ProcessTableTest(unittest.TestCase):
+    def setUp(self):
+        self.proc_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_dir)
+
+    def make_proc(self, pid, stat, cmdline):
+        os.mkdir(os.path.join(self.proc_dir, pid))
+        with open(os.path.join(self.proc_dir, pid, 'stat'), 'w') as f:
+            f.write(stat)
+        with open(os.path.join(self.proc_dir, pid, 'cmdline'), 'w') as f:
+            f.write(cmdline)
+
+    def test_read_process_table(self):
+        self.make_proc('10', '10 (java) S 1 10 10 0 -1',
+                       'java\0-cp\0a b\0')
+        self.make_proc('9', '9 (kworker/0:1) S 2 0 0 0 -1', '')
+        self.make_proc('200', '200 (odd) name) Z 10 0 0 0 -1', 'odd')
+        os.mkdir(os.path.join(self.proc_dir, 'self'))
+
+        procs = process_table.read_process_table(self.proc_dir)
+        self.assertEqual(['9', '10', '200'], [p.pid for p in procs])
+        self.assertEqual(['2', '1', '10'], [p.ppid for p in procs])
+        self.assertEqual('[kworker/0:1]', procs[0].cmdline)
+        self.assertEqual('java -cp a b', procs[1].cmdline)
+        self.assertTrue(procs[2].is_zombie())
+        self.assertFalse(procs[1].is_zombie())
+        self.assertTrue(procs[1].ps_line().endswith(' 10 1 java -cp a b'))
+
+        self.assertTrue(process_table.is_pid_running('10', self.proc_dir))
+        self.assertFalse(process_table.is_pid_running('200', self.proc_dir))
+        self.assertFalse(process_table.is_pid_running('11', self.proc_dir))
+        self.assertFalse(process_table.is_pid_running('', self.proc_dir))
+
+    def test_snapshot(self):
+        first = process_table.ProcessTable.get_processes(max_age=60)
+        self.assertIs(first, process_table.ProcessTable.get_processes(
+            max_age=60))
+        self.assertIsNot(first, process_table.ProcessTable.get_processes())
+        self.assertIn(str(os.getpid()), [p.pid for p in first])
+
+    def test_wait_for_pid_exit(self):
+        process = subprocess.Popen(['sleep', '0.5'])
+        # Reap the child in the background so it does not stay a zombie
+        threading.Thread(target=process.wait).start()
+
+        self.assertRaises(SubprocessTimeoutException,
+                          process_table.wait_for_pid_exit, process.pid, 0.1)
+        start = time.time()
+        process_table.wait_for_pid_exit(process.pid, 5)
+        self.assertLess(time.time() - start, 2)
+        self.assertFalse(process_table.is_pid_running(process.pid))
+        process_table.wait_for_pid_exit(process.pid, 0)
+
+run_unit_test(ProcessTableTest)
@@ -0,0 +1,110 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import time
+import unittest
+from zephyr.common.exceptions import *
+from zephyr.common.pcap_packet import PCAPPacket
+from zephyr.common import raw_sender
+from zephyr.common.utils import run_unit_test
+
+INTERFACE_MAC = b'\x02\x00\x00\x00\x00\x01'
+
+
+def parse_frame(frame):
+    return PCAPPacket(bytes(frame), str(time.time()))
+
+
+class RawSenderTest(unittest.TestCase):
+
+    def test_checksum(self):
+        header = raw_sender.build_ip_header('10.0.2.15', '10.0.2.2', 6, 20)
+        self.assertEqual(0, raw_sender.checksum(header))
+
+    def test_byte_data(self):
+        self.assertEqual(b'\xde\xad\xbe\xef',
+                         raw_sender.build_frame(byte_data='de:ad:be:ef'))
+        self.assertEqual(b'\xff' * 6 + INTERFACE_MAC + b'\xde\xad',
+                         raw_sender.build_frame(byte_data='de ad',
+                                                dest_mac='bc',
+                                                source_mac='own',
+                                                interface_mac=INTERFACE_MAC))
+        self.assertRaises(ArgMismatchException,
+                          raw_sender.build_frame, byte_data='dea')
+        self.assertRaises(ArgMismatchException, raw_sender.build_frame)
+
+    def test_arp(self):
+        frame = raw_sender.build_frame(
+            packet_type='arp', dest_ip='1.1.1.2', interface_ip='1.1.1.1',
+            interface_mac=INTERFACE_MAC,
+            packet_options={'command': 'request'})
+        arp = parse_frame(frame)['arp']
+
+        self.assertEqual(1, arp.operation)
+        self.assertEqual('1.1.1.1', arp.sender_ip_addr)
+        self.assertEqual('1.1.1.2', arp.target_ip_addr)
+        self.assertRaises(ArgMismatchException, raw_sender.build_frame,
+                          packet_type='arp', packet_options={})
+
+    def test_icmp(self):
+        frame = raw_sender.build_frame(
+            packet_type='icmp', source_ip='1.1.1.1', dest_ip='2.2.2.2',
+            packet_options={'command': 'ping', 'id': '3'})
+        packet = parse_frame(frame)
+
+        self.assertEqual('2.2.2.2', packet['ip'].dest_ip)
+        self.assertEqual(1, packet['ip'].protocol)
+        self.assertEqual(0, raw_sender.checksum(frame[14:34]))
+        self.assertEqual(8, packet['icmp'].type)
+        self.assertEqual(0, raw_sender.checksum(frame[34:]))
+
+    def test_tcp_udp(self):
+        packet = parse_frame(raw_sender.build_frame(
+            packet_type='tcp', source_ip='1.1.1.1', dest_ip='2.2.2.2',
+            source_port=22, dest_port=80,
+            packet_options={'flags': 'syn|ack'}))
+        self.assertEqual(22, packet['tcp'].source_port)
+        self.assertEqual(80, packet['tcp'].dest_port)
+        self.assertEqual(0x12, packet['tcp'].flags)
+
+        frame = raw_sender.build_frame(
+            packet_type='udp', source_ip='1.1.1.1', dest_ip='2.2.2.2',
+            source_port=1234, dest_port=53, payload='test')
+        packet = parse_frame(frame)
+        self.assertEqual(53, packet['udp'].dest_port)
+        self.assertTrue(frame.endswith(b'test'))
+        self.assertEqual(0, raw_sender.checksum(
+            b'\x01\x01\x01\x01\x02\x02\x02\x02\x00\x11\x00\x0c' +
+            frame[34:]))
+
+        self.assertRaises(ArgMismatchException, raw_sender.build_frame,
+                          packet_type='dns')
+
+    def test_close_sockets(self):
+        sockets = raw_sender.RawSocketSender.sockets
+        sock1 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock2 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sockets[('ns1', 'eth0')] = (sock1, INTERFACE_MAC, None)
+            sockets[('ns2', 'eth0')] = (sock2, INTERFACE_MAC, None)
+            raw_sender.RawSocketSender.close_sockets('ns1')
+            self.assertNotIn(('ns1', 'eth0'), sockets)
+            self.assertRaises(socket.error, sock1.getsockname)
+            self.assertIs(sock2, sockets[('ns2', 'eth0')][0])
+        finally:
+            sockets.pop(('ns2', 'eth0'), None)
+            sock2.close()
+
+run_unit_test(RawSenderTest)
@@ -282,6 +282,25 @@ class TCPDumpTest(unittest.TestCase):
         finally:
             tcpd.stop_capture()
 
+    def test_ready_marker(self):
+        marker = make_ready_marker()
+        frame = (b'\x02\x00\x00\x00\x00\x00' * 2 + b'\x88\xb5' +
+                 marker + b'\x00' * 10)
+        self.assertTrue(is_ready_marker(PCAPPacket(frame, ''), marker))
+        self.assertFalse(
+            is_ready_marker(PCAPPacket(frame, ''), make_ready_marker()))
+        # Any capture's marker is recognized, to keep it out of the
+        # packets returned
+        self.assertTrue(is_ready_marker(PCAPPacket(frame, '')))
+        self.assertFalse(is_ready_marker(PCAPPacket(
+            frame[:12] + b'\x08\x00' + frame[14:], '')))
+
+        sll_packet = PCAPPacket(b'\x00\x04' + b'\x00' * 12 + b'\x88\xb5' +
+                                marker, '')
+        sll_packet.link_layer = PCAPSLL
+        self.assertTrue(is_ready_marker(sll_packet, marker))
+        self.assertFalse(is_ready_marker(PCAPPacket(frame[:20], ''), marker))
+
     def tearDown(self):
         time.sleep(2)
         LinuxCLI().rm('tcp.callback.out')
@@ -13,6 +13,9 @@
 # limitations under the License.
 
 import unittest
+from zephyr.common.cli import CREATENSCMD
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.cli import REMOVENSCMD
 from zephyr.common.tcp_sender import *
 from zephyr.common.utils import run_unit_test
 
@@ -104,6 +107,31 @@ class TCPSenderTest(unittest.TestCase):
         self.assertTrue('-b' not in out)
         self.assertTrue('tcp' in out)
 
+    def test_send_packet_raw_errors(self):
+        # A frame which can't be sent once the socket is open (here, on a
+        # new namespace's loopback, which is still down) is reported,
+        # rather than sent again with mz
+        CREATENSCMD('test-tcp-send')
+        try:
+            self.assertRaises(
+                SubprocessFailedException, TCPSender.send_packet,
+                NetNSCLI('test-tcp-send'), interface='lo',
+                packet_type='udp', source_ip='127.0.0.1',
+                dest_ip='127.0.0.1', source_port=1, dest_port=2, count=2)
+        finally:
+            REMOVENSCMD('test-tcp-send')
+        # Sending forever is left to mz
+        self.assertRaises(ArgMismatchException, TCPSender.send_raw_packet,
+                          LinuxCLI(), interface='lo', packet_type='udp',
+                          source_ip='127.0.0.1', dest_ip='127.0.0.1',
+                          source_port=1, dest_port=2, count=0)
+        out = TCPSender.send_packet(
+            LinuxCLI(), interface='lo', packet_type='udp',
+            source_ip='127.0.0.1', dest_ip='127.0.0.1', source_port=1,
+            dest_port=2, count=0, timeout=1).command
+        self.assertTrue('mz lo' in out)
+        self.assertTrue('-c 0' in out)
+
     def test_send_packet_and_receive_packet(self):
         cli = LinuxCLI(debug=True)
         out = TCPSender.send_packet(
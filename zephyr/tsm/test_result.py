@@ -15,6 +15,7 @@
 import json
 import unittest
 
+from zephyr.common.cmd_trace import CommandTracer
 from zephyr.tsm.test_case import TestCase
 
 
@@ -32,6 +33,14 @@ class TestResult(unittest.TestResult):
         self.stop_time = None
         self.run_time = None
 
+    def startTest(self, test):
+        super(TestResult, self).startTest(test)
+        CommandTracer.set_test(self.suite_name, test.id())
+
+    def stopTest(self, test):
+        CommandTracer.set_test(self.suite_name)
+        super(TestResult, self).stopTest(test)
+
     def addSuccess(self, test):
         super(TestResult, self).addSuccess(test)
         self.successes.append(test)
@@ -15,12 +15,14 @@
 import datetime
 import importlib
 import inspect
+import json
 import logging
 import pkgutil
 import sys
 import traceback
 import unittest
 from zephyr.common.cli import LinuxCLI
+from zephyr.common.cmd_trace import CommandTracer
 from zephyr.common.exceptions import *
 from zephyr.common.log_manager import LogManager
 from zephyr.common import zephyr_constants
@@ -353,6 +355,7 @@ class TestSystemManager(object):
         :return: TestResult
         """
         result = TestResult(suite_name)
+        CommandTracer.set_test(suite_name)
 
         self.LOG.debug('Running suite [' + suite_name + '] with tests: ' +
                        str([t.get_name() + ' (' +
@@ -429,7 +432,15 @@ class TestSystemManager(object):
         self.result_map[suite_name] = result
         return result
 
-    def create_results(self, results_dir='./results'):
+    def create_results(self, results_dir='./results', log_compression=None,
+                       log_compression_level=None):
+        """
+        Write the results of each suite, and collate the logs next to them
+        (optionally compressed, see LogManager.collate_logs).
+        :type results_dir: str
+        :type log_compression: str
+        :type log_compression_level: int
+        """
         self.LOG.debug("Creating test_results")
         cli = LinuxCLI(priv=False)
         cli.rm(results_dir)
@@ -441,4 +452,11 @@ class TestSystemManager(object):
                               data=res.to_junit_xml())
             cli.write_to_file(wfile=results_out_dir + '/results.json',
                               data=res.to_json())
-            self.log_manager.collate_logs(results_out_dir + '/full-logs')
+            trace = CommandTracer.get_suite_trace(suite)
+            if trace is not None:
+                cli.write_to_file(
+                    wfile=results_out_dir + '/command_trace.json',
+                    data=json.dumps(trace, indent=2, sort_keys=True))
+            self.log_manager.collate_logs(results_out_dir + '/full-logs',
+                                          compression=log_compression,
+                                          level=log_compression_level)
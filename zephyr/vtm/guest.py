@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import time
+from zephyr.common import async_cli
 from zephyr.common import exceptions
 from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
 
@@ -107,7 +108,9 @@ class Guest(object):
     def start_capture(self, on_iface='eth0',
                       count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None,
-                      save_dump_file=False, save_dump_filename=None):
+                      save_dump_file=False, save_dump_filename=None,
+                      subscriber='default', buffer_packets=0, buffer_bytes=0,
+                      overflow_policy='drop_oldest', spill_filename=None):
         """
         :param on_iface: str: Interface to capture on ('any' is
         also acceptable)
@@ -121,16 +124,29 @@ class Guest(object):
         capture file
         :param save_dump_filename: str: Filename to save temporary packet
         capture file
+        :param subscriber: str: Name of the subscriber to start on the
+        interface's shared capture
+        :param buffer_packets: int: Packets to buffer (0 for no limit)
+        :param buffer_bytes: int: Bytes to buffer (0 for no limit)
+        :param overflow_policy: str: What to do with packets over the limit
+        ('drop_oldest', 'drop_newest', or 'spill')
+        :param spill_filename: str: Filename to spill packets to
         """
         self.vm_underlay.start_capture(interface=on_iface,
                                        count=count, ptype=ptype,
                                        pfilter=pfilter, callback=callback,
                                        callback_args=callback_args,
                                        save_dump_file=save_dump_file,
-                                       save_dump_filename=save_dump_filename)
+                                       save_dump_filename=save_dump_filename,
+                                       subscriber=subscriber,
+                                       buffer_packets=buffer_packets,
+                                       buffer_bytes=buffer_bytes,
+                                       overflow_policy=overflow_policy,
+                                       spill_filename=spill_filename)
 
     def capture_packets(self, on_iface='eth0', count=1,
-                        timeout=PACKET_CAPTURE_TIMEOUT):
+                        timeout=PACKET_CAPTURE_TIMEOUT,
+                        subscriber='default'):
         """
         Capture (count) number of packets that have come into the given
         interface on an running capture (raises ObjectNotFoundException if
@@ -140,19 +156,22 @@ class Guest(object):
         :param on_iface: str
         :param count: int
         :param timeout: int
+        :param subscriber: str
         :return: list[PCAPPacket]
         """
         return self.vm_underlay.capture_packets(
             interface=on_iface, count=count,
-            timeout=timeout)
+            timeout=timeout, subscriber=subscriber)
 
-    def stop_capture(self, on_iface='eth0'):
+    def stop_capture(self, on_iface='eth0', subscriber='default'):
         """
         Stop an already running capture, do nothing if capture is not running
         on interface.
         :param on_iface: str
+        :param subscriber: str
         """
-        self.vm_underlay.stop_capture(interface=on_iface)
+        self.vm_underlay.stop_capture(interface=on_iface,
+                                      subscriber=subscriber)
 
     def verify_connection_to_host(self, far_host,
                                   target_ip_addr=None,
@@ -207,6 +226,20 @@ class Guest(object):
         return self.vm_underlay.ping(target_ip=target_ip, iface=on_iface,
                                      count=count, timeout=timeout)
 
+    def ping_async(self, target_ip, on_iface=None, count=3, timeout=None):
+        """
+        Start a ping as with ping, and return a future for its result, so
+        many pings can be run at once (see async_cli.gather).
+        :param target_ip: str
+        :param on_iface: str
+        :param count: int
+        :param timeout: int
+        :return: concurrent.futures.Future
+        """
+        return self.vm_underlay.ping_async(target_ip=target_ip,
+                                           iface=on_iface, count=count,
+                                           timeout=timeout)
+
     def start_echo_server(self, ip_addr='localhost', port=DEFAULT_ECHO_PORT,
                           echo_data="pong", protocol='tcp'):
         """
@@ -251,6 +284,24 @@ class Guest(object):
             echo_request=echo_request, protocol=protocol,
             timeout=timeout)
 
+    def send_echo_request_async(self, dest_ip='localhost',
+                                dest_port=DEFAULT_ECHO_PORT,
+                                echo_request='ping', protocol='tcp',
+                                timeout=10):
+        """
+        Start an echo request as with send_echo_request, and return a
+        future for the response.
+        :param dest_ip: str
+        :param dest_port: int
+        :param echo_request: str
+        :param protocol: str
+        :return: concurrent.futures.Future
+        """
+        return self.vm_underlay.send_echo_request_async(
+            dest_ip=dest_ip, dest_port=dest_port,
+            echo_request=echo_request, protocol=protocol,
+            timeout=timeout)
+
     def execute(self, cmd_line, timeout=None, blocking=True):
         """
         Execute the given cmd_line command on this guest, using an optional
@@ -270,6 +321,17 @@ class Guest(object):
                 ', cmd error: ' + result.stderr)
         return result
 
+    def execute_async(self, cmd_line, timeout=None):
+        """
+        Start the given cmd_line command on this guest as with a blocking
+        execute, and return a future for its CommandStatus (which raises
+        SubprocessFailedException if the command fails).
+        :param cmd_line: str
+        :param timeout: int
+        :return: concurrent.futures.Future
+        """
+        return async_cli.submit(self.execute, cmd_line, timeout=timeout)
+
     def terminate(self):
         """
         Kill this VM.
@@ -13,18 +13,23 @@
 # limitations under the License.
 
 import logging
+import time
 import uuid
 
+from zephyr.common.capture_session import CaptureSession
+from zephyr.common.capture_session import DEFAULT_SUBSCRIBER
 from zephyr.common import cli
 from zephyr.common import exceptions
 from zephyr.common.ip import IP
-from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.netlink import NetlinkException
+from zephyr.common.packet_buffer import OVERFLOW_DROP_OLDEST
 from zephyr.common.tcp_sender import TCPSender
 from zephyr.common import utils
 from zephyr.common import zephyr_constants
 from zephyr.vtm.underlay import underlay_host
 
 ECHO_SERVER_TIMEOUT = 3
+IP_POLL_INTERVAL = 0.1
 
 
 class DirectUnderlayHost(underlay_host.UnderlayHost):
@@ -35,7 +40,7 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         self.cli = cli.LinuxCLI()
         self.overlay = overlay
         self.echo_server_procs = {}
-        self.packet_captures = []
+        self.packet_captures = {}
         self.vm_type = vm_type
         self.vms = {}
         self.hypervisor = hypervisor
@@ -115,15 +120,13 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
             (" and VLANS " +
              str(vm_vlans) if vm_vlans else ''))
 
-        self.execute(
-            'ip link add dev ' + tap_iface_name +
-            ' type veth peer name ' + peer_name)
-
-        self.execute(
-            'ip link set dev ' + peer_name + ' netns ' +
-            self.name + ' name ' + vm_iface_name)
-
-        self.execute('ip link set dev ' + tap_iface_name + ' up')
+        self.cli.cmd_batch(
+            ['ip link add dev ' + tap_iface_name +
+             ' type veth peer name ' + peer_name,
+             'ip link set dev ' + peer_name + ' netns ' +
+             self.name + ' name ' + vm_iface_name,
+             'ip link set dev ' + tap_iface_name + ' up'],
+            stop_on_error=False)
         vm_host.execute('ip link set dev ' + vm_iface_name + ' up')
 
         self.cli.cmd(
@@ -164,32 +167,98 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
             if dev is None:
                 raise exceptions.ArgMismatchException(
                     'Must specify either next-hop GW or device to add a route')
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                netlink.add_route(route_ip, gateway=gw_ip, ifname=dev)
+            except NetlinkException as e:
+                self.LOG.debug('Adding route failed: ' + str(e))
+        elif gw_ip is None:
             self.execute('ip route add ' + str(route_ip) + ' dev ' + str(dev))
         else:
             self.execute('ip route add ' + str(route_ip) + ' via ' + gw_ip.ip +
                          (' dev ' + str(dev) if dev else ''))
 
     def del_route(self, route_ip):
-        self.execute('ip route del ' + str(route_ip.ip))
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                netlink.del_route(route_ip.ip)
+            except NetlinkException as e:
+                self.LOG.debug('Deleting route failed: ' + str(e))
+        else:
+            self.execute('ip route del ' + str(route_ip.ip))
 
     def interface_down(self, iface):
-        self.cli.cmd('ip link set dev ' + iface + ' down')
+        self.set_interface_state(iface, up=False)
 
     def interface_up(self, iface):
-        self.cli.cmd('ip link set dev ' + iface + ' up')
+        self.set_interface_state(iface, up=True)
+
+    def set_interface_state(self, iface, up=True):
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                netlink.set_link_up(iface, up=up)
+            except NetlinkException as e:
+                self.LOG.debug('Setting link state failed: ' + str(e))
+        else:
+            self.cli.cmd('ip link set dev ' + iface +
+                         (' up' if up else ' down'))
 
     def add_ip(self, iface_name, ip_addr):
-        self.cli.cmd('ip addr add ' + str(ip_addr) + ' dev ' + iface_name)
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                netlink.add_address(iface_name, ip_addr)
+            except NetlinkException as e:
+                self.LOG.debug('Adding address failed: ' + str(e))
+        else:
+            self.cli.cmd('ip addr add ' + str(ip_addr) + ' dev ' + iface_name)
         self.main_ip = ip_addr
 
     # noinspection PyUnresolvedReferences
     def get_ip(self, iface_name):
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                addresses = netlink.get_addresses(iface_name)
+            except NetlinkException:
+                return ''
+            return addresses[0].ip if len(addresses) > 0 else ''
         return (
             self.cli.cmd(
                 'ip addr show dev ' + iface_name +
                 " | grep -w inet | awk '{print $2}' | sed 's/\/.*//g'")
             .stdout.strip().split('\n')[0])
 
+    def wait_for_ip(self, iface_name, timeout=10):
+        """
+        Wait for an IP address to be assigned to the interface (by DHCP,
+        for example).
+        :type iface_name: str
+        :type timeout: float
+        :return: str The IP address
+        """
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                return netlink.wait_for_address(iface_name, timeout).ip
+            except NetlinkException as e:
+                raise exceptions.HostNotFoundException(
+                    'Could not wait for an IP on ' + iface_name + ': ' +
+                    str(e))
+
+        deadline = time.time() + timeout
+        ip_addr = self.get_ip(iface_name)
+        while not ip_addr:
+            if time.time() > deadline:
+                raise exceptions.SubprocessTimeoutException(
+                    'No IP address on ' + iface_name + ' within timeout')
+            time.sleep(IP_POLL_INTERVAL)
+            ip_addr = self.get_ip(iface_name)
+        return ip_addr
+
     def request_ip(self, iface_name):
         return None
 
@@ -250,14 +319,15 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         tcps = TCPSender()
         opt_map = {'command': command}
         if source_mac is not None:
-            opt_map = {'smac': source_mac}
+            opt_map['smac'] = source_mac
         if dest_mac is not None:
-            opt_map = {'tmac': dest_mac}
+            opt_map['tmac'] = dest_mac
         if source_ip is not None:
-            opt_map = {'sip': source_ip}
+            opt_map['sip'] = source_ip
         if dest_ip is not None:
-            opt_map = {'tip': dest_ip}
-        opt_map += packet_options
+            opt_map['tip'] = dest_ip
+        if packet_options is not None:
+            opt_map.update(packet_options)
         return tcps.send_packet(self.cli, interface=iface, dest_ip=dest_ip,
                                 packet_type='arp',
                                 packet_options=opt_map, count=count).stdout
@@ -309,53 +379,80 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, subscriber=DEFAULT_SUBSCRIBER,
+                      buffer_packets=0, buffer_bytes=0,
+                      overflow_policy=OVERFLOW_DROP_OLDEST,
+                      spill_filename=None):
         """
         Starts the capture of packets on the host's interface with
         pcap_filter tools (e.g. tcpdump). This will start a process
         in the background listening for packets on the given interface.
         The actual packets can be retrieved via the 'capture_packets'
         method.  Capturing can be halted with the 'stop_capture'
-        method.  Only one capture can be running per interface at any
-        one time.  Use the PcapRule objects to assemble a filter via
-        standard pcap_filter rules. A callback function is available
-        to be called when each packet is parsed.  It must take at least
-        a single PCAPPacket parameter, and any number of optional
-        arguments (passed through the callback_args parameter).  The
-        packet capture will be dumped to a temporary file, which can
-        be saved off to a permanent location, if desired.
+        method.  One capture session is run per interface, and shared
+        by any number of named subscribers, each with its own filter and
+        packets, which can be started and stopped independently
+        (starting a subscriber which already exists replaces it).  The
+        session's tcpdump filters for any of the subscribers' filters,
+        and is stopped once every subscriber has stopped (including
+        subscribers which stop by themselves after 'count' packets).
+        Use the PcapRule objects to assemble a filter via standard
+        pcap_filter rules.  A callback function is available to be
+        called when each packet is parsed.
+        It must take at least a single PCAPPacket parameter, and any
+        number of optional arguments (passed through the callback_args
+        parameter).  The packets received by the subscriber can also
+        be saved off to a permanent location in pcap format, if desired.
+        The subscriber's packets are buffered in memory until retrieved,
+        which can be bounded by a packet and/or byte limit, with a policy
+        for packets over the limit ('drop_oldest', 'drop_newest', or
+        'spill' the oldest to a pcap file).
         :param interface: str: Interface to capture on ('any' is
         also acceptable)
         :param count: int: Number of packets to capture, or '0' to
         capture until explicitly stopped (default)
-        :param ptype: str: Type of packet to filter
+        :param ptype: str: Type of packet to filter (only used when
+        the interface's capture is started)
         :param pfilter: PcapRule: Ruleset for packet filtering
         :param callback: callable: Optional callback function
         :param callback_args: list[T]: Arguments to optional callback
         function
-        :param save_dump_file: bool: Optionally save the temporary
-        packet capture file
-        :param save_dump_filename: str: Filename to save temporary
+        :param save_dump_file: bool: Optionally save the packet
+        capture file
+        :param save_dump_filename: str: Filename to save the pcap
         packet capture file
+        :param subscriber: str: Name of the subscriber to start
+        :param buffer_packets: int: Packets to buffer (0 for no limit)
+        :param buffer_bytes: int: Bytes to buffer (0 for no limit)
+        :param overflow_policy: str: What to do with packets over the limit
+        :param spill_filename: str: Filename to spill packets to
         :rtype:
         """
-        tcpd = (self.packet_captures[interface]
-                if interface in self.packet_captures
-                else TCPDump())
-        """ :type: TCPDump """
-
-        self.LOG.debug('Starting tcpdump on host: ' + self.name)
-
-        tcpd.start_capture(cli=self.cli, interface=interface, count=count,
-                           packet_type=ptype, pcap_filter=pfilter,
-                           callback=callback, callback_args=callback_args,
-                           save_dump_file=save_dump_file,
-                           save_dump_filename=save_dump_filename,
-                           blocking=False)
-
-        self.packet_captures[interface] = tcpd
-
-    def capture_packets(self, interface, count=1, timeout=None):
+        session = self.packet_captures.get(interface, None)
+        """ :type: CaptureSession """
+
+        if session is None or not session.is_running():
+            session = CaptureSession(cli=self.cli, interface=interface,
+                                     packet_type=ptype)
+            self.packet_captures[interface] = session
+
+        self.LOG.debug('Starting capture subscriber ' + subscriber +
+                       ' on host: ' + self.name)
+
+        # Subscribing to a running session starts any capture its filter
+        # needs, otherwise the captures are started once subscribed
+        session.subscribe(subscriber, pcap_filter=pfilter, count=count,
+                          callback=callback, callback_args=callback_args,
+                          save_dump_file=save_dump_file,
+                          save_dump_filename=save_dump_filename,
+                          buffer_packets=buffer_packets,
+                          buffer_bytes=buffer_bytes,
+                          overflow_policy=overflow_policy,
+                          spill_filename=spill_filename)
+        session.start()
+
+    def capture_packets(self, interface, count=1, timeout=None,
+                        subscriber=DEFAULT_SUBSCRIBER):
         """
         Wait for and return a list of [count] received packets on the given
         interface. The optional timeout can be specified to bound the time
@@ -366,33 +463,52 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         return what is buffered)
         :param timeout: int: Upper bound on length of time to wait before
         exception is raised
+        :param subscriber: str: Name of the subscriber to get packets for
         :rtype: list [PCAPPacket]
         """
         if interface not in self.packet_captures:
             raise exceptions.ObjectNotFoundException(
                 'No packet capture is running or was run on host/interface' +
                 self.name + '/' + interface)
-        tcpd = self.packet_captures[interface]
-        return tcpd.wait_for_packets(count, timeout)
+        session = self.packet_captures[interface]
+        return session.get_subscriber(subscriber).wait_for_packets(
+            count, timeout)
 
-    def stop_capture(self, interface):
+    def stop_capture(self, interface, subscriber=DEFAULT_SUBSCRIBER):
         """
-        Stop the capture of packets on the given interface.  Any
-        remaining packets can be accessed through the 'capture_packets'
-        method.
+        Stop the capture of packets for the given subscriber on the
+        given interface (the capture itself is stopped once no other
+        subscribers are left).  Any remaining packets can be accessed
+        through the 'capture_packets' method.
         :param interface: str: Interface to stop capture on
+        :param subscriber: str: Name of the subscriber to stop
         :rtype:
         """
         if interface in self.packet_captures:
-            tcpd = self.packet_captures[interface]
-            tcpd.stop_capture()
+            session = self.packet_captures[interface]
+            if subscriber in session.subscribers:
+                session.detach(subscriber)
+
+    def stop_all_captures(self):
+        """
+        Stop every capture on this host's interfaces.  Packets already
+        received can still be accessed through the 'capture_packets'
+        method.
+        :rtype:
+        """
+        for session in self.packet_captures.values():
+            session.stop()
 
     def flush_arp(self):
         """
         Flush the ARP table on this Host
         :rtype:
         """
-        self.execute('ip neighbour flush all')
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            netlink.flush_neighbours()
+        else:
+            self.execute('ip neighbour flush all')
 
     def execute(self, cmd_line, timeout=None, blocking=True):
         return self.cli.cmd(cmd_line, timeout=timeout, blocking=blocking)
@@ -402,4 +518,4 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         Kill this Host.
         :rtype:
         """
-        pass
+        self.stop_all_captures()
@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
 from zephyr.common import cli
 from zephyr.common import exceptions
 from zephyr.common import ip
@@ -74,15 +73,14 @@ class IPNetnsVM(direct_underlay_host.DirectUnderlayHost,
             '-pf /run/dhclient-' + file_name + '.pid '
             '-lf /var/lib/dhcp/dhclient-' + file_name + '.lease ' +
             iface)
-        deadline = time.time() + timeout
-        while not self.get_ip(iface):
-            if time.time() > deadline:
-                self.stop_dhcp_client(iface)
-                raise exceptions.HostNotFoundException(
-                    'No IP addr received from DHCP')
-            time.sleep(0)
-
-        ip_addr = self.get_ip(iface)
+        try:
+            ip_addr = self.wait_for_ip(iface, timeout)
+        except (exceptions.SubprocessTimeoutException,
+                exceptions.HostNotFoundException):
+            self.stop_dhcp_client(iface)
+            raise exceptions.HostNotFoundException(
+                'No IP addr received from DHCP')
+
         self.dhcpcd_is_running.add(iface)
         self.LOG.debug("Received IP from DHCP server: " + ip_addr)
         return ip_addr
@@ -103,6 +101,7 @@ class IPNetnsVM(direct_underlay_host.DirectUnderlayHost,
         Kill this Host.
         :return:
         """
+        self.stop_all_captures()
         self.host.remove_taps(self)
         cli.REMOVENSCMD(self.name)
         self.host.vms.pop(self.name)
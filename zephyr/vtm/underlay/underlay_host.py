@@ -14,6 +14,7 @@
 
 import abc
 import time
+from zephyr.common import async_cli
 from zephyr.common import exceptions
 from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
 
@@ -59,6 +60,9 @@ class UnderlayHost(object):
     def get_ip(self, iface_name):
         return None
 
+    def wait_for_ip(self, iface_name, timeout=10):
+        return None
+
     def request_ip(self, iface_name):
         return None
 
@@ -180,6 +184,18 @@ class UnderlayHost(object):
             '= [' + str(reply) + ']')
         return reply
 
+    def send_echo_request_async(self, dest_ip='localhost',
+                                dest_port=DEFAULT_ECHO_PORT,
+                                echo_request='ping',
+                                protocol='tcp', timeout=10):
+        """
+        Same as send_echo_request, but run in the background.
+        :rtype: concurrent.futures.Future
+        """
+        return async_cli.submit(
+            self.send_echo_request, dest_ip=dest_ip, dest_port=dest_port,
+            echo_request=echo_request, protocol=protocol, timeout=timeout)
+
     @abc.abstractmethod
     def do_send_echo_request(self, dest_ip='localhost',
                              dest_port=DEFAULT_ECHO_PORT,
@@ -222,19 +238,30 @@ class UnderlayHost(object):
 
         return resp
 
+    def ping_async(self, target_ip, iface=None, count=1, timeout=None):
+        """
+        Same as ping, but run in the background.
+        :rtype: concurrent.futures.Future
+        """
+        return async_cli.submit(self.ping, target_ip=target_ip, iface=iface,
+                                count=count, timeout=timeout)
+
     @abc.abstractmethod
     def do_ping(self, target_ip, iface=None, count=1, timeout=None):
         return None
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, subscriber='default',
+                      buffer_packets=0, buffer_bytes=0,
+                      overflow_policy='drop_oldest', spill_filename=None):
         return None
 
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None,
+                        subscriber='default'):
         return None
 
-    def stop_capture(self, interface):
+    def stop_capture(self, interface, subscriber='default'):
         return None
 
     def flush_arp(self):
@@ -249,5 +276,12 @@ class UnderlayHost(object):
     def execute(self, cmd_line, timeout=None, blocking=True):
         return None
 
+    def execute_async(self, cmd_line, timeout=None):
+        """
+        Same as a blocking execute, but run in the background.
+        :rtype: concurrent.futures.Future
+        """
+        return async_cli.submit(self.execute, cmd_line, timeout=timeout)
+
     def terminate(self):
         return None
@@ -22,6 +22,7 @@ import traceback
 from zephyr.common import cli
 from zephyr.common import exceptions
 from zephyr.common.log_manager import LogManager
+from zephyr.common.priv_broker import PrivBroker
 from zephyr.common import zephyr_constants as zc
 from zephyr_ptm.ptm.config import version_config
 from zephyr_ptm.ptm.physical_topology_manager import PhysicalTopologyManager
@@ -68,6 +69,11 @@ def usage(except_obj):
     print("        zephyr underlay: " + und_file + ".  This file will be")
     print("        used to display the underlay topology of the currently")
     print("        running system, so it must be accurate and current.")
+    print("Options:")
+    print("    --priv-broker")
+    print("        Start a privileged broker to run allowed privileged")
+    print("        commands (for this and the host control processes),")
+    print("        instead of using sudo for each one.")
 
     if except_obj is not None:
         raise except_obj
@@ -98,7 +104,7 @@ try:
         sys.argv[1:], 'hdpc:l:fju:',
         ['help', 'debug', 'startup', 'shutdown',
          'print', 'features', 'config-file=',
-         'log-dir=', 'json'])
+         'log-dir=', 'json', 'priv-broker'])
 
     # Defaults
     ptm_ctl_dir = os.path.dirname(os.path.abspath(__file__))
@@ -112,6 +118,7 @@ try:
     neutron_command = ''
     log_dir = '/tmp/zephyr/logs'
     debug = False
+    priv_broker = False
     underlay_config_file = conf_dir + '/' + zc.DEFAULT_UNDERLAY_CONFIG
 
     for arg, value in arg_map:
@@ -134,6 +141,8 @@ try:
             command = 'features'
         elif arg in ('-j', '--json'):
             command = 'json'
+        elif arg == '--priv-broker':
+            priv_broker = True
         else:
             usage(exceptions.ArgMismatchException('Invalid argument' + arg))
 
@@ -141,6 +150,9 @@ try:
         usage(exceptions.ArgMismatchException(
             'Must specify at least one command option'))
 
+    if priv_broker:
+        PrivBroker.start_broker()
+
     log_manager = LogManager(root_dir=log_dir)
     if command == 'startup':
         log_manager.rollover_logs_fresh(file_filter='ptm*.log')
@@ -276,24 +276,22 @@ class Midolman(application.Application):
             pid = self.cli.read_from_file('/run/midolman/pid')
             self.cli.cmd('kill ' + str(pid))
 
-            deadline = datetime.datetime.now() + datetime.timedelta(seconds=30)
-            while LinuxCLI().is_pid_running(pid):
-                if datetime.datetime.now() > deadline:
+            try:
+                self.cli.wait_for_pid_exit(pid, timeout=30)
+            except exceptions.SubprocessTimeoutException:
+                self.LOG.error(
+                    "Process " + str(pid) +
+                    " not stopping, killing with extreme prejudice "
+                    "(kill -9)")
+                self.cli.cmd('kill -9 ' + str(pid))
+                try:
+                    self.cli.wait_for_pid_exit(pid, timeout=30)
+                except exceptions.SubprocessTimeoutException:
                     self.LOG.error(
                         "Process " + str(pid) +
-                        " not stopping, killing with extreme prejudice "
-                        "(kill -9)")
-                    self.cli.cmd('kill -9' + str(pid))
-
-                    deadline2 = (datetime.datetime.now() +
-                                 datetime.timedelta(seconds=30))
-                    while LinuxCLI().is_pid_running(pid):
-                        if datetime.datetime.now() > deadline2:
-                            self.LOG.error(
-                                "Process " + str(pid) +
-                                " not stopped, even with SIGKILL")
-                            raise exceptions.SubprocessTimeoutException(
-                                "Couldn't stop process: midolman")
+                        " not stopped, even with SIGKILL")
+                    raise exceptions.SubprocessTimeoutException(
+                        "Couldn't stop process: midolman")
 
             self.cli.rm('/run/midolman/pid')
 
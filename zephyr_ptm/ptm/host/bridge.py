@@ -34,7 +34,11 @@ class Bridge(Interface):
         """ :type: dict [str, Interface]"""
 
     def create(self):
-        self.cli.cmd('brctl addbr ' + self.get_name())
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.create_link, self.get_name(), 'bridge')
+        else:
+            self.cli.cmd('brctl addbr ' + self.get_name())
         # Link all configured interfaces to this bridge
         # Set any configured options
         for i in self.options:
@@ -53,7 +57,11 @@ class Bridge(Interface):
                     i.peer_interface.host.del_route(IP('0.0.0.0', '0'))
         # Remove the bridge (note, bridge interface must be DOWN for
         # removal to work)
-        self.cli.cmd('brctl delbr ' + self.get_name())
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.delete_link, self.get_name())
+        else:
+            self.cli.cmd('brctl delbr ' + self.get_name())
 
     def link_interface(self, iface):
         """
@@ -61,7 +69,12 @@ class Bridge(Interface):
         :param iface: Interface Interface to link
         :return:
         """
-        self.cli.cmd('brctl addif ' + self.get_name() + ' ' + iface.name)
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.set_link_master, iface.name,
+                              self.get_name())
+        else:
+            self.cli.cmd('brctl addif ' + self.get_name() + ' ' + iface.name)
         self.linked_interfaces[iface.name] = iface
 
     def unlink_interface(self, iface):
@@ -70,7 +83,11 @@ class Bridge(Interface):
         :param iface: Interface Interface to unlink
         :return:
         """
-        self.cli.cmd('brctl delif ' + self.get_name() + ' ' + iface.name)
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.set_link_master, iface.name, None)
+        else:
+            self.cli.cmd('brctl delif ' + self.get_name() + ' ' + iface.name)
         self.linked_interfaces.pop(iface.name)
 
     def print_config(self, indent=0):
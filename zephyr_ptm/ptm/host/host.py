@@ -18,10 +18,13 @@ import logging
 import time
 import uuid
 
+from zephyr.common.capture_session import CaptureSession
+from zephyr.common.capture_session import DEFAULT_SUBSCRIBER
 from zephyr.common.cli import LinuxCLI
 from zephyr.common import exceptions
 from zephyr.common.ip import IP
-from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.netlink import NetlinkException
+from zephyr.common.packet_buffer import OVERFLOW_DROP_OLDEST
 from zephyr.common.tcp_sender import TCPSender
 from zephyr.common.utils import get_class_from_fqn
 from zephyr.common import zephyr_constants
@@ -33,6 +36,8 @@ from zephyr_ptm.ptm.physical_topology_config import *
 from zephyr_ptm.ptm import ptm_constants
 from zephyr_ptm.ptm.ptm_object import PTMObject
 
+IP_POLL_INTERVAL = 0.1
+
 
 class Host(PTMObject):
     def __init__(self, name, ptm, cli=LinuxCLI(),
@@ -54,7 +59,7 @@ class Host(PTMObject):
         self.LOG = logging.getLogger('ptm-null-root')
         """ :type: logging.Logger"""
         self.packet_captures = {}
-        """ :type: dict[str, TCPDump]"""
+        """ :type: dict[str, CaptureSession]"""
         self.log_manager = (self.ptm.log_manager
                             if self.ptm is not None
                             else None)
@@ -292,6 +297,7 @@ class Host(PTMObject):
         self.set_loopback()
 
     def shutdown(self):
+        self.stop_all_captures()
         for interface in self.interfaces.itervalues():
             if interface.name in self.dhcpcd_is_running:
                 self.stop_dhcp_client(interface.name)
@@ -305,14 +311,28 @@ class Host(PTMObject):
         self.boot()
 
     def net_up(self):
-        # Configure and bring up all network 'devices'
+        if self.cli.netlink() is not None:
+            # Configure and bring up all network 'devices'
+            for interface in self.interfaces.itervalues():
+                self.LOG.debug('Bringing up interface: ' + interface.name +
+                               ' and configuring addresses: ' +
+                               str(map(str, interface.ip_list)))
+                interface.up()
+                interface.config_addr()
+                interface.start_vlans()
+            return
+
+        # Configure and bring up all network 'devices' in one batch
+        cmds = []
         for interface in self.interfaces.itervalues():
             self.LOG.debug('Bringing up interface: ' + interface.name +
                            ' and configuring addresses: ' +
                            str(map(str, interface.ip_list)))
-            interface.up()
-            interface.config_addr()
-            interface.start_vlans()
+            cmds.append(interface.up_command())
+            cmds += interface.config_addr_commands()
+            cmds += interface.start_vlans_commands()
+            interface.state = Interface.UP
+        self.cli.cmd_batch(cmds, stop_on_error=False)
 
     def net_finalize(self):
         # Special for VETH pairs, set the peer's default route to this host's
@@ -323,37 +343,50 @@ class Host(PTMObject):
                 interface.add_peer_route()
 
         # Set up any IP forward rules
-        for exterior, interior in self.ip_forward_rules:
-            self.cli.cmd('iptables -t nat -A POSTROUTING -o ' +
-                         exterior + ' -j MASQUERADE')
-            self.cli.cmd('/sbin/iptables -A FORWARD -i ' +
-                         interior + ' -o ' + exterior + ' -j ACCEPT')
-            self.cli.cmd('/sbin/iptables -A FORWARD -i ' +
-                         exterior + ' -o ' + interior +
-                         ' -m state --state RELATED,ESTABLISHED -j ACCEPT')
+        self.cli.cmd_batch(self.ip_forward_commands('-A'),
+                           stop_on_error=False)
 
         # Set up any IP forward rules
         for dest, gw, dev in self.route_rules:
             self.add_route(dest, gw, dev)
 
+    def ip_forward_commands(self, operation):
+        """
+        :type operation: str '-A' to add the IP forward rules, '-D' to
+        delete them
+        :return: list[str]
+        """
+        cmds = []
+        for exterior, interior in self.ip_forward_rules:
+            cmds += ['iptables -t nat ' + operation + ' POSTROUTING -o ' +
+                     exterior + ' -j MASQUERADE',
+                     '/sbin/iptables ' + operation + ' FORWARD -i ' +
+                     interior + ' -o ' + exterior + ' -j ACCEPT',
+                     '/sbin/iptables ' + operation + ' FORWARD -i ' +
+                     exterior + ' -o ' + interior +
+                     ' -m state --state RELATED,ESTABLISHED -j ACCEPT']
+        return cmds
+
     def net_down(self):
         # Set up any IP forward rules
         for dest, gw, dev in self.route_rules:
             self.del_route(dest)
 
         # Set up any IP forward rules
-        for exterior, interior in self.ip_forward_rules:
-            self.cli.cmd('iptables -t nat -D POSTROUTING -o ' +
-                         exterior + ' -j MASQUERADE')
-            self.cli.cmd('/sbin/iptables -D FORWARD -i ' +
-                         interior + ' -o ' + exterior + ' -j ACCEPT')
-            self.cli.cmd('/sbin/iptables -D FORWARD -i ' +
-                         exterior + ' -o ' + interior +
-                         ' -m state --state RELATED,ESTABLISHED -j ACCEPT')
+        self.cli.cmd_batch(self.ip_forward_commands('-D'),
+                           stop_on_error=False)
 
-        for interface in self.interfaces.itervalues():
-            interface.stop_vlans()
-            interface.down()
+        if self.cli.netlink() is not None:
+            for interface in self.interfaces.itervalues():
+                interface.stop_vlans()
+                interface.down()
+        else:
+            cmds = []
+            for interface in self.interfaces.itervalues():
+                cmds += interface.stop_vlans_commands()
+                cmds.append(interface.down_command())
+                interface.state = Interface.DOWN
+            self.cli.cmd_batch(cmds, stop_on_error=False)
 
         for bridge in self.bridges.itervalues():
             bridge.down()
@@ -412,14 +445,23 @@ class Host(PTMObject):
         self.wait_for_all_applications_to_start(app_type=app_type)
 
     def set_loopback(self, ip_addr=IP('127.0.0.1', '8')):
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                if ip_addr not in netlink.get_addresses('lo'):
+                    netlink.add_address('lo', ip_addr)
+                netlink.set_link_up('lo')
+            except NetlinkException as e:
+                self.LOG.debug('Setting up loopback failed: ' + str(e))
+            return
         if not self.cli.grep_cmd('ip addr | grep lo | grep inet',
                                  str(ip_addr)):
             self.cli.cmd('ip addr add ' + str(ip_addr) + ' dev lo')
         self.cli.cmd('ip link set dev lo up')
 
     def reset_default_route(self, ip_addr):
-        self.cli.cmd('ip route del default')
-        self.cli.cmd('ip route add default via ' + ip_addr)
+        self.del_route(IP('default'))
+        self.add_route(gw_ip=IP(ip_addr))
 
     def add_route(self, route_ip='default', gw_ip=None, dev=None):
         """
@@ -432,22 +474,70 @@ class Host(PTMObject):
             if dev is None:
                 raise exceptions.ArgMismatchException(
                     'Must specify either next-hop GW or device to add a route')
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                netlink.add_route(route_ip, gateway=gw_ip, ifname=dev)
+            except NetlinkException as e:
+                self.LOG.debug('Adding route failed: ' + str(e))
+        elif gw_ip is None:
             self.cli.cmd('ip route add ' + str(route_ip) + ' dev ' + str(dev))
         else:
             self.cli.cmd('ip route add ' + str(route_ip) + ' via ' + gw_ip.ip +
                          (' dev ' + str(dev) if dev else ''))
 
     def del_route(self, route_ip):
-        self.cli.cmd('ip route del ' + str(route_ip.ip))
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                netlink.del_route(route_ip.ip)
+            except NetlinkException as e:
+                self.LOG.debug('Deleting route failed: ' + str(e))
+        else:
+            self.cli.cmd('ip route del ' + str(route_ip.ip))
 
     # noinspection PyUnresolvedReferences
     def get_ip(self, iface_name):
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                addresses = netlink.get_addresses(iface_name)
+            except NetlinkException:
+                return ''
+            return addresses[0].ip if len(addresses) > 0 else ''
         return (
             self.cli.cmd(
                 'ip addr show dev ' + iface_name +
                 " | grep -w inet | awk '{print $2}' | sed 's/\/.*//g'")
             .stdout.strip().split('\n')[0])
 
+    def wait_for_ip(self, iface_name, timeout=10):
+        """
+        Wait for an IP address to be assigned to the interface (by DHCP,
+        for example).
+        :type iface_name: str
+        :type timeout: float
+        :return: str The IP address
+        """
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            try:
+                return netlink.wait_for_address(iface_name, timeout).ip
+            except NetlinkException as e:
+                raise exceptions.HostNotFoundException(
+                    'Could not wait for an IP on ' + iface_name + ': ' +
+                    str(e))
+
+        deadline = time.time() + timeout
+        ip_addr = self.get_ip(iface_name)
+        while not ip_addr:
+            if time.time() > deadline:
+                raise exceptions.SubprocessTimeoutException(
+                    'No IP address on ' + iface_name + ' within timeout')
+            time.sleep(IP_POLL_INTERVAL)
+            ip_addr = self.get_ip(iface_name)
+        return ip_addr
+
     def stop_dhcp_client(self, iface='eth0'):
         file_name = self.name + '.' + iface
         self.cli.cmd(
@@ -465,15 +555,14 @@ class Host(PTMObject):
             '-pf /run/dhclient-' + file_name + '.pid '
             '-lf /var/lib/dhcp/dhclient-' + file_name + '.lease ' +
             iface)
-        deadline = time.time() + timeout
-        while not self.get_ip(iface):
-            if time.time() > deadline:
-                self.stop_dhcp_client(iface)
-                raise exceptions.HostNotFoundException(
-                    'No IP addr received from DHCP')
-            time.sleep(0)
+        try:
+            ip_addr = self.wait_for_ip(iface, timeout)
+        except (exceptions.SubprocessTimeoutException,
+                exceptions.HostNotFoundException):
+            self.stop_dhcp_client(iface)
+            raise exceptions.HostNotFoundException(
+                'No IP addr received from DHCP')
 
-        ip_addr = self.get_ip(iface)
         self.dhcpcd_is_running.add(iface)
         self.LOG.debug("Received IP from DHCP server: " + ip_addr)
         return ip_addr
@@ -690,14 +779,15 @@ class Host(PTMObject):
         tcps = TCPSender()
         opt_map = {'command': command}
         if source_mac is not None:
-            opt_map = {'smac': source_mac}
+            opt_map['smac'] = source_mac
         if dest_mac is not None:
-            opt_map = {'tmac': dest_mac}
+            opt_map['tmac'] = dest_mac
         if source_ip is not None:
-            opt_map = {'sip': source_ip}
+            opt_map['sip'] = source_ip
         if dest_ip is not None:
-            opt_map = {'tip': dest_ip}
-        opt_map += packet_options
+            opt_map['tip'] = dest_ip
+        if packet_options is not None:
+            opt_map.update(packet_options)
         return tcps.send_packet(self.cli, interface=iface, dest_ip=dest_ip,
                                 packet_type='arp',
                                 packet_options=opt_map, count=count).stdout
@@ -749,59 +839,86 @@ class Host(PTMObject):
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, subscriber=DEFAULT_SUBSCRIBER,
+                      buffer_packets=0, buffer_bytes=0,
+                      overflow_policy=OVERFLOW_DROP_OLDEST,
+                      spill_filename=None):
         """
         Starts the capture of packets on the host's interface with
         pcap_filter tools (e.g. tcpdump). This will start a process
         in the background listening for packets on the given interface.
         The actual packets can be retrieved via the 'capture_packets'
         method.  Capturing can be halted with the 'stop_capture'
-        method.  Only one capture can be running per interface at any
-        one time.  Use the PcapRule objects to assemble a filter via
-        standard pcap_filter rules. A callback function is available
-        to be called when each packet is parsed.  It must take at least
-        a single PCAPPacket parameter, and any number of optional
-        arguments (passed through the callback_args parameter).  The
-        packet capture will be dumped to a temporary file, which can
-        be saved off to a permanent location, if desired.
+        method.  One capture session is run per interface, and shared
+        by any number of named subscribers, each with its own filter and
+        packets, which can be started and stopped independently
+        (starting a subscriber which already exists replaces it).  The
+        session's tcpdump filters for any of the subscribers' filters,
+        and is stopped once every subscriber has stopped (including
+        subscribers which stop by themselves after 'count' packets).
+        Use the PcapRule objects to assemble a filter via standard
+        pcap_filter rules.  A callback function is available to be
+        called when each packet is parsed.
+        It must take at least a single PCAPPacket parameter, and any
+        number of optional arguments (passed through the callback_args
+        parameter).  The packets received by the subscriber can also
+        be saved off to a permanent location in pcap format, if desired.
+        The subscriber's packets are buffered in memory until retrieved,
+        which can be bounded by a packet and/or byte limit, with a policy
+        for packets over the limit ('drop_oldest', 'drop_newest', or
+        'spill' the oldest to a pcap file).
         :param interface: str: Interface to capture on ('any' is
         also acceptable)
         :param count: int: Number of packets to capture, or '0' to
         capture until explicitly stopped (default)
-        :param ptype: str: Type of packet to filter
+        :param ptype: str: Type of packet to filter (only used when
+        the interface's capture is started)
         :param pfilter: PcapRule: Ruleset for packet filtering
         :param callback: callable: Optional callback function
         :param callback_args: list[T]: Arguments to optional callback
         function
-        :param save_dump_file: bool: Optionally save the temporary
-        packet capture file
-        :param save_dump_filename: str: Filename to save temporary
+        :param save_dump_file: bool: Optionally save the packet
+        capture file
+        :param save_dump_filename: str: Filename to save the pcap
         packet capture file
+        :param subscriber: str: Name of the subscriber to start
+        :param buffer_packets: int: Packets to buffer (0 for no limit)
+        :param buffer_bytes: int: Bytes to buffer (0 for no limit)
+        :param overflow_policy: str: What to do with packets over the limit
+        :param spill_filename: str: Filename to spill packets to
         :return:
         """
-        tcpd = (self.packet_captures[interface]
-                if interface in self.packet_captures
-                else TCPDump())
-        """ :type: TCPDump """
+        session = self.packet_captures.get(interface, None)
+        """ :type: CaptureSession """
 
-        self.LOG.debug('Starting tcpdump on host: ' + self.name)
+        if session is None or not session.is_running():
+            session = CaptureSession(cli=self.cli, interface=interface,
+                                     packet_type=ptype)
+            self.packet_captures[interface] = session
+
+        self.LOG.debug('Starting capture subscriber ' + subscriber +
+                       ' on host: ' + self.name)
 
         old_log = self.cli.log_cmd
         if self.debug:
             self.cli.log_cmd = True
 
-        tcpd.start_capture(cli=self.cli, interface=interface, count=count,
-                           packet_type=ptype, pcap_filter=pfilter,
-                           callback=callback, callback_args=callback_args,
-                           save_dump_file=save_dump_file,
-                           save_dump_filename=save_dump_filename,
-                           blocking=False)
+        # Subscribing to a running session starts any capture its filter
+        # needs, otherwise the captures are started once subscribed
+        session.subscribe(subscriber, pcap_filter=pfilter, count=count,
+                          callback=callback, callback_args=callback_args,
+                          save_dump_file=save_dump_file,
+                          save_dump_filename=save_dump_filename,
+                          buffer_packets=buffer_packets,
+                          buffer_bytes=buffer_bytes,
+                          overflow_policy=overflow_policy,
+                          spill_filename=spill_filename)
+        session.start()
 
         self.cli.log_cmd = old_log
 
-        self.packet_captures[interface] = tcpd
-
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None,
+                        subscriber=DEFAULT_SUBSCRIBER):
         """
         Wait for and return a list of [count] received packets on the given
         interface. The optional timeout can be specified to bound the time
@@ -812,30 +929,49 @@ class Host(PTMObject):
         return what is buffered)
         :param timeout: int: Upper bound on length of time to wait before
         exception is raised
+        :param subscriber: str: Name of the subscriber to get packets for
         :return: list [PCAPPacket]
         """
         if interface not in self.packet_captures:
             raise ObjectNotFoundException(
                 'No packet capture is running or was run on host/interface' +
                 self.name + '/' + interface)
-        tcpd = self.packet_captures[interface]
-        return tcpd.wait_for_packets(count, timeout)
+        session = self.packet_captures[interface]
+        return session.get_subscriber(subscriber).wait_for_packets(
+            count, timeout)
 
-    def stop_capture(self, interface):
+    def stop_capture(self, interface, subscriber=DEFAULT_SUBSCRIBER):
         """
-        Stop the capture of packets on the given interface.  Any
-        remaining packets can be accessed through the 'capture_packets'
-        method.
+        Stop the capture of packets for the given subscriber on the
+        given interface (the capture itself is stopped once no other
+        subscribers are left).  Any remaining packets can be accessed
+        through the 'capture_packets' method.
         :param interface: str: Interface to stop capture on
+        :param subscriber: str: Name of the subscriber to stop
         :return:
         """
         if interface in self.packet_captures:
-            tcpd = self.packet_captures[interface]
-            tcpd.stop_capture()
+            session = self.packet_captures[interface]
+            if subscriber in session.subscribers:
+                session.detach(subscriber)
+
+    def stop_all_captures(self):
+        """
+        Stop every capture on this host's interfaces.  Packets already
+        received can still be accessed through the 'capture_packets'
+        method.
+        :return:
+        """
+        for session in self.packet_captures.values():
+            session.stop()
 
     def flush_arp(self):
         """
         Flush the ARP table on this Host
         :return:
         """
-        self.cli.cmd('ip neighbour flush all')
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            netlink.flush_neighbours()
+        else:
+            self.cli.cmd('ip neighbour flush all')
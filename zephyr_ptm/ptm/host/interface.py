@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from zephyr.common.ip import IP
+from zephyr.common.netlink import NetlinkException
 from zephyr_ptm.ptm.ptm_object import PTMObject
 
 
@@ -50,68 +51,190 @@ class Interface(PTMObject):
     def remove(self):
         pass
 
+    def netlink_call(self, func, *args, **kwargs):
+        """
+        Run a netlink operation, ignoring failures just as failures of the
+        equivalent 'ip' commands are ignored.
+        :type func: callable
+        :return: bool True if it succeeded
+        """
+        try:
+            func(*args, **kwargs)
+            return True
+        except NetlinkException:
+            return False
+
     def config_addr(self):
+        netlink = self.cli.netlink()
+        if netlink is None:
+            self.cli.cmd_batch(self.config_addr_commands(),
+                               stop_on_error=False)
+            return
         if self.mac is not None:
-            self.cli.cmd('ip link set dev ' + self.get_name() +
-                         ' address ' + self.mac)
+            self.netlink_call(netlink.set_link_address, self.get_name(),
+                              self.mac)
+        for ip in self.ip_list:
+            self.netlink_call(netlink.add_address, self.get_name(), ip)
+
+    def config_addr_commands(self):
+        """
+        :return: list[str] Commands to set the MAC and IP addresses
+        """
+        cmds = []
+        if self.mac is not None:
+            cmds.append('ip link set dev ' + self.get_name() +
+                        ' address ' + self.mac)
 
         for ip in self.ip_list:
-            self.cli.cmd('ip addr add ' + str(ip) + ' dev ' + self.get_name())
+            cmds.append('ip addr add ' + str(ip) + ' dev ' + self.get_name())
+        return cmds
 
     def up(self):
-        self.cli.cmd('ip link set dev ' + self.get_name() + ' up')
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.set_link_up, self.get_name())
+        else:
+            self.cli.cmd(self.up_command())
         self.state = Interface.UP
 
+    def up_command(self):
+        """
+        :return: str
+        """
+        return 'ip link set dev ' + self.get_name() + ' up'
+
     def down(self):
-        self.cli.cmd('ip link set dev ' + self.get_name() + ' down')
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.set_link_up, self.get_name(), up=False)
+        else:
+            self.cli.cmd(self.down_command())
         self.state = Interface.DOWN
 
+    def down_command(self):
+        """
+        :return: str
+        """
+        return 'ip link set dev ' + self.get_name() + ' down'
+
     def set_mac(self, new_mac):
         self.mac = new_mac
-        self.cli.cmd('ip link set dev ' + self.get_name() +
-                     ' address ' + new_mac)
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.set_link_address, self.get_name(),
+                              new_mac)
+        else:
+            self.cli.cmd('ip link set dev ' + self.get_name() +
+                         ' address ' + new_mac)
 
     def add_ip(self, new_ip):
         """
         :type new_ip: IP
         """
-        self.cli.cmd('ip addr add ' + str(new_ip) + ' dev ' + self.get_name())
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.add_address, self.get_name(), new_ip)
+        else:
+            self.cli.cmd('ip addr add ' + str(new_ip) + ' dev ' +
+                         self.get_name())
         self.ip_list.append(new_ip)
 
     def del_ip(self, new_ip):
         """
         :type new_ip: IP
         """
-        self.cli.cmd('ip addr del ' + str(new_ip) +
-                     ' dev ' + self.get_name())
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.del_address, self.get_name(), new_ip)
+        else:
+            self.cli.cmd('ip addr del ' + str(new_ip) +
+                         ' dev ' + self.get_name())
         self.ip_list.remove(new_ip)
 
     def start_vlans(self):
+        if self.cli.netlink() is not None:
+            if self.vlans is not None:
+                for vlan_id, vlan_ips in self.vlans.iteritems():
+                    self.link_vlan(vlan_id, vlan_ips)
+            return
+        self.cli.cmd_batch(self.start_vlans_commands(), stop_on_error=False)
+
+    def start_vlans_commands(self):
+        """
+        :return: list[str]
+        """
+        cmds = []
         if self.vlans is not None:
             for vlan_id, vlan_ips in self.vlans.iteritems():
-                self.link_vlan(vlan_id, vlan_ips)
+                cmds += self.link_vlan_commands(vlan_id, vlan_ips)
+        return cmds
 
     def stop_vlans(self):
+        if self.cli.netlink() is not None:
+            if self.vlans is not None:
+                for vlan_id in self.vlans.iterkeys():
+                    self.unlink_vlan(vlan_id)
+            return
+        self.cli.cmd_batch(self.stop_vlans_commands(), stop_on_error=False)
+
+    def stop_vlans_commands(self):
+        """
+        :return: list[str]
+        """
+        cmds = []
         if self.vlans is not None:
             for vlan_id in self.vlans.iterkeys():
-                self.unlink_vlan(vlan_id)
+                cmds += self.unlink_vlan_commands(vlan_id)
+        return cmds
 
     def link_vlan(self, vlan_id, ip_list):
         """
         :type vlan_id: str
         :type ip_list: list[IP]
         """
+        netlink = self.cli.netlink()
+        if netlink is None:
+            self.cli.cmd_batch(self.link_vlan_commands(vlan_id, ip_list),
+                               stop_on_error=False)
+            return
         vlan_iface = self.name + '.' + str(vlan_id)
-        self.cli.cmd('ip link add link ' + self.name + ' name ' +
-                     vlan_iface + ' type vlan id ' + str(vlan_id))
-        self.cli.cmd('ip link set dev ' + vlan_iface + ' up')
+        self.netlink_call(netlink.create_link, vlan_iface, 'vlan',
+                          link=self.name, vlan_id=vlan_id)
+        self.netlink_call(netlink.set_link_up, vlan_iface)
         for ip in ip_list:
-            self.cli.cmd('ip addr add ' + str(ip) + ' dev ' + vlan_iface)
+            self.netlink_call(netlink.add_address, vlan_iface, ip)
+
+    def link_vlan_commands(self, vlan_id, ip_list):
+        """
+        :type vlan_id: str
+        :type ip_list: list[IP]
+        :return: list[str]
+        """
+        vlan_iface = self.name + '.' + str(vlan_id)
+        return (['ip link add link ' + self.name + ' name ' +
+                 vlan_iface + ' type vlan id ' + str(vlan_id),
+                 'ip link set dev ' + vlan_iface + ' up'] +
+                ['ip addr add ' + str(ip) + ' dev ' + vlan_iface
+                 for ip in ip_list])
 
     def unlink_vlan(self, vlan_id):
+        netlink = self.cli.netlink()
+        if netlink is None:
+            self.cli.cmd_batch(self.unlink_vlan_commands(vlan_id),
+                               stop_on_error=False)
+            return
+        vlan_iface = self.name + '.' + str(vlan_id)
+        self.netlink_call(netlink.set_link_up, vlan_iface, up=False)
+        self.netlink_call(netlink.delete_link, vlan_iface)
+
+    def unlink_vlan_commands(self, vlan_id):
+        """
+        :type vlan_id: str
+        :return: list[str]
+        """
         vlan_iface = self.name + '.' + str(vlan_id)
-        self.cli.cmd('ip link set dev ' + vlan_iface + ' down')
-        self.cli.cmd('ip link del ' + vlan_iface)
+        return ['ip link set dev ' + vlan_iface + ' down',
+                'ip link del ' + vlan_iface]
 
     def print_config(self, indent=0):
         print(('    ' * indent) + self.name + ' with ips: ' +
@@ -47,12 +47,17 @@ class VirtualInterface(Interface):
         Link a veth peer to a far host and return the new interface
         :return: Interface The peer on the far host, configured and ready
         """
-        self.cli.cmd(
-            'ip link add dev ' + self.get_name() +
-            ' type veth peer name ' +
-            (self.peer_name
-             if self.use_namespace
-             else self.peer_interface.name))
+        peer_name = (self.peer_name
+                     if self.use_namespace
+                     else self.peer_interface.name)
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.create_link, self.get_name(), 'veth',
+                              peer_name=peer_name)
+        else:
+            self.cli.cmd(
+                'ip link add dev ' + self.get_name() +
+                ' type veth peer name ' + peer_name)
 
         # Add interface to the linked bridge, if there is one
         if self.linked_bridge is not None:
@@ -64,9 +69,14 @@ class VirtualInterface(Interface):
 
         if self.use_namespace:
             # move peer interface onto far host's namespace
-            self.cli.cmd('ip link set dev ' + self.peer_name + ' netns ' +
-                         self.peer_interface.host.name + ' name ' +
-                         self.peer_interface.name)
+            if netlink is not None:
+                self.netlink_call(netlink.set_link_netns, self.peer_name,
+                                  self.peer_interface.host.name,
+                                  new_name=self.peer_interface.name)
+            else:
+                self.cli.cmd('ip link set dev ' + self.peer_name +
+                             ' netns ' + self.peer_interface.host.name +
+                             ' name ' + self.peer_interface.name)
 
         # In the unlikely chance that the peer is also linked to a bridge,
         # go ahead and link
@@ -79,7 +89,11 @@ class VirtualInterface(Interface):
         return self.peer_interface
 
     def remove(self):
-        self.cli.cmd('ip link del dev ' + self.get_name())
+        netlink = self.cli.netlink()
+        if netlink is not None:
+            self.netlink_call(netlink.delete_link, self.get_name())
+        else:
+            self.cli.cmd('ip link del dev ' + self.get_name())
 
     def config_addr(self):
         # Perform the normal address configuration, then set the
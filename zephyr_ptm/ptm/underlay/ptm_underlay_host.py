@@ -194,17 +194,22 @@ class PTMUnderlayHost(underlay_host.UnderlayHost):
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, subscriber='default',
+                      buffer_packets=0, buffer_bytes=0,
+                      overflow_policy='drop_oldest', spill_filename=None):
         return self.underlay_host_obj.start_capture(
             interface, count, ptype, pfilter,
-            callback, callback_args, save_dump_file, save_dump_filename)
+            callback, callback_args, save_dump_file, save_dump_filename,
+            subscriber, buffer_packets, buffer_bytes, overflow_policy,
+            spill_filename)
 
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None,
+                        subscriber='default'):
         return self.underlay_host_obj.capture_packets(
-            interface, count, timeout)
+            interface, count, timeout, subscriber)
 
-    def stop_capture(self, interface):
-        return self.underlay_host_obj.stop_capture(interface)
+    def stop_capture(self, interface, subscriber='default'):
+        return self.underlay_host_obj.stop_capture(interface, subscriber)
 
     def flush_arp(self):
         return self.underlay_host_obj.flush_arp()